@@ -0,0 +1,6 @@
+"""
+Benchmarks for the TensorIO bundler
+
+Each module in this package can be run from the project root, e.g.:
+    python -m benchmarks.streaming_memory -h
+"""
@@ -0,0 +1,70 @@
+"""
+Helpers shared by the bundler benchmarks
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+class ScratchDirectory:
+    """
+    Context manager which creates a temporary directory and removes it on exit
+    """
+    def __enter__(self):
+        self.path = tempfile.mkdtemp(prefix='tensorio-bundler-benchmark-')
+        return self.path
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.path)
+
+def write_random_file(path, size, block_size=1024 * 1024):
+    """
+    Writes size bytes of random data to the file at the given path without holding more than
+    block_size bytes in memory.
+
+    Args:
+    1. path - Path of file to write
+    2. size - Size of file in bytes
+    3. block_size - Size of blocks in which data is generated
+
+    Returns: path
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'wb') as outfile:
+        remaining = size
+        while remaining > 0:
+            block = os.urandom(min(block_size, remaining))
+            outfile.write(block)
+            remaining -= len(block)
+    return path
+
+def measure(fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) and measures its wall time and the peak memory allocated by Python
+    while it ran.
+
+    Returns: (result, seconds, peak_bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak_bytes
+
+def format_bytes(num_bytes):
+    """
+    Formats a byte count for display
+    """
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(num_bytes) < 1024 or unit == 'GiB':
+            return '{:.1f} {}'.format(num_bytes, unit)
+        num_bytes /= 1024
+    return None
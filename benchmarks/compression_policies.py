@@ -0,0 +1,122 @@
+"""
+Compares bundle size, build time and client-side extraction time of tiobundles built with various
+compression policies, for a synthetic bundle made up of a dense (incompressible) model file and
+many compressible text assets.
+
+Usage (from project root):
+    python -m benchmarks.compression_policies --model-size 67108864 --num-assets 200
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+import zipfile
+
+from tensorio_bundler import bundler, compression
+
+from .common import ScratchDirectory, format_bytes, write_random_file
+
+DEFAULT_POLICIES = [
+    'stored',
+    'deflate',
+    'deflate:9',
+    'bzip2',
+    'lzma',
+    '*.tflite=stored,deflate',
+    'auto',
+]
+
+def write_text_file(path, size, rng):
+    """
+    Writes roughly size bytes of newline-separated words (which compress well) to path
+    """
+    words = ['label', 'vocab', 'token', 'class', 'person', 'vehicle', 'animal', 'food']
+    lines = []
+    written = 0
+    while written < size:
+        line = '{}_{}\n'.format(rng.choice(words), rng.randrange(10000))
+        lines.append(line)
+        written += len(line)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as outfile:
+        outfile.write(''.join(lines))
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tiobundle compression policies')
+    parser.add_argument(
+        '--model-size',
+        type=int,
+        default=64 * 1024 * 1024,
+        help='Size (in bytes) of the synthetic (random) model file'
+    )
+    parser.add_argument('--num-assets', type=int, default=200, help='Number of text assets')
+    parser.add_argument(
+        '--asset-size',
+        type=int,
+        default=64 * 1024,
+        help='Size (in bytes) of each text asset'
+    )
+    parser.add_argument(
+        '--policies',
+        default=';'.join(DEFAULT_POLICIES),
+        help='Semicolon-separated list of compression policies to benchmark'
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with ScratchDirectory() as scratch:
+        model_path = write_random_file(os.path.join(scratch, 'model.tflite'), args.model_size)
+        model_json_path = os.path.join(scratch, 'model.json')
+        with open(model_json_path, 'w') as outfile:
+            json.dump({'model': {'file': 'model.tflite'}}, outfile)
+        assets_dir = os.path.join(scratch, 'assets')
+        for i in range(args.num_assets):
+            write_text_file(
+                os.path.join(assets_dir, 'asset-{}.txt'.format(i)),
+                args.asset_size,
+                rng
+            )
+
+        print('model of {}, {} assets of {}'.format(
+            format_bytes(args.model_size),
+            args.num_assets,
+            format_bytes(args.asset_size)
+        ))
+        print('{:<28} {:>12} {:>10} {:>10}'.format('policy', 'size', 'build s', 'extract s'))
+        for spec in args.policies.split(';'):
+            policy = compression.parse_policy(spec)
+            outfile = os.path.join(scratch, 'bundle.zip')
+            start = time.perf_counter()
+            bundler.tiobundle_build(
+                model_path,
+                model_json_path,
+                assets_dir,
+                'benchmark.tiobundle',
+                outfile,
+                compression_policy=policy
+            )
+            build_seconds = time.perf_counter() - start
+
+            extraction_dir = os.path.join(scratch, 'extracted')
+            start = time.perf_counter()
+            with zipfile.ZipFile(outfile, 'r') as tiobundle_zip:
+                tiobundle_zip.extractall(path=extraction_dir)
+            extract_seconds = time.perf_counter() - start
+
+            print('{:<28} {:>12} {:>10.3f} {:>10.3f}'.format(
+                spec,
+                format_bytes(os.path.getsize(outfile)),
+                build_seconds,
+                extract_seconds
+            ))
+            os.remove(outfile)
+            shutil.rmtree(extraction_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures the time taken to import bundler modules, and the peak resident memory of a process which
+imports them, each in a fresh interpreter.
+
+Usage (from project root):
+    python -m benchmarks.import_time
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from .common import format_bytes
+
+MEASURE_IMPORT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+# ru_maxrss is reported in kilobytes on Linux
+peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+print(json.dumps({"seconds": seconds, "peak_rss": peak_rss}))
+'''
+
+def measure_import(module, env):
+    """
+    Imports module in a fresh interpreter
+
+    Returns: Dictionary with the import time under "seconds" and the peak resident memory of the
+    interpreter under "peak_rss"
+    """
+    output = subprocess.check_output([sys.executable, '-c', MEASURE_IMPORT, module], env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark import time of bundler modules')
+    parser.add_argument(
+        '--modules',
+        default='tensorio_bundler.bundler,tensorio_bundler.rest,tensorflow',
+        help='Comma-separated list of modules to import'
+    )
+    parser.add_argument('--repeat', type=int, default=3, help='Number of imports of each module')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # Measure the API process alone, without starting conversion workers
+    env['CONVERSION_WORKERS'] = '0'
+
+    print('{:<28} {:>10} {:>14}'.format('module', 'seconds', 'peak RSS'))
+    for module in args.modules.split(','):
+        try:
+            results = [measure_import(module, env) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError:
+            print('{:<28} {:>10}'.format(module, 'failed'))
+            continue
+        seconds = min(result['seconds'] for result in results)
+        peak_rss = min(result['peak_rss'] for result in results)
+        print('{:<28} {:>10.3f} {:>14}'.format(module, seconds, format_bytes(peak_rss)))
+
+if __name__ == '__main__':
+    main()
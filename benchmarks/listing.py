@@ -0,0 +1,161 @@
+"""
+Counts the filesystem calls made by tiobundle_build for a deep asset tree, listing the tree one
+directory at a time (a listdir per directory, an isdir per entry and a stat per file, as on a
+filesystem which cannot list a tree in one pass) and in a single recursive listing (as on GCS,
+where the listing is paginated). On GCS every call is at least one round trip.
+
+Usage (from project root):
+    python -m benchmarks.listing --depth 6 --fanout 3 --files-per-dir 5
+"""
+
+import argparse
+import collections
+import json
+import os
+import time
+
+from tensorio_bundler import bundler, filesystem
+
+from .common import ScratchDirectory, write_random_file
+
+# Objects returned per page of a GCS object listing
+GCS_PAGE_SIZE = 1000
+
+class CountingFileSystem(filesystem.FileSystem):
+    """
+    Local filesystem, addressed with paths of the form <prefix><local path>, which counts the
+    calls made to it by method. If single_pass is False, trees are scanned one directory at a
+    time; otherwise each scan counts as one call per page of GCS_PAGE_SIZE files.
+    """
+    def __init__(self, prefix, single_pass, latency=0):
+        self.prefix = prefix
+        self.single_pass = single_pass
+        self.latency = latency
+        self.local = filesystem.LocalFileSystem()
+        self.calls = collections.Counter()
+
+    def _call(self, method, path, *args):
+        self.calls[method] += 1
+        time.sleep(self.latency)
+        return getattr(self.local, method)(path[len(self.prefix):], *args)
+
+    def exists(self, path):
+        return self._call('exists', path)
+
+    def isdir(self, path):
+        return self._call('isdir', path)
+
+    def listdir(self, path):
+        return self._call('listdir', path)
+
+    def size(self, path):
+        return self._call('size', path)
+
+    def stat(self, path):
+        return self._call('stat', path)
+
+    def open(self, path, mode='rb'):
+        return self._call('open', path, mode)
+
+    def scan(self, path):
+        if not self.single_pass:
+            return super().scan(path)
+        # The first page is requested whether or not there is a directory at path
+        self.calls['scan'] += 1
+        time.sleep(self.latency)
+        files = self.local.scan(path[len(self.prefix):])
+        more_pages = max(0, -(-len(files) // GCS_PAGE_SIZE) - 1)
+        self.calls['scan'] += more_pages
+        time.sleep(self.latency * more_pages)
+        return files
+
+def write_deep_tree(assets_dir, depth, fanout, files_per_dir, file_size):
+    """
+    Writes files_per_dir files of file_size bytes into every directory of a tree of the given
+    depth, in which every directory has fanout subdirectories
+
+    Returns: Number of files written
+    """
+    num_files = 0
+    directories = [assets_dir]
+    for level in range(depth + 1):
+        for directory in directories:
+            for i in range(files_per_dir):
+                write_random_file(os.path.join(directory, 'asset-{}.bin'.format(i)), file_size)
+                num_files += 1
+        if level < depth:
+            directories = [
+                os.path.join(directory, 'dir-{}'.format(i))
+                for directory in directories for i in range(fanout)
+            ]
+    return num_files
+
+def main():
+    parser = argparse.ArgumentParser(description='Count filesystem calls for a deep asset tree')
+    parser.add_argument('--depth', type=int, default=6, help='Depth of the asset tree')
+    parser.add_argument('--fanout', type=int, default=3, help='Subdirectories per directory')
+    parser.add_argument('--files-per-dir', type=int, default=5, help='Files per directory')
+    parser.add_argument('--file-size', type=int, default=256, help='Size of each asset file')
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0,
+        help='Latency (in seconds) added to every filesystem call'
+    )
+    parser.add_argument('--output', required=False, help='Path of JSON report to write')
+    args = parser.parse_args()
+
+    with ScratchDirectory() as scratch:
+        assets_dir = os.path.join(scratch, 'assets')
+        num_files = write_deep_tree(
+            assets_dir,
+            args.depth,
+            args.fanout,
+            args.files_per_dir,
+            args.file_size
+        )
+        write_random_file(os.path.join(scratch, 'model.tflite'), 1024)
+        with open(os.path.join(scratch, 'model.json'), 'w') as model_json:
+            json.dump({'name': 'listing', 'model': {'file': 'model.tflite'}}, model_json)
+
+        print('{} files in a tree of depth {} with fanout {}'.format(
+            num_files,
+            args.depth,
+            args.fanout
+        ))
+        print('{:<15} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10}'.format(
+            'listing', 'listdir', 'isdir', 'stat', 'scan', 'open', 'total', 'seconds'
+        ))
+        report = {'num_files': num_files, 'depth': args.depth, 'fanout': args.fanout, 'modes': {}}
+        for mode, single_pass in [('per-directory', False), ('single-pass', True)]:
+            prefix = 'counted-{}://'.format(mode)
+            counting = CountingFileSystem(prefix, single_pass, args.latency)
+            filesystem.register_filesystem(prefix, counting)
+            outfile = os.path.join(scratch, '{}.tiobundle.zip'.format(mode))
+            start = time.perf_counter()
+            bundler.tiobundle_build(
+                prefix + os.path.join(scratch, 'model.tflite'),
+                prefix + os.path.join(scratch, 'model.json'),
+                prefix + assets_dir,
+                'listing.tiobundle',
+                prefix + outfile
+            )
+            seconds = time.perf_counter() - start
+            report['modes'][mode] = {'calls': dict(counting.calls), 'seconds': seconds}
+            print('{:<15} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10.3f}'.format(
+                mode,
+                counting.calls['listdir'],
+                counting.calls['isdir'],
+                counting.calls['stat'],
+                counting.calls['scan'],
+                counting.calls['open'],
+                sum(counting.calls.values()),
+                seconds
+            ))
+
+        if args.output:
+            with open(args.output, 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+
+if __name__ == '__main__':
+    main()
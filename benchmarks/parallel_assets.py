@@ -0,0 +1,95 @@
+"""
+Measures the time taken to write an assets directory containing many small files into a
+tiobundle, against a filesystem which adds a fixed latency to every call (as GCS does), for
+various numbers of fetch workers.
+
+Usage (from project root):
+    python -m benchmarks.parallel_assets --num-files 500 --latency 0.02
+"""
+
+import argparse
+import os
+import time
+import zipfile
+
+from tensorio_bundler import bundler, filesystem
+
+from .common import ScratchDirectory, write_random_file
+
+class LatencyFileSystem(filesystem.FileSystem):
+    """
+    Local filesystem, addressed with paths of the form slow://<local path>, which sleeps for the
+    given latency before every call
+    """
+    PREFIX = 'slow://'
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.local = filesystem.LocalFileSystem()
+
+    def _call(self, method, path, *args):
+        time.sleep(self.latency)
+        return getattr(self.local, method)(path[len(self.PREFIX):], *args)
+
+    def exists(self, path):
+        return self._call('exists', path)
+
+    def isdir(self, path):
+        return self._call('isdir', path)
+
+    def listdir(self, path):
+        return self._call('listdir', path)
+
+    def size(self, path):
+        return self._call('size', path)
+
+    def open(self, path, mode='rb'):
+        return self._call('open', path, mode)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent asset fetching')
+    parser.add_argument('--num-files', type=int, default=500, help='Number of asset files')
+    parser.add_argument('--file-size', type=int, default=4096, help='Size of each asset file')
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.02,
+        help='Latency (in seconds) added to every filesystem call'
+    )
+    parser.add_argument(
+        '--workers',
+        default='1,4,8,32',
+        help='Comma-separated list of numbers of fetch workers to benchmark'
+    )
+    args = parser.parse_args()
+
+    with ScratchDirectory() as scratch:
+        assets_dir = os.path.join(scratch, 'assets')
+        for i in range(args.num_files):
+            write_random_file(
+                os.path.join(assets_dir, 'dir-{}'.format(i % 10), 'asset-{}.txt'.format(i)),
+                args.file_size
+            )
+        zip_path = os.path.join(scratch, 'bundle.zip')
+
+        print('{} files of {} bytes, {}s latency per call'.format(
+            args.num_files,
+            args.file_size,
+            args.latency
+        ))
+        print('{:<10} {:>10}'.format('workers', 'seconds'))
+        filesystem.register_filesystem(LatencyFileSystem.PREFIX, LatencyFileSystem(args.latency))
+        for workers in [int(workers) for workers in args.workers.split(',')]:
+            start = time.perf_counter()
+            with zipfile.ZipFile(zip_path, 'w') as zfile:
+                bundler.write_assets_to_zipfile(
+                    LatencyFileSystem.PREFIX + assets_dir,
+                    zfile,
+                    'assets',
+                    max_workers=workers
+                )
+            print('{:<10} {:>10.3f}'.format(workers, time.perf_counter() - start))
+            os.remove(zip_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compares peak memory of reading whole files into memory before adding them to a tiobundle
+against streaming them into the bundle in fixed-size chunks.
+
+Usage (from project root):
+    python -m benchmarks.streaming_memory --file-size 268435456
+"""
+
+import argparse
+import os
+import zipfile
+
+from tensorio_bundler import bundler
+
+from .common import ScratchDirectory, format_bytes, measure, write_random_file
+
+def read_whole_file(path, zip_path):
+    """
+    Baseline: reads the whole file into memory and writes it with ZipFile.writestr
+    """
+    with zipfile.ZipFile(zip_path, 'w') as zfile:
+        with open(path, 'rb') as infile:
+            zfile.writestr('model.bin', infile.read())
+
+def stream_file(path, zip_path, chunk_size):
+    """
+    Streams the file into the zipfile using bundler.stream_file_to_zipfile
+    """
+    with zipfile.ZipFile(zip_path, 'w') as zfile:
+        bundler.stream_file_to_zipfile(path, zfile, 'model.bin', chunk_size=chunk_size)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark memory use of tiobundle zipping')
+    parser.add_argument(
+        '--file-size',
+        type=int,
+        default=256 * 1024 * 1024,
+        help='Size (in bytes) of the synthetic model file'
+    )
+    parser.add_argument(
+        '--chunk-sizes',
+        default='65536,1048576,{}'.format(bundler.DEFAULT_CHUNK_SIZE),
+        help='Comma-separated list of chunk sizes to benchmark'
+    )
+    args = parser.parse_args()
+
+    with ScratchDirectory() as scratch:
+        source = write_random_file(os.path.join(scratch, 'model.bin'), args.file_size)
+        zip_path = os.path.join(scratch, 'bundle.zip')
+
+        print('File size: {}'.format(format_bytes(args.file_size)))
+        print('{:<24} {:>10} {:>14}'.format('method', 'seconds', 'peak memory'))
+
+        _, seconds, peak = measure(read_whole_file, source, zip_path)
+        print('{:<24} {:>10.3f} {:>14}'.format('read-whole-file', seconds, format_bytes(peak)))
+        os.remove(zip_path)
+
+        for chunk_size in [int(size) for size in args.chunk_sizes.split(',')]:
+            _, seconds, peak = measure(stream_file, source, zip_path, chunk_size)
+            label = 'stream ({})'.format(format_bytes(chunk_size))
+            print('{:<24} {:>10.3f} {:>14}'.format(label, seconds, format_bytes(peak)))
+            os.remove(zip_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""
+Benchmark suite for the bundling paths: builds bundles from synthetic TFLite binaries, SavedModels
+and asset trees of various sizes and file counts with tiobundle_build, converts synthetic
+SavedModels with tflite_build_from_saved_model, and builds bundles through the POST /bundle
+endpoint. Each case runs in a fresh interpreter, whose wall time, peak RSS and bytes read and
+written (see tensorio_bundler.metrics) are recorded in a JSON report. Reports from two commits can
+be compared with --baseline.
+
+Cases which need TensorFlow (conversion) or falcon (endpoint) are reported as skipped if those
+packages cannot be imported.
+
+Usage (from project root):
+    python -m benchmarks.suite --output report.json
+    python -m benchmarks.suite --model-sizes 1048576 --asset-counts 10 --baseline report.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from .common import ScratchDirectory, format_bytes, write_random_file
+
+TFLITE_BUNDLE = 'tiobundle_tflite'
+SAVED_MODEL_BUNDLE = 'tiobundle_savedmodel'
+CONVERSION = 'tflite_conversion'
+ENDPOINT = 'rest_bundle'
+CASES = [TFLITE_BUNDLE, SAVED_MODEL_BUNDLE, CONVERSION, ENDPOINT]
+
+# Cases which do not bundle assets are only run once per model size
+ASSET_CASES = {TFLITE_BUNDLE, SAVED_MODEL_BUNDLE, ENDPOINT}
+
+MODEL_JSON = {'name': 'benchmark', 'model': {'file': 'model.tflite'}}
+SAVED_MODEL_JSON = {'name': 'benchmark', 'model': {'file': 'train'}}
+
+class CaseSkipped(Exception):
+    """
+    Raised by a case whose optional dependencies are not installed
+    """
+    pass
+
+def _peak_rss():
+    # ru_maxrss is reported in kilobytes on Linux (and in bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def write_asset_tree(assets_dir, num_assets, asset_size):
+    """
+    Writes num_assets random files of asset_size bytes under assets_dir, spread over nested
+    subdirectories of at most 100 files each
+    """
+    for i in range(num_assets):
+        write_random_file(
+            os.path.join(assets_dir, 'dir-{}'.format(i // 100), 'asset-{}.bin'.format(i)),
+            asset_size
+        )
+    os.makedirs(assets_dir, exist_ok=True)
+    return assets_dir
+
+def write_fake_saved_model(saved_model_dir, model_size):
+    """
+    Writes a directory laid out like a SavedModel, whose variables file holds model_size random
+    bytes. It can be bundled but not converted.
+    """
+    write_random_file(os.path.join(saved_model_dir, 'saved_model.pb'), 64 * 1024)
+    write_random_file(os.path.join(saved_model_dir, 'variables', 'variables.index'), 1024)
+    write_random_file(
+        os.path.join(saved_model_dir, 'variables', 'variables.data-00000-of-00001'),
+        model_size
+    )
+    return saved_model_dir
+
+def write_saved_model(saved_model_dir, model_size):
+    """
+    Writes a convertible SavedModel with a single dense layer of about model_size bytes of float32
+    weights. Requires TensorFlow.
+    """
+    try:
+        import tensorflow as tf
+    except ImportError:
+        raise CaseSkipped('tensorflow is not installed')
+    width = max(1, int((model_size / 4) ** 0.5))
+    graph = tf.Graph()
+    with graph.as_default():
+        inputs = tf.compat.v1.placeholder(tf.float32, [1, width], name='inputs')
+        weights = tf.Variable(tf.random.normal([width, width]), name='weights')
+        outputs = tf.matmul(inputs, weights, name='outputs')
+        with tf.compat.v1.Session(graph=graph) as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+            tf.compat.v1.saved_model.simple_save(
+                session,
+                saved_model_dir,
+                {'inputs': inputs},
+                {'outputs': outputs}
+            )
+    return saved_model_dir
+
+def _write_json(path, contents):
+    with open(path, 'w') as outfile:
+        json.dump(contents, outfile)
+    return path
+
+def _bundle_sources(scratch, case):
+    # Writes the sources of a bundle for the given case, and returns (model path, model.json path,
+    # assets path)
+    assets_dir = write_asset_tree(
+        os.path.join(scratch, 'assets'),
+        case['num_assets'],
+        case['asset_size']
+    )
+    if case['name'] == TFLITE_BUNDLE:
+        model_path = write_random_file(os.path.join(scratch, 'model.tflite'), case['model_size'])
+        model_json_path = _write_json(os.path.join(scratch, 'model.json'), MODEL_JSON)
+    else:
+        model_path = write_fake_saved_model(os.path.join(scratch, 'train'), case['model_size'])
+        model_json_path = _write_json(os.path.join(scratch, 'model.json'), SAVED_MODEL_JSON)
+    return model_path, model_json_path, assets_dir
+
+def run_case(case):
+    """
+    Runs a single case in this interpreter (which should be a fresh one, so that its peak RSS is
+    that of the case alone)
+
+    Returns: Dictionary of measurements
+    """
+    # Imported here so that their import does not count towards the measurements of the parent
+    os.environ['CONVERSION_WORKERS'] = '0'
+    from tensorio_bundler import bundler, metrics
+
+    with ScratchDirectory() as scratch:
+        outfile = os.path.join(scratch, 'output', 'benchmark.tiobundle.zip')
+        os.makedirs(os.path.dirname(outfile))
+        if case['name'] == CONVERSION:
+            saved_model_dir = write_saved_model(
+                os.path.join(scratch, 'saved_model'),
+                case['model_size']
+            )
+            tflite_path = os.path.join(scratch, 'output', 'model.tflite')
+            baseline_rss = _peak_rss()
+            start = time.perf_counter()
+            # Latency measurement is left out so that the case times the conversion alone
+            bundler.tflite_build_from_saved_model(saved_model_dir, tflite_path, latency_runs=0)
+        elif case['name'] == ENDPOINT:
+            try:
+                from falcon import testing
+                from tensorio_bundler import rest
+            except ImportError:
+                raise CaseSkipped('falcon is not installed')
+            model_path, model_json_path, assets_dir = _bundle_sources(
+                scratch,
+                dict(case, name=SAVED_MODEL_BUNDLE)
+            )
+            client = testing.TestClient(rest.api)
+            baseline_rss = _peak_rss()
+            start = time.perf_counter()
+            response = client.simulate_post('/bundle', json={
+                'saved_model_dir': model_path,
+                'build': bundler.SAVED_MODEL,
+                'model_json_path': model_json_path,
+                'assets_path': assets_dir,
+                'bundle_name': 'benchmark.tiobundle',
+                'bundle_output_path': outfile
+            })
+            if response.status_code != 200:
+                raise RuntimeError('POST /bundle failed: {}'.format(response.text))
+        else:
+            model_path, model_json_path, assets_dir = _bundle_sources(scratch, case)
+            baseline_rss = _peak_rss()
+            start = time.perf_counter()
+            bundler.tiobundle_build(
+                model_path,
+                model_json_path,
+                assets_dir,
+                'benchmark.tiobundle',
+                outfile
+            )
+        seconds = time.perf_counter() - start
+
+    return {
+        'seconds': seconds,
+        'peak_rss': _peak_rss(),
+        # Peak RSS beyond that reached while synthesizing the sources; only meaningful if the case
+        # itself raised the peak
+        'peak_rss_increase': max(0, _peak_rss() - baseline_rss),
+        'bytes_read': metrics.BYTES_READ.value(),
+        'bytes_written': metrics.BYTES_WRITTEN.value(),
+        'stages': {
+            stage: {'count': count, 'seconds': total}
+            for stage, count, total in metrics.stage_summary()
+        }
+    }
+
+def measure_case(case, repeat):
+    """
+    Runs case repeat times, each in a fresh interpreter
+
+    Returns: Dictionary describing the case and its measurements (the fastest run, with the lowest
+    peak RSS of any run), or the reason it was skipped or failed
+    """
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.suite', '--run-case', json.dumps(case)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        lines = process.stdout.decode('utf-8').strip().splitlines()
+        if process.returncode != 0 or len(lines) == 0:
+            return dict(case, status='failed', error=process.stderr.decode('utf-8')[-2000:])
+        run = json.loads(lines[-1])
+        if run.get('skipped') is not None:
+            return dict(case, status='skipped', reason=run['skipped'])
+        runs.append(run)
+
+    result = dict(min(runs, key=lambda run: run['seconds']))
+    result['peak_rss'] = min(run['peak_rss'] for run in runs)
+    result['peak_rss_increase'] = min(run['peak_rss_increase'] for run in runs)
+    result.update(case)
+    result['status'] = 'succeeded'
+    return result
+
+def case_id(case):
+    """
+    Returns: String identifying a case by its parameters, used to match cases between reports
+    """
+    if case['name'] in ASSET_CASES:
+        return '{}/model={}/assets={}x{}'.format(
+            case['name'],
+            case['model_size'],
+            case['num_assets'],
+            case['asset_size']
+        )
+    return '{}/model={}'.format(case['name'], case['model_size'])
+
+def generate_cases(names, model_sizes, asset_counts, asset_size):
+    """
+    Returns: List of cases for every combination of the given parameters
+    """
+    cases = []
+    for name in names:
+        if name in ASSET_CASES:
+            for model_size, num_assets in itertools.product(model_sizes, asset_counts):
+                cases.append({
+                    'name': name,
+                    'model_size': model_size,
+                    'num_assets': num_assets,
+                    'asset_size': asset_size
+                })
+        else:
+            for model_size in model_sizes:
+                cases.append({'name': name, 'model_size': model_size})
+    return cases
+
+def _git_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('utf-8').strip()
+
+def print_results(results, baseline=None):
+    """
+    Prints a table of results, with the relative change in time and peak RSS against the matching
+    cases of a baseline report if one is given
+    """
+    baseline_results = {}
+    if baseline is not None:
+        baseline_results = {
+            case_id(result): result for result in baseline['results']
+            if result.get('status') == 'succeeded'
+        }
+    print('{:<56} {:>10} {:>12} {:>12} {:>12}'.format(
+        'case',
+        'seconds',
+        'peak RSS',
+        'read',
+        'written'
+    ))
+    for result in results:
+        identifier = case_id(result)
+        if result['status'] != 'succeeded':
+            print('{:<56} {}'.format(identifier, result['status']))
+            continue
+        line = '{:<56} {:>10.3f} {:>12} {:>12} {:>12}'.format(
+            identifier,
+            result['seconds'],
+            format_bytes(result['peak_rss']),
+            format_bytes(result['bytes_read']),
+            format_bytes(result['bytes_written'])
+        )
+        previous = baseline_results.get(identifier)
+        if previous is not None:
+            line += '  time {:+.1%} rss {:+.1%}'.format(
+                result['seconds'] / previous['seconds'] - 1,
+                result['peak_rss'] / previous['peak_rss'] - 1
+            )
+        print(line)
+
+def _parse_sizes(value):
+    return [int(size) for size in value.split(',') if size.strip() != '']
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite for the bundler')
+    parser.add_argument(
+        '--cases',
+        default=','.join(CASES),
+        help='Comma-separated list of cases to run (default: {})'.format(','.join(CASES))
+    )
+    parser.add_argument(
+        '--model-sizes',
+        default='1048576,16777216,134217728',
+        help='Comma-separated list of sizes (in bytes) of the synthetic models'
+    )
+    parser.add_argument(
+        '--asset-counts',
+        default='10,1000',
+        help='Comma-separated list of numbers of asset files'
+    )
+    parser.add_argument(
+        '--asset-size',
+        type=int,
+        default=4096,
+        help='Size (in bytes) of each asset file'
+    )
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each case')
+    parser.add_argument('--output', required=False, help='Path at which to write the JSON report')
+    parser.add_argument(
+        '--baseline',
+        required=False,
+        help='JSON report (e.g. from another commit) against which to compare the results'
+    )
+    parser.add_argument('--run-case', required=False, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case is not None:
+        try:
+            result = run_case(json.loads(args.run_case))
+        except CaseSkipped as e:
+            result = {'skipped': str(e)}
+        print(json.dumps(result))
+        return
+
+    cases = generate_cases(
+        [name.strip() for name in args.cases.split(',')],
+        _parse_sizes(args.model_sizes),
+        _parse_sizes(args.asset_counts),
+        args.asset_size
+    )
+    results = [measure_case(case, args.repeat) for case in cases]
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results
+    }
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+    print_results(results, baseline)
+
+    if args.output is not None:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -19,7 +19,7 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/doc-ai/tensorio-bundler",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmarks"]),
     install_requires=requirements,
     classifiers=[
         "Programming Language :: Python :: 3",
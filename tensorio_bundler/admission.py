@@ -0,0 +1,328 @@
+"""
+Admission control for bundle builds: each build is admitted once the memory and CPUs it is
+estimated to need are available, so that a burst of large builds queues instead of exhausting the
+memory of the process
+"""
+
+import asyncio
+import collections
+import math
+import os
+import threading
+import time
+
+from . import benchmark, bundler, filetree, metrics
+
+# Memory taken by a TFLite conversion, on top of a multiple of the size of the SavedModel being
+# converted (the converter holds the graph, its weights and the flatbuffer it builds at once)
+CONVERSION_BASE_MEMORY = 512 * 1024 * 1024
+CONVERSION_MEMORY_FACTOR = 3
+
+# Memory taken by a build besides the files it holds in memory while bundling them (at most
+# bundler.DEFAULT_MAX_INFLIGHT_BYTES at once)
+BUNDLE_BASE_MEMORY = 32 * 1024 * 1024
+
+DEFAULT_MAX_QUEUED = 20
+
+# Seconds after which a client refused admission is told to retry, until builds have completed
+# from which to estimate the wait
+DEFAULT_RETRY_AFTER = 30
+
+# Weight of the most recent build in the moving average of build durations
+DURATION_SMOOTHING = 0.2
+
+# Estimated resources needed by a build: bytes of memory and CPUs
+Cost = collections.namedtuple('Cost', ['memory_bytes', 'cpus'])
+
+class AdmissionQueueFullError(Exception):
+    """
+    Raised if a build cannot be admitted straight away and the admission queue is full.
+    retry_after is the number of seconds after which the build is likely to be admitted.
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _tree_bytes(path):
+    # Total size of the files under the directory at path, or 0 if there is no directory there (in
+    # which case the build fails before it uses any resources)
+    if not path:
+        return 0
+    tree = filetree.scan_if_directory(path)
+    if tree is None:
+        return 0
+    return sum(stat.size for stat in tree.files.values())
+
+def estimate_cost(spec):
+    """
+    Estimates the resources needed by the build described by a bundle specification from the sizes
+    of its SavedModel and assets, which are listed (but not read). A TFLite build needs memory for
+    the conversion of the SavedModel, followed by memory for the files being bundled; a build with
+    a benchmark needs as many CPUs as the largest thread count it benchmarks.
+
+    Returns: Cost
+    """
+    model_bytes = _tree_bytes(spec.get('saved_model_dir'))
+    asset_bytes = _tree_bytes(spec.get('assets_path'))
+    inflight_bytes = min(max(model_bytes, asset_bytes), bundler.DEFAULT_MAX_INFLIGHT_BYTES)
+    memory_bytes = BUNDLE_BASE_MEMORY + inflight_bytes
+    cpus = 1
+    if spec.get('build') == bundler.TFLITE:
+        memory_bytes = max(
+            memory_bytes,
+            CONVERSION_BASE_MEMORY + CONVERSION_MEMORY_FACTOR * model_bytes
+        )
+    if spec.get('benchmark'):
+        try:
+            options = benchmark.parse_options(spec['benchmark'])
+            cpus = max(options.thread_counts)
+        except benchmark.InvalidBenchmarkOptionsError:
+            pass
+    return Cost(memory_bytes, cpus)
+
+class Admission:
+    """
+    Resources granted to a build by an AdmissionController, which are returned to it by release
+    (or on leaving the admission as a context manager)
+    """
+    def __init__(self, controller, cost):
+        self.controller = controller
+        self.cost = cost
+        self.queued_at = time.monotonic()
+        self.admitted_at = None
+        self.wait_seconds = None
+        self._granted = False
+        self._on_grant = None
+        self._released = False
+
+    def release(self):
+        """
+        Returns the resources of the build to its controller, admitting any builds waiting for them
+        """
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class AdmissionController:
+    """
+    Admits builds while the memory and CPUs they are estimated to need (see estimate_cost) fit in
+    the budgets of the process; a budget of None is unlimited. Builds which do not fit wait in
+    order of arrival, so large builds are not starved by small ones. A build which needs more than
+    a whole budget is admitted once nothing else is running.
+
+    At most max_queued builds may wait; further builds are refused with an AdmissionQueueFullError
+    unless they are queued unbounded, by callers which bound the number of builds they have in
+    flight themselves (e.g. the workers of a job manager or batch).
+
+    Thread-safe; builds may be admitted from threads (admit, acquire) and coroutines
+    (acquire_async).
+    """
+    def __init__(self, memory_budget=None, cpu_budget=None, max_queued=DEFAULT_MAX_QUEUED):
+        self.memory_budget = memory_budget
+        self.cpu_budget = cpu_budget
+        self.max_queued = max_queued
+        self.memory_in_use = 0
+        self.cpus_in_use = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.mean_duration = None
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+
+    def _fits(self, cost):
+        if self.running == 0:
+            return True
+        if self.memory_budget is not None:
+            if self.memory_in_use + cost.memory_bytes > self.memory_budget:
+                return False
+        if self.cpu_budget is not None and self.cpus_in_use + cost.cpus > self.cpu_budget:
+            return False
+        return True
+
+    def _grant(self, admission):
+        # Must be called with the lock held
+        self.memory_in_use += admission.cost.memory_bytes
+        self.cpus_in_use += admission.cost.cpus
+        self.running += 1
+        self.admitted += 1
+        admission.admitted_at = time.monotonic()
+
+    def _retry_after(self):
+        # Must be called with the lock held. Builds run about running at a time, so the queue
+        # drains after about (queued + 1) / running builds' durations.
+        if self.mean_duration is None:
+            return DEFAULT_RETRY_AFTER
+        rounds = math.ceil((len(self._queue) + 1) / max(self.running, 1))
+        return max(1, math.ceil(rounds * self.mean_duration))
+
+    def check(self, bounded=True):
+        """
+        Raises an AdmissionQueueFullError if a build would currently be refused, so that callers
+        can refuse it before estimating its cost
+        """
+        with self._lock:
+            if bounded and len(self._queue) >= self.max_queued:
+                self._reject()
+
+    def _reject(self):
+        # Must be called with the lock held
+        self.rejected += 1
+        metrics.ADMISSION_REJECTIONS.inc()
+        raise AdmissionQueueFullError(
+            'ERROR: {} bundle builds are already waiting to be admitted'.format(len(self._queue)),
+            self._retry_after()
+        )
+
+    def _enqueue(self, cost, bounded, on_grant):
+        # Admits a build straight away if it fits (returning its Admission, granted) or queues it
+        # (returning its Admission, not granted); on_grant is called when a queued build is
+        # admitted
+        admission = Admission(self, cost)
+        with self._lock:
+            if not self._queue and self._fits(cost):
+                self._grant(admission)
+                admission._granted = True
+                return admission
+            if bounded and len(self._queue) >= self.max_queued:
+                self._reject()
+            admission._on_grant = on_grant
+            self._queue.append(admission)
+            metrics.ADMISSION_QUEUE_DEPTH.inc()
+        return admission
+
+    def _admitted(self, admission):
+        wait_seconds = admission.admitted_at - admission.queued_at
+        admission.wait_seconds = wait_seconds
+        metrics.ADMISSION_WAIT.observe(wait_seconds)
+        with self._lock:
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        return admission
+
+    def _release(self, admission):
+        granted = []
+        with self._lock:
+            if not admission._granted:
+                # Cancelled while it was waiting
+                self._queue.remove(admission)
+                metrics.ADMISSION_QUEUE_DEPTH.dec()
+            else:
+                self.memory_in_use -= admission.cost.memory_bytes
+                self.cpus_in_use -= admission.cost.cpus
+                self.running -= 1
+                duration = time.monotonic() - admission.admitted_at
+                if self.mean_duration is None:
+                    self.mean_duration = duration
+                else:
+                    self.mean_duration += DURATION_SMOOTHING * (duration - self.mean_duration)
+            while self._queue and self._fits(self._queue[0].cost):
+                waiting = self._queue.popleft()
+                metrics.ADMISSION_QUEUE_DEPTH.dec()
+                self._grant(waiting)
+                waiting._granted = True
+                granted.append(waiting)
+        for waiting in granted:
+            waiting._on_grant()
+
+    def acquire(self, cost, bounded=True):
+        """
+        Waits until a build with the given Cost is admitted.
+
+        Raises an AdmissionQueueFullError if the build has to wait and bounded is True, but
+        max_queued builds are already waiting.
+
+        Returns: Admission, to be released once the build is done
+        """
+        granted = threading.Event()
+        admission = self._enqueue(cost, bounded, granted.set)
+        if not admission._granted:
+            granted.wait()
+        return self._admitted(admission)
+
+    async def acquire_async(self, cost, bounded=True):
+        """
+        Same as acquire, for coroutines; waiting for admission does not block the event loop. If
+        the waiting coroutine is cancelled, the build leaves the queue.
+        """
+        loop = asyncio.get_event_loop()
+        granted = loop.create_future()
+
+        def on_grant():
+            loop.call_soon_threadsafe(
+                lambda: granted.done() or granted.set_result(None)
+            )
+
+        admission = self._enqueue(cost, bounded, on_grant)
+        if not admission._granted:
+            try:
+                await granted
+            except asyncio.CancelledError:
+                admission.release()
+                raise
+        return self._admitted(admission)
+
+    def admit(self, spec, bounded=True):
+        """
+        Estimates the cost of the build described by a bundle specification (see estimate_cost)
+        and waits until it is admitted (see acquire). Full queues are detected before the cost is
+        estimated.
+
+        Returns: Admission, to be released once the build is done; usable as a context manager
+        """
+        self.check(bounded)
+        return self.acquire(estimate_cost(spec), bounded)
+
+    def stats(self):
+        """
+        Returns: Dictionary of the budgets and the resources in use, the numbers of builds running
+        and queued (waiting to be admitted), admitted and rejected so far, and the mean and
+        maximum seconds for which builds waited to be admitted
+        """
+        with self._lock:
+            return {
+                'memory_budget_bytes': self.memory_budget,
+                'cpu_budget': self.cpu_budget,
+                'memory_in_use_bytes': self.memory_in_use,
+                'cpus_in_use': self.cpus_in_use,
+                'running': self.running,
+                'queued': len(self._queue),
+                'max_queued': self.max_queued,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'mean_wait_seconds': (
+                    self.total_wait_seconds / self.admitted if self.admitted else None
+                ),
+                'max_wait_seconds': self.max_wait_seconds
+            }
+
+def from_environment():
+    """
+    Creates an AdmissionController from the ADMISSION_MEMORY_BYTES and ADMISSION_CPUS environment
+    variables (the budgets of this process; either may be omitted) and the (optional)
+    ADMISSION_QUEUE_SIZE environment variable.
+
+    The budgets are not shared between processes: builds are only bounded by them if every request
+    is admitted by this process, so the API must run as a single (threaded or ASGI) worker process,
+    as it does in the Dockerfile. With several worker processes, each would admit builds up to the
+    whole budget.
+
+    Returns: AdmissionController, or None if neither budget is set
+    """
+    memory_budget = os.environ.get('ADMISSION_MEMORY_BYTES')
+    cpu_budget = os.environ.get('ADMISSION_CPUS')
+    if not memory_budget and not cpu_budget:
+        return None
+    return AdmissionController(
+        memory_budget=int(memory_budget) if memory_budget else None,
+        cpu_budget=int(cpu_budget) if cpu_budget else None,
+        max_queued=int(os.environ.get('ADMISSION_QUEUE_SIZE', DEFAULT_MAX_QUEUED))
+    )
@@ -0,0 +1,486 @@
+"""
+Asyncio-native (ASGI) variant of the TensorIO Bundler REST API, for serving many concurrent bundle
+requests from a single process. Serve it with any ASGI server, e.g.:
+    uvicorn tensorio_bundler.asgi:app
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import json
+import os
+import urllib.parse
+
+from . import (
+    admission,
+    blobstore,
+    cache,
+    conversion,
+    dedup,
+    jobs,
+    metrics,
+    pipeline,
+    reader,
+    sse
+)
+
+# Number of threads on which bundles are built (each of which fetches and compresses its files on
+# its own pool of fetch workers) and on which bundles are registered against repositories
+DEFAULT_BUNDLE_WORKERS = 8
+DEFAULT_REGISTRATION_WORKERS = 16
+
+JSON_CONTENT_TYPE = 'application/json; charset=utf-8'
+TEXT_CONTENT_TYPE = 'text/plain; charset=utf-8'
+
+class HTTPError(Exception):
+    """
+    Raised by request handlers to respond with the given HTTP status code. The body of the response
+    is a JSON object with the title and (optional) description of the error, and its headers are
+    the given list of (name, value) pairs.
+    """
+    def __init__(self, status, title, description=None, headers=()):
+        super().__init__(description or title)
+        self.status = status
+        self.title = title
+        self.description = description
+        self.headers = list(headers)
+
+def _http_error(error):
+    # HTTPError corresponding to an error raised while building a bundle. Descriptions of internal
+    # server errors are not exposed to clients.
+    code = pipeline.status_code(error)
+    if code == 500:
+        return HTTPError(500, 'Internal Server Error')
+    if isinstance(error, admission.AdmissionQueueFullError):
+        return HTTPError(
+            429,
+            'Too Many Requests',
+            str(error),
+            [('retry-after', str(error.retry_after))]
+        )
+    return HTTPError(code, 'Bundle request failed', str(error))
+
+def _header(scope, name):
+    # Value of the (first) request header with the given lowercase name, or None
+    for header_name, value in scope.get('headers', []):
+        if header_name.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+class AsyncBundleService:
+    """
+    Builds bundles from coroutines. Each blocking stage of a build runs on an executor sized for
+    that stage: conversions on one thread per conversion worker (which waits for the worker
+    process), bundling on bundle_workers threads and registration on registration_workers threads.
+    Requests beyond those limits wait on the event loop, where they only hold a coroutine, so a
+    single process can have hundreds of bundle requests in flight without its memory growing with
+    them. If an admission_controller is given, each build also waits on the event loop until the
+    resources it is estimated to need are available (see admission.AdmissionController).
+    """
+    def __init__(
+            self,
+            conversion_cache=None,
+            conversion_executor=None,
+            conversion_workers=conversion.DEFAULT_MAX_WORKERS,
+            bundle_workers=DEFAULT_BUNDLE_WORKERS,
+            registration_workers=DEFAULT_REGISTRATION_WORKERS,
+            max_jobs=jobs.DEFAULT_MAX_ASYNC_JOBS,
+            request_coalescer=None,
+            asset_store=None,
+            admission_controller=None
+        ):
+        self.conversion_cache = conversion_cache
+        self.asset_store = asset_store
+        self.admission_controller = admission_controller
+        self.conversion_executor = conversion_executor
+        self.request_coalescer = request_coalescer or dedup.RequestCoalescer()
+        self._conversion_threads = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, conversion_workers)
+        )
+        self._bundle_threads = concurrent.futures.ThreadPoolExecutor(max_workers=bundle_workers)
+        self._registration_threads = concurrent.futures.ThreadPoolExecutor(
+            max_workers=registration_workers
+        )
+        # Benchmarks run alongside conversions, on the conversion executor if there is one
+        self._stage_threads = {
+            pipeline.CONVERSION_STAGE: self._conversion_threads,
+            pipeline.BENCHMARK_STAGE: self._conversion_threads,
+            pipeline.BUNDLE_STAGE: self._bundle_threads,
+            pipeline.REGISTRATION_STAGE: self._registration_threads
+        }
+        self.job_manager = jobs.AsyncJobManager(
+            max_active=max_jobs,
+            error_status=pipeline.status_code
+        )
+
+    async def _run(self, executor, fn, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    async def bundle(self, spec, progress=None, bounded=True):
+        """
+        Builds (and, if spec specifies a repository_path, registers) the bundle described by the
+        given specification, which is assumed to have been checked by pipeline.validate_spec. See
+        pipeline.bundle_from_spec for the arguments and the result; progress is called from the
+        threads which run the stages, as well as from the event loop.
+
+        If the service has an admission controller, the build first waits to be admitted; unless
+        bounded is False, it raises an admission.AdmissionQueueFullError if it has to wait but the
+        admission queue is full.
+        """
+        with metrics.counting_errors():
+            if self.admission_controller is None:
+                return await self._bundle(spec, progress)
+            self.admission_controller.check(bounded)
+            cost = await self._run(self._bundle_threads, admission.estimate_cost, spec)
+            granted = await self.admission_controller.acquire_async(cost, bounded)
+            try:
+                return await self._bundle(spec, progress)
+            finally:
+                granted.release()
+
+    async def _bundle(self, spec, progress):
+        # Runs the steps of the build (see pipeline.bundle_steps), each on the executor of its stage
+        steps = pipeline.bundle_steps(
+            spec,
+            conversion_cache=self.conversion_cache,
+            conversion_executor=self.conversion_executor,
+            progress=progress,
+            asset_store=self.asset_store
+        )
+        result = None
+        while True:
+            try:
+                stage, step = steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result = await self._run(self._stage_threads[stage], step)
+
+    async def inspect(self, bundle_path, entry_paths=()):
+        """
+        Describes the zipped tiobundle at bundle_path (see reader.inspect_bundle) on one of the
+        bundling threads
+
+        Returns: Dictionary describing the bundle
+        """
+        return await self._run(
+            self._bundle_threads,
+            reader.inspect_bundle,
+            bundle_path,
+            entry_paths
+        )
+
+    async def bundle_once(self, spec, idempotency_key=None, progress=None, bounded=True):
+        """
+        Same as bundle, except that identical requests share a single build (see
+        dedup.RequestCoalescer)
+        """
+        return await self.request_coalescer.run_async(
+            spec,
+            self.bundle,
+            spec,
+            idempotency_key=idempotency_key,
+            progress=progress,
+            bounded=bounded
+        )
+
+    def submit(self, spec, idempotency_key=None):
+        """
+        Starts building the bundle described by spec in the background (see bundle_once). The
+        number of background builds is bounded by the job manager, so they wait to be admitted
+        however many builds are queued.
+
+        Raises a jobs.JobQueueFullError if too many bundles are already in flight.
+
+        Returns: jobs.Job
+        """
+        return self.job_manager.submit(
+            self.bundle_once,
+            spec,
+            idempotency_key=idempotency_key,
+            bounded=False
+        )
+
+    def stats(self):
+        """
+        Returns: Dictionary of statistics, as reported by GET /stats
+        """
+        return {
+            'conversion_cache': (
+                self.conversion_cache.stats() if self.conversion_cache is not None else None
+            ),
+            'asset_store': self.asset_store.stats() if self.asset_store is not None else None,
+            'jobs': self.job_manager.stats(),
+            'deduplication': self.request_coalescer.stats(),
+            'admission': (
+                self.admission_controller.stats() if self.admission_controller is not None
+                else None
+            )
+        }
+
+    async def shutdown(self):
+        """
+        Waits for the bundles in flight to finish, then stops the executors
+        """
+        await self.job_manager.join()
+        for executor in [
+                self._conversion_threads,
+                self._bundle_threads,
+                self._registration_threads
+            ]:
+            executor.shutdown(wait=True)
+        if self.conversion_executor is not None:
+            self.conversion_executor.shutdown()
+
+def from_environment():
+    """
+    Creates an AsyncBundleService configured by the same environment variables as the REST API
+    (CONVERSION_CACHE_DIR, CONVERSION_WORKERS, DEDUP_TTL, ...), and by the (optional)
+    ASYNC_BUNDLE_WORKERS, ASYNC_REGISTRATION_WORKERS and ASYNC_MAX_JOBS environment variables.
+
+    Returns: AsyncBundleService
+    """
+    return AsyncBundleService(
+        conversion_cache=cache.from_environment(),
+        conversion_executor=conversion.from_environment(),
+        conversion_workers=int(
+            os.environ.get('CONVERSION_WORKERS', conversion.DEFAULT_MAX_WORKERS)
+        ),
+        bundle_workers=int(os.environ.get('ASYNC_BUNDLE_WORKERS', DEFAULT_BUNDLE_WORKERS)),
+        registration_workers=int(
+            os.environ.get('ASYNC_REGISTRATION_WORKERS', DEFAULT_REGISTRATION_WORKERS)
+        ),
+        max_jobs=int(os.environ.get('ASYNC_MAX_JOBS', jobs.DEFAULT_MAX_ASYNC_JOBS)),
+        request_coalescer=dedup.from_environment(),
+        asset_store=blobstore.from_environment(),
+        admission_controller=admission.from_environment()
+    )
+
+class BundleApp:
+    """
+    ASGI application serving the same routes as the REST API (except for POST /bundles):
+    GET /ping, GET /stats, GET /metrics, POST /bundle, GET /bundle/inspect and
+    GET /jobs/<job_id>. The service is created from the environment when the application starts,
+    unless one is given. Event streams of bundle builds send a heartbeat after heartbeat_interval
+    seconds without events (by default, sse.heartbeat_interval_from_environment()).
+    """
+    def __init__(self, service=None, heartbeat_interval=None):
+        self.service = service
+        if heartbeat_interval is None:
+            heartbeat_interval = sse.heartbeat_interval_from_environment()
+        self.heartbeat_interval = heartbeat_interval
+        self.routes = {
+            ('GET', '/ping'): self.ping,
+            ('GET', '/stats'): self.stats,
+            ('GET', '/metrics'): self.metrics,
+            ('POST', '/bundle'): self.bundle,
+            ('GET', '/bundle/inspect'): self.inspect
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.service is None:
+                    self.service = from_environment()
+                if self.service.conversion_executor is not None:
+                    self.service.conversion_executor.start_in_background()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.service is not None:
+                    await self.service.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _route(self, method, path):
+        # Returns the handler for the request and the arguments extracted from its path
+        if path.startswith('/jobs/') and path.count('/') == 2:
+            if method != 'GET':
+                raise HTTPError(405, 'Method Not Allowed')
+            return self.job, [path[len('/jobs/'):]]
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                raise HTTPError(405, 'Method Not Allowed')
+            raise HTTPError(404, 'Not Found')
+        return handler, []
+
+    async def _http(self, scope, receive, send):
+        if self.service is None:
+            self.service = from_environment()
+        handler_name = None
+        body = None
+        try:
+            handler, args = self._route(scope['method'], scope['path'])
+            handler_name = handler.__name__
+            metrics.REQUESTS_IN_PROGRESS.inc(handler_name)
+            status, content_type, body, headers = await handler(scope, receive, *args)
+        except HTTPError as e:
+            error = {'title': e.title}
+            if e.description is not None:
+                error['description'] = e.description
+            status, content_type, body, headers = e.status, JSON_CONTENT_TYPE, error, e.headers
+        finally:
+            if handler_name is not None and not isinstance(body, sse.AsyncEventStream):
+                metrics.REQUESTS_IN_PROGRESS.dec(handler_name)
+
+        if isinstance(body, sse.AsyncEventStream):
+            # The request is handled until its stream ends, and counted with the status code of
+            # the final event of the stream
+            try:
+                await self._send_event_stream(send, status, body, headers)
+            finally:
+                metrics.REQUESTS_IN_PROGRESS.dec(handler_name)
+                metrics.REQUESTS.inc(handler_name, body.status)
+            return
+        if handler_name is not None:
+            metrics.REQUESTS.inc(handler_name, status)
+        if content_type == JSON_CONTENT_TYPE:
+            body = json.dumps(body)
+        body = body.encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', content_type.encode('latin-1')),
+                (b'content-length', str(len(body)).encode('latin-1'))
+            ] + [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _send_event_stream(self, send, status, stream, headers):
+        # Sends the frames of the stream as they are produced, in a response of unknown length
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', sse.CONTENT_TYPE.encode('latin-1')),
+                (b'cache-control', b'no-cache')
+            ] + [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        })
+        async for frame in stream.frames():
+            await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _read_json(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(400, 'Invalid request', 'Client disconnected')
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        try:
+            return json.loads(b''.join(chunks).decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, 'Malformed JSON', 'Could not parse the request body as JSON')
+
+    async def ping(self, scope, receive):
+        """
+        Returns status code 200 with body "ok". Intended for uptime checks.
+        """
+        return 200, TEXT_CONTENT_TYPE, 'ok', []
+
+    async def stats(self, scope, receive):
+        """
+        Returns status code 200 with a JSON body of statistics (see rest.StatsHandler)
+        """
+        return 200, JSON_CONTENT_TYPE, self.service.stats(), []
+
+    async def metrics(self, scope, receive):
+        """
+        Returns status code 200 with the metrics of this process in the Prometheus text format
+        """
+        return 200, metrics.CONTENT_TYPE, metrics.registry.render(), []
+
+    async def bundle(self, scope, receive):
+        """
+        Accepts the same request bodies, and gives the same responses, as
+        rest.BundleHandler.on_post. While a bundle is built, the request only holds a coroutine;
+        with "async": true, bundles are built in the background and may be polled at
+        /jobs/<job_id>. Requests which accept sse.CONTENT_TYPE are sent the progress of the build
+        as server-sent events.
+        """
+        spec = await self._read_json(receive)
+        if not isinstance(spec, dict):
+            raise HTTPError(400, 'Invalid request', 'Request body must be a JSON object')
+        try:
+            pipeline.validate_spec(spec)
+        except pipeline.BundleSpecificationError as e:
+            raise _http_error(e)
+
+        idempotency_key = _header(scope, b'idempotency-key')
+        if spec.get('async', False):
+            try:
+                job = self.service.submit(spec, idempotency_key)
+            except jobs.JobQueueFullError as e:
+                raise HTTPError(503, 'Service Unavailable', str(e))
+            return (
+                202,
+                JSON_CONTENT_TYPE,
+                {'job_id': job.id, 'state': job.state},
+                [('location', '/jobs/{}'.format(job.id))]
+            )
+
+        if sse.accepts_event_stream(_header(scope, b'accept')):
+            # A full admission queue is reported with status code 429 before the stream starts
+            if self.service.admission_controller is not None:
+                try:
+                    self.service.admission_controller.check()
+                except admission.AdmissionQueueFullError as e:
+                    raise _http_error(e)
+            stream = sse.AsyncEventStream(heartbeat_interval=self.heartbeat_interval)
+            stream.follow(self.service.bundle_once, spec, idempotency_key)
+            return 200, sse.CONTENT_TYPE, stream, []
+
+        try:
+            result = await self.service.bundle_once(spec, idempotency_key)
+        except Exception as e:
+            raise _http_error(e)
+
+        response_body = result['bundle']
+        if result['registration'] is not None:
+            response_body = 'Bundle: {}, checkpoint: {}'.format(
+                result['bundle'],
+                result['registration']
+            )
+        return 200, TEXT_CONTENT_TYPE, response_body, []
+
+    async def inspect(self, scope, receive):
+        """
+        Accepts the same query parameters, and gives the same responses, as
+        rest.InspectHandler.on_get
+        """
+        params = urllib.parse.parse_qs(scope.get('query_string', b'').decode('utf-8'))
+        if 'path' not in params:
+            raise HTTPError(400, 'Missing parameter', 'The "path" parameter is required')
+        entry_paths = [
+            entry_path
+            for value in params.get('entries', [])
+            for entry_path in value.split(',')
+            if entry_path != ''
+        ]
+        try:
+            result = await self.service.inspect(params['path'][0], entry_paths)
+        except Exception as e:
+            raise _http_error(e)
+        return 200, JSON_CONTENT_TYPE, result, []
+
+    async def job(self, scope, receive, job_id):
+        """
+        Returns status code 200 with a JSON body describing the job with the given id, or status
+        code 404 if there is no such job (see rest.JobHandler)
+        """
+        job = self.service.job_manager.get(job_id)
+        if job is None:
+            raise HTTPError(404, 'Not Found', 'No job with id {}'.format(job_id))
+        return 200, JSON_CONTENT_TYPE, job.to_dict(), []
+
+app = BundleApp()
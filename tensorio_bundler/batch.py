@@ -0,0 +1,317 @@
+"""
+Builds many tiobundles in one invocation from a manifest of bundle specifications
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+from . import blobstore, cache, conversion, filesystem, pipeline
+
+DEFAULT_MAX_WORKERS = 4
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+class BatchManifestError(Exception):
+    """
+    Raised if a batch manifest cannot be parsed or does not contain a list of bundle
+    specifications.
+    """
+    pass
+
+def parse_manifest(contents):
+    """
+    Parses a batch manifest. A manifest is either a JSON list of bundle specifications, a JSON
+    object with the list under "bundles", or a JSON Lines file with one specification per line.
+
+    Raises a BatchManifestError if the manifest cannot be parsed.
+
+    Args:
+    1. contents - String contents of the manifest
+
+    Returns: List of bundle specifications (dictionaries)
+    """
+    try:
+        manifest = json.loads(contents)
+    except ValueError:
+        manifest = []
+        for line_number, line in enumerate(contents.splitlines(), start=1):
+            if line.strip() == '':
+                continue
+            try:
+                manifest.append(json.loads(line))
+            except ValueError as e:
+                raise BatchManifestError(
+                    'ERROR: Line {} of manifest is not valid JSON: {}'.format(line_number, e)
+                )
+
+    if isinstance(manifest, dict):
+        # A JSON Lines manifest with a single specification parses as a single object
+        manifest = manifest['bundles'] if 'bundles' in manifest else [manifest]
+    if not isinstance(manifest, list):
+        raise BatchManifestError('ERROR: Manifest does not contain a list of bundles')
+    for index, spec in enumerate(manifest):
+        if not isinstance(spec, dict):
+            raise BatchManifestError('ERROR: Bundle {} in manifest is not an object'.format(index))
+    return manifest
+
+def load_manifest(path):
+    """
+    Reads a batch manifest (see parse_manifest) from the given path, which may be local or remote
+
+    Returns: List of bundle specifications (dictionaries)
+    """
+    with filesystem.open(path, 'rb') as manifest_file:
+        return parse_manifest(manifest_file.read().decode('utf-8'))
+
+def validate_specs(specs):
+    """
+    Checks every specification in a batch with pipeline.validate_spec
+
+    Returns: Dictionary mapping the index of each invalid specification to the
+    pipeline.BundleSpecificationError raised for it (empty if all specifications are valid)
+    """
+    errors = {}
+    for index, spec in enumerate(specs):
+        try:
+            pipeline.validate_spec(spec)
+        except pipeline.BundleSpecificationError as e:
+            errors[index] = e
+    return errors
+
+def _error_dict(error):
+    return {
+        'type': type(error).__name__,
+        'message': str(error),
+        'status': pipeline.status_code(error)
+    }
+
+def _build(index, spec, conversion_cache, conversion_executor, asset_store, admission_controller):
+    timings = {}
+    stage_starts = {}
+
+    def record(event):
+        now = time.monotonic()
+        if event.get('event') == 'stage_started':
+            stage_starts[event.get('stage')] = now
+        elif event.get('event') == 'stage_finished':
+            stage = event.get('stage')
+            timings[stage] = now - stage_starts.pop(stage, now)
+
+    result = {
+        'index': index,
+        'bundle_name': spec.get('bundle_name'),
+        'status': FAILED,
+        'result': None,
+        'error': None,
+        'timings': timings
+    }
+    start = time.monotonic()
+    try:
+        pipeline.validate_spec(spec)
+        with contextlib.ExitStack() as stack:
+            if admission_controller is not None:
+                # The batch bounds the number of its builds in flight, so they are queued even if
+                # the admission queue is full
+                stack.enter_context(admission_controller.admit(spec, bounded=False))
+            result['result'] = pipeline.bundle_from_spec(
+                spec,
+                conversion_cache=conversion_cache,
+                conversion_executor=conversion_executor,
+                progress=record,
+                asset_store=asset_store
+            )
+        result['status'] = SUCCEEDED
+    except Exception as e:
+        result['error'] = _error_dict(e)
+    timings['total'] = time.monotonic() - start
+    return result
+
+def run_batch(
+        specs,
+        max_workers=DEFAULT_MAX_WORKERS,
+        conversion_cache=None,
+        conversion_executor=None,
+        progress=None,
+        asset_store=None,
+        admission_controller=None
+    ):
+    """
+    Builds the bundles described by the given specifications concurrently on a pool of threads.
+    The builds share a conversion cache, so that SavedModels which appear in several
+    specifications are only converted once. A failed build does not stop the others.
+
+    Args:
+    1. specs - List of bundle specifications (see rest.BundleHandler.on_post for their keys)
+    2. max_workers - Number of bundles to build at once
+    3. conversion_cache - (Optional) cache.ConversionCache; if None, a temporary cache is used for
+       the duration of the batch
+    4. conversion_executor - (Optional) conversion.ConversionExecutor on which to run TFLite
+       conversions
+    5. progress - (Optional) Function called with {"event": "bundle_finished", "index": <index>,
+       "status": <status>} as each bundle finishes
+    6. asset_store - (Optional) blobstore.BlobStore through which the builds read assets, so that
+       assets shared by several bundles are only fetched once
+    7. admission_controller - (Optional) admission.AdmissionController under which each build
+       waits until the resources it is estimated to need are available
+
+    Returns: List with one dictionary per specification, in the order of the specifications,
+    containing its "index", "bundle_name", "status" ("succeeded" or "failed"), "result" (as
+    returned by pipeline.bundle_from_spec), "error" and the "timings" (in seconds) of each stage
+    and of the whole build
+    """
+    temp_cache_dir = None
+    if conversion_cache is None:
+        temp_cache_dir = tempfile.mkdtemp()
+        conversion_cache = cache.ConversionCache(temp_cache_dir)
+
+    results = [None] * len(specs)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                executor.submit(
+                    _build,
+                    index,
+                    spec,
+                    conversion_cache,
+                    conversion_executor,
+                    asset_store,
+                    admission_controller
+                ): index
+                for index, spec in enumerate(specs)
+            }
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if progress is not None:
+                    progress({
+                        'event': 'bundle_finished',
+                        'index': result['index'],
+                        'status': result['status']
+                    })
+    finally:
+        if temp_cache_dir is not None:
+            shutil.rmtree(temp_cache_dir, ignore_errors=True)
+
+    return results
+
+def summarize(results):
+    """
+    Returns: Dictionary with the number of bundles in a batch which "succeeded" and "failed"
+    """
+    succeeded = sum(1 for result in results if result['status'] == SUCCEEDED)
+    return {SUCCEEDED: succeeded, FAILED: len(results) - succeeded}
+
+def generate_argument_parser():
+    """
+    Generates an argument parser for use in the batch CLI
+    """
+    parser = argparse.ArgumentParser('tensorio_bundler batch')
+    parser.add_argument(
+        '--manifest',
+        required=True,
+        help='Path to a JSON or JSON Lines manifest of bundle specifications'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help='Number of bundles to build at once'
+    )
+    parser.add_argument(
+        '--conversion-cache-dir',
+        required=False,
+        help=('Directory in which to cache TFLite conversions across batches (by default, a '
+              'temporary cache is shared by the bundles in the batch)')
+    )
+    parser.add_argument(
+        '--conversion-cache-max-bytes',
+        type=int,
+        default=cache.DEFAULT_MAX_BYTES,
+        help='Maximum total size of the conversion cache, in bytes'
+    )
+    parser.add_argument(
+        '--conversion-workers',
+        type=int,
+        default=conversion.DEFAULT_MAX_WORKERS,
+        help=('Number of worker processes on which to run TFLite conversions; 0 runs them in '
+              'this process')
+    )
+    parser.add_argument(
+        '--conversion-timeout',
+        type=float,
+        default=conversion.DEFAULT_TIMEOUT,
+        help='Timeout (in seconds) for each TFLite conversion'
+    )
+    parser.add_argument(
+        '--asset-store-dir',
+        required=False,
+        help=('Local directory in which to keep assets fetched from remote filesystems, so that '
+              'assets shared by bundles (in this and later batches) are fetched once')
+    )
+    parser.add_argument(
+        '--asset-store-max-bytes',
+        type=int,
+        default=blobstore.DEFAULT_MAX_BYTES,
+        help='Maximum total size of the asset store, in bytes'
+    )
+    parser.add_argument(
+        '--output',
+        required=False,
+        help='Path at which to write the JSON results of the batch (default: standard output)'
+    )
+    return parser
+
+if __name__ == '__main__':
+    parser = generate_argument_parser()
+    args = parser.parse_args()
+
+    specs = load_manifest(args.manifest)
+
+    conversion_cache = None
+    if args.conversion_cache_dir is not None:
+        conversion_cache = cache.ConversionCache(
+            args.conversion_cache_dir,
+            args.conversion_cache_max_bytes
+        )
+    asset_store = None
+    if args.asset_store_dir is not None:
+        asset_store = blobstore.BlobStore(args.asset_store_dir, args.asset_store_max_bytes)
+    conversion_executor = None
+    if args.conversion_workers > 0:
+        conversion_executor = conversion.ConversionExecutor(
+            max_workers=args.conversion_workers,
+            timeout=args.conversion_timeout
+        )
+
+    print('Building {} bundles with {} workers'.format(len(specs), args.workers), file=sys.stderr)
+    try:
+        results = run_batch(
+            specs,
+            max_workers=args.workers,
+            conversion_cache=conversion_cache,
+            conversion_executor=conversion_executor,
+            asset_store=asset_store
+        )
+    finally:
+        if conversion_executor is not None:
+            conversion_executor.shutdown()
+
+    summary = summarize(results)
+    report = json.dumps({'results': results, 'summary': summary}, indent=2)
+    if args.output is not None:
+        with filesystem.atomic_writer(args.output) as output_file:
+            output_file.write(report.encode('utf-8'))
+    else:
+        print(report)
+
+    print('Done! {} succeeded, {} failed'.format(summary[SUCCEEDED], summary[FAILED]),
+          file=sys.stderr)
+    if summary[FAILED] > 0:
+        sys.exit(1)
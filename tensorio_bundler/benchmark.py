@@ -0,0 +1,378 @@
+"""
+Benchmarks of converted TFLite models in the TFLite interpreter, fed synthetic inputs shaped by the
+"inputs" of their model.json, checked against latency and memory budgets
+
+TensorFlow and numpy are only imported by the functions which run interpreters, so that benchmark
+options can be parsed and reports checked without them.
+"""
+
+import inspect
+import json
+import math
+import os
+import time
+
+from . import filesystem
+
+# Number of timed invocations of the model for each thread count, after the warm-up invocations
+DEFAULT_RUNS = 50
+DEFAULT_WARMUP_RUNS = 5
+# Numbers of interpreter threads with which the model is benchmarked; budgets apply to the first
+DEFAULT_THREAD_COUNTS = (1, 2, 4)
+
+# Limits which may be set in a budget: warm p50 and p95 latency, and peak memory used by the
+# interpreter (resident memory above that of the process before the model was loaded)
+BUDGET_KEYS = ('p50_ms', 'p95_ms', 'peak_memory_bytes')
+
+# Suffix appended to the bundle output path to give the path of its benchmark report
+REPORT_SUFFIX = '.benchmark.json'
+
+# Seed of the generator of synthetic inputs, so that every benchmark of a model feeds it the same
+# inputs
+INPUT_SEED = 0
+
+class InvalidBenchmarkOptionsError(Exception):
+    """
+    Raised if benchmark options (runs, thread counts or budget) are not valid.
+    """
+    pass
+
+class BudgetExceededError(Exception):
+    """
+    Raised if a benchmarked model exceeds its latency or memory budget. The benchmark report is
+    available as the report attribute.
+    """
+    def __init__(self, report):
+        self.report = report
+        super().__init__(
+            'ERROR: Model exceeded its budget - {}'.format('; '.join(report['violations']))
+        )
+
+class BenchmarkOptions:
+    """
+    Settings for a benchmark: the number of warmup_runs and timed runs of the model for each of
+    the thread_counts, and its budget (a dictionary mapping some of the BUDGET_KEYS to limits).
+    """
+    def __init__(
+            self,
+            runs=DEFAULT_RUNS,
+            warmup_runs=DEFAULT_WARMUP_RUNS,
+            thread_counts=DEFAULT_THREAD_COUNTS,
+            budget=None
+        ):
+        self.runs = runs
+        self.warmup_runs = warmup_runs
+        self.thread_counts = tuple(thread_counts)
+        self.budget = dict(budget or {})
+
+    def validate(self):
+        """
+        Raises an InvalidBenchmarkOptionsError if the options are not valid
+
+        Returns: None
+        """
+        if not _is_count(self.runs) or self.runs < 1:
+            raise InvalidBenchmarkOptionsError('ERROR: Benchmark runs must be a positive integer')
+        if not _is_count(self.warmup_runs) or self.warmup_runs < 0:
+            raise InvalidBenchmarkOptionsError(
+                'ERROR: Benchmark warm-up runs must be a non-negative integer'
+            )
+        if not self.thread_counts or not all(
+                _is_count(threads) and threads >= 1 for threads in self.thread_counts
+            ):
+            raise InvalidBenchmarkOptionsError(
+                'ERROR: Benchmark thread counts must be a non-empty list of positive integers'
+            )
+        for key, limit in self.budget.items():
+            if key not in BUDGET_KEYS:
+                raise InvalidBenchmarkOptionsError(
+                    'ERROR: Budget keys must be among {}, not {}'.format(
+                        ', '.join(BUDGET_KEYS),
+                        key
+                    )
+                )
+            if isinstance(limit, bool) or not isinstance(limit, (int, float)) or limit <= 0:
+                raise InvalidBenchmarkOptionsError(
+                    'ERROR: Budget for {} must be a positive number'.format(key)
+                )
+
+    def spec(self):
+        """
+        Returns: JSON-serializable dictionary describing the options
+        """
+        return {
+            'runs': self.runs,
+            'warmup_runs': self.warmup_runs,
+            'thread_counts': list(self.thread_counts),
+            'budget': self.budget
+        }
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def parse_options(spec):
+    """
+    Creates and validates BenchmarkOptions from their specification, e.g. the "benchmark" value
+    of a bundle specification: either True (for the default options) or a dictionary with any of
+    the keys "runs", "warmup_runs", "thread_counts" and "budget".
+
+    Raises an InvalidBenchmarkOptionsError if the specification is not valid.
+
+    Returns: BenchmarkOptions
+    """
+    if spec is True:
+        spec = {}
+    if not isinstance(spec, dict):
+        raise InvalidBenchmarkOptionsError(
+            'ERROR: Benchmark must be specified as true or as a dictionary of options'
+        )
+    unknown_keys = set(spec) - {'runs', 'warmup_runs', 'thread_counts', 'budget'}
+    if unknown_keys:
+        raise InvalidBenchmarkOptionsError(
+            'ERROR: Unknown benchmark options: {}'.format(', '.join(sorted(unknown_keys)))
+        )
+    if not isinstance(spec.get('budget', {}), dict) or not isinstance(
+            spec.get('thread_counts', []),
+            (list, tuple)
+        ):
+        raise InvalidBenchmarkOptionsError(
+            'ERROR: Benchmark budget must be a dictionary and thread counts a list'
+        )
+    options = BenchmarkOptions(
+        runs=spec.get('runs', DEFAULT_RUNS),
+        warmup_runs=spec.get('warmup_runs', DEFAULT_WARMUP_RUNS),
+        thread_counts=spec.get('thread_counts', DEFAULT_THREAD_COUNTS),
+        budget=spec.get('budget')
+    )
+    options.validate()
+    return options
+
+def report_path(bundle_path):
+    """
+    Returns: Path of the benchmark report written alongside the bundle at bundle_path
+    """
+    return '{}{}'.format(bundle_path, REPORT_SUFFIX)
+
+def resident_memory(pid):
+    """
+    Returns: Resident memory (in bytes) of process with the given pid, or None if it cannot be
+    determined on this platform
+    """
+    try:
+        with open('/proc/{}/statm'.format(pid), 'r') as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+def percentile(values, fraction):
+    """
+    Returns: The given fraction (e.g. 0.95) percentile of a non-empty list of values, by the
+    nearest-rank method
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+def time_invocations(interpreter, runs, on_invoke=None):
+    """
+    Invokes a TFLite interpreter whose inputs have been set runs times, calling on_invoke (if
+    given) after each invocation.
+
+    Returns: List of the latencies (in milliseconds) of the invocations
+    """
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        interpreter.invoke()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if on_invoke is not None:
+            on_invoke()
+    return latencies
+
+def input_shapes(model_spec, input_details):
+    """
+    Determines the shape of the synthetic input fed to each input of a TFLite model. Inputs of
+    model.json are matched to those of the model in order. Their shapes do not include the batch
+    dimension, and dimensions of -1 (of any size) are given size 1. Inputs which model.json does
+    not describe keep the shape of the model input, with dynamic dimensions given size 1.
+
+    Args:
+    1. model_spec - Parsed model.json
+    2. input_details - Input details of the TFLite interpreter (Interpreter.get_input_details)
+
+    Returns: List of shapes (lists of integers), one for each input of the model
+    """
+    described_inputs = model_spec.get('inputs', [])
+    shapes = []
+    for i, detail in enumerate(input_details):
+        model_shape = [max(int(size), 1) for size in detail['shape']]
+        if i >= len(described_inputs) or 'shape' not in described_inputs[i]:
+            shapes.append(model_shape)
+            continue
+        shape = [size if size > 0 else 1 for size in described_inputs[i]['shape']]
+        if len(shape) < len(model_shape):
+            shape = [1] * (len(model_shape) - len(shape)) + shape
+        shapes.append(shape)
+    return shapes
+
+def _value_range(input_spec):
+    # Range of synthetic values for an input described in model.json: normalized images lie in
+    # their normalized range, other images in [0, 255] and other arrays in [-1, 1]
+    if input_spec.get('type') != 'image':
+        return -1.0, 1.0
+    standard = input_spec.get('normalize', {}).get('standard')
+    if standard == '[0,1]':
+        return 0.0, 1.0
+    if standard == '[-1,1]':
+        return -1.0, 1.0
+    return 0.0, 255.0
+
+def synthetic_inputs(model_spec, input_details):
+    """
+    Generates random inputs for a TFLite model, shaped by the "inputs" of its model.json (see
+    input_shapes) and of the types the model expects
+
+    Returns: List of numpy arrays, one for each input of the model
+    """
+    import numpy as np
+
+    random = np.random.RandomState(INPUT_SEED)
+    described_inputs = model_spec.get('inputs', [])
+    inputs = []
+    shapes = input_shapes(model_spec, input_details)
+    for i, (detail, shape) in enumerate(zip(input_details, shapes)):
+        dtype = np.dtype(detail['dtype'])
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            inputs.append(random.randint(info.min, info.max, size=shape, dtype=dtype))
+            continue
+        low, high = _value_range(described_inputs[i] if i < len(described_inputs) else {})
+        inputs.append(random.uniform(low, high, size=shape).astype(dtype))
+    return inputs
+
+def interpreter_supports_threads():
+    """
+    Returns: True if the TFLite interpreter of the installed TensorFlow can be given its number of
+    threads, False otherwise. The num_threads argument of tf.lite.Interpreter only exists from
+    TensorFlow 2 on; older interpreters (such as that of TensorFlow 1.14) always run with their
+    default number of threads.
+    """
+    import tensorflow as tf
+
+    return 'num_threads' in inspect.signature(tf.lite.Interpreter.__init__).parameters
+
+def _benchmark_threads(model_content, model_spec, options, threads):
+    # Benchmarks the model with the given number of interpreter threads (or the default number of
+    # the interpreter, if threads is None), in a fresh interpreter
+    import tensorflow as tf
+
+    baseline_memory = resident_memory(os.getpid())
+    peak_memory = [baseline_memory]
+
+    def sample_memory():
+        memory = resident_memory(os.getpid())
+        if memory is not None and peak_memory[0] is not None:
+            peak_memory[0] = max(peak_memory[0], memory)
+
+    if threads is None:
+        interpreter = tf.lite.Interpreter(model_content=model_content)
+    else:
+        interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=threads)
+    input_details = interpreter.get_input_details()
+    inputs = synthetic_inputs(model_spec, input_details)
+    for detail, value in zip(input_details, inputs):
+        if list(detail['shape']) != list(value.shape):
+            interpreter.resize_tensor_input(detail['index'], value.shape)
+    interpreter.allocate_tensors()
+    for detail, value in zip(input_details, inputs):
+        interpreter.set_tensor(detail['index'], value)
+    sample_memory()
+
+    time_invocations(interpreter, options.warmup_runs, sample_memory)
+    latencies = time_invocations(interpreter, options.runs, sample_memory)
+    return {
+        'threads': threads,
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'mean_ms': sum(latencies) / len(latencies),
+        'peak_memory_bytes': (
+            peak_memory[0] - baseline_memory if baseline_memory is not None else None
+        ),
+        'inputs': [
+            {'name': detail['name'], 'shape': list(value.shape), 'dtype': str(value.dtype)}
+            for detail, value in zip(input_details, inputs)
+        ]
+    }
+
+def check_budget(report, budget):
+    """
+    Returns: List of descriptions of the limits of budget which the results in a benchmark report
+    (see benchmark_model) exceed
+    """
+    violations = []
+    for key in BUDGET_KEYS:
+        if key in budget and report.get(key) is not None and report[key] > budget[key]:
+            violations.append('{} of {} exceeds budget of {}'.format(key, report[key], budget[key]))
+    return violations
+
+def benchmark_model(tflite_path, model_json_path, options=None):
+    """
+    Benchmarks the TFLite model at tflite_path on the CPU, in the TFLite interpreter of this
+    process, once for each of the thread counts of options: after its warm-up runs, the model is
+    invoked runs times on synthetic inputs (see synthetic_inputs), timing each invocation and
+    sampling the resident memory of the process. If the interpreter cannot be given its number of
+    threads (see interpreter_supports_threads), the model is only benchmarked once, with the
+    default number of threads of the interpreter, and its result has null "threads".
+
+    Args:
+    1. tflite_path - Path to TFLite binary
+    2. model_json_path - Path to the model.json describing its inputs
+    3. options - (Optional) BenchmarkOptions; defaults to BenchmarkOptions()
+
+    Returns: Benchmark report; a dictionary of the "options", the "p50_ms", "p95_ms" and
+    "peak_memory_bytes" with the first thread count (to which the budget applies), results for
+    every thread count under "threads" (with "speedup" relative to the first), the "violations" of
+    the budget and whether the model "passed" its budget
+    """
+    if options is None:
+        options = BenchmarkOptions()
+    with filesystem.open(model_json_path, 'rb') as model_json_file:
+        model_spec = json.loads(model_json_file.read().decode('utf-8'))
+    with filesystem.open(tflite_path, 'rb') as tflite_file:
+        model_content = tflite_file.read()
+
+    thread_counts = options.thread_counts if interpreter_supports_threads() else [None]
+    results = [
+        _benchmark_threads(model_content, model_spec, options, threads)
+        for threads in thread_counts
+    ]
+    for result in results:
+        # Ratio of the p50 latency with the first thread count to that with this one
+        result['speedup'] = (
+            round(results[0]['p50_ms'] / result['p50_ms'], 2) if result['p50_ms'] else None
+        )
+
+    report = {
+        'model': tflite_path,
+        'options': options.spec(),
+        'inputs': results[0].pop('inputs'),
+        'p50_ms': results[0]['p50_ms'],
+        'p95_ms': results[0]['p95_ms'],
+        'peak_memory_bytes': results[0]['peak_memory_bytes'],
+        'threads': results
+    }
+    for result in results[1:]:
+        result.pop('inputs')
+    report['violations'] = check_budget(report, options.budget)
+    report['passed'] = not report['violations']
+    return report
+
+def write_report(report, path):
+    """
+    Writes a benchmark report as JSON to the given path (local or GCS)
+
+    Returns: None
+    """
+    with filesystem.open(path, 'wb') as report_file:
+        report_file.write(json.dumps(report, sort_keys=True, indent=2).encode('utf-8'))
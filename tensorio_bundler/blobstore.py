@@ -0,0 +1,203 @@
+"""
+Local content-addressed store of asset files fetched from remote filesystems, shared by the
+bundles (and processes) which use the same assets
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import threading
+import uuid
+
+from . import filesystem, metrics
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Suffix of the files in which blobs are stored, and name of the file locked by the process which
+# is evicting blobs
+BLOB_SUFFIX = '.blob'
+LOCK_FILENAME = '.lock'
+
+class BlobStore:
+    """
+    Store of the contents of files under a local directory, keyed by the fingerprints of the files
+    (see filesystem.FileStat). Files with the same fingerprint (e.g. GCS objects with the same MD5)
+    share a single blob, wherever they are stored. Blobs are evicted in least recently used order
+    once the blobs in the directory take up more than max_bytes.
+
+    The same directory may be shared by several processes (e.g. gunicorn workers): blobs are
+    written to temporary files which are renamed into place, so they are never read partially
+    written, and eviction is serialized by a lock file. A blob evicted by another process while it
+    is being looked up is a miss. Errors accessing the store are counted and treated as misses, so
+    that an unavailable store never fails a build.
+    """
+    def __init__(self, store_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        # Estimate of the bytes in the store, which only counts the blobs added by this process
+        # since the store was last scanned
+        self._bytes = sum(size for _, size, _ in self._scan())
+
+    def blob_path(self, fingerprint):
+        """
+        Returns: Path of the file in which the blob of the file with the given fingerprint is stored
+        """
+        digest = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+        return os.path.join(self.store_dir, digest + BLOB_SUFFIX)
+
+    def get(self, fingerprint, size):
+        """
+        Returns: Contents of the file with the given fingerprint and size, or None if they are not
+        in the store
+        """
+        path = self.blob_path(fingerprint)
+        try:
+            with open(path, 'rb') as blob_file:
+                data = blob_file.read()
+            # Marks the blob as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            self._count(errors=1)
+            return None
+        if len(data) != size:
+            self._count(errors=1)
+            return None
+        return data
+
+    def put(self, fingerprint, data):
+        """
+        Adds the contents of the file with the given fingerprint to the store, evicting least
+        recently used blobs if the store grows larger than max_bytes
+
+        Returns: None
+        """
+        if len(data) > self.max_bytes:
+            return
+        path = self.blob_path(fingerprint)
+        temp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        try:
+            with open(temp_path, 'wb') as blob_file:
+                blob_file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            self._count(errors=1)
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            return
+        with self._lock:
+            self._bytes += len(data)
+            over_budget = self._bytes > self.max_bytes
+        if over_budget:
+            try:
+                self._evict()
+            except OSError:
+                self._count(errors=1)
+
+    def read(self, path, stat=None):
+        """
+        Reads the file at path, from the store if its contents are there, and from its filesystem
+        (adding them to the store) otherwise. Files without a fingerprint (e.g. local files) are
+        always read from their filesystem.
+
+        Args:
+        1. path - Path to file (GCS ok)
+        2. stat - (Optional) filesystem.FileStat of the file, if it is already known
+
+        Returns: Contents of the file
+        """
+        if stat is None:
+            stat = filesystem.stat(path)
+        if stat.fingerprint is None:
+            return _read(path)
+        data = self.get(stat.fingerprint, stat.size)
+        if data is not None:
+            self._count(hits=1, bytes_served=len(data))
+            metrics.ASSET_STORE_REQUESTS.inc('hit')
+            return data
+        self._count(misses=1)
+        metrics.ASSET_STORE_REQUESTS.inc('miss')
+        data = _read(path)
+        self.put(stat.fingerprint, data)
+        return data
+
+    def stats(self):
+        """
+        Returns: Dictionary of store statistics: hits, misses, hit_rate, errors, bytes_served from
+        the store, and the number of entries and bytes in it
+        """
+        blobs = self._scan()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'errors': self.errors,
+                'bytes_served': self.bytes_served,
+                'entries': len(blobs),
+                'bytes': sum(size for _, size, _ in blobs)
+            }
+
+    def _count(self, hits=0, misses=0, errors=0, bytes_served=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.errors += errors
+            self.bytes_served += bytes_served
+
+    def _scan(self):
+        # Returns (path, size, last use) of every blob in the store
+        blobs = []
+        for entry in os.scandir(self.store_dir):
+            if not entry.name.endswith(BLOB_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((entry.path, stat.st_size, stat.st_mtime))
+        return blobs
+
+    def _evict(self):
+        with open(os.path.join(self.store_dir, LOCK_FILENAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                blobs = sorted(self._scan(), key=lambda blob: blob[2])
+                total_bytes = sum(size for _, size, _ in blobs)
+                for path, size, _ in blobs:
+                    if total_bytes <= self.max_bytes:
+                        break
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+                    total_bytes -= size
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        with self._lock:
+            self._bytes = total_bytes
+
+def _read(path):
+    with filesystem.open(path, 'rb') as infile:
+        data = infile.read()
+    metrics.BYTES_READ.inc(amount=len(data))
+    return data
+
+def from_environment():
+    """
+    Creates a BlobStore from the ASSET_STORE_DIR and (optional) ASSET_STORE_MAX_BYTES environment
+    variables.
+
+    Returns: BlobStore, or None if ASSET_STORE_DIR is not set
+    """
+    store_dir = os.environ.get('ASSET_STORE_DIR')
+    if not store_dir:
+        return None
+    return BlobStore(store_dir, int(os.environ.get('ASSET_STORE_MAX_BYTES', DEFAULT_MAX_BYTES)))
@@ -3,17 +3,48 @@ TensorIO Bundler core functionality and CLI
 """
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import itertools
 import json
 import os
-import tempfile
+import sys
+import time
 import zipfile
+import zlib
 
-import requests
-import tensorflow as tf
+from . import (
+    benchmark,
+    blobstore,
+    cache,
+    compression,
+    filesystem,
+    filetree,
+    manifest,
+    metrics,
+    quantization,
+    ziputil
+)
 
 TFLITE = 'tflite'
 SAVED_MODEL = 'savedmodel'
 
+# Size of the buffer used when streaming files into a zipped tiobundle. Peak memory used while
+# copying a single file into the bundle is bounded by this value.
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Number of threads used to fetch assets concurrently when writing them into a tiobundle, and the
+# maximum number of bytes of fetched assets which may be held in memory waiting to be written.
+DEFAULT_FETCH_WORKERS = 8
+DEFAULT_MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+
+# Size of the blocks in which files larger than the chunk size (e.g. the variables shards of a
+# SavedModel) are read and compressed concurrently by the fetch workers; 0 streams such files one
+# at a time instead
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
 class SavedModelDirMisspecificationError(Exception):
     """
     Raised in the process of a TFLite build if the SavedModel directory either does not
@@ -27,6 +58,20 @@ class TFLiteFileExistsError(Exception):
     at the specified build path. """
     pass
 
+class TFLiteConversionError(Exception):
+    """
+    Raised in the process of a TFLite build if the conversion fails in a
+    conversion.ConversionExecutor worker, or if the worker crashes or exceeds its limits.
+    """
+    pass
+
+class TFLiteConversionTimeoutError(TFLiteConversionError):
+    """
+    Raised in the process of a TFLite build if the conversion does not finish within the timeout
+    of the conversion.ConversionExecutor running it.
+    """
+    pass
+
 class ZippedTIOBundleExistsError(Exception):
     """
     Raised in the process of a zipped tiobundle build if a file (or directory) already exists
@@ -39,7 +84,7 @@ class ZippedTIOBundleMisspecificationError(Exception):
     Raised in the process of a zipped tiobundle build if one or more of:
     1. model.json
     2. tflite binary
-    does not exist as a file.
+    does not exist as a file, or if the assets directory does not exist as a directory.
     """
     pass
 
@@ -61,111 +106,918 @@ class InvalidBundleSpecification(Exception):
     """
     pass
 
-def tflite_build_from_saved_model(saved_model_dir, outfile):
+def convert_saved_model(saved_model_dir, outfile, options=None):
     """
-    Builds TFLite binary from SavedModel directory
+    Converts SavedModel into TFLite binary, without any checks on the paths involved
+
+    TensorFlow is imported here rather than at module level, because it takes seconds (and hundreds
+    of megabytes of memory) to import and is only needed for conversions.
 
     Args:
     1. saved_model_dir - Directory containing SavedModel protobuf file and variables
     2. outfile - Path to which to write TFLite binary
+    3. options - (Optional) quantization.ConversionOptions specifying the conversion profile; by
+       default, the model is converted without optimizations
 
     Returns: None
     """
-    if tf.gfile.Exists(outfile):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    quantization.configure_converter(converter, options)
+    tflite_model = converter.convert()
+    with filesystem.open(outfile, 'wb') as outf:
+        outf.write(tflite_model)
+
+def _notify(progress, event, **details):
+    if progress is not None:
+        details['event'] = event
+        progress(details)
+
+@metrics.timed('tflite_build')
+def tflite_build_from_saved_model(
+        saved_model_dir,
+        outfile,
+        conversion_cache=None,
+        conversion_executor=None,
+        conversion_options=None,
+        latency_runs=quantization.DEFAULT_LATENCY_RUNS,
+        progress=None
+    ):
+    """
+    Builds TFLite binary from SavedModel directory
+
+    Args:
+    1. saved_model_dir - Directory containing SavedModel protobuf file and variables
+    2. outfile - Path to which to write TFLite binary
+    3. conversion_cache - (Optional) cache.ConversionCache to consult before converting the
+       SavedModel and to populate after converting it
+    4. conversion_executor - (Optional) conversion.ConversionExecutor on which to run the
+       conversion; if not specified, the conversion runs in the calling process
+    5. conversion_options - (Optional) quantization.ConversionOptions specifying the conversion
+       profile; by default, the model is converted without optimizations
+    6. latency_runs - Number of timed invocations of the TFLite binary in the TFLite interpreter
+       (on the conversion executor, if given) used to measure its latency; 0 skips the measurement
+    7. progress - (Optional) Function called with {"event": "conversion_step", "step": <step>}
+       as each step of the build starts: "hashing" the SavedModel for its cache key, "converting"
+       it, copying a previous conversion from the cache ("cached") or "measuring_latency"
+
+    Returns: Conversion report (see quantization.conversion_report) recording the options, the size
+    of the TFLite binary and its latency
+    """
+    if filesystem.exists(outfile):
         raise TFLiteFileExistsError(
             'ERROR: Specified TFLite binary path ({}) already exists'.format(outfile)
         )
-    if not tf.gfile.Exists(saved_model_dir) or not tf.gfile.IsDirectory(saved_model_dir):
+    if not filesystem.exists(saved_model_dir) or not filesystem.isdir(saved_model_dir):
         raise SavedModelDirMisspecificationError(
             ('ERROR: Specified SavedModel directory ({}) either does not exist or is not a '
              'directory').format(saved_model_dir)
         )
 
-    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
-    tflite_model = converter.convert()
-    with tf.gfile.Open(outfile, 'wb') as outf:
-        outf.write(tflite_model)
+    if conversion_cache is None:
+        _notify(progress, 'conversion_step', step='converting')
+        _run_conversion(saved_model_dir, outfile, conversion_executor, conversion_options)
+    else:
+        _notify(progress, 'conversion_step', step='hashing')
+        with metrics.timed('conversion_cache_key'):
+            cache_key = conversion_cache.key(
+                saved_model_dir,
+                conversion_options.cache_settings() if conversion_options is not None else None
+            )
+        # Concurrent conversions of the same SavedModel wait for the first one to finish and then
+        # copy its result from the cache
+        with conversion_cache.lock(cache_key):
+            with metrics.timed('conversion_cache_fetch'):
+                cached = conversion_cache.fetch(cache_key, outfile)
+            if cached:
+                _notify(progress, 'conversion_step', step='cached')
+            else:
+                _notify(progress, 'conversion_step', step='converting')
+                _run_conversion(saved_model_dir, outfile, conversion_executor, conversion_options)
+                with metrics.timed('conversion_cache_store'):
+                    conversion_cache.store(cache_key, outfile)
+
+    latency = None
+    if latency_runs > 0:
+        _notify(progress, 'conversion_step', step='measuring_latency')
+        with metrics.timed('conversion_latency'):
+            if conversion_executor is not None:
+                latency = conversion_executor.measure_latency(outfile, latency_runs)
+            else:
+                latency = quantization.measure_latency(outfile, latency_runs)
+    return quantization.conversion_report(outfile, conversion_options, latency)
 
-def tiobundle_build(model_path, model_json_path, assets_path, bundle_name, outfile):
+@metrics.timed('benchmark')
+def tflite_benchmark(
+        tflite_path,
+        model_json_path,
+        report_path,
+        options=None,
+        conversion_executor=None
+    ):
+    """
+    Benchmarks a TFLite binary in the TFLite interpreter on synthetic inputs shaped by its
+    model.json (see benchmark.benchmark_model), writes the benchmark report to report_path and
+    checks the results against the budget of the options.
+
+    Raises a benchmark.BudgetExceededError if the model exceeds its budget; the report is written
+    either way.
+
+    Args:
+    1. tflite_path - Path to TFLite binary
+    2. model_json_path - Path to TensorIO-compatible model.json file describing its inputs
+    3. report_path - Path to which to write the benchmark report (e.g. benchmark.report_path of
+       the bundle being built)
+    4. options - (Optional) benchmark.BenchmarkOptions; defaults to benchmark.BenchmarkOptions()
+    5. conversion_executor - (Optional) conversion.ConversionExecutor on which to run the
+       benchmark; if not specified, the benchmark runs in the calling process
+
+    Returns: Benchmark report
+    """
+    if not filesystem.exists(tflite_path):
+        raise ZippedTIOBundleMisspecificationError(
+            'ERROR: TFLite binary path ({}) does not exist'.format(tflite_path)
+        )
+    if conversion_executor is not None:
+        report = conversion_executor.benchmark(tflite_path, model_json_path, options)
+    else:
+        report = benchmark.benchmark_model(tflite_path, model_json_path, options)
+    benchmark.write_report(report, report_path)
+    if not report['passed']:
+        raise benchmark.BudgetExceededError(report)
+    return report
+
+@metrics.timed('conversion')
+def _run_conversion(saved_model_dir, outfile, conversion_executor, conversion_options):
+    if conversion_executor is not None:
+        conversion_executor.convert(saved_model_dir, outfile, options=conversion_options)
+    else:
+        convert_saved_model(saved_model_dir, outfile, conversion_options)
+    metrics.BYTES_WRITTEN.inc(amount=filesystem.size(outfile))
+
+class _BundleProgress:
+    """
+    Counts the files and bytes written into a bundle, out of the files_total files and bytes_total
+    bytes it is to contain, and reports them to a progress callback. Called with the events
+    emitted by write_assets_to_zipfile.
+    """
+    def __init__(self, progress, files_total, bytes_total):
+        self.progress = progress
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        self.files_done = 0
+        self.bytes_done = 0
+        _notify(progress, 'bundle_started', files_total=files_total, bytes_total=bytes_total)
+
+    def __call__(self, event):
+        self.bytes_done += event['bytes']
+        if event['event'] == 'file_zipped':
+            self.files_done += 1
+        _notify(
+            self.progress,
+            'bundle_progress',
+            path=event['path'],
+            files_done=self.files_done,
+            files_total=self.files_total,
+            bytes_done=self.bytes_done,
+            bytes_total=self.bytes_total
+        )
+
+    def file_zipped(self, zip_target, size):
+        self({'event': 'file_zipped', 'path': zip_target, 'bytes': size})
+
+def _tree_totals(tree):
+    # Number of files in a filetree.FileTree and their total size, or zeros if there is no tree
+    if tree is None:
+        return 0, 0
+    return len(tree.files), sum(stat.size for stat in tree.files.values())
+
+@metrics.timed('bundle')
+def tiobundle_build(
+        model_path,
+        model_json_path,
+        assets_path,
+        bundle_name,
+        outfile,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        fetch_workers=DEFAULT_FETCH_WORKERS,
+        max_inflight_bytes=DEFAULT_MAX_INFLIGHT_BYTES,
+        previous_bundle=None,
+        compression_policy=None,
+        reproducible=False,
+        block_size=DEFAULT_BLOCK_SIZE,
+        conversion_report=None,
+        asset_store=None,
+        progress=None,
+        existing_bundle_checked=False
+    ):
     """
     Builds zipped tiobundle file (e.g. for direct download into Net Runner)
 
+    If previous_bundle is given, entries of that bundle whose sources have the same size and CRC
+    as before are copied into the new bundle as they are, without being recompressed.
+
+    If reproducible is True, every entry is given a fixed timestamp and fixed permissions, and a
+    manifest of the SHA-256 of every file (see manifest.BundleManifest) is added to the bundle as
+    manifest.MANIFEST_FILENAME. If a bundle whose manifest has the same digest already exists at
+    outfile, it is left as it is instead of raising a ZippedTIOBundleExistsError. Comparing the
+    digests hashes every source, so callers which have already checked with
+    identical_bundle_exists should pass existing_bundle_checked=True.
+
+    If conversion_report is given, it is added to the bundle as quantization.REPORT_FILENAME.
+    Reproducible bundles get the report without its latency (see quantization.reproducible_report),
+    so that their bytes do not depend on timings. The report is not recorded in the manifest, since
+    it is derived from the TFLite binary whose hash is.
+
     Args:
     1. model_path - Path to TFLite binary or SavedModel directory
     2. model_json_path - Path to TensorIO-compatible model.json file
     3. assets_path - Path to TensorIO-compatible assets directory
     4. bundle_name - Name of the bundle
     5. outfile - Name under which the zipped tiobundle file should be stored
+    6. chunk_size - Size (in bytes) of the buffer used to stream files into the bundle
+    7. fetch_workers - Maximum number of asset files fetched concurrently
+    8. max_inflight_bytes - Maximum number of bytes of prefetched asset files held in memory
+    9. previous_bundle - (Optional) Path to a zipped tiobundle from a previous build of this bundle
+    10. compression_policy - (Optional) compression.CompressionPolicy deciding how each entry of
+        the bundle is compressed; by default, entries are stored uncompressed
+    11. reproducible - If True, builds a reproducible bundle with a manifest (see above)
+    12. block_size - Size (in bytes) of the blocks in which files of a SavedModel directory or the
+        assets directory larger than chunk_size are fetched and compressed concurrently, or 0 to
+        stream them one at a time
+    13. conversion_report - (Optional) Report of the conversion which produced the TFLite binary
+        at model_path (as returned by tflite_build_from_saved_model)
+    14. asset_store - (Optional) blobstore.BlobStore through which to read the files of the assets
+        directory (see write_assets_to_zipfile)
+    15. progress - (Optional) Function called with {"event": "bundle_started", "files_total": <n>,
+        "bytes_total": <n>} once the files to be bundled have been listed, and with
+        {"event": "bundle_progress", "path": <zip target>, "files_done": <n>, "bytes_done": <n>,
+        "files_total": <n>, "bytes_total": <n>} as each file (and each block of a file written in
+        blocks) is written into the bundle
+    16. existing_bundle_checked - If True, the caller has already found (with
+        identical_bundle_exists) that outfile does not hold an identical bundle, so a
+        reproducible build raises a ZippedTIOBundleExistsError if outfile exists without hashing
+        the sources again
 
     Returns: outfile path if the zipped tiobundle was created successfully
     """
-    if tf.gfile.Exists(outfile):
+    if filesystem.exists(outfile) and not reproducible:
         raise ZippedTIOBundleExistsError(
             'ERROR: Specified zipped tiobundle output path ({}) already exists'.format(outfile)
         )
 
-    if not tf.gfile.Exists(model_path):
+    # Directories (a SavedModel and the assets) are each listed once, up front; the listings are
+    # used both to check them and to write their files into the bundle
+    model_tree = filetree.scan_if_directory(model_path)
+    if model_tree is None and not filesystem.exists(model_path):
         raise ZippedTIOBundleMisspecificationError(
             'ERROR: TFLite binary path ({}) does not exist'.format(
                 model_path
             )
         )
 
-    if not tf.gfile.Exists(model_json_path) or tf.gfile.IsDirectory(model_json_path):
+    if not filesystem.exists(model_json_path) or filesystem.isdir(model_json_path):
         raise ZippedTIOBundleMisspecificationError(
             'ERROR: model.json path ({}) either does not exist or is not a file'.format(
                 model_path
             )
         )
 
-    _, temp_outfile = tempfile.mkstemp(suffix='.zip')
-    with zipfile.ZipFile(temp_outfile, 'w') as tiobundle_zip:
-        # We have to use the ZipFile writestr method because there is no guarantee that
-        # all the files to be included in the archive are on the same filesystem that
-        # the function is running on -- they could be on GCS.
-        with tf.gfile.Open(model_json_path, 'rb') as model_json_file:
-            model_json = model_json_file.read()
-            model_json_string = model_json.decode('utf-8')
-            bundle_spec = json.loads(model_json_string)
-        tiobundle_zip.writestr(
-            os.path.join(bundle_name, 'model.json'),
-            model_json
-        )
-
-        model_spec = bundle_spec.get('model', {})
-        if tf.gfile.IsDirectory(model_path):
-            # We are bundling a SavedModel directory.
-            # It goes into the train/ subdirectory of bundle
-            model_dirname = model_spec.get('file')
-            if model_dirname is None:
-                raise InvalidBundleSpecification('No "file" specified under "model" key')
-            saved_model_target = os.path.join(bundle_name, model_dirname)
-            write_assets_to_zipfile(model_path, tiobundle_zip, saved_model_target)
-        else:
-            # We are bundling a tflite file.
-            # We will store the tflite file under the model_filename specified in the model.json
-            # If this is not specified, we store the file as "model.tflite"
-            model_filename = model_spec.get('file', 'model.tflite')
-            with tf.gfile.Open(model_path, 'rb') as tflite_file:
-                tflite_model = tflite_file.read()
-            tiobundle_zip.writestr(
-                os.path.join(bundle_name, model_filename),
-                tflite_model
+    assets_tree = None
+    if assets_path is not None:
+        assets_tree = filetree.scan_if_directory(assets_path)
+        if assets_tree is None:
+            raise ZippedTIOBundleMisspecificationError(
+                'ERROR: assets path ({}) either does not exist or is not a directory'.format(
+                    assets_path
+                )
+            )
+
+    if previous_bundle is not None and not filesystem.exists(previous_bundle):
+        raise ZippedTIOBundleMisspecificationError(
+            'ERROR: previous bundle ({}) does not exist'.format(previous_bundle)
+        )
+
+    if compression_policy is None:
+        compression_policy = compression.CompressionPolicy()
+
+    bundle_manifest = None
+    if reproducible:
+        if filesystem.exists(outfile):
+            if not existing_bundle_checked and identical_bundle_exists(
+                    outfile,
+                    model_path,
+                    model_json_path,
+                    assets_path,
+                    bundle_name,
+                    compression_policy=compression_policy,
+                    chunk_size=chunk_size,
+                    fetch_workers=fetch_workers
+                ):
+                return outfile
+            raise ZippedTIOBundleExistsError(
+                'ERROR: Specified zipped tiobundle output path ({}) already exists and holds a '
+                'different bundle'.format(outfile)
             )
+        bundle_manifest = manifest.BundleManifest(bundle_name, compression_policy.spec())
 
-        if assets_path is not None:
-            assets_zip_target = os.path.join(bundle_name, 'assets')
-            write_assets_to_zipfile(assets_path, tiobundle_zip, assets_zip_target)
+    # The bundle is streamed straight to outfile, where it only appears once it is complete; if
+    # building it fails, nothing is written to outfile.
+    with contextlib.ExitStack() as stack:
+        previous = None
+        if previous_bundle is not None:
+            previous_file = stack.enter_context(filesystem.open(previous_bundle, 'rb'))
+            previous = ziputil.ReusableEntries(stack.enter_context(zipfile.ZipFile(previous_file)))
+        bundle_file = stack.enter_context(filesystem.atomic_writer(outfile))
+        with zipfile.ZipFile(bundle_file, 'w') as tiobundle_zip:
+            # We cannot use the ZipFile write method because there is no guarantee that all the
+            # files to be included in the archive are on the same filesystem that the function
+            # is running on -- they could be on GCS. Instead, we stream them into the archive in
+            # chunks.
+            model_json = _read_file(model_json_path)
+            bundle_spec = json.loads(model_json.decode('utf-8'))
+            model_json_target = os.path.join(bundle_name, 'model.json')
+            model_target = _model_zip_target(model_tree is not None, bundle_spec, bundle_name)
 
-    tf.gfile.Copy(temp_outfile, outfile)
-    os.remove(temp_outfile)
+            bundle_progress = None
+            if progress is not None:
+                model_files, model_bytes = _tree_totals(model_tree)
+                if model_tree is None:
+                    model_files, model_bytes = 1, filesystem.size(model_path)
+                asset_files, asset_bytes = _tree_totals(assets_tree)
+                bundle_progress = _BundleProgress(
+                    progress,
+                    1 + model_files + asset_files,
+                    len(model_json) + model_bytes + asset_bytes
+                )
+
+            _write_prepared_entry(
+                _prepare_entry(
+                    model_json,
+                    model_json_target,
+                    compression_policy,
+                    previous,
+                    bundle_manifest
+                ),
+                tiobundle_zip,
+                model_json_target,
+                chunk_size,
+                previous,
+                bundle_manifest
+            )
+            if bundle_progress is not None:
+                bundle_progress.file_zipped(model_json_target, len(model_json))
+
+            with metrics.timed('bundle_model'):
+                if model_tree is not None:
+                    # We are bundling a SavedModel directory.
+                    # It goes into the train/ subdirectory of bundle
+                    write_assets_to_zipfile(
+                        model_path,
+                        tiobundle_zip,
+                        model_target,
+                        chunk_size=chunk_size,
+                        max_workers=fetch_workers,
+                        max_inflight_bytes=max_inflight_bytes,
+                        previous=previous,
+                        compression_policy=compression_policy,
+                        bundle_manifest=bundle_manifest,
+                        block_size=block_size,
+                        tree=model_tree,
+                        progress=bundle_progress
+                    )
+                else:
+                    # We are bundling a tflite file.
+                    _write_file_to_zipfile(
+                        model_path,
+                        tiobundle_zip,
+                        model_target,
+                        chunk_size,
+                        compression_policy,
+                        previous,
+                        bundle_manifest
+                    )
+                    if bundle_progress is not None:
+                        bundle_progress.file_zipped(model_target, model_bytes)
+
+            if assets_path is not None:
+                assets_zip_target = os.path.join(bundle_name, 'assets')
+                write_assets_to_zipfile(
+                    assets_path,
+                    tiobundle_zip,
+                    assets_zip_target,
+                    chunk_size=chunk_size,
+                    max_workers=fetch_workers,
+                    max_inflight_bytes=max_inflight_bytes,
+                    previous=previous,
+                    compression_policy=compression_policy,
+                    bundle_manifest=bundle_manifest,
+                    block_size=block_size,
+                    asset_store=asset_store,
+                    tree=assets_tree,
+                    progress=bundle_progress
+                )
+
+            if conversion_report is not None:
+                if reproducible:
+                    conversion_report = quantization.reproducible_report(conversion_report)
+                _write_metadata_entry(
+                    tiobundle_zip,
+                    os.path.join(bundle_name, quantization.REPORT_FILENAME),
+                    quantization.report_to_json(conversion_report),
+                    reproducible
+                )
+
+            if bundle_manifest is not None:
+                _write_metadata_entry(
+                    tiobundle_zip,
+                    os.path.join(bundle_name, manifest.MANIFEST_FILENAME),
+                    bundle_manifest.to_json(),
+                    True
+                )
+
+        metrics.BYTES_WRITTEN.inc(amount=bundle_file.tell())
+        # Leaving the stack completes the upload of the bundle (or moves it into place)
+        finalize_start = time.perf_counter()
+    metrics.STAGE_DURATION.observe(time.perf_counter() - finalize_start, 'bundle_finalize')
 
     return outfile
 
-def write_assets_to_zipfile(assets_dir, zfile, zip_subdir):
+def _write_metadata_entry(zfile, zip_target, data, reproducible):
+    # Metadata written by the bundler (the manifest and conversion report) is always stored
+    # uncompressed, so that it can be read cheaply
+    zinfo = ziputil.new_zipinfo(zip_target, reproducible=reproducible)
+    zinfo.CRC = zlib.crc32(data)
+    zinfo.file_size = len(data)
+    zinfo.compress_size = len(data)
+    ziputil.write_raw_entry(zfile, zinfo, data)
+
+def _model_zip_target(is_saved_model, bundle_spec, bundle_name):
+    # Returns the path in the bundle at which the model (a SavedModel directory or a TFLite binary)
+    # is stored, as specified under the "model" key of model.json
+    model_spec = bundle_spec.get('model', {})
+    if is_saved_model:
+        # SavedModel directories have to be named in model.json
+        model_dirname = model_spec.get('file')
+        if model_dirname is None:
+            raise InvalidBundleSpecification('No "file" specified under "model" key')
+        return os.path.join(bundle_name, model_dirname)
+    # TFLite binaries are stored as "model.tflite" unless model.json specifies otherwise
+    return os.path.join(bundle_name, model_spec.get('file', 'model.tflite'))
+
+@metrics.timed('bundle_digest')
+def tiobundle_digest(
+        model_path,
+        model_json_path,
+        assets_path,
+        bundle_name,
+        compression_policy=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        fetch_workers=DEFAULT_FETCH_WORKERS
+    ):
+    """
+    Computes the digest that a reproducible tiobundle built from the given sources (see
+    tiobundle_build) would record in its manifest, without building it. The sources are hashed
+    concurrently by a pool of fetch_workers threads.
+
+    Args:
+    1. model_path - Path to TFLite binary or SavedModel directory
+    2. model_json_path - Path to TensorIO-compatible model.json file
+    3. assets_path - Path to TensorIO-compatible assets directory
+    4. bundle_name - Name of the bundle
+    5. compression_policy - (Optional) compression.CompressionPolicy the bundle would be built with
+    6. chunk_size - Size (in bytes) of the buffer used to read each source
+    7. fetch_workers - Maximum number of sources hashed concurrently
+
+    Returns: Digest of the bundle (see manifest.BundleManifest.digest)
+    """
+    if compression_policy is None:
+        compression_policy = compression.CompressionPolicy()
+    bundle_spec = json.loads(_read_file(model_json_path).decode('utf-8'))
+    model_tree = filetree.scan_if_directory(model_path)
+    model_target = _model_zip_target(model_tree is not None, bundle_spec, bundle_name)
+
+    sources = [(model_json_path, os.path.join(bundle_name, 'model.json'))]
+    if model_tree is not None:
+        sources.extend(
+            (path, zip_target) for path, zip_target, _ in model_tree.list_files(model_target)
+        )
+    else:
+        sources.append((model_path, model_target))
+    if assets_path is not None:
+        sources.extend(list_assets(assets_path, os.path.join(bundle_name, 'assets')))
+
+    bundle_manifest = manifest.BundleManifest(bundle_name, compression_policy.spec())
+    with concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers) as executor:
+        hashes = executor.map(
+            lambda source: manifest.file_sha256(source[0], chunk_size),
+            sources
+        )
+        for (_, zip_target), sha256 in zip(sources, hashes):
+            bundle_manifest.add(zip_target, sha256)
+    return bundle_manifest.digest()
+
+def identical_bundle_exists(
+        outfile,
+        model_path,
+        model_json_path,
+        assets_path,
+        bundle_name,
+        compression_policy=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        fetch_workers=DEFAULT_FETCH_WORKERS
+    ):
+    """
+    Checks whether outfile holds a reproducible tiobundle identical to the one which would be built
+    from the given sources (see tiobundle_digest for the arguments), in which case building and
+    registering it again can be skipped.
+
+    Returns: True if there is a bundle with the same digest at outfile, False otherwise
+    """
+    if not filesystem.exists(outfile):
+        return False
+    existing_digest = manifest.read_digest(outfile)
+    if existing_digest is None:
+        return False
+    return existing_digest == tiobundle_digest(
+        model_path,
+        model_json_path,
+        assets_path,
+        bundle_name,
+        compression_policy=compression_policy,
+        chunk_size=chunk_size,
+        fetch_workers=fetch_workers
+    )
+
+def stream_file_to_zipfile(
+        path,
+        zfile,
+        zip_target,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        file_size=None,
+        compression_policy=None,
+        reproducible=False,
+        sha256=None
+    ):
+    """
+    Copies the file at the given path into zipfile in chunks of at most chunk_size bytes, so that
+    the whole file never has to be held in memory.
+
+    Args:
+    1. path - Local or GCS path of the file to be written into zfile
+    2. zfile - zipfile.ZipFile instance (opened for writing) into which the file should be written
+    3. zip_target - Path in zipfile at which to store the file
+    4. chunk_size - Size (in bytes) of the buffer used to copy the file
+    5. file_size - (Optional) Size of the file, if already known; saves a Stat call
+    6. compression_policy - (Optional) compression.CompressionPolicy deciding how the file is
+       compressed; by default, it is stored uncompressed
+    7. reproducible - If True, the entry is given fixed metadata (see ziputil.make_reproducible)
+    8. sha256 - (Optional) hashlib object which is updated with the contents of the file
+
+    Returns: Number of bytes copied
+    """
+    if file_size is None:
+        file_size = filesystem.size(path)
+    if compression_policy is None:
+        compression_policy = compression.CompressionPolicy()
+    # The entry is written before its size is known, so we have to tell the writer to reserve
+    # space for ZIP64 sizes if the file is large enough to need them.
+    force_zip64 = file_size > zipfile.ZIP64_LIMIT
+    with filesystem.open(path, 'rb') as infile:
+        first_chunk_size = chunk_size
+        if compression_policy.needs_sample(zip_target):
+            first_chunk_size = max(chunk_size, compression.SAMPLE_SIZE)
+        first_chunk = infile.read(first_chunk_size)
+        compress_type, level = compression_policy.select(zip_target, first_chunk)
+
+        def chunks():
+            chunk = first_chunk
+            while chunk:
+                metrics.BYTES_READ.inc(amount=len(chunk))
+                if sha256 is not None:
+                    sha256.update(chunk)
+                yield chunk
+                chunk = infile.read(chunk_size)
+
+        return ziputil.write_streamed_entry(
+            zfile,
+            ziputil.new_zipinfo(zip_target, compress_type, reproducible=reproducible),
+            chunks(),
+            level=level,
+            force_zip64=force_zip64
+        )
+
+def list_assets(assets_dir, zip_subdir):
+    """
+    Recursively lists the files under the given assets directory along with the paths in a
+    zipfile under which they should be stored, in the order of filetree.FileTree.list_files. The
+    directory is listed in a single pass (see filetree.scan).
+
+    Args:
+    1. assets_dir - Local or GCS path to assets directory
+    2. zip_subdir - Path in zipfile corresponding to assets_dir
+
+    Returns: List of (asset path, zip target) pairs
+    """
+    listed = filetree.scan(assets_dir).list_files(zip_subdir)
+    return [(path, zip_target) for path, zip_target, _ in listed]
+
+def _read_file(path, asset_store=None, stat=None):
+    # Reads a whole file, through the asset store (see blobstore.BlobStore.read) if one is given
+    if asset_store is not None:
+        return asset_store.read(path, stat)
+    with filesystem.open(path, 'rb') as infile:
+        data = infile.read()
+    metrics.BYTES_READ.inc(amount=len(data))
+    return data
+
+# Contents of a file prepared for writing into a zipfile: its data (compressed as compress_type),
+# or None if the entry is to be copied from a previous build of the bundle instead. The SHA-256 of
+# the contents is only computed for bundles with a manifest.
+_PreparedEntry = collections.namedtuple(
+    '_PreparedEntry',
+    ['data', 'crc', 'file_size', 'compress_type', 'sha256']
+)
+
+def _prepare_entry(data, zip_target, compression_policy, previous, bundle_manifest=None):
+    crc = zlib.crc32(data)
+    sha256 = None
+    if bundle_manifest is not None:
+        sha256 = hashlib.sha256(data).hexdigest()
+    compress_type, level = compression_policy.select(zip_target, data)
+    if previous is not None and previous.match(zip_target, len(data), crc, compress_type):
+        return _PreparedEntry(None, crc, len(data), compress_type, sha256)
+    return _PreparedEntry(
+        ziputil.compress(data, compress_type, level),
+        crc,
+        len(data),
+        compress_type,
+        sha256
+    )
+
+def _read_and_prepare_entry(
+        path,
+        zip_target,
+        compression_policy,
+        previous,
+        bundle_manifest=None,
+        asset_store=None,
+        stat=None
+    ):
+    return _prepare_entry(
+        _read_file(path, asset_store, stat),
+        zip_target,
+        compression_policy,
+        previous,
+        bundle_manifest
+    )
+
+def _write_prepared_entry(entry, zfile, zip_target, chunk_size, previous, bundle_manifest=None):
+    reproducible = bundle_manifest is not None
+    if reproducible:
+        bundle_manifest.add(zip_target, entry.sha256)
+    if entry.data is None:
+        previous.reuse(
+            zfile,
+            zip_target,
+            entry.file_size,
+            entry.crc,
+            entry.compress_type,
+            chunk_size,
+            reproducible=reproducible
+        )
+        return
+    zinfo = ziputil.new_zipinfo(zip_target, entry.compress_type, reproducible=reproducible)
+    zinfo.CRC = entry.crc
+    zinfo.file_size = entry.file_size
+    zinfo.compress_size = len(entry.data)
+    ziputil.write_raw_entry(zfile, zinfo, entry.data)
+
+# Checksums of a file too large to be read into memory and the compression type it would be written
+# with, so that it can be matched against an entry in a previous build
+_FileInspection = collections.namedtuple(
+    '_FileInspection',
+    ['crc', 'compress_type', 'sha256']
+)
+
+def _inspect_file(path, zip_target, chunk_size, compression_policy, with_sha256=False):
+    crc = 0
+    sha256 = hashlib.sha256() if with_sha256 else None
+    compress_type = None
+    with filesystem.open(path, 'rb') as infile:
+        while True:
+            chunk = infile.read(max(chunk_size, compression.SAMPLE_SIZE))
+            if compress_type is None:
+                compress_type, _ = compression_policy.select(zip_target, chunk)
+            if not chunk:
+                break
+            metrics.BYTES_READ.inc(amount=len(chunk))
+            crc = zlib.crc32(chunk, crc)
+            if sha256 is not None:
+                sha256.update(chunk)
+    return _FileInspection(crc, compress_type, sha256.hexdigest() if with_sha256 else None)
+
+def _write_large_file_to_zipfile(
+        path,
+        zfile,
+        zip_target,
+        chunk_size,
+        file_size,
+        compression_policy,
+        previous,
+        inspection,
+        bundle_manifest
+    ):
+    # Writes a file which is streamed rather than read into memory, reusing its entry in the
+    # previous build if the inspection of the file (if any) shows that it has not changed
+    reproducible = bundle_manifest is not None
+    if inspection is not None and previous.reuse(
+            zfile,
+            zip_target,
+            file_size,
+            inspection.crc,
+            inspection.compress_type,
+            chunk_size,
+            reproducible=reproducible
+        ):
+        if reproducible:
+            bundle_manifest.add(zip_target, inspection.sha256)
+        return
+    sha256 = hashlib.sha256() if reproducible else None
+    stream_file_to_zipfile(
+        path,
+        zfile,
+        zip_target,
+        chunk_size=chunk_size,
+        file_size=file_size,
+        compression_policy=compression_policy,
+        reproducible=reproducible,
+        sha256=sha256
+    )
+    if reproducible:
+        bundle_manifest.add(zip_target, sha256.hexdigest())
+
+def _write_file_to_zipfile(
+        path,
+        zfile,
+        zip_target,
+        chunk_size,
+        compression_policy,
+        previous,
+        bundle_manifest=None
+    ):
+    file_size = filesystem.size(path)
+    inspection = None
+    if previous is not None and previous.find(zip_target, file_size) is not None:
+        inspection = _inspect_file(
+            path,
+            zip_target,
+            chunk_size,
+            compression_policy,
+            with_sha256=bundle_manifest is not None
+        )
+    _write_large_file_to_zipfile(
+        path,
+        zfile,
+        zip_target,
+        chunk_size,
+        file_size,
+        compression_policy,
+        previous,
+        inspection,
+        bundle_manifest
+    )
+
+# Block of a file larger than the chunk size, read by a fetch worker, along with the compression
+# type chosen for the file (from its first block). The block is compressed by the worker if the
+# compression type allows (see ziputil.BLOCK_COMPRESS_TYPES); otherwise compressed is None.
+_Block = collections.namedtuple('_Block', ['data', 'compressed', 'compress_type', 'level'])
+
+def _read_block(path, offset, length):
+    with filesystem.open(path, 'rb') as infile:
+        infile.seek(offset)
+        data = infile.read(length)
+    if len(data) != length:
+        raise TIOZipError('{} changed while it was being read'.format(path))
+    metrics.BYTES_READ.inc(amount=length)
+    return data
+
+def _prepare_block(path, offset, length, final, zip_target, compression_policy, first_block):
+    data = _read_block(path, offset, length)
+    if first_block is None:
+        compress_type, level = compression_policy.select(zip_target, data)
+    else:
+        # The first block of the file was submitted before this one, so it is already running
+        first = first_block.result()
+        compress_type, level = first.compress_type, first.level
+    compressed = None
+    if compress_type in ziputil.BLOCK_COMPRESS_TYPES:
+        compressed = ziputil.compress_block(data, compress_type, level, final)
+    return _Block(data, compressed, compress_type, level)
+
+class _BlockedFile:
+    """
+    File larger than the chunk size which is read in blocks of block_size bytes by a pool of
+    fetch workers. Blocks are submitted one at a time (as the memory budget allows) and written
+    in order.
+    """
+    def __init__(self, path, zip_target, size, block_size):
+        self.path = path
+        self.zip_target = zip_target
+        self.size = size
+        self.block_size = block_size
+        self.futures = []
+        self.first = None
+        self.next_offset = 0
+        self.reported_bytes = 0
+        self.started = time.perf_counter()
+
+    def submitted_all(self):
+        return self.next_offset >= self.size
+
+    def next_length(self):
+        return min(self.block_size, self.size - self.next_offset)
+
+    def submit_next(self, executor, compression_policy):
+        length = self.next_length()
+        future = executor.submit(
+            _prepare_block,
+            self.path,
+            self.next_offset,
+            length,
+            self.next_offset + length >= self.size,
+            self.zip_target,
+            compression_policy,
+            self.first
+        )
+        if self.first is None:
+            self.first = future
+        self.futures.append(future)
+        self.next_offset += length
+        return length
+
+    def block_count(self):
+        return -(-self.size // self.block_size)
+
+def _write_blocked_file(blocked, zfile, blocks, bundle_manifest):
+    # Writes the file from an iterator over its _Blocks, compressing them in this thread if their
+    # compression type cannot be compressed in blocks
+    reproducible = bundle_manifest is not None
+    first = next(blocks)
+    compressor = None
+    if first.compress_type not in ziputil.BLOCK_COMPRESS_TYPES:
+        compressor = ziputil.make_compressor(first.compress_type, first.level)
+    sha256 = hashlib.sha256() if reproducible else None
+
+    def compressed_blocks():
+        for block in itertools.chain([first], blocks):
+            if sha256 is not None:
+                sha256.update(block.data)
+            if compressor is None:
+                yield block.data, block.compressed
+            else:
+                yield block.data, compressor.compress(block.data)
+        if compressor is not None:
+            yield b'', compressor.flush()
+
+    ziputil.write_compressed_blocks(
+        zfile,
+        ziputil.new_zipinfo(blocked.zip_target, first.compress_type, reproducible=reproducible),
+        compressed_blocks(),
+        force_zip64=blocked.size > zipfile.ZIP64_LIMIT
+    )
+    if reproducible:
+        bundle_manifest.add(blocked.zip_target, sha256.hexdigest())
+
+@metrics.timed('write_assets')
+def write_assets_to_zipfile(
+        assets_dir,
+        zfile,
+        zip_subdir,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_workers=DEFAULT_FETCH_WORKERS,
+        max_inflight_bytes=DEFAULT_MAX_INFLIGHT_BYTES,
+        previous=None,
+        compression_policy=None,
+        bundle_manifest=None,
+        block_size=DEFAULT_BLOCK_SIZE,
+        asset_store=None,
+        tree=None,
+        progress=None
+    ):
     """
     Recursively writes the contents of assets directory into assets/ directory in zipfile.
 
+    The assets tree is listed up front, in a single pass which also gets the size of each file
+    (see filetree.scan). Files no larger than chunk_size are then fetched and
+    compressed concurrently by a pool of max_workers threads. Larger files (such as the variables
+    shards of a SavedModel) are split into blocks of block_size bytes, which are fetched and
+    compressed concurrently by the same pool; if block_size is 0, they are streamed in chunks
+    instead. At most max_inflight_bytes worth of fetched files and blocks are held in memory at
+    any time. Entries are always written into zfile from the calling thread, in the order in which
+    they were listed.
+
     Raises a TIOZipError if there is an issue writing the assets from assets_dir into the zipfile
     at the given zip_subdir.
 
@@ -174,35 +1026,180 @@ def write_assets_to_zipfile(assets_dir, zfile, zip_subdir):
     2. zfile - zipfile.ZipFile instance representing the zipfile into which assets should be
        written
     3. zip_subdir - Path in zipfile under which to write the assets at the given assets_dir
+    4. chunk_size - Size (in bytes) of the buffer used to stream each asset into zfile
+    5. max_workers - Maximum number of assets fetched concurrently
+    6. max_inflight_bytes - Maximum number of bytes of prefetched assets held in memory
+    7. previous - (Optional) ziputil.ReusableEntries of a previous build of the bundle; assets
+       which have not changed since that build are copied from it without recompression
+    8. compression_policy - (Optional) compression.CompressionPolicy deciding how each asset is
+       compressed; by default, assets are stored uncompressed
+    9. bundle_manifest - (Optional) manifest.BundleManifest in which to record the SHA-256 of each
+       asset; if given, the assets are written reproducibly (see ziputil.make_reproducible)
+    10. block_size - Size (in bytes) of the blocks in which assets larger than chunk_size are
+        fetched and compressed concurrently, or 0 to stream them
+    11. asset_store - (Optional) blobstore.BlobStore consulted before fetching each asset no
+        larger than chunk_size, and populated with the assets which were not in it
+    12. tree - (Optional) filetree.FileTree of assets_dir, if it has already been listed
+    13. progress - (Optional) Function called with {"event": "file_zipped", "path": <zip target>,
+        "bytes": <n>} as each asset is written, and with {"event": "block_zipped", ...} as each
+        block of an asset written in blocks is; "bytes" counts the bytes of the asset written
+        since the previous event for it
 
     Returns: None
     """
-    assets = tf.gfile.Glob(os.path.join(assets_dir, '*'))
-    # Will map asset subdirectories to their target zip subdirectories
-    assets_subdirs = {}
-    for asset in assets:
-        asset_basename = os.path.basename(asset)
-        if tf.gfile.IsDirectory(asset):
-            # The zip subdirectory into which the asset subdirectory should be written is formed
-            # by joining the current zip_subdir with the asset_basename
-            zip_target = os.path.join(zip_subdir, asset_basename)
-            assets_subdirs[asset] = zip_target
-        else:
-            zip_target = os.path.join(zip_subdir, asset_basename)
-            try:
-                with tf.gfile.Open(asset, 'rb') as asset_file:
-                    asset_bytes = asset_file.read()
-                zfile.writestr(zip_target, asset_bytes)
-            except Exception as err:
-                message = 'Error inserting {} into zipfile at {}: {}'.format(asset, zip_target, err)
-                raise TIOZipError(message)
-
-    for assets_subdir in assets_subdirs:
-        write_assets_to_zipfile(assets_subdir, zfile, assets_subdirs[assets_subdir])
+    if compression_policy is None:
+        compression_policy = compression.CompressionPolicy()
+    if tree is None:
+        tree = filetree.scan(assets_dir)
+    listed = tree.list_files(zip_subdir)
+    assets = [(path, zip_target) for path, zip_target, _ in listed]
+    stats = [stat for _, _, stat in listed]
+    sizes = [stat.size for stat in stats]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Queue of (asset index, work) pairs in the order in which the assets will be written. The
+        # work is a _BlockedFile for large assets which are read in blocks, and a future otherwise
+        # (None for large assets which are streamed without being inspected).
+        pending = collections.deque()
+        next_index = 0
+        inflight_bytes = 0
+        # Large asset whose blocks are still being submitted
+        submitting = None
+
+        def fill():
+            # Submits work in the order in which it will be written, as long as the memory budget
+            # allows; the budget may only be exceeded when nothing else is in flight
+            nonlocal next_index, inflight_bytes, submitting
+            while True:
+                if submitting is not None:
+                    if submitting.submitted_all():
+                        submitting = None
+                        continue
+                    length = submitting.next_length()
+                    if inflight_bytes > 0 and inflight_bytes + length > max_inflight_bytes:
+                        return
+                    inflight_bytes += submitting.submit_next(executor, compression_policy)
+                    continue
+
+                if next_index >= len(assets):
+                    return
+                asset, zip_target = assets[next_index]
+                size = sizes[next_index]
+                if size > chunk_size:
+                    # Large files which may be unchanged since the previous build are streamed by
+                    # this thread, after being inspected in the background
+                    if previous is not None and previous.find(zip_target, size) is not None:
+                        future = executor.submit(
+                            _inspect_file,
+                            asset,
+                            zip_target,
+                            chunk_size,
+                            compression_policy,
+                            bundle_manifest is not None
+                        )
+                        pending.append((next_index, future))
+                    elif block_size:
+                        submitting = _BlockedFile(asset, zip_target, size, block_size)
+                        pending.append((next_index, submitting))
+                    else:
+                        pending.append((next_index, None))
+                elif inflight_bytes > 0 and inflight_bytes + size > max_inflight_bytes:
+                    return
+                else:
+                    future = executor.submit(
+                        _read_and_prepare_entry,
+                        asset,
+                        zip_target,
+                        compression_policy,
+                        previous,
+                        bundle_manifest,
+                        asset_store,
+                        stats[next_index]
+                    )
+                    pending.append((next_index, future))
+                    inflight_bytes += size
+                next_index += 1
+
+        def blocks(blocked):
+            # Yields the blocks of a large asset in order, submitting more work as they are consumed
+            nonlocal inflight_bytes
+            for index in range(blocked.block_count()):
+                if index >= len(blocked.futures):
+                    fill()
+                block = blocked.futures[index].result()
+                blocked.futures[index] = None
+                inflight_bytes -= len(block.data)
+                fill()
+                yield block
+                if progress is not None:
+                    blocked.reported_bytes += len(block.data)
+                    _notify(
+                        progress,
+                        'block_zipped',
+                        path=blocked.zip_target,
+                        bytes=len(block.data)
+                    )
+
+        # Work of the asset being written
+        writing = None
+        try:
+            while pending or next_index < len(assets):
+                fill()
+                index, writing = pending.popleft()
+                work = writing
+                asset, zip_target = assets[index]
+                try:
+                    if isinstance(work, _BlockedFile):
+                        _write_blocked_file(work, zfile, blocks(work), bundle_manifest)
+                        metrics.LARGE_FILE_THROUGHPUT.observe(
+                            sizes[index] / max(time.perf_counter() - work.started, 1e-9)
+                        )
+                    elif sizes[index] > chunk_size:
+                        started = time.perf_counter()
+                        _write_large_file_to_zipfile(
+                            asset,
+                            zfile,
+                            zip_target,
+                            chunk_size,
+                            sizes[index],
+                            compression_policy,
+                            previous,
+                            work.result() if work is not None else None,
+                            bundle_manifest
+                        )
+                        metrics.LARGE_FILE_THROUGHPUT.observe(
+                            sizes[index] / max(time.perf_counter() - started, 1e-9)
+                        )
+                    else:
+                        _write_prepared_entry(
+                            work.result(),
+                            zfile,
+                            zip_target,
+                            chunk_size,
+                            previous,
+                            bundle_manifest
+                        )
+                        inflight_bytes -= sizes[index]
+                except Exception as err:
+                    message = 'Error inserting {} into zipfile at {}: {}'.format(
+                        asset,
+                        zip_target,
+                        err
+                    )
+                    raise TIOZipError(message)
+                if progress is not None:
+                    reported = work.reported_bytes if isinstance(work, _BlockedFile) else 0
+                    _notify(progress, 'file_zipped', path=zip_target, bytes=sizes[index] - reported)
+        finally:
+            for work in [writing] + [work for _, work in pending]:
+                futures = work.futures if isinstance(work, _BlockedFile) else [work]
+                for future in futures:
+                    if future is not None:
+                        future.cancel()
 
     return None
 
-def register_bundle(bundle_path, resource_path):
+@metrics.timed('registration')
+def register_bundle(bundle_path, resource_path, client=None):
     """
     Registeres bundle at the given path against a TensorIO Models repository at the given resource
     path.
@@ -211,35 +1208,17 @@ def register_bundle(bundle_path, resource_path):
     1. bundle_path - path to TensorIO bundle (GCS ok)
     2. resource_path - Full checkpoint path at which bundle should be registered
        (e.g. /models/<modelName>/hyperparameters/<hyperparametersName>/checkpoints/<checkpointName>)
+    3. client - (Optional) repository.RepositoryClient to register the bundle with; by default,
+       a client configured by the REPOSITORY and REPOSITORY_API_KEY environment variables, which
+       is shared by all registrations in this process
 
     Returns: Response text if the registration was successful, raises an error otherwise.
     """
-    checkpoints, checkpoint_id = os.path.split(resource_path)
-    if checkpoints == '' or checkpoint_id == '':
-        raise TIOModelsRegistrationError('Invalid resource path: {}'.format(resource_path))
-
-    repository_url = os.environ.get('REPOSITORY')
-    if repository_url is None:
-        # Should be in the form <host>[:<port>]/v1/repository
-        raise TIOModelsRegistrationError('REPOSITORY environment variable not set')
-
-    repository_api_key = os.environ.get('REPOSITORY_API_KEY')
-    if repository_api_key is None:
-        raise TIOModelsRegistrationError('REPOSITORY_API_KEY environment variable not set')
-
-    gcs_prefix = 'gs://'
-    if bundle_path[:len(gcs_prefix)] == gcs_prefix:
-        link = 'https://storage.googleapis.com/{}'.format(bundle_path[len(gcs_prefix):])
-
-    payload = {
-        'checkpointId': checkpoint_id,
-        'link': link
-    }
-    request_url = repository_url + checkpoints
-    bearer_token = 'Bearer {}'.format(repository_api_key)
-    headers = {'Authorization': bearer_token}
-    response = requests.post(request_url, headers=headers, json=payload)
-    return response.text
+    if client is None:
+        # Imported here because the repository module itself depends on this one
+        from . import repository
+        client = repository.default_client()
+    return client.register(bundle_path, resource_path)
 
 def generate_argument_parser():
     """
@@ -249,6 +1228,9 @@ def generate_argument_parser():
 
     Returns: None
     """
+    # Imported here because the watch module itself depends on this one
+    from . import watch
+
     parser = argparse.ArgumentParser(description='Create tiobundles for use with TensorIO')
 
     parser.add_argument(
@@ -286,6 +1268,228 @@ def generate_argument_parser():
         required=False,
         help='Path at which tiobundle zipfile should be created; defaults to <BUNDLE_NAME>.zip'
     )
+    parser.add_argument(
+        '--conversion-cache-dir',
+        required=False,
+        help=(
+            '(Optional) Directory (GCS ok) in which to cache TFLite binaries, keyed by the '
+            'contents of the SavedModel they were converted from'
+        )
+    )
+    parser.add_argument(
+        '--conversion-cache-max-bytes',
+        type=int,
+        default=cache.DEFAULT_MAX_BYTES,
+        help='Size (in bytes) beyond which entries are evicted from the conversion cache'
+    )
+    parser.add_argument(
+        '--conversion-timeout',
+        type=float,
+        required=False,
+        help=(
+            '(Optional) Timeout (in seconds) for the TFLite conversion; if this or '
+            '--conversion-memory-limit is specified, the conversion runs in a separate process'
+        )
+    )
+    parser.add_argument(
+        '--conversion-memory-limit',
+        type=int,
+        required=False,
+        help=(
+            '(Optional) Limit (in bytes) on the resident memory of the process running the TFLite '
+            'conversion; if this or --conversion-timeout is specified, the conversion runs in a '
+            'separate process'
+        )
+    )
+    parser.add_argument(
+        '--conversion-profile',
+        choices=quantization.PROFILES,
+        default=quantization.DEFAULT_PROFILE,
+        help=(
+            'Post-training quantization applied by the TFLite conversion: none, dynamic_range '
+            '(8-bit weights), float16 (float16 weights; TensorFlow 1.15 or later) or '
+            'full_integer (8-bit weights and activations; requires --representative-dataset) '
+            '(default: {})'.format(
+                quantization.DEFAULT_PROFILE
+            )
+        )
+    )
+    parser.add_argument(
+        '--representative-dataset',
+        required=False,
+        help=(
+            '(Optional) Path (GCS ok) to a .npy file (single input) or .npz file (one array per '
+            'input) of sample inputs, indexed by their first axis, used to calibrate '
+            'full_integer conversions'
+        )
+    )
+    parser.add_argument(
+        '--latency-runs',
+        type=int,
+        default=quantization.DEFAULT_LATENCY_RUNS,
+        help=(
+            'Number of timed invocations of the converted TFLite model used to measure its '
+            'latency, which is recorded with its size in the conversion report of the bundle; 0 '
+            'skips the measurement (default: {})'.format(quantization.DEFAULT_LATENCY_RUNS)
+        )
+    )
+    parser.add_argument(
+        '--benchmark',
+        action='store_true',
+        help=(
+            'Benchmark the converted TFLite model in the TFLite interpreter on synthetic inputs '
+            'shaped by model.json before bundling it, writing the report to <outfile>{} '
+            '(--build={} only)'.format(benchmark.REPORT_SUFFIX, TFLITE)
+        )
+    )
+    parser.add_argument(
+        '--benchmark-runs',
+        type=int,
+        default=benchmark.DEFAULT_RUNS,
+        help='Number of timed invocations of the model for each thread count (default: {})'.format(
+            benchmark.DEFAULT_RUNS
+        )
+    )
+    parser.add_argument(
+        '--benchmark-threads',
+        default=','.join(str(threads) for threads in benchmark.DEFAULT_THREAD_COUNTS),
+        help=(
+            'Comma-separated numbers of interpreter threads with which to benchmark the model; the '
+            'budget applies to the first (default: {})'.format(
+                ','.join(str(threads) for threads in benchmark.DEFAULT_THREAD_COUNTS)
+            )
+        )
+    )
+    parser.add_argument(
+        '--budget-p50-ms',
+        type=float,
+        required=False,
+        help='(Optional) Fail the build if the benchmarked p50 latency exceeds this (milliseconds)'
+    )
+    parser.add_argument(
+        '--budget-p95-ms',
+        type=float,
+        required=False,
+        help='(Optional) Fail the build if the benchmarked p95 latency exceeds this (milliseconds)'
+    )
+    parser.add_argument(
+        '--budget-peak-memory-bytes',
+        type=int,
+        required=False,
+        help='(Optional) Fail the build if the benchmarked peak memory exceeds this (bytes)'
+    )
+    parser.add_argument(
+        '--asset-store-dir',
+        required=False,
+        help=(
+            '(Optional) Local directory in which to keep the asset files fetched from remote '
+            'filesystems (e.g. GCS), keyed by their contents, so that bundles sharing assets fetch '
+            'them once'
+        )
+    )
+    parser.add_argument(
+        '--asset-store-max-bytes',
+        type=int,
+        default=blobstore.DEFAULT_MAX_BYTES,
+        help='Size (in bytes) beyond which least recently used assets are evicted from the store'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=(
+            'Size (in bytes) of the buffer used to stream files into the tiobundle; bounds the '
+            'memory used per file (default: {})'.format(DEFAULT_CHUNK_SIZE)
+        )
+    )
+    parser.add_argument(
+        '--fetch-workers',
+        type=int,
+        default=DEFAULT_FETCH_WORKERS,
+        help='Number of asset files to fetch concurrently (default: {})'.format(
+            DEFAULT_FETCH_WORKERS
+        )
+    )
+    parser.add_argument(
+        '--max-inflight-bytes',
+        type=int,
+        default=DEFAULT_MAX_INFLIGHT_BYTES,
+        help=(
+            'Maximum number of bytes of fetched asset files to hold in memory while they wait to '
+            'be written into the tiobundle (default: {})'.format(DEFAULT_MAX_INFLIGHT_BYTES)
+        )
+    )
+    parser.add_argument(
+        '--block-size',
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help=(
+            'Size (in bytes) of the blocks in which files larger than --chunk-size (e.g. '
+            'SavedModel variables shards) are fetched and compressed concurrently; 0 streams them '
+            'one at a time (default: {})'.format(DEFAULT_BLOCK_SIZE)
+        )
+    )
+    parser.add_argument(
+        '--compression',
+        default=compression.DEFAULT_POLICY,
+        help=(
+            'Compression policy for the entries of the tiobundle: a comma-separated list of '
+            '<glob>=<method>[:<level>] rules, optionally ending in a default <method>[:<level>]; '
+            'methods are stored, deflate, bzip2, lzma and auto (deflate if a sample of the entry '
+            'compresses well, store otherwise); e.g. "*.tflite=stored,deflate:9" '
+            '(default: {})'.format(compression.DEFAULT_POLICY)
+        )
+    )
+    parser.add_argument(
+        '--reproducible',
+        action='store_true',
+        help=(
+            'Build a reproducible tiobundle (fixed timestamps and permissions) containing a '
+            'manifest of the SHA-256 of its files; if an identical bundle already exists at the '
+            'output path, it is neither built nor registered again'
+        )
+    )
+    parser.add_argument(
+        '--previous-bundle',
+        required=False,
+        help=(
+            '(Optional) Zipped tiobundle from a previous build of this bundle; files which have '
+            'not changed since are copied from it rather than compressed again'
+        )
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Print the time taken by each stage of the build once it is done'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help=(
+            'Keep running after the build, rebuilding the bundle (and the TFLite model) in place '
+            'whenever the SavedModel, model.json, assets or representative dataset change; only '
+            'the stages affected by a change are run again, unchanged entries are copied from the '
+            'last build, and the time taken by each rebuild is printed'
+        )
+    )
+    parser.add_argument(
+        '--watch-interval',
+        type=float,
+        default=watch.DEFAULT_POLL_INTERVAL,
+        help=(
+            'Seconds between checks for changes to sources which are not watched with inotify '
+            '(e.g. on GCS) (default: {})'.format(watch.DEFAULT_POLL_INTERVAL)
+        )
+    )
+    parser.add_argument(
+        '--watch-debounce',
+        type=float,
+        default=watch.DEFAULT_DEBOUNCE,
+        help=(
+            'Seconds for which sources must stay unchanged before the bundle is rebuilt '
+            '(default: {})'.format(watch.DEFAULT_DEBOUNCE)
+        )
+    )
     parser.add_argument(
         '--repository-path',
         required=False,
@@ -300,30 +1504,151 @@ def generate_argument_parser():
 
     return parser
 
+def conversion_from_arguments(args):
+    """
+    Creates the conversion cache and executor requested by the command line arguments (see
+    generate_argument_parser) of a TFLite build
+
+    Returns: (conversion_cache, conversion_executor) pair, each of them None unless requested
+    """
+    conversion_cache = None
+    if args.conversion_cache_dir is not None:
+        conversion_cache = cache.ConversionCache(
+            args.conversion_cache_dir,
+            args.conversion_cache_max_bytes
+        )
+    conversion_executor = None
+    if args.conversion_timeout is not None or args.conversion_memory_limit is not None:
+        # Imported here because the conversion module itself depends on this one
+        from . import conversion
+        conversion_executor = conversion.ConversionExecutor(
+            max_workers=1,
+            timeout=args.conversion_timeout,
+            memory_limit=args.conversion_memory_limit
+        )
+    return conversion_cache, conversion_executor
+
 
 if __name__ == '__main__':
     parser = generate_argument_parser()
     args = parser.parse_args()
     model_path = args.saved_model_dir
-    if args.build == TFLITE:
-        if args.tflite_model is None:
-            raise ValueError(
-                '--tflite-model argument must be specified when --build={}'.format(TFLITE)
+    conversion_report = None
+    tiobundle_zip = args.outfile
+    if tiobundle_zip is None:
+        tiobundle_zip = '{}.zip'.format(args.bundle_name)
+
+    benchmark_spec = None
+    benchmark_options = None
+    if args.benchmark:
+        if args.build != TFLITE:
+            raise ValueError('--benchmark is only supported with --build={}'.format(TFLITE))
+        budget = {
+            'p50_ms': args.budget_p50_ms,
+            'p95_ms': args.budget_p95_ms,
+            'peak_memory_bytes': args.budget_peak_memory_bytes
+        }
+        benchmark_spec = {
+            'runs': args.benchmark_runs,
+            'thread_counts': [int(threads) for threads in args.benchmark_threads.split(',')],
+            'budget': {key: limit for key, limit in budget.items() if limit is not None}
+        }
+        benchmark_options = benchmark.parse_options(benchmark_spec)
+
+    if args.build == TFLITE and args.tflite_model is None:
+        raise ValueError(
+            '--tflite-model argument must be specified when --build={}'.format(TFLITE)
+        )
+
+    if args.watch:
+        from . import watch
+        conversion_cache, conversion_executor = None, None
+        if args.build == TFLITE:
+            conversion_cache, conversion_executor = conversion_from_arguments(args)
+        asset_store = None
+        if args.asset_store_dir is not None:
+            asset_store = blobstore.BlobStore(args.asset_store_dir, args.asset_store_max_bytes)
+        try:
+            watch.watch(
+                {
+                    'build': args.build,
+                    'saved_model_dir': args.saved_model_dir,
+                    'tflite_model': args.tflite_model,
+                    'model_json_path': args.model_json,
+                    'assets_path': args.assets_dir,
+                    'bundle_name': args.bundle_name,
+                    'bundle_output_path': tiobundle_zip,
+                    'previous_bundle_path': args.previous_bundle,
+                    'repository_path': args.repository_path,
+                    'compression': args.compression,
+                    'reproducible': args.reproducible,
+                    'conversion_profile': args.conversion_profile,
+                    'representative_dataset': args.representative_dataset,
+                    'latency_runs': args.latency_runs,
+                    'benchmark': benchmark_spec
+                },
+                conversion_cache=conversion_cache,
+                conversion_executor=conversion_executor,
+                asset_store=asset_store,
+                bundle_options={
+                    'chunk_size': args.chunk_size,
+                    'fetch_workers': args.fetch_workers,
+                    'max_inflight_bytes': args.max_inflight_bytes,
+                    'block_size': args.block_size
+                },
+                poll_interval=args.watch_interval,
+                debounce=args.watch_debounce
             )
-        if tf.gfile.Exists(args.tflite_model):
+        except KeyboardInterrupt:
+            print('Stopped watching')
+        finally:
+            if conversion_executor is not None:
+                conversion_executor.shutdown()
+        sys.exit(0)
+
+    if args.build == TFLITE:
+        if filesystem.exists(args.tflite_model):
             raise Exception('ERROR: TFLite model already exists - {}'.format(args.tflite_model))
 
         model_path = args.tflite_model
+        conversion_options = quantization.parse_options(
+            args.conversion_profile,
+            args.representative_dataset
+        )
 
         print('Building TFLite model -')
         print('SavedModel directory: {}, TFLite model: {}'.format(
             args.saved_model_dir, args.tflite_model
         ))
-        tflite_build_from_saved_model(args.saved_model_dir, args.tflite_model)
+        conversion_cache, conversion_executor = conversion_from_arguments(args)
+        try:
+            conversion_report = tflite_build_from_saved_model(
+                args.saved_model_dir,
+                args.tflite_model,
+                conversion_cache=conversion_cache,
+                conversion_executor=conversion_executor,
+                conversion_options=conversion_options,
+                latency_runs=args.latency_runs
+            )
+        finally:
+            if conversion_executor is not None:
+                conversion_executor.shutdown()
+        if conversion_cache is not None:
+            print('Conversion cache: {}'.format(conversion_cache.stats()))
+        print('Conversion report: {}'.format(json.dumps(conversion_report, sort_keys=True)))
 
-    tiobundle_zip = args.outfile
-    if tiobundle_zip is None:
-        tiobundle_zip = '{}.zip'.format(args.bundle_name)
+        if benchmark_options is not None:
+            print('Benchmarking TFLite model -')
+            benchmark_report = tflite_benchmark(
+                args.tflite_model,
+                args.model_json,
+                benchmark.report_path(tiobundle_zip),
+                options=benchmark_options
+            )
+            for result in benchmark_report['threads']:
+                print('threads: {threads}, p50: {p50_ms:.2f} ms, p95: {p95_ms:.2f} ms, peak '
+                      'memory: {peak_memory_bytes} bytes, speedup: {speedup}'.format(**result))
+            print('Benchmark report: {}'.format(benchmark.report_path(tiobundle_zip)))
 
     print('Building tiobundle -')
     print('model: {}, model.json: {}, assets directory: {}, bundle: {}, zipfile: {}'.format(
@@ -333,17 +1658,60 @@ if __name__ == '__main__':
         args.bundle_name,
         tiobundle_zip
     ))
-    bundle_path = tiobundle_build(
+    compression_policy = compression.parse_policy(args.compression)
+    asset_store = None
+    if args.asset_store_dir is not None:
+        asset_store = blobstore.BlobStore(args.asset_store_dir, args.asset_store_max_bytes)
+    unchanged = args.reproducible and identical_bundle_exists(
+        tiobundle_zip,
         model_path,
         args.model_json,
         args.assets_dir,
         args.bundle_name,
-        tiobundle_zip
+        compression_policy=compression_policy,
+        chunk_size=args.chunk_size,
+        fetch_workers=args.fetch_workers
     )
-    print('Bundle created: {}'.format(bundle_path))
+    if unchanged:
+        bundle_path = tiobundle_zip
+        print('Identical bundle already exists: {}'.format(bundle_path))
+    else:
+        bundle_path = tiobundle_build(
+            model_path,
+            args.model_json,
+            args.assets_dir,
+            args.bundle_name,
+            tiobundle_zip,
+            chunk_size=args.chunk_size,
+            fetch_workers=args.fetch_workers,
+            max_inflight_bytes=args.max_inflight_bytes,
+            previous_bundle=args.previous_bundle,
+            compression_policy=compression_policy,
+            reproducible=args.reproducible,
+            block_size=args.block_size,
+            conversion_report=conversion_report,
+            asset_store=asset_store,
+            existing_bundle_checked=True
+        )
+        print('Bundle created: {}'.format(bundle_path))
+        if asset_store is not None:
+            print('Asset store: {}'.format(asset_store.stats()))
 
-    if args.repository_path != '':
+    if args.repository_path != '' and not unchanged:
         registration = register_bundle(bundle_path, args.repository_path)
         print('Bundle registered against repository: {}'.format(registration))
 
+    if args.profile:
+        print(metrics.format_stage_summary())
+        print('Bytes read: {}, bytes written: {}'.format(
+            metrics.BYTES_READ.value(),
+            metrics.BYTES_WRITTEN.value()
+        ))
+        large_files, total_throughput = metrics.LARGE_FILE_THROUGHPUT.summary().get((), (0, 0.0))
+        if large_files > 0:
+            print('Large files: {}, mean throughput: {:.1f} MiB/s'.format(
+                large_files,
+                total_throughput / large_files / (1024 * 1024)
+            ))
+
     print('Done!')
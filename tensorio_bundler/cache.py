@@ -0,0 +1,255 @@
+"""
+Content-addressed cache of TFLite binaries converted from SavedModels
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import pkg_resources
+
+from . import filesystem
+
+INDEX_FILENAME = 'index.json'
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+# Size of the buffer used to hash SavedModel files
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+def _tensorflow_version():
+    # Read from package metadata so that computing cache keys does not require importing TensorFlow
+    try:
+        return pkg_resources.get_distribution('tensorflow').version
+    except pkg_resources.DistributionNotFound:
+        return 'unknown'
+
+def saved_model_digest(saved_model_dir, settings=None):
+    """
+    Computes a SHA-256 digest of the contents of a SavedModel directory (saved_model.pb, variables
+    and any other files it contains) together with the settings used to convert it and the version
+    of TensorFlow doing the conversion.
+
+    The directory is listed in a single pass (see filesystem.scan). Files which the listing gives a
+    fingerprint (e.g. the MD5 of a GCS object) are identified by their size and fingerprint, so
+    that computing the key of a remote SavedModel does not download it; the contents of the others
+    (e.g. local files) are hashed.
+
+    Args:
+    1. saved_model_dir - Local or GCS path to SavedModel directory
+    2. settings - (Optional) JSON-serializable dictionary of converter settings
+
+    Returns: Hex digest string
+    """
+    digest = hashlib.sha256()
+    digest.update(_tensorflow_version().encode('utf-8'))
+    digest.update(json.dumps(settings or {}, sort_keys=True).encode('utf-8'))
+
+    files = filesystem.scan(saved_model_dir)
+    for relative_path in sorted(files):
+        digest.update(relative_path.encode('utf-8'))
+        digest.update(b'\0')
+        file_stat = files[relative_path]
+        if file_stat.fingerprint is not None:
+            digest.update('{}:{}'.format(file_stat.size, file_stat.fingerprint).encode('utf-8'))
+        else:
+            with filesystem.open(os.path.join(saved_model_dir, relative_path), 'rb') as infile:
+                while True:
+                    chunk = infile.read(HASH_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+class ConversionCache:
+    """
+    Cache of TFLite binaries stored under a local or GCS directory, keyed by the digest of the
+    SavedModel they were converted from. Entries are evicted in least recently used order once
+    the total size of the cache exceeds max_bytes.
+
+    The cache index is stored alongside the entries, so the same directory may be shared by
+    several processes. Concurrent updates to the index from different processes may lose access
+    times, which only affects the order of eviction. Errors accessing the cache are counted and
+    treated as misses, so that an unavailable cache never fails a conversion.
+    """
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        # Maps keys to (lock, number of threads using the lock) pairs
+        self._key_locks = {}
+        filesystem.makedirs(cache_dir)
+
+    def key(self, saved_model_dir, settings=None):
+        """
+        Returns the cache key for the given SavedModel directory and converter settings
+        """
+        return saved_model_digest(saved_model_dir, settings)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        Context manager which holds a lock specific to the given key, so that threads in this
+        process converting the same SavedModel can wait for each other rather than converting it
+        concurrently
+        """
+        with self._lock:
+            key_lock, users = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (key_lock, users + 1)
+        try:
+            with key_lock:
+                yield
+        finally:
+            with self._lock:
+                key_lock, users = self._key_locks[key]
+                if users == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (key_lock, users - 1)
+
+    def entry_path(self, key):
+        """
+        Returns the path at which the cache entry with the given key is stored
+        """
+        return os.path.join(self.cache_dir, '{}.tflite'.format(key))
+
+    def fetch(self, key, outfile):
+        """
+        Copies the cached TFLite binary with the given key to outfile, if it exists. The cache is
+        only locked while its index is read and updated, not while the entry is copied.
+
+        Args:
+        1. key - Cache key (as returned by the key method)
+        2. outfile - Path to which the TFLite binary should be copied
+
+        Returns: True if the entry was in the cache, False otherwise
+        """
+        try:
+            with self._lock:
+                cached = key in self._read_index()
+            if cached and filesystem.exists(self.entry_path(key)):
+                filesystem.copy(self.entry_path(key), outfile)
+            else:
+                cached = False
+        except Exception:
+            with self._lock:
+                self.errors += 1
+                self.misses += 1
+            return False
+
+        with self._lock:
+            if not cached:
+                self.misses += 1
+                return False
+            self.hits += 1
+            try:
+                index = self._read_index()
+                if key in index:
+                    index[key]['last_access'] = time.time()
+                    self._write_index(index)
+            except Exception:
+                # The entry was fetched; only its access time is lost
+                self.errors += 1
+            return True
+
+    def store(self, key, tflite_file):
+        """
+        Adds the TFLite binary at the given path to the cache under the given key, evicting least
+        recently used entries if the cache grows larger than max_bytes. The binary is copied into
+        the cache before the cache is locked to update its index.
+
+        Args:
+        1. key - Cache key (as returned by the key method)
+        2. tflite_file - Path to TFLite binary
+
+        Returns: None
+        """
+        try:
+            size = filesystem.size(tflite_file)
+            temp_path = '{}.{}.tmp'.format(self.entry_path(key), uuid.uuid4().hex)
+            filesystem.copy(tflite_file, temp_path)
+            filesystem.rename(temp_path, self.entry_path(key))
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            return
+
+        with self._lock:
+            try:
+                index = self._read_index()
+                index[key] = {'size': size, 'last_access': time.time()}
+                self._evict(index)
+                self._write_index(index)
+            except Exception:
+                self.errors += 1
+
+    def stats(self):
+        """
+        Returns: Dictionary of cache statistics
+        """
+        with self._lock:
+            try:
+                index = self._read_index()
+            except Exception:
+                index = {}
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'entries': len(index),
+                'bytes': sum(entry['size'] for entry in index.values())
+            }
+
+    def _evict(self, index):
+        total_bytes = sum(entry['size'] for entry in index.values())
+        by_last_access = sorted(index, key=lambda key: index[key]['last_access'])
+        for key in by_last_access:
+            if total_bytes <= self.max_bytes:
+                break
+            entry_path = self.entry_path(key)
+            if filesystem.exists(entry_path):
+                filesystem.remove(entry_path)
+            total_bytes -= index.pop(key)['size']
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILENAME)
+
+    def _read_index(self):
+        index_path = self._index_path()
+        if not filesystem.exists(index_path):
+            return {}
+        with filesystem.open(index_path, 'rb') as index_file:
+            try:
+                return json.loads(index_file.read().decode('utf-8'))
+            except ValueError:
+                # A corrupt index only loses access times; the entries are still valid.
+                return {}
+
+    def _write_index(self, index):
+        index_path = self._index_path()
+        temp_path = '{}.{}.tmp'.format(index_path, uuid.uuid4().hex)
+        with filesystem.open(temp_path, 'wb') as index_file:
+            index_file.write(json.dumps(index).encode('utf-8'))
+        filesystem.rename(temp_path, index_path)
+
+def from_environment():
+    """
+    Creates a ConversionCache from the CONVERSION_CACHE_DIR and (optional)
+    CONVERSION_CACHE_MAX_BYTES environment variables.
+
+    Returns: ConversionCache, or None if CONVERSION_CACHE_DIR is not set
+    """
+    cache_dir = os.environ.get('CONVERSION_CACHE_DIR')
+    if not cache_dir:
+        return None
+    max_bytes = int(os.environ.get('CONVERSION_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    return ConversionCache(cache_dir, max_bytes)
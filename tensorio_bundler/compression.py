@@ -0,0 +1,175 @@
+"""
+Policies deciding how each entry of a tiobundle is compressed
+"""
+
+import fnmatch
+import zipfile
+import zlib
+
+STORED = 'stored'
+DEFLATE = 'deflate'
+BZIP2 = 'bzip2'
+LZMA = 'lzma'
+# Deflates entries whose sampled prefix compresses well and stores the others
+AUTO = 'auto'
+
+COMPRESS_TYPES = {
+    STORED: zipfile.ZIP_STORED,
+    DEFLATE: zipfile.ZIP_DEFLATED,
+    BZIP2: zipfile.ZIP_BZIP2,
+    LZMA: zipfile.ZIP_LZMA,
+}
+
+# Ranges (inclusive) of the compression levels accepted by each method; methods which are not
+# listed do not take a level. AUTO levels apply to the entries which it deflates.
+LEVEL_RANGES = {
+    DEFLATE: (-1, 9),
+    BZIP2: (1, 9),
+    AUTO: (-1, 9),
+}
+
+# Bundles were always stored uncompressed before compression policies were introduced
+DEFAULT_POLICY = STORED
+
+# Number of bytes at the start of each entry which AUTO compresses to estimate how well the whole
+# entry would compress
+SAMPLE_SIZE = 64 * 1024
+# AUTO deflates entries whose sampled prefix deflates to at most this fraction of its size
+AUTO_MAX_RATIO = 0.9
+
+class InvalidCompressionPolicyError(Exception):
+    """
+    Raised if a compression policy specification cannot be parsed.
+    """
+    pass
+
+def _parse_method(method_spec):
+    method, _, level = method_spec.strip().partition(':')
+    method = method.strip().lower()
+    if method not in COMPRESS_TYPES and method != AUTO:
+        raise InvalidCompressionPolicyError(
+            'ERROR: Unknown compression method "{}"; must be one of {}'.format(
+                method,
+                ', '.join(sorted(list(COMPRESS_TYPES) + [AUTO]))
+            )
+        )
+    if level == '':
+        return method, None
+    if method not in LEVEL_RANGES:
+        raise InvalidCompressionPolicyError(
+            'ERROR: Compression method {} does not take a level'.format(method)
+        )
+    try:
+        parsed_level = int(level)
+    except ValueError:
+        raise InvalidCompressionPolicyError(
+            'ERROR: Invalid compression level "{}" for {}'.format(level, method)
+        )
+    min_level, max_level = LEVEL_RANGES[method]
+    if not min_level <= parsed_level <= max_level:
+        raise InvalidCompressionPolicyError(
+            'ERROR: Compression level of {} must be between {} and {}; got {}'.format(
+                method,
+                min_level,
+                max_level,
+                parsed_level
+            )
+        )
+    return method, parsed_level
+
+class CompressionPolicy:
+    """
+    Chooses the compression of each entry in a bundle from a list of (glob pattern, method, level)
+    rules. Patterns are matched against the paths of entries relative to the bundle directory (e.g.
+    "assets/labels.txt"); the first matching rule applies, and entries which match no rule use the
+    default method.
+    """
+    def __init__(self, rules=None, default=(STORED, None)):
+        self.rules = list(rules or [])
+        self.default = default
+
+    def method(self, zip_target):
+        """
+        Returns: (method, level) pair which applies to the entry at zip_target
+        """
+        relative_path = zip_target.replace('\\', '/').split('/', 1)[-1]
+        for pattern, method, level in self.rules:
+            if fnmatch.fnmatch(relative_path, pattern):
+                return method, level
+        return self.default
+
+    def spec(self):
+        """
+        Returns: Specification of this policy in the form accepted by parse_policy
+        """
+        def method_spec(method, level):
+            return method if level is None else '{}:{}'.format(method, level)
+        parts = [
+            '{}={}'.format(pattern, method_spec(method, level))
+            for pattern, method, level in self.rules
+        ]
+        parts.append(method_spec(*self.default))
+        return ','.join(parts)
+
+    def needs_sample(self, zip_target):
+        """
+        Returns: True if choosing the compression of the entry at zip_target requires a sample of
+        its contents
+        """
+        return self.method(zip_target)[0] == AUTO
+
+    def select(self, zip_target, sample=b''):
+        """
+        Chooses the compression of the entry at zip_target.
+
+        Args:
+        1. zip_target - Path of the entry in the bundle
+        2. sample - Prefix of the contents of the entry (at least SAMPLE_SIZE bytes of it, unless
+           the entry is smaller); only used for entries whose method is AUTO
+
+        Returns: (zip compression type, level) pair
+        """
+        method, level = self.method(zip_target)
+        if method == AUTO:
+            sample = sample[:SAMPLE_SIZE]
+            if len(sample) > 0 and len(zlib.compress(sample, 1)) <= AUTO_MAX_RATIO * len(sample):
+                method = DEFLATE
+            else:
+                method = STORED
+        return COMPRESS_TYPES[method], level
+
+def parse_policy(spec):
+    """
+    Parses a compression policy specification: a comma-separated list of rules of the form
+    <glob pattern>=<method>[:<level>], optionally ending in a bare <method>[:<level>] which applies
+    to entries that match none of the rules (by default they are stored). The methods are "stored",
+    "deflate", "bzip2", "lzma" and "auto"; levels may only be given to those in LEVEL_RANGES. For
+    example:
+        *.tflite=stored,assets/*=deflate:9,auto
+
+    Raises an InvalidCompressionPolicyError if the specification is not a string or cannot be
+    parsed.
+
+    Args:
+    1. spec - Policy specification, or None for the DEFAULT_POLICY
+
+    Returns: CompressionPolicy
+    """
+    if spec is None:
+        spec = DEFAULT_POLICY
+    if not isinstance(spec, str):
+        raise InvalidCompressionPolicyError('ERROR: Compression policy must be a string')
+    rules = []
+    default = (STORED, None)
+    parts = [part for part in spec.split(',') if part.strip() != '']
+    for index, part in enumerate(parts):
+        pattern, separator, method_spec = part.rpartition('=')
+        if separator == '':
+            if index != len(parts) - 1:
+                raise InvalidCompressionPolicyError(
+                    'ERROR: Default compression method "{}" must come last'.format(part)
+                )
+            default = _parse_method(part)
+        else:
+            rules.append((pattern.strip(),) + _parse_method(method_spec))
+    return CompressionPolicy(rules, default)
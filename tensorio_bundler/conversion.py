@@ -0,0 +1,273 @@
+"""
+Isolated execution of SavedModel to TFLite conversions on a pool of warm worker processes
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+from . import benchmark, bundler, quantization
+
+DEFAULT_MAX_WORKERS = 1
+DEFAULT_TIMEOUT = 30 * 60
+
+# Interval (in seconds) at which workers are checked for completion and memory usage
+POLL_INTERVAL = 0.5
+
+# Functions which conversion workers run on request, by name
+_WORKER_FUNCTIONS = {
+    'convert': bundler.convert_saved_model,
+    'measure_latency': quantization.measure_latency,
+    'benchmark': benchmark.benchmark_model
+}
+
+def _worker_main(connection):
+    """
+    Entry point of conversion worker processes. Imports TensorFlow, reports that it is ready and
+    then runs requests received over the connection until it is closed. Each request is a
+    (function name, arguments) pair naming one of the _WORKER_FUNCTIONS.
+    """
+    import tensorflow # pylint: disable=unused-import
+    connection.send(('ready', None))
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        function_name, args = request
+        try:
+            result = _WORKER_FUNCTIONS[function_name](*args)
+            connection.send(('ok', result))
+        except Exception as err:
+            connection.send(('error', '{}: {}'.format(type(err).__name__, err)))
+
+class _Worker:
+    """
+    A single conversion worker process and the connection used to send it requests
+    """
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_connection,), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+
+    def run(self, request, timeout, memory_limit):
+        """
+        Runs a request (see _worker_main), such as a conversion, on this worker.
+
+        Raises a bundler.TFLiteConversionError if the worker crashes, times out or exceeds the
+        memory limit, in which case it should not be reused.
+
+        Returns: ("ok", <result>) if the request succeeded, ("error", <message>) if it failed
+        """
+        if not self.ready:
+            # Time spent importing TensorFlow does not count towards the timeout
+            self._receive(None, None)
+            self.ready = True
+        try:
+            self.connection.send(request)
+        except OSError as err:
+            raise bundler.TFLiteConversionError(
+                'ERROR: Could not send request to conversion worker - {}'.format(err)
+            )
+        return self._receive(timeout, memory_limit)
+
+    def _receive(self, timeout, memory_limit):
+        start = time.time()
+        while True:
+            wait = POLL_INTERVAL
+            if timeout is not None:
+                remaining = timeout - (time.time() - start)
+                if remaining <= 0:
+                    raise bundler.TFLiteConversionTimeoutError(
+                        'ERROR: Conversion did not finish within {} seconds'.format(timeout)
+                    )
+                wait = min(wait, remaining)
+            if self.connection.poll(wait) or not self.process.is_alive():
+                break
+            if memory_limit is not None:
+                memory = benchmark.resident_memory(self.process.pid)
+                if memory is not None and memory > memory_limit:
+                    raise bundler.TFLiteConversionError(
+                        'ERROR: Conversion exceeded memory limit of {} bytes'.format(memory_limit)
+                    )
+        try:
+            return self.connection.recv()
+        except EOFError:
+            self.process.join(POLL_INTERVAL)
+            raise bundler.TFLiteConversionError(
+                'ERROR: Conversion worker exited with code {}'.format(self.process.exitcode)
+            )
+
+    def stop(self):
+        """
+        Stops the worker process, killing it if it is busy
+        """
+        if self.process.is_alive():
+            os.kill(self.process.pid, signal.SIGKILL)
+        self.process.join()
+        self.connection.close()
+
+class ConversionExecutor:
+    """
+    Runs TFLite conversions on a pool of max_workers processes which import TensorFlow when they
+    are started, so that conversions do not pay for the import and a converter which crashes or
+    runs out of memory cannot take down the calling process. The workers are started by start (or
+    start_in_background) or, failing that, by the first request, so that creating an executor does
+    not import TensorFlow by itself.
+
+    Each conversion must finish within timeout seconds and its worker must use at most
+    memory_limit bytes of resident memory (if specified); otherwise the worker is killed, replaced
+    and a bundler.TFLiteConversionError is raised.
+
+    Conversions beyond the number of workers wait for a worker to become free.
+    """
+    def __init__(
+            self,
+            max_workers=DEFAULT_MAX_WORKERS,
+            timeout=DEFAULT_TIMEOUT,
+            memory_limit=None
+        ):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        # Workers are spawned rather than forked so that they do not inherit the state (threads,
+        # sockets) of the process that created them
+        self._context = multiprocessing.get_context('spawn')
+        self._idle_workers = queue.Queue()
+        self._workers = []
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the worker processes, unless they have already been started
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            for _ in range(self.max_workers):
+                self._add_worker()
+            self._started = True
+
+    def start_in_background(self):
+        """
+        Starts the worker processes (see start) on a daemon thread, so that they import TensorFlow
+        while the calling process goes on, e.g. to serve requests, and conversions do not wait for
+        them to start
+
+        Returns: None
+        """
+        threading.Thread(target=self.start, daemon=True).start()
+
+    def _add_worker(self):
+        # Must be called with _start_lock held
+        worker = _Worker(self._context)
+        self._workers.append(worker)
+        self._idle_workers.put(worker)
+
+    def _run(self, request, timeout):
+        # Runs a request on an idle worker, replacing the worker if it fails
+        self.start()
+        worker = self._idle_workers.get()
+        try:
+            result = worker.run(
+                request,
+                timeout if timeout is not None else self.timeout,
+                self.memory_limit
+            )
+        except Exception:
+            with self._start_lock:
+                self._workers.remove(worker)
+                self._add_worker()
+            worker.stop()
+            raise
+        self._idle_workers.put(worker)
+        return result
+
+    def convert(self, saved_model_dir, outfile, timeout=None, options=None):
+        """
+        Converts the SavedModel in saved_model_dir into a TFLite binary at outfile on one of the
+        worker processes.
+
+        Args:
+        1. saved_model_dir - Directory containing SavedModel protobuf file and variables
+        2. outfile - Path to which to write TFLite binary
+        3. timeout - (Optional) Timeout (in seconds) for this conversion; defaults to the
+           timeout of the executor
+        4. options - (Optional) quantization.ConversionOptions specifying the conversion profile
+
+        Returns: None
+        """
+        status, message = self._run(('convert', (saved_model_dir, outfile, options)), timeout)
+        if status != 'ok':
+            raise bundler.TFLiteConversionError(
+                'ERROR: Conversion of {} failed - {}'.format(saved_model_dir, message)
+            )
+
+    def measure_latency(self, tflite_path, runs=quantization.DEFAULT_LATENCY_RUNS, timeout=None):
+        """
+        Measures the latency of the TFLite binary at tflite_path in the TFLite interpreter of one
+        of the worker processes (see quantization.measure_latency), subject to the same limits as
+        conversions.
+
+        Returns: Latency measurements, as returned by quantization.measure_latency
+        """
+        status, result = self._run(('measure_latency', (tflite_path, runs)), timeout)
+        if status != 'ok':
+            raise bundler.TFLiteConversionError(
+                'ERROR: Measuring the latency of {} failed - {}'.format(tflite_path, result)
+            )
+        return result
+
+    def benchmark(self, tflite_path, model_json_path, options=None, timeout=None):
+        """
+        Benchmarks the TFLite binary at tflite_path in the TFLite interpreter of one of the worker
+        processes (see benchmark.benchmark_model), subject to the same limits as conversions.
+
+        Returns: Benchmark report, as returned by benchmark.benchmark_model
+        """
+        status, result = self._run(
+            ('benchmark', (tflite_path, model_json_path, options)),
+            timeout
+        )
+        if status != 'ok':
+            raise bundler.TFLiteConversionError(
+                'ERROR: Benchmarking {} failed - {}'.format(tflite_path, result)
+            )
+        return result
+
+    def shutdown(self):
+        """
+        Stops all worker processes
+        """
+        with self._start_lock:
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+            self._idle_workers = queue.Queue()
+            self._started = False
+
+def from_environment():
+    """
+    Creates a ConversionExecutor configured by the (optional) CONVERSION_WORKERS,
+    CONVERSION_TIMEOUT and CONVERSION_MEMORY_LIMIT environment variables.
+
+    Returns: ConversionExecutor, or None if CONVERSION_WORKERS is 0 (in which case conversions
+    should run in the calling process)
+    """
+    max_workers = int(os.environ.get('CONVERSION_WORKERS', DEFAULT_MAX_WORKERS))
+    if max_workers == 0:
+        return None
+    memory_limit = os.environ.get('CONVERSION_MEMORY_LIMIT')
+    return ConversionExecutor(
+        max_workers=max_workers,
+        timeout=float(os.environ.get('CONVERSION_TIMEOUT', DEFAULT_TIMEOUT)),
+        memory_limit=int(memory_limit) if memory_limit is not None else None
+    )
@@ -0,0 +1,169 @@
+"""
+Deduplication of identical bundle requests: concurrent duplicates share a single build, and the
+results of recently completed builds are returned to retries without building again
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+
+from . import metrics
+
+# Seconds for which the result of a successful build is returned to identical requests
+DEFAULT_TTL = 300.0
+# Number of results retained
+DEFAULT_MAX_ENTRIES = 1000
+
+# Keys of bundle specifications which do not affect the bundle that is built
+IGNORED_KEYS = {'async'}
+
+class IdempotencyKeyMismatchError(Exception):
+    """
+    Raised if an idempotency key is reused with a different bundle specification.
+    """
+    pass
+
+def fingerprint(spec):
+    """
+    Returns: SHA-256 (hex digest) of the canonical JSON encoding of the bundle specification,
+    ignoring the IGNORED_KEYS
+    """
+    relevant = {key: value for key, value in spec.items() if key not in IGNORED_KEYS}
+    canonical = json.dumps(relevant, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class RequestCoalescer:
+    """
+    Runs each distinct bundle request once. Requests are identified by their idempotency key if
+    they have one, and by the fingerprint of their specification otherwise. A request which
+    arrives while an identical one is running waits for it and gets the same result (or error);
+    one which arrives within ttl seconds of an identical request succeeding gets its result
+    straight away. Failures are not retained, so a retry after a failure builds again.
+
+    Thread-safe; the same coalescer may be used from threads (run) and coroutines (run_async).
+    """
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._in_flight = {}
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self.cached = 0
+
+    def _claim(self, spec, idempotency_key):
+        # Returns (key, future, owner): owner is True if the caller is to run the request and
+        # resolve future, and False if it should wait on future
+        spec_fingerprint = fingerprint(spec)
+        key = 'key:' + idempotency_key if idempotency_key else 'spec:' + spec_fingerprint
+        now = time.time()
+        with self._lock:
+            while self._results:
+                oldest_key, (_, _, completed_at) = next(iter(self._results.items()))
+                if now - completed_at <= self.ttl:
+                    break
+                self._results.pop(oldest_key)
+
+            if key in self._results:
+                result_fingerprint, result, _ = self._results[key]
+                self._check_fingerprint(idempotency_key, result_fingerprint, spec_fingerprint)
+                self.cached += 1
+                metrics.DEDUPLICATED_REQUESTS.inc('cached')
+                future = concurrent.futures.Future()
+                future.set_result(result)
+                return key, future, False
+
+            if key in self._in_flight:
+                in_flight_fingerprint, future = self._in_flight[key]
+                self._check_fingerprint(idempotency_key, in_flight_fingerprint, spec_fingerprint)
+                self.coalesced += 1
+                metrics.DEDUPLICATED_REQUESTS.inc('coalesced')
+                return key, future, False
+
+            future = concurrent.futures.Future()
+            self._in_flight[key] = (spec_fingerprint, future)
+            return key, future, True
+
+    def _check_fingerprint(self, idempotency_key, expected, actual):
+        if expected != actual:
+            raise IdempotencyKeyMismatchError(
+                'ERROR: Idempotency key {} was already used for a different request'.format(
+                    idempotency_key
+                )
+            )
+
+    def _resolve(self, key, future, result=None, error=None):
+        with self._lock:
+            spec_fingerprint, _ = self._in_flight.pop(key)
+            if error is None and self.ttl > 0:
+                self._results[key] = (spec_fingerprint, result, time.time())
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def run(self, spec, fn, *args, idempotency_key=None, **kwargs):
+        """
+        Returns fn(*args, **kwargs), unless an identical request (see RequestCoalescer) is running
+        or recently succeeded, in which case its result is returned instead. Errors raised by fn
+        are raised to every request waiting for it.
+        """
+        key, future, owner = self._claim(spec, idempotency_key)
+        if not owner:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._resolve(key, future, error=e)
+            raise
+        self._resolve(key, future, result=result)
+        return result
+
+    async def run_async(self, spec, coroutine_fn, *args, idempotency_key=None, **kwargs):
+        """
+        Same as run, for a coroutine function; waiting for an identical request does not block the
+        event loop.
+        """
+        key, future, owner = self._claim(spec, idempotency_key)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await coroutine_fn(*args, **kwargs)
+        except BaseException as e:
+            self._resolve(key, future, error=e)
+            raise
+        self._resolve(key, future, result=result)
+        return result
+
+    def stats(self):
+        """
+        Returns: Dictionary with the numbers of requests which waited for an identical request
+        (coalesced) or got the result of one which had completed (cached), and of requests
+        in_flight and results retained
+        """
+        with self._lock:
+            return {
+                'coalesced': self.coalesced,
+                'cached': self.cached,
+                'in_flight': len(self._in_flight),
+                'results': len(self._results)
+            }
+
+def from_environment():
+    """
+    Creates a RequestCoalescer configured by the (optional) DEDUP_TTL and DEDUP_MAX_ENTRIES
+    environment variables. Set DEDUP_TTL to 0 to only coalesce concurrent requests.
+
+    Returns: RequestCoalescer
+    """
+    return RequestCoalescer(
+        ttl=float(os.environ.get('DEDUP_TTL', DEFAULT_TTL)),
+        max_entries=int(os.environ.get('DEDUP_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+    )
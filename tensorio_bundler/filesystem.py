@@ -0,0 +1,855 @@
+"""
+Filesystem abstraction over local, GCS, in-memory and other (TensorFlow-supported) paths
+
+Paths are dispatched to a FileSystem by their prefix:
++ gs:// paths are handled by GCSFileSystem if the google-cloud-storage package is installed, and by
+  TensorFlowFileSystem otherwise
++ mem:// paths are handled by a MemoryFileSystem (intended for tests)
++ paths with any other scheme (e.g. hdfs://) are handled by TensorFlowFileSystem
++ paths without a scheme are handled by LocalFileSystem
+
+The module-level functions (exists, isdir, open, ...) dispatch to the appropriate FileSystem.
+"""
+
+import builtins
+import collections
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import uuid
+
+GCS_PREFIX = 'gs://'
+MEMORY_PREFIX = 'mem://'
+
+# Size of the buffer used when copying files between filesystems
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Size of the chunks in which data is sent in resumable uploads to GCS; must be a multiple of
+# 256 KiB
+GCS_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Size of the buffer used by files opened for random access (e.g. to read a single entry of a zip);
+# small, so that seeking around a remote file does not download much more than is read
+RANDOM_ACCESS_BUFFER_SIZE = 64 * 1024
+
+# Size (in bytes) of a file, and a fingerprint identifying the version of its contents (e.g. the MD5
+# of a GCS object) which changes whenever they change, or None if the filesystem has no cheap way
+# of identifying them
+FileStat = collections.namedtuple('FileStat', ['size', 'fingerprint'])
+
+class AtomicWriter:
+    """
+    Write-only file-like object whose contents only appear at its destination path once it is
+    closed. Calling discard instead of close abandons everything written so far.
+
+    When used as a context manager, the writer is closed if the block succeeds and discarded if
+    it raises an exception.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.closed = False
+
+    def write(self, data):
+        """
+        Writes data (bytes) to the file
+
+        Returns: Number of bytes written
+        """
+        raise NotImplementedError
+
+    def tell(self):
+        """
+        Returns: Number of bytes written so far
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Does nothing; data is only guaranteed to reach its destination when the writer is closed
+        """
+        pass
+
+    def writable(self):
+        return True
+
+    def close(self):
+        """
+        Makes the data written so far available at the destination path
+        """
+        if not self.closed:
+            self.closed = True
+            self._commit()
+
+    def discard(self):
+        """
+        Abandons the data written so far, leaving the destination path untouched
+        """
+        if not self.closed:
+            self.closed = True
+            self._discard()
+
+    def _commit(self):
+        raise NotImplementedError
+
+    def _discard(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+class _TemporaryFileWriter(AtomicWriter):
+    """
+    AtomicWriter which writes to a temporary file and then copies it to its destination when it is
+    closed. The temporary file is seekable.
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self.temp_file = tempfile.NamedTemporaryFile(
+            prefix='tensorio-bundler-',
+            suffix='.tmp',
+            delete=False
+        )
+
+    def write(self, data):
+        return self.temp_file.write(data)
+
+    def tell(self):
+        return self.temp_file.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.temp_file.seek(offset, whence)
+
+    def seekable(self):
+        return True
+
+    def flush(self):
+        self.temp_file.flush()
+
+    def _commit(self):
+        self.temp_file.close()
+        try:
+            copy(self.temp_file.name, self.path)
+        finally:
+            os.remove(self.temp_file.name)
+
+    def _discard(self):
+        self.temp_file.close()
+        os.remove(self.temp_file.name)
+
+class _LocalAtomicWriter(_TemporaryFileWriter):
+    """
+    AtomicWriter which writes to a temporary file in the same directory as its destination and
+    renames it into place when it is closed
+    """
+    def __init__(self, path):
+        AtomicWriter.__init__(self, path)
+        temp_path = os.path.join(
+            os.path.dirname(os.path.abspath(path)),
+            '.{}.{}.tmp'.format(os.path.basename(path), uuid.uuid4().hex)
+        )
+        # Unlike tempfile, this creates the file with the same permissions as any other new file
+        self.temp_file = builtins.open(temp_path, 'xb')
+
+    def _commit(self):
+        self.temp_file.close()
+        try:
+            os.replace(self.temp_file.name, self.path)
+        except OSError:
+            os.remove(self.temp_file.name)
+            raise
+
+class FileSystem:
+    """
+    Interface implemented by each filesystem. Paths passed to its methods include their scheme.
+    """
+    def exists(self, path):
+        """
+        Returns: True if there is a file or directory at path, False otherwise
+        """
+        raise NotImplementedError
+
+    def isdir(self, path):
+        """
+        Returns: True if there is a directory at path, False otherwise
+        """
+        raise NotImplementedError
+
+    def listdir(self, path):
+        """
+        Returns: List of the names of the files and directories in the directory at path
+        """
+        raise NotImplementedError
+
+    def size(self, path):
+        """
+        Returns: Size (in bytes) of the file at path
+        """
+        raise NotImplementedError
+
+    def stat(self, path):
+        """
+        Returns: FileStat of the file at path. By default, it has no fingerprint; filesystems
+        which get one with the size of the file (in the same request) override this.
+        """
+        return FileStat(self.size(path), None)
+
+    def open(self, path, mode='rb'):
+        """
+        Opens the file at path in binary mode ('rb' or 'wb'). Files opened for reading are
+        streamed rather than read into memory in their entirety.
+
+        Returns: File-like object
+        """
+        raise NotImplementedError
+
+    def open_random_access(self, path, buffer_size=RANDOM_ACCESS_BUFFER_SIZE):
+        """
+        Opens the file at path for reading with seeks, such that reading a few bytes at some
+        offset only reads (about) buffer_size bytes from the underlying storage. By default, this
+        is the same as opening the file in 'rb' mode; filesystems whose files are read in large
+        chunks override this.
+
+        Returns: Seekable file-like object
+        """
+        return self.open(path, 'rb')
+
+    def atomic_writer(self, path):
+        """
+        Opens the file at path for writing, such that it only appears at path once the writer is
+        closed. By default, data is spooled to a local temporary file which is copied to path when
+        the writer is closed; filesystems which can stream data to its destination override this.
+
+        Returns: AtomicWriter
+        """
+        return _TemporaryFileWriter(path)
+
+    def makedirs(self, path):
+        """
+        Creates the directory at path (and any missing parents) if it does not already exist
+        """
+        raise NotImplementedError
+
+    def rename(self, source, target):
+        """
+        Moves the file at source to target, replacing any existing file at target
+        """
+        raise NotImplementedError
+
+    def remove(self, path):
+        """
+        Deletes the file at path
+        """
+        raise NotImplementedError
+
+    def scan(self, path):
+        """
+        Lists every file under the directory at path, with its FileStat. By default, this walks
+        the directory and stats each file; filesystems which can list a whole tree (with the sizes
+        of its files) in a single paginated pass override this.
+
+        Raises a FileNotFoundError if there is no directory at path.
+
+        Returns: Dictionary mapping the path of each file, relative to path, to its FileStat
+        """
+        if not self.isdir(path):
+            raise FileNotFoundError(path)
+        root = path.rstrip('/') + '/'
+        return {file_path[len(root):]: self.stat(file_path) for file_path in self.walk(path)}
+
+    def walk(self, path):
+        """
+        Returns: List of the paths of all the files under the directory at path
+        """
+        files = []
+        for name in self.listdir(path):
+            child = os.path.join(path, name)
+            if self.isdir(child):
+                files.extend(self.walk(child))
+            else:
+                files.append(child)
+        return files
+
+class LocalFileSystem(FileSystem):
+    """
+    Files on the local filesystem
+    """
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def open(self, path, mode='rb'):
+        return builtins.open(path, mode)
+
+    def atomic_writer(self, path):
+        return _LocalAtomicWriter(path)
+
+    def makedirs(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def rename(self, source, target):
+        os.replace(source, target)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def scan(self, path):
+        if not os.path.isdir(path):
+            raise FileNotFoundError(path)
+        files = {}
+        for dirname, _, filenames in os.walk(path):
+            for filename in filenames:
+                file_path = os.path.join(dirname, filename)
+                files[os.path.relpath(file_path, path)] = FileStat(os.path.getsize(file_path), None)
+        return files
+
+    def walk(self, path):
+        return [
+            os.path.join(dirname, filename)
+            for dirname, _, filenames in os.walk(path)
+            for filename in filenames
+        ]
+
+class TensorFlowFileSystem(FileSystem):
+    """
+    Files on any filesystem supported by tf.gfile. TensorFlow is only imported when this
+    filesystem is first used.
+    """
+    def __init__(self):
+        self._gfile = None
+
+    @property
+    def gfile(self):
+        """
+        Returns: The tf.gfile module
+        """
+        if self._gfile is None:
+            import tensorflow as tf
+            self._gfile = tf.gfile
+        return self._gfile
+
+    def exists(self, path):
+        return self.gfile.Exists(path)
+
+    def isdir(self, path):
+        return self.gfile.IsDirectory(path)
+
+    def listdir(self, path):
+        return [name.rstrip('/') for name in self.gfile.ListDirectory(path)]
+
+    def size(self, path):
+        return self.gfile.Stat(path).length
+
+    def stat(self, path):
+        stat = self.gfile.Stat(path)
+        return FileStat(stat.length, 'gfile:{}#{}'.format(path, stat.mtime_nsec))
+
+    def open(self, path, mode='rb'):
+        return self.gfile.Open(path, mode)
+
+    def makedirs(self, path):
+        self.gfile.MakeDirs(path)
+
+    def rename(self, source, target):
+        self.gfile.Rename(source, target, overwrite=True)
+
+    def remove(self, path):
+        self.gfile.Remove(path)
+
+class _GCSReader(io.RawIOBase):
+    """
+    Seekable, read-only file-like object which reads a GCS object with ranged requests
+    """
+    def __init__(self, blob):
+        super().__init__()
+        self.blob = blob
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.blob.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.blob.size)
+        if end <= self.position:
+            return 0
+        data = self.blob.download_as_string(start=self.position, end=end - 1)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+def _resumable_upload_session():
+    """
+    Creates the HTTP session on which the chunks of a resumable upload to GCS are sent. The session
+    URL returned by Blob.create_resumable_upload_session authorizes the upload by itself, so a plain
+    requests session is enough and the storage client's own (private) authorized session is not
+    needed.
+
+    Returns: requests.Session
+    """
+    import requests
+    return requests.Session()
+
+class _GCSUploadWriter(AtomicWriter):
+    """
+    AtomicWriter which streams data to a GCS object in a resumable upload. Data is sent in chunks
+    of GCS_UPLOAD_CHUNK_SIZE bytes as it is written, and the object is only created once the final
+    chunk is sent when the writer is closed.
+    """
+    def __init__(self, path, blob, transport, chunk_size=GCS_UPLOAD_CHUNK_SIZE):
+        super().__init__(path)
+        self.transport = transport
+        self.chunk_size = chunk_size
+        self.session_url = blob.create_resumable_upload_session()
+        self.buffer = bytearray()
+        self.bytes_uploaded = 0
+
+    def write(self, data):
+        self.buffer.extend(data)
+        while len(self.buffer) >= self.chunk_size:
+            self._upload(bytes(self.buffer[:self.chunk_size]), final=False)
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def tell(self):
+        return self.bytes_uploaded + len(self.buffer)
+
+    def _upload(self, chunk, final):
+        total = str(self.bytes_uploaded + len(chunk)) if final else '*'
+        if chunk:
+            content_range = 'bytes {}-{}/{}'.format(
+                self.bytes_uploaded,
+                self.bytes_uploaded + len(chunk) - 1,
+                total
+            )
+        else:
+            content_range = 'bytes */{}'.format(total)
+        response = self.transport.put(
+            self.session_url,
+            data=chunk,
+            headers={'Content-Range': content_range}
+        )
+        # GCS responds with 308 to each intermediate chunk, and 200 or 201 to the final one
+        expected_status_codes = {200, 201} if final else {308}
+        if response.status_code not in expected_status_codes:
+            raise IOError('Upload to {} failed with status code {}: {}'.format(
+                self.path,
+                response.status_code,
+                response.text
+            ))
+        self.bytes_uploaded += len(chunk)
+
+    def _commit(self):
+        self._upload(bytes(self.buffer), final=True)
+        self.buffer = bytearray()
+
+    def _discard(self):
+        self.buffer = bytearray()
+        # Cancels the upload session; GCS responds with status code 499
+        self.transport.delete(self.session_url)
+
+class GCSFileSystem(FileSystem):
+    """
+    Files on Google Cloud Storage, accessed using the google-cloud-storage client. Directories are
+    implied by the names of the objects under them.
+    """
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+        Returns: google.cloud.storage.Client, created on first use
+        """
+        with self._lock:
+            if self._client is None:
+                from google.cloud import storage
+                self._client = storage.Client()
+            return self._client
+
+    def _split(self, path):
+        bucket_name, _, name = path[len(GCS_PREFIX):].partition('/')
+        return self.client.bucket(bucket_name), name
+
+    def _blob(self, path):
+        bucket, name = self._split(path)
+        blob = bucket.get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(path)
+        return blob
+
+    def exists(self, path):
+        bucket, name = self._split(path)
+        return bucket.blob(name).exists() or self.isdir(path)
+
+    def isdir(self, path):
+        bucket, name = self._split(path)
+        prefix = name.rstrip('/') + '/' if name else ''
+        return any(True for _ in self.client.list_blobs(bucket, prefix=prefix, max_results=1))
+
+    def listdir(self, path):
+        bucket, name = self._split(path)
+        prefix = name.rstrip('/') + '/' if name else ''
+        blobs = self.client.list_blobs(bucket, prefix=prefix, delimiter='/')
+        names = [blob.name[len(prefix):] for blob in blobs if blob.name != prefix]
+        # Subdirectories are only available once all pages of blobs have been listed
+        names.extend(subdir[len(prefix):].rstrip('/') for subdir in blobs.prefixes)
+        return names
+
+    def size(self, path):
+        return self._blob(path).size
+
+    def stat(self, path):
+        return _blob_stat(self._blob(path))
+
+    def open(self, path, mode='rb'):
+        if mode == 'rb':
+            return io.BufferedReader(_GCSReader(self._blob(path)), buffer_size=COPY_CHUNK_SIZE)
+        if mode == 'wb':
+            return self.atomic_writer(path)
+        raise ValueError('Unsupported mode for GCS file: {}'.format(mode))
+
+    def open_random_access(self, path, buffer_size=RANDOM_ACCESS_BUFFER_SIZE):
+        return io.BufferedReader(_GCSReader(self._blob(path)), buffer_size=buffer_size)
+
+    def atomic_writer(self, path):
+        bucket, name = self._split(path)
+        return _GCSUploadWriter(path, bucket.blob(name), _resumable_upload_session())
+
+    def makedirs(self, path):
+        # Directories on GCS exist implicitly
+        pass
+
+    def rename(self, source, target):
+        source_bucket, source_name = self._split(source)
+        target_bucket, target_name = self._split(target)
+        source_bucket.copy_blob(source_bucket.blob(source_name), target_bucket, target_name)
+        source_bucket.delete_blob(source_name)
+
+    def remove(self, path):
+        bucket, name = self._split(path)
+        bucket.delete_blob(name)
+
+    def scan(self, path):
+        # A single listing of every object under the prefix, which is paginated by the client and
+        # returns the size and MD5 of each object with its name
+        bucket, name = self._split(path)
+        prefix = name.rstrip('/') + '/' if name else ''
+        files = {}
+        found = False
+        for blob in self.client.list_blobs(bucket, prefix=prefix):
+            found = True
+            # Placeholder objects for directories (e.g. created by the console) are not files
+            if not blob.name.endswith('/'):
+                files[blob.name[len(prefix):]] = _blob_stat(blob)
+        if not found:
+            raise FileNotFoundError(path)
+        return files
+
+    def walk(self, path):
+        bucket, name = self._split(path)
+        prefix = name.rstrip('/') + '/' if name else ''
+        return [
+            '{}{}/{}'.format(GCS_PREFIX, bucket.name, blob.name)
+            for blob in self.client.list_blobs(bucket, prefix=prefix)
+            if not blob.name.endswith('/')
+        ]
+
+def _blob_stat(blob):
+    # Objects with the same MD5 have the same contents wherever they are stored. Composite objects
+    # have no MD5, so they are identified by their generation instead.
+    if blob.md5_hash:
+        return FileStat(blob.size, 'md5:{}'.format(blob.md5_hash))
+    fingerprint = 'gcs:{}/{}#{}'.format(blob.bucket.name, blob.name, blob.generation)
+    return FileStat(blob.size, fingerprint)
+
+class _MemoryWriter(AtomicWriter):
+    """
+    AtomicWriter which stores its contents in a MemoryFileSystem when it is closed
+    """
+    def __init__(self, filesystem, path):
+        super().__init__(path)
+        self.filesystem = filesystem
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def tell(self):
+        return self.buffer.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.buffer.seek(offset, whence)
+
+    def seekable(self):
+        return True
+
+    def _commit(self):
+        with self.filesystem.lock:
+            self.filesystem.files[self.path] = self.buffer.getvalue()
+
+    def _discard(self):
+        self.buffer = None
+
+class MemoryFileSystem(FileSystem):
+    """
+    Files held in memory, keyed by their full paths. Directories are implied by the paths of the
+    files under them, or created explicitly with makedirs.
+    """
+    def __init__(self):
+        self.files = {}
+        self.directories = set()
+        self.lock = threading.Lock()
+
+    def _children(self, path):
+        prefix = path.rstrip('/') + '/'
+        with self.lock:
+            paths = list(self.files) + list(self.directories)
+        return {
+            child[len(prefix):].split('/')[0]
+            for child in paths if child.startswith(prefix) and child != prefix
+        }
+
+    def exists(self, path):
+        return path in self.files or self.isdir(path)
+
+    def isdir(self, path):
+        return path.rstrip('/') in self.directories or len(self._children(path)) > 0
+
+    def listdir(self, path):
+        if not self.isdir(path):
+            raise FileNotFoundError(path)
+        return sorted(self._children(path))
+
+    def size(self, path):
+        with self.lock:
+            if path not in self.files:
+                raise FileNotFoundError(path)
+            return len(self.files[path])
+
+    def stat(self, path):
+        with self.lock:
+            if path not in self.files:
+                raise FileNotFoundError(path)
+            contents = self.files[path]
+        return _memory_stat(contents)
+
+    def scan(self, path):
+        if not self.isdir(path):
+            raise FileNotFoundError(path)
+        prefix = path.rstrip('/') + '/'
+        with self.lock:
+            files = list(self.files.items())
+        return {
+            name[len(prefix):]: _memory_stat(contents)
+            for name, contents in files if name.startswith(prefix)
+        }
+
+    def open(self, path, mode='rb'):
+        if mode == 'rb':
+            with self.lock:
+                if path not in self.files:
+                    raise FileNotFoundError(path)
+                return io.BytesIO(self.files[path])
+        if mode == 'wb':
+            return self.atomic_writer(path)
+        raise ValueError('Unsupported mode for in-memory file: {}'.format(mode))
+
+    def atomic_writer(self, path):
+        return _MemoryWriter(self, path)
+
+    def makedirs(self, path):
+        with self.lock:
+            self.directories.add(path.rstrip('/'))
+
+    def rename(self, source, target):
+        with self.lock:
+            if source not in self.files:
+                raise FileNotFoundError(source)
+            self.files[target] = self.files.pop(source)
+
+    def remove(self, path):
+        with self.lock:
+            if path not in self.files:
+                raise FileNotFoundError(path)
+            del self.files[path]
+
+def _memory_stat(contents):
+    return FileStat(len(contents), 'sha256:{}'.format(hashlib.sha256(contents).hexdigest()))
+
+_local_filesystem = LocalFileSystem()
+_tensorflow_filesystem = TensorFlowFileSystem()
+
+# Maps path prefixes to the filesystems which handle them
+_filesystems = {
+    MEMORY_PREFIX: MemoryFileSystem()
+}
+_filesystems_lock = threading.Lock()
+
+def register_filesystem(prefix, filesystem):
+    """
+    Registers filesystem to handle all paths which start with the given prefix (e.g. "gs://")
+    """
+    with _filesystems_lock:
+        _filesystems[prefix] = filesystem
+
+def _default_gcs_filesystem():
+    try:
+        from google.cloud import storage # pylint: disable=unused-import
+    except ImportError:
+        return _tensorflow_filesystem
+    return GCSFileSystem()
+
+def get_filesystem(path):
+    """
+    Returns: FileSystem which handles the given path
+    """
+    with _filesystems_lock:
+        if GCS_PREFIX not in _filesystems and path.startswith(GCS_PREFIX):
+            _filesystems[GCS_PREFIX] = _default_gcs_filesystem()
+        for prefix in sorted(_filesystems, key=len, reverse=True):
+            if path.startswith(prefix):
+                return _filesystems[prefix]
+    if '://' in path:
+        return _tensorflow_filesystem
+    return _local_filesystem
+
+def exists(path):
+    """
+    Returns: True if there is a file or directory at path, False otherwise
+    """
+    return get_filesystem(path).exists(path)
+
+def isdir(path):
+    """
+    Returns: True if there is a directory at path, False otherwise
+    """
+    return get_filesystem(path).isdir(path)
+
+def listdir(path):
+    """
+    Returns: List of the names of the files and directories in the directory at path
+    """
+    return get_filesystem(path).listdir(path)
+
+def size(path):
+    """
+    Returns: Size (in bytes) of the file at path
+    """
+    return get_filesystem(path).size(path)
+
+def stat(path):
+    """
+    Returns: FileStat (size and fingerprint) of the file at path
+    """
+    return get_filesystem(path).stat(path)
+
+def open(path, mode='rb'): # pylint: disable=redefined-builtin
+    """
+    Opens the file at path in binary mode ('rb' or 'wb')
+
+    Returns: File-like object
+    """
+    return get_filesystem(path).open(path, mode)
+
+def open_random_access(path, buffer_size=RANDOM_ACCESS_BUFFER_SIZE):
+    """
+    Opens the file at path for reading with seeks, reading about buffer_size bytes from the
+    underlying storage at each offset read
+
+    Returns: Seekable file-like object
+    """
+    return get_filesystem(path).open_random_access(path, buffer_size)
+
+def atomic_writer(path):
+    """
+    Opens the file at path for writing, such that it only appears at path once the writer is
+    closed (or, if it is used as a context manager, once the block using it succeeds)
+
+    Returns: AtomicWriter
+    """
+    return get_filesystem(path).atomic_writer(path)
+
+def makedirs(path):
+    """
+    Creates the directory at path (and any missing parents) if it does not already exist
+    """
+    get_filesystem(path).makedirs(path)
+
+def rename(source, target):
+    """
+    Moves the file at source to target (which must be on the same filesystem), replacing any
+    existing file at target
+    """
+    get_filesystem(source).rename(source, target)
+
+def remove(path):
+    """
+    Deletes the file at path
+    """
+    get_filesystem(path).remove(path)
+
+def walk(path):
+    """
+    Returns: List of the paths of all the files under the directory at path
+    """
+    return get_filesystem(path).walk(path)
+
+def scan(path):
+    """
+    Lists every file under the directory at path, with its FileStat, in as few calls to the
+    filesystem as it allows (a single paginated listing on GCS).
+
+    Raises a FileNotFoundError if there is no directory at path.
+
+    Returns: Dictionary mapping the path of each file, relative to path, to its FileStat
+    """
+    return get_filesystem(path).scan(path)
+
+def copy(source, target, chunk_size=COPY_CHUNK_SIZE):
+    """
+    Copies the file at source to target, which may be on a different filesystem, in chunks of at
+    most chunk_size bytes
+
+    Returns: Number of bytes copied
+    """
+    bytes_copied = 0
+    with open(source, 'rb') as infile:
+        with open(target, 'wb') as outfile:
+            while True:
+                chunk = infile.read(chunk_size)
+                if not chunk:
+                    break
+                outfile.write(chunk)
+                bytes_copied += len(chunk)
+    return bytes_copied
@@ -0,0 +1,108 @@
+"""
+In-memory indexes of directory trees, built from a single recursive listing of each tree (see
+filesystem.scan), so that listing the files of a tree and checking what is in it does not cost a
+filesystem call (on GCS, a round trip) per file or directory
+"""
+
+import os
+
+from . import filesystem, metrics
+
+class FileTree:
+    """
+    Index of the files under the directory at root, with their FileStats, and of the directories
+    which hold them. Paths in the index are relative to root; the root itself is ''.
+    """
+    def __init__(self, root, files):
+        self.root = root
+        self.files = files
+        # Names of the files and subdirectories of each directory
+        self.children = {'': ([], [])}
+        for relative_path in files:
+            parent, name = os.path.split(relative_path)
+            self._add_directory(parent)
+            self.children[parent][0].append(name)
+
+    def _add_directory(self, relative_path):
+        if relative_path not in self.children:
+            parent, name = os.path.split(relative_path)
+            self._add_directory(parent)
+            self.children[parent][1].append(name)
+            self.children[relative_path] = ([], [])
+
+    def path(self, relative_path):
+        """
+        Returns: Full path (with the scheme of root) of the file or directory at relative_path
+        """
+        return os.path.join(self.root, relative_path) if relative_path else self.root
+
+    def exists(self, relative_path):
+        """
+        Returns: True if there is a file or directory at relative_path, False otherwise
+        """
+        return relative_path in self.files or self.isdir(relative_path)
+
+    def isdir(self, relative_path):
+        """
+        Returns: True if there is a directory at relative_path, False otherwise
+        """
+        return relative_path in self.children
+
+    def stat(self, relative_path):
+        """
+        Returns: filesystem.FileStat of the file at relative_path; raises a FileNotFoundError if
+        there is no file there
+        """
+        if relative_path not in self.files:
+            raise FileNotFoundError(self.path(relative_path))
+        return self.files[relative_path]
+
+    def list_files(self, zip_subdir):
+        """
+        Lists the files in the tree along with the paths in a zipfile under which they should be
+        stored. Files in a directory are listed before the contents of its subdirectories, and
+        both are listed in order of their names, so that the listing does not depend on the order
+        in which the filesystem returned them.
+
+        Args:
+        1. zip_subdir - Path in zipfile corresponding to root
+
+        Returns: List of (file path, zip target, filesystem.FileStat) triples
+        """
+        listed = []
+        # Stack of directories still to be listed, the next one last
+        directories = ['']
+        while directories:
+            directory = directories.pop()
+            filenames, subdirs = self.children[directory]
+            for filename in sorted(filenames):
+                relative_path = os.path.join(directory, filename)
+                listed.append((
+                    self.path(relative_path),
+                    os.path.join(zip_subdir, relative_path),
+                    self.files[relative_path]
+                ))
+            directories.extend(
+                os.path.join(directory, subdir) for subdir in sorted(subdirs, reverse=True)
+            )
+        return listed
+
+@metrics.timed('assets_listing')
+def scan(path):
+    """
+    Indexes the tree under the directory at path with a single recursive listing.
+
+    Raises a FileNotFoundError if there is no directory at path.
+
+    Returns: FileTree
+    """
+    return FileTree(path, filesystem.scan(path))
+
+def scan_if_directory(path):
+    """
+    Returns: FileTree of the directory at path (see scan), or None if there is no directory there
+    """
+    try:
+        return scan(path)
+    except FileNotFoundError:
+        return None
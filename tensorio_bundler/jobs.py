@@ -0,0 +1,248 @@
+"""
+Background execution of bundle builds with a bounded worker pool
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+import uuid
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_QUEUED = 100
+DEFAULT_MAX_FINISHED = 1000
+DEFAULT_MAX_ASYNC_JOBS = 1000
+
+class JobQueueFullError(Exception):
+    """
+    Raised if a job is submitted to a JobManager which already has the maximum number of jobs
+    waiting to run.
+    """
+    pass
+
+class Job:
+    """
+    State of a single job submitted to a JobManager
+    """
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.state = QUEUED
+        self.stage = None
+        self.completed_stages = []
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def update(self, event):
+        """
+        Records a progress event (as emitted by pipeline.bundle_from_spec) against the job
+        """
+        if event.get('event') == 'stage_started':
+            self.stage = event.get('stage')
+        elif event.get('event') == 'stage_finished':
+            self.completed_stages.append(event.get('stage'))
+            self.stage = None
+        elif event.get('event') in ('bundle_started', 'bundle_progress'):
+            self.progress = {
+                key: event.get(key, 0)
+                for key in ['files_done', 'files_total', 'bytes_done', 'bytes_total']
+            }
+
+    def to_dict(self):
+        """
+        Returns: JSON-serializable representation of the job
+        """
+        return {
+            'id': self.id,
+            'state': self.state,
+            'stage': self.stage,
+            'completed_stages': list(self.completed_stages),
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+class _JobTable:
+    """
+    Jobs known to a job manager. At most max_active jobs may be queued or running at any time. The
+    state of the max_finished most recently finished jobs is retained so that it can be queried
+    after they finish.
+    """
+    def __init__(self, max_active, max_finished=DEFAULT_MAX_FINISHED, error_status=None):
+        self.max_active = max_active
+        self.max_finished = max_finished
+        self.error_status = error_status
+        self._jobs = collections.OrderedDict()
+        self._finished = collections.deque()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def _add(self):
+        # Raises a JobQueueFullError if max_active jobs are already queued or running
+        job = Job()
+        with self._lock:
+            if self._active >= self.max_active:
+                raise JobQueueFullError(
+                    'ERROR: {} jobs are already queued or running'.format(self._active)
+                )
+            self._active += 1
+            self._jobs[job.id] = job
+        return job
+
+    def _start(self, job):
+        job.state = RUNNING
+        job.started_at = time.time()
+
+    def _fail(self, job, err):
+        job.error = {
+            'type': type(err).__name__,
+            'message': str(err)
+        }
+        if self.error_status is not None:
+            job.error['status'] = self.error_status(err)
+
+    def _finish(self, job, state):
+        with self._lock:
+            job.finished_at = time.time()
+            job.state = state
+            self._active -= 1
+            self._finished.append(job.id)
+            while len(self._finished) > self.max_finished:
+                self._jobs.pop(self._finished.popleft(), None)
+
+    def get(self, job_id):
+        """
+        Returns: Job with the given id, or None if there is no such job
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """
+        Returns: Dictionary of job counts by state
+        """
+        with self._lock:
+            counts = collections.Counter(job.state for job in self._jobs.values())
+        return {state: counts.get(state, 0) for state in [QUEUED, RUNNING, SUCCEEDED, FAILED]}
+
+class JobManager(_JobTable):
+    """
+    Runs jobs on a pool of max_workers threads. At most max_queued jobs may be waiting for a worker
+    at any time. The state of the max_finished most recently finished jobs is retained so that it
+    can be queried after they finish.
+
+    Jobs are held in memory, so their state is only visible to the process that runs them.
+    """
+    def __init__(
+            self,
+            max_workers=DEFAULT_MAX_WORKERS,
+            max_queued=DEFAULT_MAX_QUEUED,
+            max_finished=DEFAULT_MAX_FINISHED,
+            error_status=None
+        ):
+        super().__init__(max_workers + max_queued, max_finished, error_status)
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submits fn(*args, progress=<callback>, **kwargs) to be run by the worker pool. The progress
+        callback records events against the job.
+
+        Raises a JobQueueFullError if too many jobs are already waiting to run.
+
+        Returns: Job
+        """
+        job = self._add()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        self._start(job)
+        state = FAILED
+        try:
+            job.result = fn(*args, progress=job.update, **kwargs)
+            state = SUCCEEDED
+        except Exception as err:
+            self._fail(job, err)
+        finally:
+            self._finish(job, state)
+
+class AsyncJobManager(_JobTable):
+    """
+    Runs jobs as asyncio tasks on the running event loop. A job only costs a task while it waits,
+    so many more jobs may be in flight than with a JobManager; the work they do should be bounded
+    by the coroutines themselves (e.g. by the executors on which they make blocking calls). At
+    most max_active jobs may be in flight at any time.
+
+    Jobs are held in memory, so their state is only visible to the process that runs them.
+    """
+    def __init__(
+            self,
+            max_active=DEFAULT_MAX_ASYNC_JOBS,
+            max_finished=DEFAULT_MAX_FINISHED,
+            error_status=None
+        ):
+        super().__init__(max_active, max_finished, error_status)
+        self._tasks = set()
+
+    def submit(self, coroutine_fn, *args, **kwargs):
+        """
+        Schedules coroutine_fn(*args, progress=<callback>, **kwargs) on the running event loop. The
+        progress callback records events against the job.
+
+        Raises a JobQueueFullError if too many jobs are already in flight.
+
+        Returns: Job
+        """
+        job = self._add()
+        task = asyncio.ensure_future(self._run(job, coroutine_fn, args, kwargs))
+        # The event loop only holds weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job, coroutine_fn, args, kwargs):
+        self._start(job)
+        state = FAILED
+        try:
+            job.result = await coroutine_fn(*args, progress=job.update, **kwargs)
+            state = SUCCEEDED
+        except Exception as err:
+            self._fail(job, err)
+        finally:
+            self._finish(job, state)
+
+    async def join(self):
+        """
+        Waits for all jobs in flight to finish
+        """
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+def from_environment(error_status=None):
+    """
+    Creates a JobManager configured by the (optional) BUNDLE_WORKERS and BUNDLE_QUEUE_SIZE
+    environment variables.
+
+    Returns: JobManager
+    """
+    return JobManager(
+        max_workers=int(os.environ.get('BUNDLE_WORKERS', DEFAULT_MAX_WORKERS)),
+        max_queued=int(os.environ.get('BUNDLE_QUEUE_SIZE', DEFAULT_MAX_QUEUED)),
+        error_status=error_status
+    )
@@ -0,0 +1,95 @@
+"""
+Manifests of the contents of reproducible tiobundles, and the digests which identify them
+"""
+
+import hashlib
+import json
+import zipfile
+
+from . import filesystem, metrics
+
+# Name of the manifest entry within the bundle directory
+MANIFEST_FILENAME = 'manifest.json'
+
+# Version of the manifest format; part of the digest, so that bundles built with a different format
+# are never considered identical
+MANIFEST_VERSION = 1
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class BundleManifest:
+    """
+    Records the SHA-256 of every file in a bundle, keyed by its path relative to the bundle
+    directory. The digest of the manifest identifies the contents of the bundle, so two bundles
+    with the same digest are interchangeable.
+    """
+    def __init__(self, bundle_name, compression=None):
+        self.bundle_name = bundle_name
+        self.compression = compression
+        self.files = {}
+
+    def add(self, zip_target, sha256):
+        """
+        Records the SHA-256 (hex digest) of the file at zip_target in the bundle
+        """
+        self.files[_bundle_relative_path(zip_target)] = sha256
+
+    def _contents(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'bundle_name': self.bundle_name,
+            'compression': self.compression,
+            'files': self.files
+        }
+
+    def digest(self):
+        """
+        Returns: SHA-256 (hex digest) of the canonical JSON encoding of the manifest
+        """
+        canonical = json.dumps(self._contents(), sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def to_json(self):
+        """
+        Returns: Manifest (including its digest) encoded as JSON bytes, as stored in the bundle
+        """
+        contents = self._contents()
+        contents['digest'] = self.digest()
+        return json.dumps(contents, sort_keys=True, indent=2).encode('utf-8')
+
+def _bundle_relative_path(name):
+    return name.replace('\\', '/').split('/', 1)[-1]
+
+def file_sha256(path, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Computes the SHA-256 of the file at the given path, reading it in chunks of at most chunk_size
+    bytes.
+
+    Returns: SHA-256 (hex digest) of the file contents
+    """
+    sha256 = hashlib.sha256()
+    with filesystem.open(path, 'rb') as infile:
+        while True:
+            chunk = infile.read(chunk_size)
+            if not chunk:
+                break
+            metrics.BYTES_READ.inc(amount=len(chunk))
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def read_digest(bundle_path):
+    """
+    Reads the digest recorded in the manifest of the zipped tiobundle at bundle_path. Only the
+    central directory and the manifest entry are read.
+
+    Returns: Digest of the bundle, or None if it has no (readable) manifest
+    """
+    try:
+        with filesystem.open_random_access(bundle_path) as bundle_file:
+            with zipfile.ZipFile(bundle_file) as bundle_zip:
+                for name in bundle_zip.namelist():
+                    if _bundle_relative_path(name) == MANIFEST_FILENAME:
+                        return json.loads(bundle_zip.read(name).decode('utf-8')).get('digest')
+    except (zipfile.BadZipFile, ValueError, KeyError):
+        return None
+    return None
@@ -0,0 +1,311 @@
+"""
+Metrics for the bundler (stage timings, bytes read and written, requests and errors), exposed in
+the Prometheus text format
+"""
+
+import contextlib
+import math
+import threading
+import time
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (in seconds) of the buckets of stage duration histograms; bundling stages range from
+# milliseconds (small assets) to tens of minutes (large conversions)
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0
+)
+
+# Upper bounds (in bytes per second) of the buckets of throughput histograms
+THROUGHPUT_BUCKETS = tuple(
+    megabytes * 1024 * 1024 for megabytes in (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if len(pairs) == 0:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+class _Metric:
+    """
+    Metric with a value for each combination of label values. Thread-safe.
+    """
+    metric_type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.label_names):
+            raise ValueError('{} expects labels {}, got {}'.format(
+                self.name,
+                self.label_names,
+                label_values
+            ))
+        return tuple(str(value) for value in label_values)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Returns: Lines describing this metric in the Prometheus text format
+        """
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.metric_type)
+        ]
+        with self._lock:
+            for suffix, label_values, extra, value in self._samples():
+                lines.append('{}{}{} {}'.format(
+                    self.name,
+                    suffix,
+                    _format_labels(self.label_names, label_values, extra),
+                    _format_value(value)
+                ))
+        return lines
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count
+    """
+    metric_type = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        """
+        Increases the count with the given label values by amount
+        """
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *label_values):
+        """
+        Returns: Count with the given label values
+        """
+        with self._lock:
+            return self._values.get(self._key(label_values), 0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '', key, (), value
+
+class Gauge(_Metric):
+    """
+    Value which can go up and down
+    """
+    metric_type = 'gauge'
+
+    def inc(self, *label_values, amount=1):
+        """
+        Increases the value with the given label values by amount
+        """
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        """
+        Decreases the value with the given label values by amount
+        """
+        self.inc(*label_values, amount=-amount)
+
+    def value(self, *label_values):
+        """
+        Returns: Value with the given label values
+        """
+        with self._lock:
+            return self._values.get(self._key(label_values), 0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '', key, (), value
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values (e.g. durations) over fixed buckets
+    """
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, *label_values):
+        """
+        Records an observation of value with the given label values
+        """
+        key = self._key(label_values)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def summary(self):
+        """
+        Returns: Dictionary mapping the label values of each series to its (count, sum) of
+        observations
+        """
+        with self._lock:
+            return {
+                key: (sum(counts), total) for key, (counts, total) in self._values.items()
+            }
+
+    def _samples(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', key, (('le', _format_value(bound)),), cumulative
+            yield '_sum', key, (), total
+            yield '_count', key, (), cumulative
+
+class Registry:
+    """
+    Collection of metrics rendered together
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        """
+        Adds metric to the registry
+
+        Returns: metric
+        """
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Returns: All metrics in the registry in the Prometheus text format
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Metrics of this process
+registry = Registry()
+
+STAGE_DURATION = registry.register(Histogram(
+    'tensorio_bundler_stage_duration_seconds',
+    'Time taken by each stage of bundle builds',
+    ['stage']
+))
+BYTES_READ = registry.register(Counter(
+    'tensorio_bundler_read_bytes_total',
+    'Bytes of source files read while building bundles'
+))
+BYTES_WRITTEN = registry.register(Counter(
+    'tensorio_bundler_written_bytes_total',
+    'Bytes of TFLite binaries and bundles written'
+))
+ERRORS = registry.register(Counter(
+    'tensorio_bundler_errors_total',
+    'Failed bundle builds by exception class',
+    ['exception']
+))
+LARGE_FILE_THROUGHPUT = registry.register(Histogram(
+    'tensorio_bundler_large_file_throughput_bytes_per_second',
+    'Rate at which each file larger than the chunk size (e.g. a SavedModel variables shard) was '
+    'fetched, compressed and written into a bundle',
+    buckets=THROUGHPUT_BUCKETS
+))
+REQUESTS_IN_PROGRESS = registry.register(Gauge(
+    'tensorio_bundler_requests_in_progress',
+    'REST requests being handled, by handler',
+    ['handler']
+))
+REQUESTS = registry.register(Counter(
+    'tensorio_bundler_requests_total',
+    'REST requests handled, by handler and response status code',
+    ['handler', 'status']
+))
+DEDUPLICATED_REQUESTS = registry.register(Counter(
+    'tensorio_bundler_deduplicated_requests_total',
+    'Bundle requests answered by an identical request, by whether it was running or had completed',
+    ['outcome']
+))
+ASSET_STORE_REQUESTS = registry.register(Counter(
+    'tensorio_bundler_asset_store_requests_total',
+    'Lookups of asset files in the local asset store, by whether they were found (hit) or not '
+    '(miss)',
+    ['outcome']
+))
+ADMISSION_QUEUE_DEPTH = registry.register(Gauge(
+    'tensorio_bundler_admission_queue_depth',
+    'Bundle builds waiting to be admitted'
+))
+ADMISSION_WAIT = registry.register(Histogram(
+    'tensorio_bundler_admission_wait_seconds',
+    'Time for which bundle builds waited to be admitted'
+))
+ADMISSION_REJECTIONS = registry.register(Counter(
+    'tensorio_bundler_admission_rejections_total',
+    'Bundle builds refused admission because the admission queue was full'
+))
+
+@contextlib.contextmanager
+def timed(stage):
+    """
+    Context manager which records the time taken by the block it wraps as a STAGE_DURATION
+    observation for the given stage, whether or not the block succeeds
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, stage)
+
+@contextlib.contextmanager
+def counting_errors():
+    """
+    Context manager which counts any exception raised by the block it wraps in ERRORS, by its
+    class name, and re-raises it
+    """
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(type(e).__name__)
+        raise
+
+def stage_summary():
+    """
+    Returns: List of (stage, count, total seconds) triples for every stage timed in this process,
+    in order of total time spent (longest first)
+    """
+    summary = [
+        (key[0], count, total) for key, (count, total) in STAGE_DURATION.summary().items()
+    ]
+    return sorted(summary, key=lambda stage: stage[2], reverse=True)
+
+def format_stage_summary():
+    """
+    Returns: Table of the stage timings of this process (see stage_summary), for display
+    """
+    lines = ['{:<24} {:>8} {:>12} {:>12}'.format('stage', 'count', 'total s', 'mean s')]
+    for stage, count, total in stage_summary():
+        lines.append('{:<24} {:>8} {:>12.3f} {:>12.3f}'.format(stage, count, total, total / count))
+    return '\n'.join(lines)
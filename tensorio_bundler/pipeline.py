@@ -0,0 +1,414 @@
+"""
+Runs tiobundle builds from bundle specifications, as accepted by the REST API
+"""
+
+import functools
+
+from . import admission, benchmark, bundler, compression, dedup, metrics, quantization, reader
+
+REQUIRED_KEYS = {
+    'saved_model_dir',
+    'build',
+    'model_json_path',
+    'assets_path',
+    'bundle_name',
+    'bundle_output_path'
+}
+
+# Stages of a bundle build, in the order in which they are run
+CONVERSION_STAGE = 'conversion'
+BENCHMARK_STAGE = 'benchmark'
+BUNDLE_STAGE = 'bundle'
+REGISTRATION_STAGE = 'registration'
+
+class BundleSpecificationError(Exception):
+    """
+    Raised if a bundle specification is not valid.
+    """
+    pass
+
+class MissingBundleSpecificationKeysError(BundleSpecificationError):
+    """
+    Raised if a bundle specification does not contain all of the REQUIRED_KEYS.
+    """
+    def __init__(self, missing_keys):
+        self.missing_keys = missing_keys
+        message = 'Request body missing the following keys: {}'.format(', '.join(missing_keys))
+        super().__init__(message)
+
+class InvalidBuildError(BundleSpecificationError):
+    """
+    Raised if the build type in a bundle specification is neither bundler.TFLITE nor
+    bundler.SAVED_MODEL.
+    """
+    pass
+
+class MissingTFLiteModelError(BundleSpecificationError):
+    """
+    Raised if a bundle specification has build type bundler.TFLITE but does not specify the path
+    at which the TFLite binary should be created.
+    """
+    pass
+
+class InvalidCompressionError(BundleSpecificationError):
+    """
+    Raised if the compression policy in a bundle specification cannot be parsed.
+    """
+    pass
+
+class InvalidConversionOptionsError(BundleSpecificationError):
+    """
+    Raised if the conversion profile, representative dataset or latency runs in a bundle
+    specification are not valid (see quantization.parse_options).
+    """
+    pass
+
+class InvalidBenchmarkError(BundleSpecificationError):
+    """
+    Raised if a bundle specification requests a benchmark with invalid options (see
+    benchmark.parse_options), or for a build type other than bundler.TFLITE.
+    """
+    pass
+
+# HTTP status codes corresponding to errors raised while validating and running bundle builds.
+# Errors which are not listed here correspond to status code 500.
+ERROR_STATUS_CODES = [
+    (MissingBundleSpecificationKeysError, 400),
+    (InvalidBuildError, 400),
+    (InvalidCompressionError, 400),
+    (InvalidConversionOptionsError, 400),
+    (InvalidBenchmarkError, 400),
+    (MissingTFLiteModelError, 422),
+    (bundler.TFLiteFileExistsError, 409),
+    (bundler.SavedModelDirMisspecificationError, 404),
+    (bundler.ZippedTIOBundleExistsError, 409),
+    (bundler.ZippedTIOBundleMisspecificationError, 404),
+    (reader.BundleNotFoundError, 404),
+    (reader.BundleEntryNotFoundError, 404),
+    (reader.BundleEntryTooLargeError, 413),
+    (reader.BundleReadError, 422),
+    (dedup.IdempotencyKeyMismatchError, 422),
+    (benchmark.BudgetExceededError, 422),
+    (admission.AdmissionQueueFullError, 429),
+]
+
+def status_code(error):
+    """
+    Returns: HTTP status code corresponding to the given error
+    """
+    for error_class, code in ERROR_STATUS_CODES:
+        if isinstance(error, error_class):
+            return code
+    return 500
+
+def validate_spec(spec):
+    """
+    Checks that a bundle specification contains everything needed to build a bundle.
+
+    Raises a BundleSpecificationError if it does not.
+
+    Args:
+    1. spec - Dictionary specifying the bundle (see rest.BundleHandler.on_post for its keys)
+
+    Returns: None
+    """
+    missing_keys = [key for key in REQUIRED_KEYS if key not in spec]
+    if len(missing_keys) > 0:
+        raise MissingBundleSpecificationKeysError(missing_keys)
+
+    valid_builds = {bundler.TFLITE, bundler.SAVED_MODEL}
+    if spec.get('build') not in valid_builds:
+        raise InvalidBuildError('"build" must be one of {}'.format(valid_builds))
+
+    if spec.get('build') == bundler.TFLITE and spec.get('tflite_model') is None:
+        raise MissingTFLiteModelError(
+            'ERROR: "tflite_model" must be specified in request body if "build" is set '
+            'to {}'.format(bundler.TFLITE)
+        )
+
+    try:
+        compression.parse_policy(spec.get('compression'))
+    except compression.InvalidCompressionPolicyError as e:
+        raise InvalidCompressionError(str(e))
+
+    try:
+        conversion_options(spec)
+    except quantization.InvalidConversionProfileError as e:
+        raise InvalidConversionOptionsError(str(e))
+    latency_runs = spec.get('latency_runs', quantization.DEFAULT_LATENCY_RUNS)
+    if not isinstance(latency_runs, int) or isinstance(latency_runs, bool) or latency_runs < 0:
+        raise InvalidConversionOptionsError('"latency_runs" must be a non-negative integer')
+
+    if spec.get('benchmark'):
+        if spec.get('build') != bundler.TFLITE:
+            raise InvalidBenchmarkError(
+                'ERROR: "benchmark" is only supported if "build" is set to {}'.format(
+                    bundler.TFLITE
+                )
+            )
+        try:
+            benchmark.parse_options(spec.get('benchmark'))
+        except benchmark.InvalidBenchmarkOptionsError as e:
+            raise InvalidBenchmarkError(str(e))
+
+def conversion_options(spec):
+    """
+    Returns: quantization.ConversionOptions for the "conversion_profile" and
+    "representative_dataset" of a bundle specification
+    """
+    return quantization.parse_options(
+        spec.get('conversion_profile'),
+        spec.get('representative_dataset')
+    )
+
+def _notify(progress, event, **details):
+    if progress is not None:
+        details['event'] = event
+        progress(details)
+
+@metrics.counting_errors()
+def bundle_from_spec(
+        spec,
+        conversion_cache=None,
+        conversion_executor=None,
+        progress=None,
+        asset_store=None
+    ):
+    """
+    Builds (and, if spec specifies a repository_path, registers) the bundle described by the given
+    specification. The specification is assumed to have been checked by validate_spec.
+
+    Args:
+    1. spec - Dictionary specifying the bundle (see rest.BundleHandler.on_post for its keys)
+    2. conversion_cache - (Optional) cache.ConversionCache used for TFLite builds
+    3. conversion_executor - (Optional) conversion.ConversionExecutor on which to run TFLite
+       conversions
+    4. progress - (Optional) Function called with a dictionary describing each event in the
+       build; {"event": "stage_started", "stage": <stage>} when each stage starts,
+       {"event": "stage_finished", "stage": <stage>} when it finishes and
+       {"event": "bundle_unchanged", "bundle": <path>} if the bundle is reproducible and an
+       identical bundle already exists at its output path. Within stages, it is also called with
+       the "conversion_step" events of bundler.tflite_build_from_saved_model and the
+       "bundle_started" and "bundle_progress" events of bundler.tiobundle_build.
+    5. asset_store - (Optional) blobstore.BlobStore through which to read assets
+
+    If spec sets "benchmark", the converted model is benchmarked (see needs_benchmark) before it
+    is bundled, and the build fails with a benchmark.BudgetExceededError if it exceeds its budget.
+    If spec sets "reproducible" and an identical bundle already exists at its output path, that
+    bundle is neither built nor registered again. Errors raised by the build are counted in
+    metrics.ERRORS.
+
+    Returns: Dictionary with the path of the bundle under "bundle", the response from the
+    repository under "registration" (None if the bundle was not registered), whether an identical
+    bundle already existed under "unchanged" and the benchmark report under "benchmark" (None if
+    the model was not benchmarked)
+    """
+    return run_steps(
+        bundle_steps(
+            spec,
+            conversion_cache=conversion_cache,
+            conversion_executor=conversion_executor,
+            progress=progress,
+            asset_store=asset_store
+        )
+    )
+
+def bundle_steps(
+        spec,
+        conversion_cache=None,
+        conversion_executor=None,
+        progress=None,
+        asset_store=None
+    ):
+    """
+    The build of bundle_from_spec (which takes the same arguments), as a generator which yields
+    each blocking step of the build as a (stage, function) pair. Its caller runs each function
+    wherever suits the stage (e.g. on an executor dedicated to it) and sends its result back into
+    the generator, which returns the result of the build (see run_steps). Progress events are
+    reported by the generator itself.
+    """
+    model_path = spec.get('saved_model_dir')
+    conversion_report = None
+    if spec.get('build') == bundler.TFLITE:
+        _notify(progress, 'stage_started', stage=CONVERSION_STAGE)
+        model_path, conversion_report = yield CONVERSION_STAGE, functools.partial(
+            convert_model,
+            spec,
+            conversion_cache=conversion_cache,
+            conversion_executor=conversion_executor,
+            progress=progress
+        )
+        _notify(progress, 'stage_finished', stage=CONVERSION_STAGE)
+
+    benchmark_report = None
+    if needs_benchmark(spec):
+        _notify(progress, 'stage_started', stage=BENCHMARK_STAGE)
+        benchmark_report = yield BENCHMARK_STAGE, functools.partial(
+            run_benchmark,
+            spec,
+            model_path,
+            conversion_executor=conversion_executor
+        )
+        _notify(progress, 'stage_finished', stage=BENCHMARK_STAGE)
+
+    if (yield BUNDLE_STAGE, functools.partial(bundle_is_unchanged, spec, model_path)):
+        _notify(progress, 'bundle_unchanged', bundle=spec.get('bundle_output_path'))
+        return unchanged_result(spec, benchmark_report)
+
+    _notify(progress, 'stage_started', stage=BUNDLE_STAGE)
+    outfile = yield BUNDLE_STAGE, functools.partial(
+        build_bundle,
+        spec,
+        model_path,
+        conversion_report,
+        asset_store,
+        progress,
+        existing_bundle_checked=True
+    )
+    _notify(progress, 'stage_finished', stage=BUNDLE_STAGE)
+
+    registration = None
+    if needs_registration(spec):
+        _notify(progress, 'stage_started', stage=REGISTRATION_STAGE)
+        registration = yield REGISTRATION_STAGE, functools.partial(register, spec, outfile)
+        _notify(progress, 'stage_finished', stage=REGISTRATION_STAGE)
+
+    return {
+        'bundle': outfile,
+        'registration': registration,
+        'unchanged': False,
+        'benchmark': benchmark_report
+    }
+
+def run_steps(steps):
+    """
+    Runs the steps yielded by bundle_steps one after the other, in the calling thread
+
+    Returns: Result of the build
+    """
+    result = None
+    while True:
+        try:
+            _, step = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = step()
+
+# The stages of bundle_from_spec, which may also be run separately (e.g. on different executors).
+# Each of them takes a specification which has been checked by validate_spec.
+
+def convert_model(spec, conversion_cache=None, conversion_executor=None, progress=None):
+    """
+    Runs the CONVERSION_STAGE of the bundle described by spec: converts its SavedModel into a TFLite
+    binary with its conversion profile if its build type is bundler.TFLITE, reporting its steps to
+    progress (if given)
+
+    Returns: (path of the model to bundle, conversion report) pair; the report (see
+    bundler.tflite_build_from_saved_model) is None unless the model was converted
+    """
+    if spec.get('build') != bundler.TFLITE:
+        return spec.get('saved_model_dir'), None
+    report = bundler.tflite_build_from_saved_model(
+        spec.get('saved_model_dir'),
+        spec.get('tflite_model'),
+        conversion_cache=conversion_cache,
+        conversion_executor=conversion_executor,
+        conversion_options=conversion_options(spec),
+        latency_runs=spec.get('latency_runs', quantization.DEFAULT_LATENCY_RUNS),
+        progress=progress
+    )
+    return spec.get('tflite_model'), report
+
+def needs_benchmark(spec):
+    """
+    Returns: True if the TFLite model of the bundle described by spec is to be benchmarked
+    """
+    return spec.get('build') == bundler.TFLITE and bool(spec.get('benchmark'))
+
+def run_benchmark(spec, model_path, conversion_executor=None):
+    """
+    Runs the BENCHMARK_STAGE of the bundle described by spec, benchmarking the TFLite model at
+    model_path with the options under "benchmark" and writing the report alongside the bundle
+    (see benchmark.report_path)
+
+    Returns: Benchmark report
+    """
+    return bundler.tflite_benchmark(
+        model_path,
+        spec.get('model_json_path'),
+        benchmark.report_path(spec.get('bundle_output_path')),
+        options=benchmark.parse_options(spec.get('benchmark')),
+        conversion_executor=conversion_executor
+    )
+
+def bundle_is_unchanged(spec, model_path):
+    """
+    Returns: True if spec sets "reproducible" and an identical bundle already exists at its output
+    path, in which case the bundle need neither be built nor registered again
+    """
+    if not spec.get('reproducible', False):
+        return False
+    return bundler.identical_bundle_exists(
+        spec.get('bundle_output_path'),
+        model_path,
+        spec.get('model_json_path'),
+        spec.get('assets_path'),
+        spec.get('bundle_name'),
+        compression_policy=compression.parse_policy(spec.get('compression'))
+    )
+
+def unchanged_result(spec, benchmark_report=None):
+    """
+    Returns: Result of bundle_from_spec for a bundle which is unchanged (see bundle_is_unchanged)
+    """
+    return {
+        'bundle': spec.get('bundle_output_path'),
+        'registration': None,
+        'unchanged': True,
+        'benchmark': benchmark_report
+    }
+
+def build_bundle(
+        spec,
+        model_path,
+        conversion_report=None,
+        asset_store=None,
+        progress=None,
+        **options
+    ):
+    """
+    Runs the BUNDLE_STAGE of the bundle described by spec, bundling the model at model_path and the
+    report of its conversion (if any), reading assets through asset_store (if given) and reporting
+    the files written to progress (if given). Further options (e.g. chunk_size) are passed on to
+    bundler.tiobundle_build.
+
+    Returns: Path of the bundle
+    """
+    return bundler.tiobundle_build(
+        model_path,
+        spec.get('model_json_path'),
+        spec.get('assets_path'),
+        spec.get('bundle_name'),
+        spec.get('bundle_output_path'),
+        previous_bundle=spec.get('previous_bundle_path'),
+        compression_policy=compression.parse_policy(spec.get('compression')),
+        reproducible=spec.get('reproducible', False),
+        conversion_report=conversion_report,
+        asset_store=asset_store,
+        progress=progress,
+        **options
+    )
+
+def needs_registration(spec):
+    """
+    Returns: True if the bundle described by spec is to be registered against a repository
+    """
+    return spec.get('repository_path', '') != ''
+
+def register(spec, outfile):
+    """
+    Runs the REGISTRATION_STAGE of the bundle described by spec, whose bundle is at outfile
+
+    Returns: Response from the repository
+    """
+    return bundler.register_bundle(outfile, spec.get('repository_path'))
@@ -0,0 +1,242 @@
+"""
+Conversion profiles (post-training quantization settings) for SavedModel to TFLite conversions,
+and the conversion reports recorded in bundles built from them
+
+TensorFlow and numpy are only imported by the functions which configure converters and run
+interpreters, so that profiles can be parsed and validated without them.
+"""
+
+import io
+import json
+import statistics
+
+from . import benchmark, filesystem, manifest
+
+# Conversion profiles: no optimizations, weights quantized to 8 bits with float activations,
+# weights stored as float16, and weights and activations quantized to 8 bits (which requires a
+# representative dataset to calibrate the ranges of the activations)
+NO_QUANTIZATION = 'none'
+DYNAMIC_RANGE = 'dynamic_range'
+FLOAT16 = 'float16'
+FULL_INTEGER = 'full_integer'
+
+PROFILES = (NO_QUANTIZATION, DYNAMIC_RANGE, FLOAT16, FULL_INTEGER)
+DEFAULT_PROFILE = NO_QUANTIZATION
+
+# Maximum number of samples of a representative dataset used to calibrate a full integer conversion
+DEFAULT_MAX_SAMPLES = 100
+
+# Number of timed invocations of the converted model when measuring its latency (after one warm-up
+# invocation); 0 skips the measurement
+DEFAULT_LATENCY_RUNS = 10
+
+# Name of the conversion report added to the bundle directory of bundles built from conversions
+REPORT_FILENAME = 'conversion.json'
+
+class InvalidConversionProfileError(Exception):
+    """
+    Raised if a conversion profile is not one of the PROFILES, or if its representative dataset is
+    missing or not wanted.
+    """
+    pass
+
+class ConversionOptions:
+    """
+    Settings for a SavedModel to TFLite conversion: the conversion profile (one of PROFILES) and,
+    for FULL_INTEGER conversions, the path (local or GCS) to the representative dataset.
+
+    A representative dataset is either a .npy file holding an array whose first axis indexes the
+    samples (for models with a single input), or a .npz file holding one such array per input of
+    the model, in the order of the inputs. At most max_samples samples are used.
+    """
+    def __init__(
+            self,
+            profile=DEFAULT_PROFILE,
+            representative_dataset=None,
+            max_samples=DEFAULT_MAX_SAMPLES
+        ):
+        self.profile = profile
+        self.representative_dataset = representative_dataset
+        self.max_samples = max_samples
+
+    def validate(self):
+        """
+        Raises an InvalidConversionProfileError if the options are inconsistent
+
+        Returns: None
+        """
+        if self.profile not in PROFILES:
+            raise InvalidConversionProfileError(
+                'ERROR: Conversion profile must be one of {}, not {}'.format(
+                    ', '.join(PROFILES),
+                    self.profile
+                )
+            )
+        if self.profile == FULL_INTEGER and not self.representative_dataset:
+            raise InvalidConversionProfileError(
+                'ERROR: Conversion profile {} requires a representative dataset'.format(
+                    FULL_INTEGER
+                )
+            )
+        if self.profile != FULL_INTEGER and self.representative_dataset:
+            raise InvalidConversionProfileError(
+                'ERROR: A representative dataset is only used by conversion profile {}'.format(
+                    FULL_INTEGER
+                )
+            )
+        if self.max_samples < 1:
+            raise InvalidConversionProfileError(
+                'ERROR: At least one representative sample is required'
+            )
+
+    def spec(self):
+        """
+        Returns: JSON-serializable dictionary describing the options
+        """
+        return {
+            'profile': self.profile,
+            'representative_dataset': self.representative_dataset,
+            'max_samples': self.max_samples if self.representative_dataset else None
+        }
+
+    def cache_settings(self):
+        """
+        Returns: Converter settings identifying conversions with these options in a conversion
+        cache (see cache.saved_model_digest); the representative dataset is identified by its
+        contents rather than its path. None for the default options, so that their conversions
+        share cache entries with conversions made before profiles were introduced.
+        """
+        if self.profile == NO_QUANTIZATION:
+            return None
+        settings = {'profile': self.profile}
+        if self.representative_dataset:
+            settings['representative_dataset'] = manifest.file_sha256(self.representative_dataset)
+            settings['max_samples'] = self.max_samples
+        return settings
+
+def parse_options(profile=None, representative_dataset=None, max_samples=None):
+    """
+    Creates and validates the ConversionOptions for the given conversion profile (DEFAULT_PROFILE
+    if None) and representative dataset, e.g. as given in a bundle specification.
+
+    Raises an InvalidConversionProfileError if they are not valid.
+
+    Returns: ConversionOptions
+    """
+    options = ConversionOptions(
+        profile if profile is not None else DEFAULT_PROFILE,
+        representative_dataset,
+        max_samples if max_samples is not None else DEFAULT_MAX_SAMPLES
+    )
+    options.validate()
+    return options
+
+def load_representative_dataset(path, max_samples=DEFAULT_MAX_SAMPLES):
+    """
+    Reads a representative dataset (see ConversionOptions) into memory.
+
+    Returns: List of samples, each of them a list of numpy arrays (one per model input, with a
+    leading batch dimension of 1)
+    """
+    import numpy as np
+
+    with filesystem.open(path, 'rb') as dataset_file:
+        loaded = np.load(io.BytesIO(dataset_file.read()), allow_pickle=False)
+    if isinstance(loaded, np.ndarray):
+        inputs = [loaded]
+    else:
+        inputs = [loaded[name] for name in loaded.files]
+    if not inputs or any(len(array) != len(inputs[0]) for array in inputs):
+        raise InvalidConversionProfileError(
+            'ERROR: Representative dataset {} must hold the same number of samples for every '
+            'input'.format(path)
+        )
+    num_samples = min(len(inputs[0]), max_samples)
+    return [[array[i:i + 1] for array in inputs] for i in range(num_samples)]
+
+def configure_converter(converter, options):
+    """
+    Applies the conversion profile of the given ConversionOptions to a tf.lite.TFLiteConverter,
+    using only the converter settings available in TensorFlow 1.14. In particular, FULL_INTEGER
+    conversions quantize the operations of the model to 8 bits but keep its float inputs and
+    outputs, and FLOAT16 conversions need a converter whose target_spec has supported_types
+    (TensorFlow 1.15 on).
+
+    Raises an InvalidConversionProfileError if the converter cannot produce the profile.
+
+    Returns: None
+    """
+    import tensorflow as tf
+
+    if options is None or options.profile == NO_QUANTIZATION:
+        return
+    if options.profile == FLOAT16 and not hasattr(converter.target_spec, 'supported_types'):
+        # Older converters would silently produce a DYNAMIC_RANGE model instead
+        raise InvalidConversionProfileError(
+            'ERROR: Conversion profile {} is not supported by TensorFlow {}'.format(
+                FLOAT16,
+                tf.__version__
+            )
+        )
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if options.profile == FLOAT16:
+        converter.target_spec.supported_types = [tf.float16]
+    elif options.profile == FULL_INTEGER:
+        samples = load_representative_dataset(options.representative_dataset, options.max_samples)
+        converter.representative_dataset = tf.lite.RepresentativeDataset(lambda: iter(samples))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+def measure_latency(tflite_path, runs=DEFAULT_LATENCY_RUNS):
+    """
+    Measures the latency of the TFLite model at the given path in the TFLite interpreter of this
+    process, feeding it zeros of the shape and type of each input. The model is invoked once to
+    warm up and then runs more times.
+
+    Returns: Dictionary with the number of timed "runs" and their "mean_ms", "median_ms" and
+    "min_ms" latencies
+    """
+    import numpy as np
+    import tensorflow as tf
+
+    with filesystem.open(tflite_path, 'rb') as tflite_file:
+        interpreter = tf.lite.Interpreter(model_content=tflite_file.read())
+    interpreter.allocate_tensors()
+    for detail in interpreter.get_input_details():
+        interpreter.set_tensor(detail['index'], np.zeros(detail['shape'], dtype=detail['dtype']))
+
+    interpreter.invoke()
+    latencies = benchmark.time_invocations(interpreter, runs)
+    return {
+        'runs': runs,
+        'mean_ms': statistics.mean(latencies),
+        'median_ms': statistics.median(latencies),
+        'min_ms': min(latencies)
+    }
+
+def conversion_report(tflite_path, options, latency=None):
+    """
+    Returns: Dictionary recording the conversion options (see ConversionOptions.spec), the size
+    (in bytes) of the TFLite binary at tflite_path and its latency (as returned by measure_latency,
+    or None if it was not measured)
+    """
+    if options is None:
+        options = ConversionOptions()
+    return {
+        'conversion': options.spec(),
+        'size_bytes': filesystem.size(tflite_path),
+        'latency': latency
+    }
+
+def reproducible_report(report):
+    """
+    Returns: Copy of a conversion report without its latency, which varies from one conversion to
+    the next, so that the report can be added to reproducible bundles (see
+    bundler.tiobundle_build)
+    """
+    return dict(report, latency=None)
+
+def report_to_json(report):
+    """
+    Returns: UTF-8 encoded JSON of a conversion report, as stored in bundles
+    """
+    return json.dumps(report, sort_keys=True, indent=2).encode('utf-8')
@@ -0,0 +1,234 @@
+"""
+Reads the contents of zipped tiobundles without downloading them in their entirety. Bundles are
+opened for random access, so only the zip central directory and the entries which are actually
+read (e.g. model.json, the manifest) are transferred; the model weights never are.
+"""
+
+import base64
+import io
+import json
+import zipfile
+
+from . import filesystem, manifest, metrics, quantization
+
+MODEL_JSON_FILENAME = 'model.json'
+
+# Entries larger than this (uncompressed) are not returned by BundleReader.inspect, so that an
+# inspection cannot be made to download the model weights
+MAX_INSPECTED_ENTRY_SIZE = 4 * 1024 * 1024
+
+class BundleReadError(Exception):
+    """
+    Raised if a zipped tiobundle cannot be read as a zip file.
+    """
+    pass
+
+class BundleNotFoundError(BundleReadError):
+    """
+    Raised if there is no zipped tiobundle at the given path.
+    """
+    pass
+
+class BundleEntryNotFoundError(Exception):
+    """
+    Raised if a zipped tiobundle has no entry at the requested path.
+    """
+    pass
+
+class BundleEntryTooLargeError(Exception):
+    """
+    Raised if an entry requested from BundleReader.inspect is larger than
+    MAX_INSPECTED_ENTRY_SIZE.
+    """
+    pass
+
+class _CountingReader(io.RawIOBase):
+    """
+    Seekable, read-only file-like object which counts the bytes read from the file it wraps
+    """
+    def __init__(self, infile):
+        super().__init__()
+        self.infile = infile
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.infile.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.infile.seek(offset, whence)
+
+    def readinto(self, buffer):
+        data = self.infile.read(len(buffer))
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+    def close(self):
+        self.infile.close()
+        super().close()
+
+class BundleReader:
+    """
+    Random-access reader for a zipped tiobundle. Entry paths are given relative to the bundle
+    directory (e.g. "model.json", "assets/labels.txt").
+
+    Use as a context manager, or call close when done.
+    """
+    def __init__(self, bundle_path, buffer_size=filesystem.RANDOM_ACCESS_BUFFER_SIZE):
+        self.bundle_path = bundle_path
+        if not filesystem.exists(bundle_path) or filesystem.isdir(bundle_path):
+            raise BundleNotFoundError('ERROR: No zipped tiobundle at {}'.format(bundle_path))
+        self._file = _CountingReader(filesystem.open_random_access(bundle_path, buffer_size))
+        try:
+            self._zip = zipfile.ZipFile(self._file)
+        except (zipfile.BadZipFile, OSError) as e:
+            self._file.close()
+            raise BundleReadError(
+                'ERROR: Could not read zipped tiobundle at {}: {}'.format(bundle_path, e)
+            )
+        self._entries = {}
+        self.bundle_name = None
+        for zinfo in self._zip.infolist():
+            if zinfo.is_dir():
+                continue
+            bundle_name, _, relative_path = zinfo.filename.replace('\\', '/').partition('/')
+            if self.bundle_name is None:
+                self.bundle_name = bundle_name
+            self._entries[relative_path] = zinfo
+
+    @property
+    def bytes_read(self):
+        """
+        Number of bytes of the bundle read so far
+        """
+        return self._file.bytes_read
+
+    def entries(self):
+        """
+        Returns: List of dictionaries describing the entries of the bundle (path, size,
+        compressed_size and crc), sorted by path
+        """
+        return [
+            {
+                'path': path,
+                'size': zinfo.file_size,
+                'compressed_size': zinfo.compress_size,
+                'crc': zinfo.CRC
+            }
+            for path, zinfo in sorted(self._entries.items())
+        ]
+
+    def has_entry(self, path):
+        """
+        Returns: True if the bundle has an entry at the given path, False otherwise
+        """
+        return path in self._entries
+
+    def read(self, path):
+        """
+        Reads the entry at the given path, raising a BundleEntryNotFoundError if there is none
+
+        Returns: Contents of the entry (bytes)
+        """
+        zinfo = self._entries.get(path)
+        if zinfo is None:
+            raise BundleEntryNotFoundError(
+                'ERROR: No entry {} in zipped tiobundle at {}'.format(path, self.bundle_path)
+            )
+        return self._zip.read(zinfo)
+
+    def read_inspected(self, path):
+        """
+        Same as read, except that it raises a BundleEntryTooLargeError if the entry is larger than
+        MAX_INSPECTED_ENTRY_SIZE, rather than reading it into memory
+
+        Returns: Contents of the entry (bytes)
+        """
+        zinfo = self._entries.get(path)
+        if zinfo is not None and zinfo.file_size > MAX_INSPECTED_ENTRY_SIZE:
+            raise BundleEntryTooLargeError(
+                'ERROR: Entry {} ({} bytes) is larger than the limit of {} bytes'.format(
+                    path,
+                    zinfo.file_size,
+                    MAX_INSPECTED_ENTRY_SIZE
+                )
+            )
+        return self.read(path)
+
+    def model_json(self):
+        """
+        Returns: Parsed model.json of the bundle (see read_inspected for its size limit)
+        """
+        return json.loads(self.read_inspected(MODEL_JSON_FILENAME).decode('utf-8'))
+
+    def manifest(self):
+        """
+        Returns: Parsed manifest of the bundle (see manifest.BundleManifest), or None if it was not
+        built reproducibly
+        """
+        if not self.has_entry(manifest.MANIFEST_FILENAME):
+            return None
+        return json.loads(self.read_inspected(manifest.MANIFEST_FILENAME).decode('utf-8'))
+
+    def conversion_report(self):
+        """
+        Returns: Parsed conversion report of the bundle (see quantization.conversion_report), or
+        None if its model was not converted by the bundler
+        """
+        if not self.has_entry(quantization.REPORT_FILENAME):
+            return None
+        return json.loads(self.read_inspected(quantization.REPORT_FILENAME).decode('utf-8'))
+
+    def inspect(self, entry_paths=()):
+        """
+        Describes the bundle, reading only its central directory, model.json, manifest, conversion
+        report and the entries at entry_paths, each of which may be at most
+        MAX_INSPECTED_ENTRY_SIZE bytes (see read_inspected).
+
+        Returns: Dictionary with the bundle_name, entries (see BundleReader.entries), model_json,
+        manifest, conversion_report and base64-encoded contents of the requested entries of the
+        bundle, and the number of bytes_read from it
+        """
+        contents = {}
+        for path in entry_paths:
+            contents[path] = base64.b64encode(self.read_inspected(path)).decode('ascii')
+
+        return {
+            'bundle_path': self.bundle_path,
+            'bundle_name': self.bundle_name,
+            'entries': self.entries(),
+            'model_json': self.model_json() if self.has_entry(MODEL_JSON_FILENAME) else None,
+            'manifest': self.manifest(),
+            'conversion_report': self.conversion_report(),
+            'contents': contents,
+            'bytes_read': self.bytes_read
+        }
+
+    def close(self):
+        """
+        Closes the bundle
+        """
+        self._zip.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+@metrics.timed('bundle_inspect')
+def inspect_bundle(bundle_path, entry_paths=()):
+    """
+    Describes the zipped tiobundle at bundle_path (see BundleReader.inspect)
+
+    Returns: Dictionary describing the bundle
+    """
+    with BundleReader(bundle_path) as reader:
+        return reader.inspect(entry_paths)
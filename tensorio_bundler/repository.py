@@ -0,0 +1,226 @@
+"""
+Client for the REST API of TensorIO Models repositories
+"""
+
+import concurrent.futures
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import bundler, filesystem
+
+# Timeouts (in seconds) for establishing connections to the repository and for waiting on its
+# responses
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_WORKERS = 8
+
+# Responses with these status codes are retried. Registrations are not idempotent, so they are
+# only retried on responses which say that the request was not processed: other errors (e.g. a 502
+# or 504 from a proxy) may come after the registration has been made.
+RETRY_STATUS_CODES = (429, 503)
+
+GCS_LINK_PREFIX = 'https://storage.googleapis.com/'
+LINK_PREFIXES = ('http://', 'https://')
+
+def bundle_link(bundle_path):
+    """
+    Returns: URL from which the bundle at the given path can be downloaded
+
+    Raises a bundler.TIOModelsRegistrationError if no such URL can be derived from the path.
+    """
+    gcs_prefix = filesystem.GCS_PREFIX
+    if bundle_path.startswith(gcs_prefix):
+        return GCS_LINK_PREFIX + bundle_path[len(gcs_prefix):]
+    if bundle_path.startswith(LINK_PREFIXES):
+        return bundle_path
+    raise bundler.TIOModelsRegistrationError(
+        'ERROR: Cannot register bundle at {}; bundles must be on GCS or at an HTTP(S) URL'.format(
+            bundle_path
+        )
+    )
+
+class RepositoryClient:
+    """
+    Registers bundles against a TensorIO Models repository over a pool of keep-alive connections.
+    Requests which fail to connect, or which receive one of the RETRY_STATUS_CODES, are retried
+    with exponential backoff. Requests which may have reached the repository (e.g. which timed out
+    waiting for a response) are never retried, so that a bundle is not registered twice.
+
+    Clients are safe to share between threads.
+    """
+    def __init__(
+            self,
+            repository_url,
+            api_key,
+            connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+            read_timeout=DEFAULT_READ_TIMEOUT,
+            retries=DEFAULT_RETRIES,
+            backoff_factor=DEFAULT_BACKOFF_FACTOR,
+            pool_size=DEFAULT_POOL_SIZE
+        ):
+        self.repository_url = repository_url
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=False,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            # Registrations are POSTs, which urllib3 does not retry by default
+            method_whitelist=frozenset(['POST']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = 'Bearer {}'.format(api_key)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def register(self, bundle_path, resource_path):
+        """
+        Registers bundle at the given path against the repository at the given resource path.
+
+        Raises a bundler.TIOModelsRegistrationError if the resource path is invalid, if the
+        repository cannot be reached or if it responds with an error status code.
+
+        Args:
+        1. bundle_path - path to TensorIO bundle (GCS ok)
+        2. resource_path - Full checkpoint path at which bundle should be registered (e.g.
+           /models/<modelName>/hyperparameters/<hyperparametersName>/checkpoints/<checkpointName>)
+
+        Returns: Response text
+        """
+        checkpoints, checkpoint_id = os.path.split(resource_path)
+        if checkpoints == '' or checkpoint_id == '':
+            raise bundler.TIOModelsRegistrationError(
+                'Invalid resource path: {}'.format(resource_path)
+            )
+
+        payload = {
+            'checkpointId': checkpoint_id,
+            'link': bundle_link(bundle_path)
+        }
+        request_url = self.repository_url + checkpoints
+        try:
+            response = self.session.post(request_url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise bundler.TIOModelsRegistrationError(
+                'ERROR: Request to {} failed: {}'.format(request_url, e)
+            )
+        if response.status_code >= 400:
+            raise bundler.TIOModelsRegistrationError(
+                'ERROR: Repository responded to registration at {} with status code {}: {}'.format(
+                    resource_path,
+                    response.status_code,
+                    response.text
+                )
+            )
+        return response.text
+
+    def register_many(self, registrations, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Registers many bundles concurrently. A failed registration does not stop the others.
+
+        Args:
+        1. registrations - List of (bundle path, resource path) pairs
+        2. max_workers - Maximum number of registrations in flight at once
+
+        Returns: List with one dictionary per registration, in the order of registrations,
+        containing its "bundle", "resource_path", and either the "registration" response text or
+        the "error" message (the other being None)
+        """
+        def register(registration):
+            bundle_path, resource_path = registration
+            result = {
+                'bundle': bundle_path,
+                'resource_path': resource_path,
+                'registration': None,
+                'error': None
+            }
+            try:
+                result['registration'] = self.register(bundle_path, resource_path)
+            except bundler.TIOModelsRegistrationError as e:
+                result['error'] = str(e)
+            return result
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(register, registrations))
+
+    def close(self):
+        """
+        Closes the connections held by the client
+        """
+        self.session.close()
+
+def _float_from_environment(name, default):
+    value = os.environ.get(name)
+    return float(value) if value is not None else default
+
+def from_environment():
+    """
+    Creates a RepositoryClient for the repository at the URL in the REPOSITORY environment
+    variable, authenticated with the key in REPOSITORY_API_KEY. Timeouts and retries can be
+    configured by the (optional) REPOSITORY_CONNECT_TIMEOUT, REPOSITORY_READ_TIMEOUT and
+    REPOSITORY_RETRIES environment variables.
+
+    Raises a bundler.TIOModelsRegistrationError if REPOSITORY or REPOSITORY_API_KEY is not set.
+
+    Returns: RepositoryClient
+    """
+    repository_url = os.environ.get('REPOSITORY')
+    if repository_url is None:
+        # Should be in the form <host>[:<port>]/v1/repository
+        raise bundler.TIOModelsRegistrationError('REPOSITORY environment variable not set')
+
+    repository_api_key = os.environ.get('REPOSITORY_API_KEY')
+    if repository_api_key is None:
+        raise bundler.TIOModelsRegistrationError('REPOSITORY_API_KEY environment variable not set')
+
+    return RepositoryClient(
+        repository_url,
+        repository_api_key,
+        connect_timeout=_float_from_environment(
+            'REPOSITORY_CONNECT_TIMEOUT',
+            DEFAULT_CONNECT_TIMEOUT
+        ),
+        read_timeout=_float_from_environment('REPOSITORY_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+        retries=int(os.environ.get('REPOSITORY_RETRIES', DEFAULT_RETRIES))
+    )
+
+_default_client = None
+_default_client_config = None
+_default_client_lock = threading.Lock()
+
+def default_client():
+    """
+    Returns: RepositoryClient configured by the environment (see from_environment), shared by all
+    callers in this process so that they share its connections. A new client is created if the
+    configuring environment variables change.
+    """
+    global _default_client, _default_client_config
+    config = tuple(
+        os.environ.get(name) for name in [
+            'REPOSITORY',
+            'REPOSITORY_API_KEY',
+            'REPOSITORY_CONNECT_TIMEOUT',
+            'REPOSITORY_READ_TIMEOUT',
+            'REPOSITORY_RETRIES'
+        ]
+    )
+    with _default_client_lock:
+        if _default_client is None or config != _default_client_config:
+            _default_client = from_environment()
+            _default_client_config = config
+        return _default_client
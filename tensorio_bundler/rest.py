@@ -2,11 +2,97 @@
 TensorIO Bundler REST API
 """
 
-import json
+import os
 
 import falcon
 
-from . import bundler
+from . import (
+    admission,
+    batch,
+    blobstore,
+    cache,
+    conversion,
+    dedup,
+    jobs,
+    metrics,
+    pipeline,
+    reader,
+    sse
+)
+
+# Shared by all requests handled by this process; None unless CONVERSION_CACHE_DIR is set
+conversion_cache = cache.from_environment()
+
+# Local store of assets fetched from GCS, shared by all requests (and, through its directory, by all
+# worker processes); None unless ASSET_STORE_DIR is set
+asset_store = blobstore.from_environment()
+
+# Warm worker processes on which TFLite conversions run, so that a crashing converter cannot take
+# down this process; None if CONVERSION_WORKERS is 0. The workers are started (and import
+# TensorFlow) in the background, so that neither loading the API nor its first conversion waits
+# for them.
+conversion_executor = conversion.from_environment()
+if conversion_executor is not None:
+    conversion_executor.start_in_background()
+
+# Upper bound on the number of bundles built at once by a single POST /bundles request
+batch_max_workers = int(os.environ.get('BATCH_MAX_WORKERS', batch.DEFAULT_MAX_WORKERS))
+
+# Runs bundle builds requested with "async": true. Jobs are held in the memory of this process, so
+# the API must run as a single (threaded) worker process, as in the Dockerfile.
+job_manager = jobs.from_environment(error_status=pipeline.status_code)
+
+# Shares builds between identical POST /bundle requests
+request_coalescer = dedup.from_environment()
+
+# Admits bundle builds against the memory and CPU budgets of this process, which is the only one
+# serving the API (see the Dockerfile); None unless ADMISSION_MEMORY_BYTES or ADMISSION_CPUS is set
+admission_controller = admission.from_environment()
+
+# Seconds without progress after which a heartbeat is sent on the event streams of bundle builds
+sse_heartbeat_interval = sse.heartbeat_interval_from_environment()
+
+def raise_http_error(error):
+    """
+    Raises the falcon HTTP error corresponding to an error raised while building a bundle.
+    Descriptions of internal server errors are not exposed to clients.
+    """
+    code = pipeline.status_code(error)
+    if code == 500:
+        raise falcon.HTTPInternalServerError()
+    if isinstance(error, admission.AdmissionQueueFullError):
+        raise falcon.HTTPTooManyRequests(description=str(error), retry_after=error.retry_after)
+    raise falcon.HTTPError(getattr(falcon, 'HTTP_{}'.format(code)), description=str(error))
+
+class MetricsMiddleware:
+    """
+    Counts the requests handled by each handler (by response status code) and the requests each
+    handler is currently handling. Requests answered with an event stream (see _stream_bundle) are
+    handled until their stream ends, and are counted with the status code of its final event.
+    """
+    def process_resource(self, req, resp, resource, params):
+        if resource is not None:
+            metrics.REQUESTS_IN_PROGRESS.inc(type(resource).__name__)
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        if resource is None:
+            return
+        handler = type(resource).__name__
+        stream = req.context.get('event_stream')
+        if stream is not None and req_succeeded:
+            resp.stream = _metered_frames(handler, stream, resp.stream)
+            return
+        metrics.REQUESTS_IN_PROGRESS.dec(handler)
+        metrics.REQUESTS.inc(handler, resp.status.split(' ', 1)[0])
+
+def _metered_frames(handler, stream, frames):
+    # Yields the frames of an event stream, accounting for its request once the stream ends (or the
+    # client disconnects, in which case the server closes this generator)
+    try:
+        yield from frames
+    finally:
+        metrics.REQUESTS_IN_PROGRESS.dec(handler)
+        metrics.REQUESTS.inc(handler, stream.status)
 
 class PingHandler:
     """
@@ -20,19 +106,50 @@ class PingHandler:
         resp.status = falcon.HTTP_200
         resp.body = 'ok'
 
+class StatsHandler:
+    """
+    Handler for service statistics
+    """
+    def on_get(self, req, resp):
+        """
+        Returns status code 200 with a JSON body containing statistics for the caches used by this
+        process (e.g. conversion cache and asset store hits and misses), counts of its bundle jobs
+        by state, counts of the bundle requests answered by identical requests, and the resources
+        in use, queue depth and wait times of admission control.
+        Caches and admission control are reported as null if they are not configured.
+        """
+        stats = {
+            'conversion_cache': conversion_cache.stats() if conversion_cache is not None else None,
+            'asset_store': asset_store.stats() if asset_store is not None else None,
+            'jobs': job_manager.stats(),
+            'deduplication': request_coalescer.stats(),
+            'admission': (
+                admission_controller.stats() if admission_controller is not None else None
+            )
+        }
+        resp.status = falcon.HTTP_200
+        resp.media = stats
+
+class MetricsHandler:
+    """
+    Handler for Prometheus scrapes
+    """
+    def on_get(self, req, resp):
+        """
+        Returns status code 200 with the metrics of this process (see the metrics module) in the
+        Prometheus text format: durations of the stages of bundle builds, bytes read and written,
+        errors by exception class, and requests handled and in progress by handler.
+        """
+        resp.status = falcon.HTTP_200
+        resp.content_type = metrics.CONTENT_TYPE
+        resp.body = metrics.registry.render()
+
 class BundleHandler:
     """
     Handler for bundle creation requests
     """
 
-    required_keys = {
-        'saved_model_dir',
-        'build',
-        'model_json_path',
-        'assets_path',
-        'bundle_name',
-        'bundle_output_path'
-    }
+    required_keys = pipeline.REQUIRED_KEYS
 
     def on_post(self, req, resp):
         """
@@ -45,10 +162,51 @@ class BundleHandler:
         6. Bundle name
         7. Bundle output path
         8. Repository resource path
+        9. (Optional) "async" flag; if true, the bundle is built in the background
+        10. (Optional) "previous_bundle_path" - path to a zipped tiobundle from a previous build;
+            unchanged files are copied from it rather than compressed again
+        11. (Optional) "compression" - compression policy for the entries of the bundle (see
+            compression.parse_policy); by default, entries are stored uncompressed
+        12. (Optional) "reproducible" flag; if true, the bundle is built reproducibly with a
+            manifest of its contents, and if an identical bundle already exists at the output path,
+            it is neither built nor registered again
+        13. (Optional) "conversion_profile" - for TFLite builds, one of quantization.PROFILES
+            ("none", "dynamic_range", "float16" or "full_integer"); defaults to "none"
+        14. (Optional) "representative_dataset" - path to a .npy or .npz file of sample inputs,
+            required by the "full_integer" profile (see quantization.ConversionOptions)
+        15. (Optional) "latency_runs" - number of timed invocations of the converted model used to
+            measure its latency, which is recorded with its size in the conversion report of the
+            bundle; 0 skips the measurement
+        16. (Optional) "benchmark" - for TFLite builds, true or a dictionary of benchmark options
+            ("runs", "warmup_runs", "thread_counts" and "budget"; see benchmark.parse_options). The
+            converted model is benchmarked before it is bundled, its report is written to the
+            bundle output path with the suffix benchmark.REPORT_SUFFIX, and the build fails if the
+            model exceeds its budget
+
+        Identical requests (or requests with the same Idempotency-Key header) which arrive while a
+        build is running wait for it and get its result, as do those which arrive within DEDUP_TTL
+        seconds of it succeeding (see dedup.RequestCoalescer).
+
+        If admission control is configured (see admission.from_environment), each build waits
+        until the memory and CPUs it is estimated to need are available. Builds requested with
+        "async": true wait in the background.
+
+        If the Accept header of a request lists sse.CONTENT_TYPE (and "async" is not true), the
+        progress of the build is streamed as server-sent events while it runs: the events of
+        pipeline.bundle_from_spec (stages, conversion steps, and files and bytes bundled out of
+        the total), a heartbeat comment after every SSE_HEARTBEAT_SECONDS seconds without events,
+        and finally a "result" event with the result of the build or an "error" event with the
+        "status" (and "title" and "description") its response would have had. Requests which
+        share an identical build only receive heartbeats and the final event.
 
         Possible responses:
         + Responds with status code 200 and body containing the GCS path of the tiobundle if the
           bundle was created successfully.
+        + Responds with status code 200 and a stream of server-sent events (see above) if the
+          request asks for them and is valid.
+        + Responds with status code 202 if "async" is true and the request is valid. The JSON body
+          contains the "job_id" of the build, whose state can be polled at /jobs/<job_id> (also
+          given in the Location header).
         + Responds with a status code of 400 if the request body is either not a processable JSON
           string or if it does not specify the appropriate fields or if the fields are inappropriate
           to the request (e.g. missing keys). The body of the response will specify the erroneous
@@ -64,82 +222,261 @@ class BundleHandler:
             + model.json
             + assets directory
             + TFlite binary or SavedModel directory
+        + Responds with a 503 if "async" is true and too many jobs are already queued.
+        + Responds with a 422 if the Idempotency-Key header was already used for a different
+          request body.
+        + Responds with a 422 if "benchmark" is set and the model exceeds its budget.
+        + Responds with a 429 if the build has to wait to be admitted but too many builds are
+          already waiting. The Retry-After header gives the estimated wait in seconds.
         """
         # The following assignment automatically returns a 400 response code if the input is not
         # parseable JSON.
         request_body = req.media
 
-        missing_keys = [key for key in self.required_keys if key not in request_body]
-        if len(missing_keys) > 0:
-            message = 'Request body missing the following keys: {}'.format(
-                ', '.join(missing_keys)
+        try:
+            pipeline.validate_spec(request_body)
+        except pipeline.MissingBundleSpecificationKeysError as e:
+            raise falcon.HTTPBadRequest(str(e))
+        except pipeline.BundleSpecificationError as e:
+            raise_http_error(e)
+
+        idempotency_key = req.get_header('Idempotency-Key')
+        if request_body.get('async', False):
+            try:
+                job = job_manager.submit(
+                    request_coalescer.run,
+                    request_body,
+                    _bundle_when_admitted,
+                    request_body,
+                    bounded=False,
+                    idempotency_key=idempotency_key,
+                    conversion_cache=conversion_cache,
+                    conversion_executor=conversion_executor,
+                    asset_store=asset_store
+                )
+            except jobs.JobQueueFullError as e:
+                raise falcon.HTTPServiceUnavailable(description=str(e), retry_after=30)
+            resp.status = falcon.HTTP_202
+            resp.location = '/jobs/{}'.format(job.id)
+            resp.media = {'job_id': job.id, 'state': job.state}
+            return
+
+        if sse.accepts_event_stream(req.get_header('Accept')):
+            _stream_bundle(req, resp, request_body, idempotency_key)
+            return
+
+        try:
+            result = request_coalescer.run(
+                request_body,
+                _bundle_when_admitted,
+                request_body,
+                idempotency_key=idempotency_key,
+                conversion_cache=conversion_cache,
+                conversion_executor=conversion_executor,
+                asset_store=asset_store
             )
-            raise falcon.HTTPBadRequest(message)
+        except Exception as e:
+            raise_http_error(e)
 
-        valid_builds = {bundler.TFLITE, bundler.SAVED_MODEL}
-        if request_body.get('build') not in valid_builds:
+        response_body = result['bundle']
+        if result['registration'] is not None:
+            response_body = 'Bundle: {}, checkpoint: {}'.format(
+                result['bundle'],
+                result['registration']
+            )
+
+        resp.status = falcon.HTTP_200
+        resp.body = response_body
+
+def _stream_bundle(req, resp, spec, idempotency_key):
+    # Responds with a stream of the progress events of the build, which runs on its own thread. A
+    # full admission queue is reported with status code 429 before the stream starts. The stream
+    # is kept in the request context, so that MetricsMiddleware can account for the request once
+    # the stream ends.
+    if admission_controller is not None:
+        try:
+            admission_controller.check()
+        except admission.AdmissionQueueFullError as e:
+            raise_http_error(e)
+    stream = sse.EventStream(heartbeat_interval=sse_heartbeat_interval)
+    stream.follow(
+        request_coalescer.run,
+        spec,
+        _bundle_when_admitted,
+        spec,
+        idempotency_key=idempotency_key,
+        conversion_cache=conversion_cache,
+        conversion_executor=conversion_executor,
+        asset_store=asset_store
+    )
+    resp.status = falcon.HTTP_200
+    resp.content_type = sse.CONTENT_TYPE
+    resp.set_header('Cache-Control', 'no-cache')
+    # Stops proxies such as nginx from buffering the stream
+    resp.set_header('X-Accel-Buffering', 'no')
+    resp.stream = stream.frames()
+    req.context['event_stream'] = stream
+
+def _bundle_when_admitted(spec, bounded=True, **kwargs):
+    # Builds a bundle (see pipeline.bundle_from_spec) once admission control admits it. Requests
+    # whose number is bounded by a job manager are queued even if the admission queue is full.
+    if admission_controller is None:
+        return pipeline.bundle_from_spec(spec, **kwargs)
+    with admission_controller.admit(spec, bounded=bounded):
+        return pipeline.bundle_from_spec(spec, **kwargs)
+
+class BatchHandler:
+    """
+    Handler for requests to create many bundles at once
+    """
+    def on_post(self, req, resp):
+        """
+        Accepts POST requests with a JSON body containing:
+        1. "bundles" - list of bundle specifications, each with the keys accepted by
+           BundleHandler.on_post
+        2. (Optional) "max_workers" - number of bundles to build at once (capped by the
+           BATCH_MAX_WORKERS environment variable)
+        3. (Optional) "async" flag; if true, the batch is built in the background
+
+        The bundles are built concurrently and share this process's conversion cache, conversion
+        workers and admission control (under which they wait to be admitted however many builds
+        are queued). A bundle which fails to build does not stop the others.
+
+        Possible responses:
+        + Responds with status code 200 and a JSON body whose "results" list contains, for each
+          specification in order, its "status" ("succeeded" or "failed"), its "result" or "error"
+          and the "timings" of its stages, and whose "summary" counts the bundles which succeeded
+          and failed.
+        + Responds with status code 202 if "async" is true and the request is valid. The JSON body
+          contains the "job_id" of the batch, whose state can be polled at /jobs/<job_id>.
+        + Responds with status code 400 if "bundles" is not a list or if any of the
+          specifications is invalid. The body of the response lists the errors by index and no
+          bundles are built.
+        + Responds with a 503 if "async" is true and too many jobs are already queued.
+        """
+        request_body = req.media
+
+        specs = request_body.get('bundles') if isinstance(request_body, dict) else None
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
             raise falcon.HTTPBadRequest(
-                description='"build" must be one of {}'.format(valid_builds)
+                'Invalid batch',
+                'Request body must contain a list of bundle specifications under "bundles"'
             )
 
-        if request_body.get('build') == bundler.TFLITE and request_body.get('tflite_model') is None:
-            raise falcon.HTTPUnprocessableEntity(
-                description=(
-                    'ERROR: "tflite_model" must be specified in request body if "build" is set '
-                    'to {}'.format(bundler.TFLITE)
+        errors = batch.validate_specs(specs)
+        if len(errors) > 0:
+            raise falcon.HTTPBadRequest(
+                'Invalid batch',
+                '; '.join(
+                    'bundle {}: {}'.format(index, error) for index, error in sorted(errors.items())
                 )
             )
 
-        model_path = request_body.get('saved_model_dir')
+        max_workers = request_body.get('max_workers', batch_max_workers)
+        if not isinstance(max_workers, int) or max_workers < 1:
+            raise falcon.HTTPBadRequest('Invalid batch', '"max_workers" must be a positive integer')
+        max_workers = min(max_workers, batch_max_workers)
 
-        if request_body.get('build') == bundler.TFLITE:
+        if request_body.get('async', False):
             try:
-                bundler.tflite_build_from_saved_model(
-                    request_body.get('saved_model_dir'),
-                    request_body.get('tflite_model')
+                job = job_manager.submit(
+                    _run_batch,
+                    specs,
+                    max_workers=max_workers
                 )
-            except bundler.TFLiteFileExistsError as e:
-                raise falcon.HTTPConflict(description=str(e))
-            except bundler.SavedModelDirMisspecificationError as e:
-                raise falcon.HTTPNotFound(description=str(e))
-            except Exception as e:
-                raise falcon.HTTPInternalServerError()
+            except jobs.JobQueueFullError as e:
+                raise falcon.HTTPServiceUnavailable(description=str(e), retry_after=30)
+            resp.status = falcon.HTTP_202
+            resp.location = '/jobs/{}'.format(job.id)
+            resp.media = {'job_id': job.id, 'state': job.state}
+            return
 
-            model_path = request_body.get('tflite_model')
+        resp.status = falcon.HTTP_200
+        resp.media = _run_batch(specs, max_workers=max_workers)
 
+def _run_batch(specs, max_workers, progress=None):
+    results = batch.run_batch(
+        specs,
+        max_workers=max_workers,
+        conversion_cache=conversion_cache,
+        conversion_executor=conversion_executor,
+        progress=progress,
+        asset_store=asset_store,
+        admission_controller=admission_controller
+    )
+    return {'results': results, 'summary': batch.summarize(results)}
+
+class InspectHandler:
+    """
+    Handler for requests to inspect zipped tiobundles
+    """
+    def on_get(self, req, resp):
+        """
+        Accepts GET requests with query parameters:
+        1. "path" - path of the zipped tiobundle
+        2. (Optional) "entries" - comma-separated paths (relative to the bundle directory) of
+           entries whose contents should be returned
+
+        Only the zip central directory, model.json, the manifest and the requested entries are
+        read from the bundle, so the model weights are never transferred.
+
+        Possible responses:
+        + Responds with status code 200 and a JSON body (see reader.BundleReader.inspect) giving
+          the bundle_name, entries (with their sizes), model_json, manifest (null unless the bundle
+          was built reproducibly), base64-encoded contents of the requested entries and the
+          number of bytes_read from the bundle.
+        + Responds with status code 400 if the path is missing.
+        + Responds with status code 404 if there is no bundle at the path, or if a requested entry
+          is not in the bundle.
+        + Responds with status code 413 if a requested entry is larger than
+          reader.MAX_INSPECTED_ENTRY_SIZE.
+        + Responds with status code 422 if the file at the path is not a zip file.
+        """
+        bundle_path = req.get_param('path', required=True)
+        entry_paths = req.get_param_as_list('entries') or []
         try:
-            outfile = bundler.tiobundle_build(
-                model_path,
-                request_body.get('model_json_path'),
-                request_body.get('assets_path'),
-                request_body.get('bundle_name'),
-                request_body.get('bundle_output_path')
-            )
-        except bundler.ZippedTIOBundleExistsError as e:
-            raise falcon.HTTPConflict(description=str(e))
-        except bundler.ZippedTIOBundleMisspecificationError as e:
-            raise falcon.HTTPNotFound(description=str(e))
-        except Exception:
-            raise falcon.HTTPInternalServerError()
-
-        response_body = outfile
-        registration = ''
-
-        repository_path = request_body.get('repository_path', '')
-        if repository_path != '':
-            try:
-                registration = register_bundle(outfile, repository_path)
-            except Exception as err:
-                raise falcon.HTTPInternalServerError()
-            response_body = 'Bundle: {}, checkpoint: {}'.format(outfile, registration)
+            result = reader.inspect_bundle(bundle_path, entry_paths)
+        except Exception as e:
+            raise_http_error(e)
+        resp.status = falcon.HTTP_200
+        resp.media = result
 
+class JobHandler:
+    """
+    Handler for bundle job status requests
+    """
+    def on_get(self, req, resp, job_id):
+        """
+        Returns status code 200 with a JSON body describing the state of the job with the given id
+        ("queued", "running", "succeeded" or "failed"), the stage it is running, the files and
+        bytes it has bundled out of the total, its result if it succeeded and its error if it
+        failed. Returns status code 404 if there is no such job.
+        """
+        job = job_manager.get(job_id)
+        if job is None:
+            raise falcon.HTTPNotFound(description='No job with id {}'.format(job_id))
         resp.status = falcon.HTTP_200
-        resp.body = response_body
+        resp.media = job.to_dict()
 
-api = falcon.API()
+api = falcon.API(middleware=[MetricsMiddleware()])
 
 ping_handler = PingHandler()
 api.add_route('/ping', ping_handler)
 
+stats_handler = StatsHandler()
+api.add_route('/stats', stats_handler)
+
+metrics_handler = MetricsHandler()
+api.add_route('/metrics', metrics_handler)
+
 bundle_handler = BundleHandler()
 api.add_route('/bundle', bundle_handler)
+
+inspect_handler = InspectHandler()
+api.add_route('/bundle/inspect', inspect_handler)
+
+batch_handler = BatchHandler()
+api.add_route('/bundles', batch_handler)
+
+job_handler = JobHandler()
+api.add_route('/jobs/{job_id}', job_handler)
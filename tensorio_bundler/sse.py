@@ -0,0 +1,212 @@
+"""
+Server-sent events through which the progress of a bundle build is streamed to clients which ask
+for it (with an "Accept: text/event-stream" header), so that a slow build can be told apart from a
+hung one
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+
+from . import pipeline
+
+CONTENT_TYPE = 'text/event-stream'
+
+# Seconds without events after which a comment is sent, so that clients and proxies can see that
+# the connection is alive while a stage (e.g. a conversion) runs without reporting progress
+DEFAULT_HEARTBEAT_INTERVAL = 15
+
+HEARTBEAT = b': heartbeat\n\n'
+
+# Events which end a stream: the result of the build, or the error which it raised
+RESULT_EVENT = 'result'
+ERROR_EVENT = 'error'
+
+# Status code of streams whose client disconnected before the final event was sent (as in nginx)
+CLIENT_CLOSED_REQUEST = 499
+
+def accepts_event_stream(accept):
+    """
+    Returns: True if the given Accept header of a request lists CONTENT_TYPE, False otherwise
+    """
+    if not accept:
+        return False
+    return any(
+        media_range.split(';', 1)[0].strip() == CONTENT_TYPE for media_range in accept.split(',')
+    )
+
+def heartbeat_interval_from_environment():
+    """
+    Returns: Heartbeat interval of event streams, from the (optional) SSE_HEARTBEAT_SECONDS
+    environment variable
+    """
+    return float(os.environ.get('SSE_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_INTERVAL))
+
+def format_event(event):
+    """
+    Formats a progress event (a dictionary with its type under "event") as a server-sent event
+    whose data is the JSON of the rest of the dictionary
+
+    Returns: bytes
+    """
+    data = dict(event)
+    name = data.pop('event')
+    return 'event: {}\ndata: {}\n\n'.format(name, json.dumps(data)).encode('utf-8')
+
+def final_event(result=None, error=None):
+    """
+    Returns: Event ending the stream of a build which returned result (see
+    pipeline.bundle_from_spec) or raised error. Descriptions of internal server errors are not
+    exposed to clients.
+    """
+    if error is None:
+        return dict(result, event=RESULT_EVENT)
+    code = pipeline.status_code(error)
+    if code == 500:
+        return {'event': ERROR_EVENT, 'status': 500, 'title': 'Internal Server Error'}
+    event = {
+        'event': ERROR_EVENT,
+        'status': code,
+        'title': 'Bundle request failed',
+        'description': str(error)
+    }
+    if hasattr(error, 'retry_after'):
+        event['retry_after'] = error.retry_after
+    return event
+
+def final_status(event):
+    """
+    Returns: Status code with which the build ending with the given event would have been answered
+    without a stream (200 for a result), or None if the event does not end the stream
+    """
+    if event.get('event') == RESULT_EVENT:
+        return 200
+    if event.get('event') == ERROR_EVENT:
+        return event['status']
+    return None
+
+def coalesce(events):
+    """
+    Drops each "bundle_progress" event which is followed by another one, which supersedes it, so
+    that clients which read slower than files are bundled are not sent a backlog of events
+
+    Returns: List of events
+    """
+    return [
+        event for event, following in zip(events, events[1:] + [None])
+        if not (
+            event.get('event') == 'bundle_progress'
+            and following is not None
+            and following.get('event') == 'bundle_progress'
+        )
+    ]
+
+def _frames(events):
+    # Formats a batch of events as they are to be sent, each with its final_status, ending with the
+    # final event (if any)
+    for event in coalesce(events):
+        yield format_event(event), final_status(event)
+
+class EventStream:
+    """
+    Events published by a build running on another thread, which are sent to the client as they
+    arrive (see frames). publish may be used as the progress callback of the build.
+
+    Once the final event has been sent, status is its final_status; until then, it is
+    CLIENT_CLOSED_REQUEST.
+    """
+    def __init__(self, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL):
+        self.heartbeat_interval = heartbeat_interval
+        self.status = CLIENT_CLOSED_REQUEST
+        self._queue = queue.Queue()
+
+    def publish(self, event):
+        self._queue.put(event)
+
+    def follow(self, fn, *args, **kwargs):
+        """
+        Runs fn(*args, progress=self.publish, **kwargs) on a new thread, ending the stream with
+        its result or the error which it raised. The build goes on if the client disconnects.
+        """
+        def run():
+            try:
+                result = fn(*args, progress=self.publish, **kwargs)
+            except Exception as e:
+                self.publish(final_event(error=e))
+            else:
+                self.publish(final_event(result=result))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def frames(self):
+        """
+        Yields each event as a server-sent event (see format_event), or HEARTBEAT after
+        heartbeat_interval seconds without events, until the stream ends
+        """
+        while True:
+            try:
+                events = [self._queue.get(timeout=self.heartbeat_interval)]
+            except queue.Empty:
+                yield HEARTBEAT
+                continue
+            while True:
+                try:
+                    events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for frame, status in _frames(events):
+                yield frame
+                if status is not None:
+                    self.status = status
+                    return
+
+class AsyncEventStream:
+    """
+    Same as EventStream, for builds run by coroutines; it must be created on the event loop, but
+    events may be published from any thread.
+    """
+    def __init__(self, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL):
+        self.heartbeat_interval = heartbeat_interval
+        self.status = CLIENT_CLOSED_REQUEST
+        self._loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def publish(self, event):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    def follow(self, coroutine_fn, *args, **kwargs):
+        """
+        Schedules coroutine_fn(*args, progress=self.publish, **kwargs) on the event loop, ending
+        the stream with its result or the error which it raised. The build goes on if the client
+        disconnects.
+        """
+        async def run():
+            try:
+                result = await coroutine_fn(*args, progress=self.publish, **kwargs)
+            except Exception as e:
+                self.publish(final_event(error=e))
+            else:
+                self.publish(final_event(result=result))
+
+        self._task = asyncio.ensure_future(run())
+
+    async def frames(self):
+        """
+        Same as EventStream.frames, as an asynchronous generator
+        """
+        while True:
+            try:
+                events = [await asyncio.wait_for(self._queue.get(), self.heartbeat_interval)]
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            while not self._queue.empty():
+                events.append(self._queue.get_nowait())
+            for frame, status in _frames(events):
+                yield frame
+                if status is not None:
+                    self.status = status
+                    return
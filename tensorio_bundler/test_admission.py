@@ -0,0 +1,148 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+
+from . import admission, bundler, filesystem
+
+class TestEstimateCost(unittest.TestCase):
+    ROOT = 'mem://test-admission'
+
+    def setUp(self):
+        filesystem.register_filesystem(self.ROOT, filesystem.MemoryFileSystem())
+        for relative_path, size in [('train/saved_model.pb', 1000), ('assets/labels.txt', 10)]:
+            with filesystem.open(os.path.join(self.ROOT, relative_path), 'wb') as outfile:
+                outfile.write(b'0' * size)
+
+    def spec(self, build, **extra):
+        spec = {
+            'saved_model_dir': os.path.join(self.ROOT, 'train'),
+            'assets_path': os.path.join(self.ROOT, 'assets'),
+            'build': build
+        }
+        spec.update(extra)
+        return spec
+
+    def test_savedmodel_build(self):
+        cost = admission.estimate_cost(self.spec(bundler.SAVED_MODEL))
+        self.assertEqual(cost, admission.Cost(admission.BUNDLE_BASE_MEMORY + 1000, 1))
+
+    def test_tflite_build(self):
+        cost = admission.estimate_cost(
+            self.spec(bundler.TFLITE, benchmark={'thread_counts': [1, 4]})
+        )
+        self.assertEqual(
+            cost,
+            admission.Cost(
+                admission.CONVERSION_BASE_MEMORY + admission.CONVERSION_MEMORY_FACTOR * 1000,
+                4
+            )
+        )
+
+    def test_missing_directories(self):
+        cost = admission.estimate_cost(
+            self.spec(bundler.SAVED_MODEL, saved_model_dir=os.path.join(self.ROOT, 'nonexistent'))
+        )
+        self.assertEqual(cost.memory_bytes, admission.BUNDLE_BASE_MEMORY + 10)
+
+class TestAdmissionController(unittest.TestCase):
+    def test_admits_within_budget(self):
+        controller = admission.AdmissionController(memory_budget=100, cpu_budget=2)
+        first = controller.acquire(admission.Cost(60, 1))
+        second = controller.acquire(admission.Cost(40, 1))
+        stats = controller.stats()
+        self.assertEqual(stats['running'], 2)
+        self.assertEqual(stats['memory_in_use_bytes'], 100)
+        first.release()
+        second.release()
+        self.assertEqual(controller.stats()['memory_in_use_bytes'], 0)
+
+    def test_build_larger_than_budget_runs_alone(self):
+        controller = admission.AdmissionController(memory_budget=100)
+        with controller.acquire(admission.Cost(1000, 1)):
+            self.assertEqual(controller.stats()['running'], 1)
+
+    def test_queues_in_order_of_arrival(self):
+        controller = admission.AdmissionController(cpu_budget=1)
+        running = controller.acquire(admission.Cost(0, 1))
+        admitted = []
+
+        def build(name):
+            with controller.acquire(admission.Cost(0, 1)):
+                admitted.append(name)
+
+        threads = []
+        for name in ['first', 'second']:
+            thread = threading.Thread(target=build, args=(name,))
+            thread.start()
+            threads.append(thread)
+            while controller.stats()['queued'] < len(threads):
+                time.sleep(0.01)
+        self.assertListEqual(admitted, [])
+
+        running.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertListEqual(admitted, ['first', 'second'])
+        stats = controller.stats()
+        self.assertEqual(stats['admitted'], 3)
+        self.assertGreater(stats['max_wait_seconds'], 0)
+
+    def test_full_queue(self):
+        controller = admission.AdmissionController(cpu_budget=1, max_queued=0)
+        running = controller.acquire(admission.Cost(0, 1))
+        with self.assertRaises(admission.AdmissionQueueFullError) as context:
+            controller.acquire(admission.Cost(0, 1))
+        self.assertEqual(context.exception.retry_after, admission.DEFAULT_RETRY_AFTER)
+        self.assertEqual(controller.stats()['rejected'], 1)
+
+        # Builds whose number is bounded elsewhere wait however many builds are queued
+        unbounded = threading.Thread(
+            target=lambda: controller.acquire(admission.Cost(0, 1), bounded=False).release()
+        )
+        unbounded.start()
+        while controller.stats()['queued'] < 1:
+            time.sleep(0.01)
+        running.release()
+        unbounded.join(5)
+        self.assertEqual(controller.stats()['admitted'], 2)
+
+    def test_acquire_async(self):
+        controller = admission.AdmissionController(cpu_budget=1)
+
+        async def run():
+            running = await controller.acquire_async(admission.Cost(0, 1))
+            waiting = asyncio.ensure_future(controller.acquire_async(admission.Cost(0, 1)))
+            cancelled = asyncio.ensure_future(controller.acquire_async(admission.Cost(0, 1)))
+            await asyncio.sleep(0)
+            self.assertEqual(controller.stats()['queued'], 2)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            self.assertEqual(controller.stats()['queued'], 1)
+            running.release()
+            (await waiting).release()
+
+        # asyncio.run only exists from Python 3.7 on
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+        stats = controller.stats()
+        self.assertEqual(stats['admitted'], 2)
+        self.assertEqual(stats['running'], 0)
+        self.assertEqual(stats['queued'], 0)
+
+    def test_from_environment(self):
+        self.assertIsNone(admission.from_environment())
+        os.environ['ADMISSION_CPUS'] = '2'
+        try:
+            controller = admission.from_environment()
+        finally:
+            del os.environ['ADMISSION_CPUS']
+        self.assertEqual(controller.cpu_budget, 2)
+        self.assertIsNone(controller.memory_budget)
+
+if __name__ == '__main__':
+    unittest.main()
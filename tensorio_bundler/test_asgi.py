@@ -0,0 +1,303 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import urllib.parse
+import zipfile
+
+from . import admission, asgi, bundler, metrics, test_sse
+
+def run_coroutine(coroutine):
+    """
+    Runs a coroutine to completion on a new event loop (asyncio.run only exists from Python 3.7 on)
+
+    Returns: Result of the coroutine
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+class TestASGIApp(unittest.TestCase):
+    FIXTURES_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'fixtures'
+    )
+    SAVED_MODEL_TIOBUNDLE = os.path.join(FIXTURES_DIR, 'savedmodel.tiobundle')
+    EVENT_STREAM_HEADERS = [(b'accept', b'text/event-stream')]
+
+    def setUp(self):
+        self.service = asgi.AsyncBundleService(bundle_workers=2, registration_workers=1)
+        self.app = asgi.BundleApp(self.service)
+        self.temp_dirs = []
+
+    def tearDown(self):
+        for temp_dir in self.temp_dirs:
+            shutil.rmtree(temp_dir)
+
+    def create_temp_dir(self):
+        temp_dir = tempfile.mkdtemp()
+        self.temp_dirs.append(temp_dir)
+        return temp_dir
+
+    def savedmodel_spec(self, outfile, **extra):
+        spec = {
+            'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+            'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+            'bundle_name': 'actual.tiobundle',
+            'bundle_output_path': outfile
+        }
+        spec.update(extra)
+        return spec
+
+    async def request(self, method, path, body=None, query_string=b'', headers=()):
+        """
+        Sends a request to the application under test, as an ASGI server would
+
+        Returns: (status, headers, body) of the response
+        """
+        request_body = b'' if body is None else body
+        if not isinstance(request_body, bytes):
+            request_body = json.dumps(request_body).encode('utf-8')
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query_string,
+            'headers': list(headers)
+        }
+        messages = [{'type': 'http.request', 'body': request_body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        start, *responses = sent
+        body = b''.join(response['body'] for response in responses)
+        return start['status'], dict(start['headers']), body.decode('utf-8')
+
+    def run_requests(self, *requests):
+        async def run():
+            results = await asyncio.gather(*[self.request(*request) for request in requests])
+            await self.service.shutdown()
+            return results
+        return run_coroutine(run())
+
+    def test_ping(self):
+        [(status, _, body)] = self.run_requests(('GET', '/ping'))
+        self.assertEqual(status, 200)
+        self.assertEqual(body, 'ok')
+
+    def test_unknown_route_and_method(self):
+        [(not_found, _, _), (not_allowed, _, _)] = self.run_requests(
+            ('GET', '/nonexistent'),
+            ('GET', '/bundle')
+        )
+        self.assertEqual(not_found, 404)
+        self.assertEqual(not_allowed, 405)
+
+    def test_savedmodel_bundle_build(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        [(status, _, body)] = self.run_requests(('POST', '/bundle', self.savedmodel_spec(outfile)))
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, outfile)
+        with zipfile.ZipFile(outfile) as bundle_zip:
+            self.assertIn('actual.tiobundle/model.json', bundle_zip.namelist())
+
+    def test_concurrent_bundle_builds(self):
+        outdir = self.create_temp_dir()
+        outfiles = [os.path.join(outdir, '{}.tiobundle.zip'.format(i)) for i in range(20)]
+
+        results = self.run_requests(
+            *[('POST', '/bundle', self.savedmodel_spec(outfile)) for outfile in outfiles]
+        )
+
+        self.assertListEqual([status for status, _, _ in results], [200] * len(outfiles))
+        self.assertListEqual([body for _, _, body in results], outfiles)
+
+    def test_identical_bundle_requests_share_a_build(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        results = self.run_requests(
+            *[('POST', '/bundle', self.savedmodel_spec(outfile)) for _ in range(10)]
+        )
+
+        # Without deduplication, all but one of the requests would fail with status code 409
+        self.assertListEqual([status for status, _, _ in results], [200] * 10)
+        self.assertListEqual([body for _, _, body in results], [outfile] * 10)
+        self.assertEqual(self.service.request_coalescer.stats()['coalesced'], 9)
+
+    def test_async_savedmodel_bundle_build(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        async def run():
+            status, headers, body = await self.request(
+                'POST',
+                '/bundle',
+                self.savedmodel_spec(outfile, **{'async': True})
+            )
+            self.assertEqual(status, 202)
+            job_path = '/jobs/{}'.format(json.loads(body)['job_id'])
+            self.assertEqual(headers[b'location'], job_path.encode('latin-1'))
+            await self.service.job_manager.join()
+            job_status, _, job_body = await self.request('GET', job_path)
+            await self.service.shutdown()
+            return job_status, json.loads(job_body)
+
+        job_status, job = run_coroutine(run())
+        self.assertEqual(job_status, 200)
+        self.assertEqual(job['state'], 'succeeded')
+        self.assertEqual(job['result']['bundle'], outfile)
+
+    def test_inspect_bundle(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        async def run():
+            await self.request('POST', '/bundle', self.savedmodel_spec(outfile))
+            query = urllib.parse.urlencode({'path': outfile})
+            status, _, body = await self.request(
+                'GET',
+                '/bundle/inspect',
+                query_string=query.encode('utf-8')
+            )
+            missing_status, _, _ = await self.request(
+                'GET',
+                '/bundle/inspect',
+                query_string=b'path=nonexistent.zip'
+            )
+            await self.service.shutdown()
+            return status, json.loads(body), missing_status
+
+        status, result, missing_status = run_coroutine(run())
+        self.assertEqual(status, 200)
+        self.assertEqual(result['bundle_name'], 'actual.tiobundle')
+        with open(os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json')) as model_json_file:
+            self.assertDictEqual(result['model_json'], json.load(model_json_file))
+        self.assertEqual(missing_status, 404)
+
+    def test_nonexistent_job(self):
+        [(status, _, _)] = self.run_requests(('GET', '/jobs/nonexistent'))
+        self.assertEqual(status, 404)
+
+    def test_bundle_with_malformed_request_body(self):
+        [(status, _, _)] = self.run_requests(('POST', '/bundle', b'{"saved_model_dir": '))
+        self.assertEqual(status, 400)
+
+    def test_bundle_with_missing_keys_in_body(self):
+        [(status, _, body)] = self.run_requests(('POST', '/bundle', {'build': bundler.SAVED_MODEL}))
+        self.assertEqual(status, 400)
+        self.assertIn('saved_model_dir', json.loads(body)['description'])
+
+    def test_bundle_with_invalid_conversion_profile(self):
+        outdir = self.create_temp_dir()
+        spec = self.savedmodel_spec(
+            os.path.join(outdir, 'test.tiobundle.zip'),
+            conversion_profile='full_integer'
+        )
+        [(status, _, body)] = self.run_requests(('POST', '/bundle', spec))
+        self.assertEqual(status, 400)
+        self.assertIn('representative dataset', json.loads(body)['description'])
+
+    def test_benchmark_requires_tflite_build(self):
+        outdir = self.create_temp_dir()
+        spec = self.savedmodel_spec(os.path.join(outdir, 'test.tiobundle.zip'), benchmark=True)
+        [(status, _, body)] = self.run_requests(('POST', '/bundle', spec))
+        self.assertEqual(status, 400)
+        self.assertIn('benchmark', json.loads(body)['description'])
+
+    def test_bundle_with_existing_output(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+        with open(outfile, 'wb'):
+            pass
+
+        [(status, _, _)] = self.run_requests(('POST', '/bundle', self.savedmodel_spec(outfile)))
+        self.assertEqual(status, 409)
+
+    def test_bundle_refused_when_admission_queue_is_full(self):
+        self.service.admission_controller = admission.AdmissionController(
+            cpu_budget=1,
+            max_queued=0
+        )
+        running = self.service.admission_controller.acquire(admission.Cost(0, 1))
+        outdir = self.create_temp_dir()
+        spec = self.savedmodel_spec(os.path.join(outdir, 'test.tiobundle.zip'))
+        [(status, headers, _)] = self.run_requests(('POST', '/bundle', spec))
+        running.release()
+        self.assertEqual(status, 429)
+        self.assertEqual(headers[b'retry-after'], str(admission.DEFAULT_RETRY_AFTER).encode())
+
+    def test_streamed_savedmodel_bundle_build(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        [(status, headers, body)] = self.run_requests(
+            ('POST', '/bundle', self.savedmodel_spec(outfile), b'', self.EVENT_STREAM_HEADERS)
+        )
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'text/event-stream')
+        events = test_sse.parse_frames(
+            frame.encode('utf-8') + b'\n\n' for frame in body.split('\n\n') if frame
+        )
+        names = [event for event, _ in events]
+        self.assertEqual(names[0], 'stage_started')
+        self.assertIn('bundle_started', names)
+        self.assertIn('bundle_progress', names)
+        self.assertEqual(names[-1], 'result')
+        result = events[-1][1]
+        self.assertEqual(result['bundle'], outfile)
+        progress = [data for event, data in events if event == 'bundle_progress'][-1]
+        self.assertEqual(progress['bytes_done'], progress['bytes_total'])
+
+    def test_streamed_bundle_build_with_existing_output(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+        with open(outfile, 'wb'):
+            pass
+
+        conflicts = metrics.REQUESTS.value('bundle', 409)
+        [(status, _, body)] = self.run_requests(
+            ('POST', '/bundle', self.savedmodel_spec(outfile), b'', self.EVENT_STREAM_HEADERS)
+        )
+        # The stream has started by the time the build fails, so the error is its last event
+        self.assertEqual(status, 200)
+        self.assertIn('event: error\ndata: {"status": 409', body)
+        # The request is counted with the status code of the error once the stream has ended
+        self.assertEqual(metrics.REQUESTS.value('bundle', 409), conflicts + 1)
+        self.assertEqual(metrics.REQUESTS_IN_PROGRESS.value('bundle'), 0)
+
+    def test_lifespan(self):
+        app = asgi.BundleApp(self.service)
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        run_coroutine(app({'type': 'lifespan'}, receive, send))
+        self.assertListEqual(
+            [message['type'] for message in sent],
+            ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+        )
+
+if __name__ == '__main__':
+    unittest.main()
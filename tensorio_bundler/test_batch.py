@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from . import batch, bundler
+
+class TestBatch(unittest.TestCase):
+    FIXTURES_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'fixtures'
+    )
+    SAVED_MODEL_TIOBUNDLE = os.path.join(FIXTURES_DIR, 'savedmodel.tiobundle')
+
+    def setUp(self):
+        self.output_directories = []
+
+    def tearDown(self):
+        for output_directory in self.output_directories:
+            shutil.rmtree(output_directory)
+
+    def create_temp_dir(self):
+        temp_dir = tempfile.mkdtemp()
+        self.output_directories.append(temp_dir)
+        return temp_dir
+
+    def savedmodel_spec(self, outdir, bundle_name):
+        return {
+            'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+            'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+            'bundle_name': bundle_name,
+            'bundle_output_path': os.path.join(outdir, '{}.zip'.format(bundle_name))
+        }
+
+    def test_parse_manifest(self):
+        specs = [{'bundle_name': 'a.tiobundle'}, {'bundle_name': 'b.tiobundle'}]
+        self.assertEqual(batch.parse_manifest(json.dumps(specs)), specs)
+        self.assertEqual(batch.parse_manifest(json.dumps({'bundles': specs})), specs)
+        self.assertEqual(
+            batch.parse_manifest('\n'.join(json.dumps(spec) for spec in specs) + '\n\n'),
+            specs
+        )
+
+        with self.assertRaises(batch.BatchManifestError):
+            batch.parse_manifest('{"bundle_name": "a.tiobundle"}\nnot json\n')
+        with self.assertRaises(batch.BatchManifestError):
+            batch.parse_manifest(json.dumps({'bundles': 'a.tiobundle'}))
+        with self.assertRaises(batch.BatchManifestError):
+            batch.parse_manifest(json.dumps(['a.tiobundle']))
+
+    def test_load_manifest(self):
+        specs = [{'bundle_name': 'a.tiobundle'}]
+        manifest_path = os.path.join(self.create_temp_dir(), 'manifest.jsonl')
+        with open(manifest_path, 'w') as manifest_file:
+            manifest_file.write(json.dumps(specs[0]))
+        self.assertEqual(batch.load_manifest(manifest_path), specs)
+
+    def test_run_batch(self):
+        outdir = self.create_temp_dir()
+        valid_specs = [self.savedmodel_spec(outdir, 'b{}.tiobundle'.format(i)) for i in range(3)]
+        invalid_spec = dict(valid_specs[0], bundle_name='invalid.tiobundle')
+        del invalid_spec['model_json_path']
+        conflicting_spec = dict(valid_specs[1], bundle_name='conflicting.tiobundle')
+        with open(conflicting_spec['bundle_output_path'], 'wb'):
+            pass
+        specs = [valid_specs[0], invalid_spec, conflicting_spec, valid_specs[2]]
+
+        events = []
+        results = batch.run_batch(specs, max_workers=2, progress=events.append)
+
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertEqual(
+            [result['status'] for result in results],
+            [batch.SUCCEEDED, batch.FAILED, batch.FAILED, batch.SUCCEEDED]
+        )
+        self.assertEqual(results[1]['error']['status'], 400)
+        self.assertEqual(results[2]['error']['status'], 409)
+        self.assertEqual(batch.summarize(results), {batch.SUCCEEDED: 2, batch.FAILED: 2})
+        self.assertEqual(sorted(event['index'] for event in events), [0, 1, 2, 3])
+
+        for index in [0, 3]:
+            self.assertEqual(results[index]['result']['bundle'], specs[index]['bundle_output_path'])
+            self.assertIn('bundle', results[index]['timings'])
+            self.assertIn('total', results[index]['timings'])
+            with zipfile.ZipFile(specs[index]['bundle_output_path']) as tiobundle_zip:
+                self.assertIn(
+                    '{}/model.json'.format(specs[index]['bundle_name']),
+                    tiobundle_zip.namelist()
+                )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import benchmark, bundler, filesystem
+
+class FakeExecutor:
+    """
+    Stands in for a conversion.ConversionExecutor, returning a fixed benchmark report
+    """
+    def __init__(self, p50_ms, budget):
+        self.p50_ms = p50_ms
+        self.budget = budget
+
+    def benchmark(self, tflite_path, model_json_path, options=None):
+        report = {'p50_ms': self.p50_ms, 'p95_ms': self.p50_ms, 'peak_memory_bytes': 1024}
+        report['violations'] = benchmark.check_budget(report, self.budget)
+        report['passed'] = not report['violations']
+        return report
+
+class TestBenchmark(unittest.TestCase):
+    ROOT = 'mem://test-benchmark'
+    FIXTURES_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'fixtures'
+    )
+
+    def test_parse_options(self):
+        options = benchmark.parse_options(True)
+        self.assertEqual(options.runs, benchmark.DEFAULT_RUNS)
+        self.assertTupleEqual(options.thread_counts, benchmark.DEFAULT_THREAD_COUNTS)
+
+        options = benchmark.parse_options(
+            {'runs': 10, 'thread_counts': [2], 'budget': {'p95_ms': 20}}
+        )
+        self.assertEqual(options.runs, 10)
+        self.assertTupleEqual(options.thread_counts, (2,))
+        self.assertDictEqual(options.budget, {'p95_ms': 20})
+
+    def test_invalid_options(self):
+        invalid_specs = [
+            'yes',
+            {'runs': 0},
+            {'thread_counts': []},
+            {'thread_counts': [0]},
+            {'budget': {'p99_ms': 10}},
+            {'budget': {'p50_ms': -1}},
+            {'iterations': 10}
+        ]
+        for spec in invalid_specs:
+            with self.assertRaises(benchmark.InvalidBenchmarkOptionsError):
+                benchmark.parse_options(spec)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 0.5), 50)
+        self.assertEqual(benchmark.percentile(values, 0.95), 95)
+        self.assertEqual(benchmark.percentile([3.0], 0.95), 3.0)
+
+    def test_input_shapes(self):
+        model_spec = {'inputs': [{'name': 'image', 'type': 'image', 'shape': [224, 224, 3]}]}
+        input_details = [{'shape': [1, 224, 224, 3]}, {'shape': [1, -1]}]
+        self.assertListEqual(
+            benchmark.input_shapes(model_spec, input_details),
+            [[1, 224, 224, 3], [1, 1]]
+        )
+
+        dynamic_spec = {'inputs': [{'name': 'tokens', 'type': 'array', 'shape': [-1, 128]}]}
+        self.assertListEqual(
+            benchmark.input_shapes(dynamic_spec, [{'shape': [1, 1, 128]}]),
+            [[1, 1, 128]]
+        )
+
+    def test_check_budget(self):
+        report = {'p50_ms': 10.0, 'p95_ms': 30.0, 'peak_memory_bytes': None}
+        self.assertListEqual(benchmark.check_budget(report, {'p50_ms': 20}), [])
+        violations = benchmark.check_budget(report, {'p95_ms': 20, 'peak_memory_bytes': 1})
+        self.assertEqual(len(violations), 1)
+        self.assertIn('p95_ms', violations[0])
+
+    def test_tflite_benchmark_writes_report(self):
+        tflite_path = os.path.join(self.ROOT, 'model.tflite')
+        report_path = benchmark.report_path(os.path.join(self.ROOT, 'test.tiobundle.zip'))
+        with filesystem.open(tflite_path, 'wb') as tflite_file:
+            tflite_file.write(b'model')
+        try:
+            report = bundler.tflite_benchmark(
+                tflite_path,
+                os.path.join(self.ROOT, 'model.json'),
+                report_path,
+                conversion_executor=FakeExecutor(10.0, {'p50_ms': 20})
+            )
+            self.assertTrue(report['passed'])
+
+            with self.assertRaises(benchmark.BudgetExceededError) as context:
+                bundler.tflite_benchmark(
+                    tflite_path,
+                    os.path.join(self.ROOT, 'model.json'),
+                    report_path,
+                    conversion_executor=FakeExecutor(30.0, {'p50_ms': 20})
+                )
+            # The report is written even if the model exceeds its budget
+            with filesystem.open(report_path, 'rb') as report_file:
+                written = json.loads(report_file.read().decode('utf-8'))
+            self.assertDictEqual(written, context.exception.report)
+            self.assertFalse(written['passed'])
+        finally:
+            filesystem.remove(tflite_path)
+            filesystem.remove(report_path)
+
+    @unittest.skipUnless(importlib.util.find_spec('tensorflow'), 'requires TensorFlow')
+    def test_benchmark_model(self):
+        output_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_directory)
+        tflite_path = os.path.join(output_directory, 'model.tflite')
+        bundler.convert_saved_model(os.path.join(self.FIXTURES_DIR, 'test-model'), tflite_path)
+
+        report = benchmark.benchmark_model(
+            tflite_path,
+            os.path.join(self.FIXTURES_DIR, 'test.tiobundle', 'model.json'),
+            benchmark.BenchmarkOptions(runs=3, warmup_runs=1, thread_counts=(1, 2))
+        )
+
+        self.assertTrue(report['passed'])
+        self.assertGreater(report['p50_ms'], 0)
+        expected_threads = [1, 2] if benchmark.interpreter_supports_threads() else [None]
+        self.assertListEqual([result['threads'] for result in report['threads']], expected_threads)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from . import blobstore, bundler, filesystem
+
+class TestBlobStore(unittest.TestCase):
+    ROOT = 'mem://test-blobstore'
+
+    def setUp(self):
+        filesystem.register_filesystem(self.ROOT, filesystem.MemoryFileSystem())
+        self.store_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def write(self, relative_path, contents):
+        path = os.path.join(self.ROOT, relative_path)
+        with filesystem.open(path, 'wb') as outfile:
+            outfile.write(contents)
+        return path
+
+    def test_read_through(self):
+        path = self.write('labels.txt', b'labels')
+        store = blobstore.BlobStore(self.store_dir)
+        self.assertEqual(store.read(path), b'labels')
+        self.assertEqual(store.read(path), b'labels')
+        stats = store.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(stats['bytes_served'], len(b'labels'))
+        self.assertEqual(stats['entries'], 1)
+
+    def test_shared_by_stores_and_files_with_same_contents(self):
+        # Stores sharing a directory stand in for processes sharing it
+        first_path = self.write('first/labels.txt', b'labels')
+        second_path = self.write('second/labels.txt', b'labels')
+        blobstore.BlobStore(self.store_dir).read(first_path)
+        store = blobstore.BlobStore(self.store_dir)
+        self.assertEqual(store.read(second_path), b'labels')
+        self.assertEqual(store.stats()['hits'], 1)
+
+    def test_changed_file_is_a_miss(self):
+        path = self.write('labels.txt', b'labels')
+        store = blobstore.BlobStore(self.store_dir)
+        store.read(path)
+        self.write('labels.txt', b'new labels')
+        self.assertEqual(store.read(path), b'new labels')
+        self.assertEqual(store.stats()['misses'], 2)
+
+    def test_size_mismatch_is_a_miss(self):
+        store = blobstore.BlobStore(self.store_dir)
+        store.put('sha256:abc', b'abc')
+        self.assertEqual(store.get('sha256:abc', 3), b'abc')
+        self.assertIsNone(store.get('sha256:abc', 4))
+        self.assertIsNone(store.get('sha256:def', 3))
+
+    def test_eviction(self):
+        store = blobstore.BlobStore(self.store_dir, max_bytes=10)
+        store.put('sha256:first', b'01234')
+        os.utime(store.blob_path('sha256:first'), (0, 0))
+        store.put('sha256:second', b'56789')
+        store.put('sha256:third', b'abcde')
+        # The least recently used blob is evicted
+        self.assertIsNone(store.get('sha256:first', 5))
+        self.assertEqual(store.get('sha256:second', 5), b'56789')
+        self.assertEqual(store.get('sha256:third', 5), b'abcde')
+        self.assertLessEqual(store.stats()['bytes'], 10)
+
+        # Blobs larger than the store are not added
+        store.put('sha256:large', b'0' * 11)
+        self.assertIsNone(store.get('sha256:large', 11))
+
+    def test_bundles_share_assets(self):
+        sources = {
+            'model.tflite': b'tflite',
+            'model.json': b'{"model": {"file": "model.tflite"}}',
+            'assets/labels.txt': b'labels',
+            'assets/nested/vocab.txt': b'vocab'
+        }
+        for relative_path, contents in sources.items():
+            self.write(relative_path, contents)
+
+        store = blobstore.BlobStore(self.store_dir)
+        for name in ('first', 'second'):
+            outfile = os.path.join(self.ROOT, '{}.tiobundle.zip'.format(name))
+            bundler.tiobundle_build(
+                os.path.join(self.ROOT, 'model.tflite'),
+                os.path.join(self.ROOT, 'model.json'),
+                os.path.join(self.ROOT, 'assets'),
+                'actual.tiobundle',
+                outfile,
+                asset_store=store
+            )
+            with filesystem.open(outfile, 'rb') as bundle_file:
+                with zipfile.ZipFile(bundle_file, 'r') as tiobundle_zip:
+                    for relative_path, contents in sources.items():
+                        self.assertEqual(
+                            tiobundle_zip.read(os.path.join('actual.tiobundle', relative_path)),
+                            contents
+                        )
+
+        stats = store.stats()
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['hits'], 2)
+
+    def test_from_environment(self):
+        os.environ.pop('ASSET_STORE_DIR', None)
+        self.assertIsNone(blobstore.from_environment())
+        os.environ['ASSET_STORE_DIR'] = self.store_dir
+        os.environ['ASSET_STORE_MAX_BYTES'] = '100'
+        try:
+            store = blobstore.from_environment()
+        finally:
+            del os.environ['ASSET_STORE_DIR']
+            del os.environ['ASSET_STORE_MAX_BYTES']
+        self.assertEqual(store.store_dir, self.store_dir)
+        self.assertEqual(store.max_bytes, 100)
+
+if __name__ == '__main__':
+    unittest.main()
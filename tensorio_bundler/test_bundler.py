@@ -1,12 +1,14 @@
 import filecmp
 import glob
+import hashlib
+import json
 import os
 import shutil
 import tempfile
 import unittest
 import zipfile
 
-from . import bundler
+from . import bundler, compression, filesystem, manifest, quantization
 
 class TestBundler(unittest.TestCase):
     FIXTURES_DIR = os.path.join(
@@ -175,6 +177,389 @@ class TestBundler(unittest.TestCase):
         }
         self.assertSetEqual(set(extracted_paths), expected_paths)
 
+    def test_stream_file_to_zipfile_in_small_chunks(self):
+        outdir = self.create_temp_dir()
+        source_file = os.path.join(outdir, 'source.bin')
+        source_bytes = os.urandom(10000)
+        with open(source_file, 'wb') as ofp:
+            ofp.write(source_bytes)
+
+        outfile = os.path.join(outdir, 'test.zip')
+        with zipfile.ZipFile(outfile, 'w') as zfile:
+            bytes_copied = bundler.stream_file_to_zipfile(
+                source_file,
+                zfile,
+                'target.bin',
+                chunk_size=333
+            )
+        self.assertEqual(bytes_copied, len(source_bytes))
+
+        with zipfile.ZipFile(outfile, 'r') as zfile:
+            self.assertEqual(zfile.read('target.bin'), source_bytes)
+
+    def test_write_assets_to_zipfile_preserves_listing_order(self):
+        assets_dir = self.create_temp_dir()
+        asset_contents = {}
+        for i in range(20):
+            relative_path = os.path.join('nested' if i % 3 == 0 else '', 'asset-{}.txt'.format(i))
+            asset_path = os.path.join(assets_dir, relative_path)
+            os.makedirs(os.path.dirname(asset_path), exist_ok=True)
+            # Every fifth asset is larger than the chunk size and so will be streamed
+            contents = os.urandom(500 if i % 5 == 0 else 50)
+            with open(asset_path, 'wb') as ofp:
+                ofp.write(contents)
+            asset_contents[os.path.join('assets', relative_path)] = contents
+
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.zip')
+        with zipfile.ZipFile(outfile, 'w') as zfile:
+            bundler.write_assets_to_zipfile(
+                assets_dir,
+                zfile,
+                'assets',
+                chunk_size=100,
+                max_workers=4,
+                max_inflight_bytes=120
+            )
+
+        expected_order = [
+            zip_target for _, zip_target in bundler.list_assets(assets_dir, 'assets')
+        ]
+        with zipfile.ZipFile(outfile, 'r') as zfile:
+            self.assertListEqual(zfile.namelist(), expected_order)
+            for name in zfile.namelist():
+                self.assertEqual(zfile.read(name), asset_contents[name])
+
+    def test_tiobundle_build_on_memory_filesystem(self):
+        root = 'mem://test-tiobundle-build'
+        filesystem.register_filesystem(root, filesystem.MemoryFileSystem())
+        sources = {
+            'model.tflite': b'tflite',
+            'model.json': b'{"model": {"file": "model.tflite"}}',
+            'assets/labels.txt': b'labels',
+            'assets/nested/labels.txt': b'nested labels'
+        }
+        for relative_path, contents in sources.items():
+            with filesystem.open(os.path.join(root, relative_path), 'wb') as outfile:
+                outfile.write(contents)
+
+        outfile = os.path.join(root, 'output', 'test.tiobundle.zip')
+        tiobundle_name = 'actual.tiobundle'
+        bundler.tiobundle_build(
+            os.path.join(root, 'model.tflite'),
+            os.path.join(root, 'model.json'),
+            os.path.join(root, 'assets'),
+            tiobundle_name,
+            outfile
+        )
+
+        with filesystem.open(outfile, 'rb') as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'r') as tiobundle_zip:
+                for relative_path, contents in sources.items():
+                    self.assertEqual(
+                        tiobundle_zip.read(os.path.join(tiobundle_name, relative_path)),
+                        contents
+                    )
+
+    def test_tiobundle_build_reuses_unchanged_entries_of_previous_bundle(self):
+        root = 'mem://test-tiobundle-build-reuse'
+        filesystem.register_filesystem(root, filesystem.MemoryFileSystem())
+        sources = {
+            'model.tflite': b'tflite',
+            'model.json': b'{"model": {"file": "model.tflite"}}',
+            'assets/labels.txt': b'labels',
+            'assets/nested/labels.txt': b'nested labels',
+            'assets/vocab.txt': b'vocab'
+        }
+        for relative_path, contents in sources.items():
+            with filesystem.open(os.path.join(root, relative_path), 'wb') as outfile:
+                outfile.write(contents)
+
+        # Entries of the previous bundle are dated 1980, so that the entries copied from it can
+        # be told apart from the ones written afresh
+        previous_bundle = os.path.join(root, 'previous.tiobundle.zip')
+        previous_contents = dict(sources)
+        previous_contents['assets/labels.txt'] = b'labelz'
+        previous_contents['assets/vocab.txt'] = b'old vocab'
+        with filesystem.open(previous_bundle, 'wb') as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'w') as previous_zip:
+                for relative_path, contents in previous_contents.items():
+                    info = zipfile.ZipInfo(os.path.join('previous.tiobundle', relative_path))
+                    previous_zip.writestr(info, contents)
+
+        outfile = os.path.join(root, 'test.tiobundle.zip')
+        tiobundle_name = 'actual.tiobundle'
+        bundler.tiobundle_build(
+            os.path.join(root, 'model.tflite'),
+            os.path.join(root, 'model.json'),
+            os.path.join(root, 'assets'),
+            tiobundle_name,
+            outfile,
+            chunk_size=8,
+            previous_bundle=previous_bundle
+        )
+
+        with filesystem.open(outfile, 'rb') as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'r') as tiobundle_zip:
+                self.assertIsNone(tiobundle_zip.testzip())
+                reused = set()
+                for relative_path, contents in sources.items():
+                    name = os.path.join(tiobundle_name, relative_path)
+                    self.assertEqual(tiobundle_zip.read(name), contents)
+                    if tiobundle_zip.getinfo(name).date_time[0] == 1980:
+                        reused.add(relative_path)
+
+        self.assertSetEqual(
+            reused,
+            {'model.tflite', 'model.json', 'assets/nested/labels.txt'}
+        )
+
+    def test_tiobundle_build_with_compression_policy(self):
+        root = 'mem://test-tiobundle-build-compression'
+        filesystem.register_filesystem(root, filesystem.MemoryFileSystem())
+        sources = {
+            'model.tflite': os.urandom(1000),
+            'model.json': b'{"model": {"file": "model.tflite"}}',
+            'assets/labels.txt': b'label\n' * 1000,
+            'assets/vocab.bin': os.urandom(1000)
+        }
+        for relative_path, contents in sources.items():
+            with filesystem.open(os.path.join(root, relative_path), 'wb') as outfile:
+                outfile.write(contents)
+
+        outfile = os.path.join(root, 'test.tiobundle.zip')
+        tiobundle_name = 'actual.tiobundle'
+        bundler.tiobundle_build(
+            os.path.join(root, 'model.tflite'),
+            os.path.join(root, 'model.json'),
+            os.path.join(root, 'assets'),
+            tiobundle_name,
+            outfile,
+            chunk_size=100,
+            compression_policy=compression.parse_policy('*.tflite=stored,model.json=bzip2,auto')
+        )
+
+        expected_compress_types = {
+            'model.tflite': zipfile.ZIP_STORED,
+            'model.json': zipfile.ZIP_BZIP2,
+            'assets/labels.txt': zipfile.ZIP_DEFLATED,
+            'assets/vocab.bin': zipfile.ZIP_STORED
+        }
+        with filesystem.open(outfile, 'rb') as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'r') as tiobundle_zip:
+                self.assertIsNone(tiobundle_zip.testzip())
+                for relative_path, contents in sources.items():
+                    name = os.path.join(tiobundle_name, relative_path)
+                    self.assertEqual(tiobundle_zip.read(name), contents)
+                    self.assertEqual(
+                        tiobundle_zip.getinfo(name).compress_type,
+                        expected_compress_types[relative_path]
+                    )
+
+    def test_savedmodel_tiobundle_build_with_blocked_shards(self):
+        root = 'mem://test-tiobundle-build-blocked-shards'
+        filesystem.register_filesystem(root, filesystem.MemoryFileSystem())
+        shard = (b'weights ' * 300)[:2000] + os.urandom(500)
+        sources = {
+            'train/saved_model.pb': b'graph',
+            'train/variables/variables.data-00000-of-00003': shard,
+            'train/variables/variables.data-00001-of-00003': shard[::-1],
+            'train/variables/variables.data-00002-of-00003': shard[:1000],
+            'train/variables/variables.index': b'index',
+            'model.json': b'{"model": {"file": "train"}}'
+        }
+        for relative_path, contents in sources.items():
+            with filesystem.open(os.path.join(root, relative_path), 'wb') as outfile:
+                outfile.write(contents)
+
+        digests = []
+        builds = [('deflate:6', 0), ('deflate:6', 300), ('bzip2', 300), ('auto', 300)]
+        for policy, block_size in builds:
+            outfile = os.path.join(root, 'test-{}-{}.tiobundle.zip'.format(policy, block_size))
+            bundler.tiobundle_build(
+                os.path.join(root, 'train'),
+                os.path.join(root, 'model.json'),
+                None,
+                'actual.tiobundle',
+                outfile,
+                chunk_size=100,
+                max_inflight_bytes=1000,
+                compression_policy=compression.parse_policy(policy),
+                reproducible=True,
+                block_size=block_size
+            )
+            with filesystem.open(outfile, 'rb') as bundle_file:
+                with zipfile.ZipFile(bundle_file, 'r') as tiobundle_zip:
+                    self.assertIsNone(tiobundle_zip.testzip())
+                    for relative_path, contents in sources.items():
+                        name = os.path.join('actual.tiobundle', relative_path)
+                        self.assertEqual(tiobundle_zip.read(name), contents)
+            digests.append(manifest.read_digest(outfile))
+
+        # The digest depends on the contents and compression policy, not on how files were read
+        self.assertEqual(digests[0], digests[1])
+
+    def test_tiobundle_build_reports_progress(self):
+        root = 'mem://test-tiobundle-build-progress'
+        filesystem.register_filesystem(root, filesystem.MemoryFileSystem())
+        sources = {
+            'train/saved_model.pb': b'graph',
+            'train/variables/variables.data-00000-of-00001': os.urandom(2500),
+            'assets/labels.txt': b'labels',
+            'model.json': b'{"model": {"file": "train"}}'
+        }
+        for relative_path, contents in sources.items():
+            with filesystem.open(os.path.join(root, relative_path), 'wb') as outfile:
+                outfile.write(contents)
+
+        events = []
+        bundler.tiobundle_build(
+            os.path.join(root, 'train'),
+            os.path.join(root, 'model.json'),
+            os.path.join(root, 'assets'),
+            'actual.tiobundle',
+            os.path.join(root, 'test.tiobundle.zip'),
+            chunk_size=100,
+            block_size=1000,
+            progress=events.append
+        )
+
+        total_bytes = sum(len(contents) for contents in sources.values())
+        self.assertDictEqual(
+            events[0],
+            {'event': 'bundle_started', 'files_total': 4, 'bytes_total': total_bytes}
+        )
+        # The shard is written in three blocks, each of which is reported, and then as a whole
+        shard_target = 'actual.tiobundle/train/variables/variables.data-00000-of-00001'
+        shard_done = [event['bytes_done'] for event in events if event.get('path') == shard_target]
+        self.assertListEqual(
+            [done - previous for previous, done in zip(shard_done, shard_done[1:])],
+            [1000, 500, 0]
+        )
+        bytes_done = [event['bytes_done'] for event in events[1:]]
+        self.assertListEqual(bytes_done, sorted(bytes_done))
+        self.assertEqual(events[-1]['files_done'], 4)
+        self.assertEqual(events[-1]['bytes_done'], total_bytes)
+
+    def test_reproducible_tiobundle_build(self):
+        root = 'mem://test-tiobundle-build-reproducible'
+        filesystem.register_filesystem(root, filesystem.MemoryFileSystem())
+        sources = {
+            'model.tflite': os.urandom(1000),
+            'model.json': b'{"model": {"file": "model.tflite"}}',
+            'assets/labels.txt': b'labels',
+            'assets/nested/labels.txt': b'nested labels'
+        }
+        for relative_path, contents in sources.items():
+            with filesystem.open(os.path.join(root, relative_path), 'wb') as outfile:
+                outfile.write(contents)
+
+        def build(outfile, **options):
+            return bundler.tiobundle_build(
+                os.path.join(root, 'model.tflite'),
+                os.path.join(root, 'model.json'),
+                os.path.join(root, 'assets'),
+                'actual.tiobundle',
+                outfile,
+                chunk_size=100,
+                compression_policy=compression.parse_policy('auto'),
+                reproducible=True,
+                **options
+            )
+
+        def read(outfile):
+            with filesystem.open(outfile, 'rb') as bundle_file:
+                return bundle_file.read()
+
+        first = build(os.path.join(root, 'first.tiobundle.zip'))
+        second = build(os.path.join(root, 'second.tiobundle.zip'))
+        self.assertEqual(read(first), read(second))
+
+        digest = bundler.tiobundle_digest(
+            os.path.join(root, 'model.tflite'),
+            os.path.join(root, 'model.json'),
+            os.path.join(root, 'assets'),
+            'actual.tiobundle',
+            compression_policy=compression.parse_policy('auto')
+        )
+        self.assertEqual(manifest.read_digest(first), digest)
+        with filesystem.open(first, 'rb') as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'r') as tiobundle_zip:
+                self.assertIsNone(tiobundle_zip.testzip())
+                recorded = json.loads(tiobundle_zip.read('actual.tiobundle/manifest.json'))
+                for info in tiobundle_zip.infolist():
+                    self.assertEqual(info.date_time, (1980, 1, 1, 0, 0, 0))
+        self.assertSetEqual(set(recorded['files']), set(sources))
+        self.assertEqual(
+            recorded['files']['assets/labels.txt'],
+            hashlib.sha256(b'labels').hexdigest()
+        )
+
+        # Building an identical bundle over an existing one leaves it in place, unless the caller
+        # has already compared their digests (and found them to differ)
+        self.assertEqual(build(first), first)
+        with self.assertRaises(bundler.ZippedTIOBundleExistsError):
+            build(first, existing_bundle_checked=True)
+
+        with filesystem.open(os.path.join(root, 'assets/labels.txt'), 'wb') as outfile:
+            outfile.write(b'changed labels')
+        with self.assertRaises(bundler.ZippedTIOBundleExistsError):
+            build(first)
+
+    def test_tiobundle_build_with_conversion_report(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+        tflite_file = os.path.join(outdir, 'model.tflite')
+        with open(tflite_file, 'wb') as model_file:
+            model_file.write(os.urandom(1000))
+        report = quantization.conversion_report(
+            tflite_file,
+            quantization.parse_options(quantization.DYNAMIC_RANGE),
+            {'runs': 1, 'mean_ms': 1.0, 'median_ms': 1.0, 'min_ms': 1.0}
+        )
+
+        def build(outfile, conversion_report):
+            bundler.tiobundle_build(
+                tflite_file,
+                os.path.join(self.TEST_TIOBUNDLE, 'model.json'),
+                None,
+                'actual.tiobundle',
+                outfile,
+                reproducible=True,
+                conversion_report=conversion_report
+            )
+
+        build(outfile, report)
+        with zipfile.ZipFile(outfile, 'r') as tiobundle_zip:
+            recorded = json.loads(tiobundle_zip.read('actual.tiobundle/conversion.json'))
+            recorded_manifest = json.loads(tiobundle_zip.read('actual.tiobundle/manifest.json'))
+        self.assertEqual(recorded['conversion'], report['conversion'])
+        self.assertEqual(recorded['size_bytes'], 1000)
+        # The report does not affect the digest of reproducible bundles
+        self.assertNotIn(quantization.REPORT_FILENAME, recorded_manifest['files'])
+
+        # Nor do the latencies measured by different conversions affect their bytes
+        self.assertIsNone(recorded['latency'])
+        other_outfile = os.path.join(outdir, 'other.tiobundle.zip')
+        build(other_outfile, dict(report, latency={'runs': 1, 'mean_ms': 2.0}))
+        self.assertTrue(filecmp.cmp(outfile, other_outfile, shallow=False))
+
+    def test_failed_tiobundle_build_leaves_no_output(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+        model_json_path = os.path.join(outdir, 'model.json')
+        with open(model_json_path, 'w') as ofp:
+            ofp.write('{"model": {}}')
+        with self.assertRaises(bundler.InvalidBundleSpecification):
+            bundler.tiobundle_build(
+                os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+                model_json_path,
+                os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+                'actual.tiobundle',
+                outfile
+            )
+        self.assertListEqual(os.listdir(outdir), ['model.json'])
+
     def test_tiobundle_build_when_outfile_already_exists(self):
         outdir = self.create_temp_dir()
         outfile = os.path.join(outdir, 'test.tiobundle.zip')
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from . import cache, filesystem
+
+class CountingFileSystem(filesystem.MemoryFileSystem):
+    """
+    In-memory filesystem which counts the files opened on it
+    """
+    def __init__(self):
+        super().__init__()
+        self.opened = 0
+
+    def open(self, path, mode='rb'):
+        self.opened += 1
+        return super().open(path, mode)
+
+class TestConversionCache(unittest.TestCase):
+    FIXTURES_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'fixtures'
+    )
+    TEST_MODEL_DIR = os.path.join(FIXTURES_DIR, 'test-model')
+
+    def setUp(self):
+        self.output_directories = []
+
+    def tearDown(self):
+        for output_directory in self.output_directories:
+            shutil.rmtree(output_directory)
+
+    def create_temp_dir(self):
+        temp_dir = tempfile.mkdtemp()
+        self.output_directories.append(temp_dir)
+        return temp_dir
+
+    def create_file(self, directory, filename, contents):
+        path = os.path.join(directory, filename)
+        with open(path, 'wb') as ofp:
+            ofp.write(contents)
+        return path
+
+    def test_saved_model_digest_depends_on_contents_and_settings(self):
+        saved_model_dir = os.path.join(self.create_temp_dir(), 'saved_model')
+        shutil.copytree(self.TEST_MODEL_DIR, saved_model_dir)
+        digest = cache.saved_model_digest(saved_model_dir)
+
+        self.assertEqual(cache.saved_model_digest(saved_model_dir), digest)
+        self.assertEqual(cache.saved_model_digest(self.TEST_MODEL_DIR), digest)
+        self.assertNotEqual(
+            cache.saved_model_digest(saved_model_dir, {'optimizations': ['DEFAULT']}),
+            digest
+        )
+
+        with open(os.path.join(saved_model_dir, 'variables', 'variables.index'), 'ab') as ofp:
+            ofp.write(b'changed')
+        self.assertNotEqual(cache.saved_model_digest(saved_model_dir), digest)
+
+    def test_saved_model_digest_uses_fingerprints(self):
+        root = 'mem://test-saved-model-digest'
+        counting_filesystem = CountingFileSystem()
+        filesystem.register_filesystem(root, counting_filesystem)
+        saved_model_dir = os.path.join(root, 'saved_model')
+        for relative_path in ['saved_model.pb', 'variables/variables.index']:
+            with filesystem.open(os.path.join(saved_model_dir, relative_path), 'wb') as ofp:
+                ofp.write(relative_path.encode('utf-8'))
+        counting_filesystem.opened = 0
+
+        # Files with fingerprints are not read to compute the digest
+        digest = cache.saved_model_digest(saved_model_dir)
+        self.assertEqual(counting_filesystem.opened, 0)
+
+        with filesystem.open(os.path.join(saved_model_dir, 'saved_model.pb'), 'wb') as ofp:
+            ofp.write(b'changed')
+        self.assertNotEqual(cache.saved_model_digest(saved_model_dir), digest)
+
+    def test_fetch_and_store(self):
+        cache_dir = self.create_temp_dir()
+        outdir = self.create_temp_dir()
+        conversion_cache = cache.ConversionCache(cache_dir)
+        tflite_file = self.create_file(outdir, 'model.tflite', b'tflite')
+
+        fetched_file = os.path.join(outdir, 'fetched.tflite')
+        self.assertFalse(conversion_cache.fetch('key', fetched_file))
+        conversion_cache.store('key', tflite_file)
+        self.assertTrue(conversion_cache.fetch('key', fetched_file))
+        with open(fetched_file, 'rb') as infile:
+            self.assertEqual(infile.read(), b'tflite')
+
+        stats = conversion_cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['bytes'], len(b'tflite'))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache_dir = self.create_temp_dir()
+        outdir = self.create_temp_dir()
+        conversion_cache = cache.ConversionCache(cache_dir, max_bytes=20)
+
+        conversion_cache.store('first', self.create_file(outdir, 'first', b'x' * 10))
+        conversion_cache.store('second', self.create_file(outdir, 'second', b'x' * 10))
+        # Accessing the first entry makes the second entry the least recently used one
+        self.assertTrue(conversion_cache.fetch('first', os.path.join(outdir, 'fetched')))
+        conversion_cache.store('third', self.create_file(outdir, 'third', b'x' * 10))
+
+        self.assertTrue(os.path.exists(conversion_cache.entry_path('first')))
+        self.assertFalse(os.path.exists(conversion_cache.entry_path('second')))
+        self.assertTrue(os.path.exists(conversion_cache.entry_path('third')))
+        self.assertEqual(conversion_cache.stats()['bytes'], 20)
+
+    def test_lock_serializes_threads_using_the_same_key(self):
+        conversion_cache = cache.ConversionCache(self.create_temp_dir())
+        holding = []
+        overlaps = []
+        guard = threading.Lock()
+
+        def hold(key):
+            with conversion_cache.lock(key):
+                with guard:
+                    overlaps.extend(held for held in holding if held == key)
+                    holding.append(key)
+                threading.Event().wait(0.05)
+                with guard:
+                    holding.remove(key)
+
+        threads = [threading.Thread(target=hold, args=(key,)) for key in ['a', 'a', 'b', 'a']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(conversion_cache._key_locks, {})
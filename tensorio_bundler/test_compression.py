@@ -0,0 +1,66 @@
+import os
+import unittest
+import zipfile
+
+from . import compression
+
+class TestCompression(unittest.TestCase):
+    def test_parse_policy(self):
+        policy = compression.parse_policy('*.tflite=stored, assets/*=deflate:9,lzma')
+        self.assertEqual(
+            policy.select('test.tiobundle/model.tflite'),
+            (zipfile.ZIP_STORED, None)
+        )
+        self.assertEqual(
+            policy.select('test.tiobundle/assets/labels.txt'),
+            (zipfile.ZIP_DEFLATED, 9)
+        )
+        self.assertEqual(
+            policy.select('test.tiobundle/model.json'),
+            (zipfile.ZIP_LZMA, None)
+        )
+
+    def test_spec_round_trips(self):
+        spec = '*.tflite=stored,assets/*=deflate:9,lzma'
+        self.assertEqual(compression.parse_policy(spec).spec(), spec)
+        self.assertEqual(compression.parse_policy(None).spec(), 'stored')
+
+    def test_default_policy_stores_entries(self):
+        policy = compression.parse_policy(None)
+        self.assertEqual(policy.select('test.tiobundle/model.json'), (zipfile.ZIP_STORED, None))
+
+    def test_auto_policy_samples_contents(self):
+        policy = compression.parse_policy('auto')
+        self.assertTrue(policy.needs_sample('test.tiobundle/model.json'))
+        self.assertEqual(
+            policy.select('test.tiobundle/model.json', b'{"model": {}} ' * 1000)[0],
+            zipfile.ZIP_DEFLATED
+        )
+        self.assertEqual(
+            policy.select('test.tiobundle/model.tflite', os.urandom(10000))[0],
+            zipfile.ZIP_STORED
+        )
+        self.assertEqual(policy.select('test.tiobundle/empty.txt', b'')[0], zipfile.ZIP_STORED)
+
+    def test_invalid_policies(self):
+        invalid_specs = [
+            'zstd',
+            '*.txt=deflate:high',
+            'deflate,*.txt=stored',
+            'deflate:42',
+            'bzip2:0',
+            '*.txt=stored:9',
+            'lzma:1',
+            5,
+            {}
+        ]
+        for spec in invalid_specs:
+            with self.assertRaises(compression.InvalidCompressionPolicyError):
+                compression.parse_policy(spec)
+
+    def test_level_ranges(self):
+        for spec in ['deflate:-1', 'deflate:0', 'deflate:9', 'bzip2:1', 'bzip2:9', 'auto:6']:
+            compression.parse_policy(spec)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import filecmp
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from . import bundler, conversion
+
+class TestConversionExecutor(unittest.TestCase):
+    FIXTURES_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'fixtures'
+    )
+    TEST_MODEL_DIR = os.path.join(FIXTURES_DIR, 'test-model')
+    TEST_TFLITE_FILE = os.path.join(FIXTURES_DIR, 'test.tflite')
+
+    def setUp(self):
+        self.executor = conversion.ConversionExecutor(max_workers=1)
+        self.output_directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.executor.shutdown()
+        shutil.rmtree(self.output_directory)
+
+    def test_tflite_build_from_saved_model_with_executor(self):
+        tflite_file = os.path.join(self.output_directory, 'model.tflite')
+        bundler.tflite_build_from_saved_model(
+            self.TEST_MODEL_DIR,
+            tflite_file,
+            conversion_executor=self.executor
+        )
+        self.assertTrue(filecmp.cmp(tflite_file, self.TEST_TFLITE_FILE))
+
+    def test_failed_conversion_does_not_break_executor(self):
+        invalid_saved_model_dir = os.path.join(self.output_directory, 'invalid')
+        os.mkdir(invalid_saved_model_dir)
+        with self.assertRaises(bundler.TFLiteConversionError):
+            self.executor.convert(
+                invalid_saved_model_dir,
+                os.path.join(self.output_directory, 'invalid.tflite')
+            )
+
+        tflite_file = os.path.join(self.output_directory, 'model.tflite')
+        self.executor.convert(self.TEST_MODEL_DIR, tflite_file)
+        self.assertTrue(filecmp.cmp(tflite_file, self.TEST_TFLITE_FILE))
+
+    def test_workers_start_in_background(self):
+        self.assertListEqual(self.executor._workers, [])
+        self.executor.start_in_background()
+        deadline = time.time() + 5
+        while len(self.executor._workers) < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.executor._workers), 1)
+        # Starting the workers again does nothing
+        self.executor.start()
+        self.assertEqual(len(self.executor._workers), 1)
+
+    def test_worker_is_replaced_when_it_exceeds_timeout(self):
+        self.executor.start()
+        worker = self.executor._workers[0]
+        with self.assertRaises(bundler.TFLiteConversionTimeoutError):
+            self.executor.convert(
+                self.TEST_MODEL_DIR,
+                os.path.join(self.output_directory, 'model.tflite'),
+                timeout=0
+            )
+        self.assertFalse(worker.process.is_alive())
+        self.assertEqual(len(self.executor._workers), 1)
+        self.assertIsNot(self.executor._workers[0], worker)
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from . import dedup
+
+class TestRequestCoalescer(unittest.TestCase):
+    def test_fingerprint_ignores_async_flag(self):
+        spec = {'bundle_name': 'test.tiobundle', 'build': 'savedmodel'}
+        self.assertEqual(
+            dedup.fingerprint(spec),
+            dedup.fingerprint(dict(spec, **{'async': True}))
+        )
+        self.assertNotEqual(
+            dedup.fingerprint(spec),
+            dedup.fingerprint(dict(spec, bundle_name='other.tiobundle'))
+        )
+
+    def test_concurrent_requests_share_a_build(self):
+        coalescer = dedup.RequestCoalescer()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def build(value):
+            calls.append(value)
+            started.set()
+            release.wait(5)
+            return value
+
+        results = []
+        def request():
+            results.append(coalescer.run({'bundle_name': 'test'}, build, 'result'))
+
+        threads = [threading.Thread(target=request)]
+        threads[0].start()
+        started.wait(5)
+        threads.extend(threading.Thread(target=request) for _ in range(4))
+        for thread in threads[1:]:
+            thread.start()
+        while coalescer.stats()['coalesced'] < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertListEqual(calls, ['result'])
+        self.assertListEqual(results, ['result'] * 5)
+
+    def test_completed_results_are_cached(self):
+        coalescer = dedup.RequestCoalescer(ttl=60)
+        calls = []
+
+        def build():
+            calls.append(None)
+            return len(calls)
+
+        self.assertEqual(coalescer.run({'bundle_name': 'test'}, build), 1)
+        self.assertEqual(coalescer.run({'bundle_name': 'test'}, build), 1)
+        self.assertEqual(coalescer.run({'bundle_name': 'other'}, build), 2)
+        self.assertEqual(coalescer.stats()['cached'], 1)
+
+    def test_expired_and_evicted_results(self):
+        expiring = dedup.RequestCoalescer(ttl=0)
+        bounded = dedup.RequestCoalescer(ttl=60, max_entries=1)
+        calls = []
+
+        def build():
+            calls.append(None)
+            return len(calls)
+
+        self.assertEqual(expiring.run({'bundle_name': 'test'}, build), 1)
+        self.assertEqual(expiring.run({'bundle_name': 'test'}, build), 2)
+
+        self.assertEqual(bounded.run({'bundle_name': 'first'}, build), 3)
+        self.assertEqual(bounded.run({'bundle_name': 'second'}, build), 4)
+        self.assertEqual(bounded.run({'bundle_name': 'first'}, build), 5)
+
+    def test_failures_are_not_cached(self):
+        coalescer = dedup.RequestCoalescer()
+        calls = []
+
+        def build():
+            calls.append(None)
+            if len(calls) == 1:
+                raise KeyError('first attempt')
+            return 'result'
+
+        with self.assertRaises(KeyError):
+            coalescer.run({'bundle_name': 'test'}, build)
+        self.assertEqual(coalescer.run({'bundle_name': 'test'}, build), 'result')
+
+    def test_idempotency_key(self):
+        coalescer = dedup.RequestCoalescer()
+        coalescer.run({'bundle_name': 'test'}, lambda: 'result', idempotency_key='key')
+
+        retry = coalescer.run(
+            {'async': True, 'bundle_name': 'test'},
+            lambda: 'other',
+            idempotency_key='key'
+        )
+        self.assertEqual(retry, 'result')
+        with self.assertRaises(dedup.IdempotencyKeyMismatchError):
+            coalescer.run({'bundle_name': 'other'}, lambda: 'other', idempotency_key='key')
+
+    def test_run_async(self):
+        coalescer = dedup.RequestCoalescer()
+        calls = []
+
+        async def build(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return value
+
+        async def run():
+            return await asyncio.gather(
+                *[coalescer.run_async({'bundle_name': 'test'}, build, 'result') for _ in range(10)]
+            )
+
+        # asyncio.run only exists from Python 3.7 on
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertListEqual(results, ['result'] * 10)
+        self.assertListEqual(calls, ['result'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import filesystem
+
+class FileSystemTestMixin:
+    """
+    Tests which every FileSystem implementation should pass. Subclasses set self.root to a
+    directory on the filesystem under test.
+    """
+    def write(self, path, contents):
+        filesystem.makedirs(os.path.dirname(path))
+        with filesystem.open(path, 'wb') as outfile:
+            outfile.write(contents)
+
+    def read(self, path):
+        with filesystem.open(path, 'rb') as infile:
+            return infile.read()
+
+    def test_write_and_read(self):
+        path = os.path.join(self.root, 'file.txt')
+        self.assertFalse(filesystem.exists(path))
+        self.write(path, b'contents')
+        self.assertTrue(filesystem.exists(path))
+        self.assertFalse(filesystem.isdir(path))
+        self.assertEqual(filesystem.size(path), len(b'contents'))
+        self.assertEqual(self.read(path), b'contents')
+
+    def test_listdir_and_walk(self):
+        self.write(os.path.join(self.root, 'a.txt'), b'a')
+        self.write(os.path.join(self.root, 'sub', 'b.txt'), b'b')
+        self.assertTrue(filesystem.isdir(os.path.join(self.root, 'sub')))
+        self.assertSetEqual(set(filesystem.listdir(self.root)), {'a.txt', 'sub'})
+        self.assertSetEqual(
+            set(filesystem.walk(self.root)),
+            {os.path.join(self.root, 'a.txt'), os.path.join(self.root, 'sub', 'b.txt')}
+        )
+
+    def test_scan(self):
+        self.write(os.path.join(self.root, 'a.txt'), b'a')
+        self.write(os.path.join(self.root, 'sub', 'deeper', 'b.txt'), b'bb')
+        files = filesystem.scan(self.root)
+        self.assertSetEqual(set(files), {'a.txt', os.path.join('sub', 'deeper', 'b.txt')})
+        self.assertEqual(files['a.txt'].size, 1)
+        self.assertEqual(files[os.path.join('sub', 'deeper', 'b.txt')].size, 2)
+        with self.assertRaises(FileNotFoundError):
+            filesystem.scan(os.path.join(self.root, 'a.txt'))
+        with self.assertRaises(FileNotFoundError):
+            filesystem.scan(os.path.join(self.root, 'nonexistent'))
+
+    def test_rename_and_remove(self):
+        source = os.path.join(self.root, 'source.txt')
+        target = os.path.join(self.root, 'target.txt')
+        self.write(source, b'source')
+        self.write(target, b'target')
+        filesystem.rename(source, target)
+        self.assertFalse(filesystem.exists(source))
+        self.assertEqual(self.read(target), b'source')
+        filesystem.remove(target)
+        self.assertFalse(filesystem.exists(target))
+
+    def test_copy(self):
+        source = os.path.join(self.root, 'source.bin')
+        target = os.path.join(self.root, 'target.bin')
+        contents = os.urandom(1000)
+        self.write(source, contents)
+        self.assertEqual(filesystem.copy(source, target, chunk_size=64), len(contents))
+        self.assertEqual(self.read(target), contents)
+
+    def test_atomic_writer(self):
+        path = os.path.join(self.root, 'atomic.txt')
+        filesystem.makedirs(self.root)
+        with filesystem.atomic_writer(path) as writer:
+            writer.write(b'atomic')
+            self.assertEqual(writer.tell(), len(b'atomic'))
+            self.assertFalse(filesystem.exists(path))
+        self.assertEqual(self.read(path), b'atomic')
+
+    def test_atomic_writer_discards_on_error(self):
+        path = os.path.join(self.root, 'discarded.txt')
+        filesystem.makedirs(self.root)
+        with self.assertRaises(RuntimeError):
+            with filesystem.atomic_writer(path) as writer:
+                writer.write(b'discarded')
+                raise RuntimeError('failed')
+        self.assertFalse(filesystem.exists(path))
+        self.assertListEqual(filesystem.listdir(self.root), [])
+
+class TestLocalFileSystem(FileSystemTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_get_filesystem(self):
+        self.assertIsInstance(filesystem.get_filesystem(self.root), filesystem.LocalFileSystem)
+
+class TestMemoryFileSystem(FileSystemTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.memory_filesystem = filesystem.MemoryFileSystem()
+        filesystem.register_filesystem('mem://test-memory-filesystem/', self.memory_filesystem)
+        self.root = 'mem://test-memory-filesystem/root'
+
+    def test_get_filesystem(self):
+        self.assertIs(filesystem.get_filesystem(self.root), self.memory_filesystem)
+        self.assertIsInstance(
+            filesystem.get_filesystem('mem://other'),
+            filesystem.MemoryFileSystem
+        )
+
+    def test_open_nonexistent_file(self):
+        with self.assertRaises(FileNotFoundError):
+            filesystem.open(os.path.join(self.root, 'nonexistent'), 'rb')
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ''
+
+class FakeTransport:
+    def __init__(self):
+        self.requests = []
+
+    def put(self, url, data, headers):
+        self.requests.append(('PUT', headers['Content-Range'], data))
+        final = not headers['Content-Range'].endswith('/*')
+        return FakeResponse(200 if final else 308)
+
+    def delete(self, url):
+        self.requests.append(('DELETE', None, None))
+        return FakeResponse(499)
+
+class FakeBlob:
+    def create_resumable_upload_session(self):
+        return 'https://upload.example.com/session'
+
+class FakeBucket:
+    def __init__(self, name):
+        self.name = name
+
+class FakeListedBlob:
+    def __init__(self, bucket, name, size, md5_hash=None, generation=1):
+        self.bucket = bucket
+        self.name = name
+        self.size = size
+        self.md5_hash = md5_hash
+        self.generation = generation
+
+class FakeStorageClient:
+    """
+    Stands in for a google.cloud.storage.Client holding a single bucket, counting listings
+    """
+    def __init__(self, bucket_name, objects):
+        self.fake_bucket = FakeBucket(bucket_name)
+        self.objects = objects
+        self.listings = 0
+
+    def bucket(self, name):
+        return self.fake_bucket
+
+    def list_blobs(self, bucket, prefix='', **kwargs):
+        self.listings += 1
+        return [
+            FakeListedBlob(bucket, name, size, md5_hash)
+            for name, (size, md5_hash) in sorted(self.objects.items()) if name.startswith(prefix)
+        ]
+
+class TestGCSFileSystem(unittest.TestCase):
+    def test_scan(self):
+        client = FakeStorageClient('bucket', {
+            'assets/': (0, None),
+            'assets/labels.txt': (6, 'bWQ1'),
+            'assets/nested/deeper/vocab.txt': (5, None),
+            'other/file.txt': (4, 'b3RoZXI=')
+        })
+        gcs = filesystem.GCSFileSystem(client)
+        files = gcs.scan('gs://bucket/assets')
+        self.assertEqual(client.listings, 1)
+        self.assertDictEqual(files, {
+            'labels.txt': filesystem.FileStat(6, 'md5:bWQ1'),
+            'nested/deeper/vocab.txt': filesystem.FileStat(
+                5,
+                'gcs:bucket/assets/nested/deeper/vocab.txt#1'
+            )
+        })
+        with self.assertRaises(FileNotFoundError):
+            gcs.scan('gs://bucket/nonexistent')
+
+class TestGCSUploadWriter(unittest.TestCase):
+    def test_upload_in_chunks(self):
+        transport = FakeTransport()
+        writer = filesystem._GCSUploadWriter('gs://bucket/object', FakeBlob(), transport, 4)
+        writer.write(b'abcdef')
+        writer.write(b'ghij')
+        self.assertEqual(writer.tell(), 10)
+        writer.close()
+        self.assertListEqual(transport.requests, [
+            ('PUT', 'bytes 0-3/*', b'abcd'),
+            ('PUT', 'bytes 4-7/*', b'efgh'),
+            ('PUT', 'bytes 8-9/10', b'ij')
+        ])
+
+    def test_upload_of_whole_chunks(self):
+        transport = FakeTransport()
+        writer = filesystem._GCSUploadWriter('gs://bucket/object', FakeBlob(), transport, 4)
+        writer.write(b'abcd')
+        writer.close()
+        self.assertListEqual(transport.requests, [
+            ('PUT', 'bytes 0-3/*', b'abcd'),
+            ('PUT', 'bytes */4', b'')
+        ])
+
+    def test_discard(self):
+        transport = FakeTransport()
+        writer = filesystem._GCSUploadWriter('gs://bucket/object', FakeBlob(), transport, 4)
+        writer.write(b'abcdef')
+        writer.discard()
+        self.assertEqual(transport.requests[-1][0], 'DELETE')
@@ -0,0 +1,122 @@
+import os
+import unittest
+import zipfile
+
+from . import bundler, filesystem, filetree
+
+class CountingFileSystem(filesystem.MemoryFileSystem):
+    """
+    MemoryFileSystem which counts the calls made to it, by method
+    """
+    def __init__(self):
+        super().__init__()
+        self.calls = {}
+
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def exists(self, path):
+        self._count('exists')
+        return super().exists(path)
+
+    def isdir(self, path):
+        self._count('isdir')
+        return super().isdir(path)
+
+    def listdir(self, path):
+        self._count('listdir')
+        return super().listdir(path)
+
+    def size(self, path):
+        self._count('size')
+        return super().size(path)
+
+    def stat(self, path):
+        self._count('stat')
+        return super().stat(path)
+
+    def scan(self, path):
+        self._count('scan')
+        return super().scan(path)
+
+class TestFileTree(unittest.TestCase):
+    ROOT = 'mem://test-filetree'
+
+    def setUp(self):
+        self.filesystem = CountingFileSystem()
+        filesystem.register_filesystem(self.ROOT, self.filesystem)
+
+    def write(self, relative_path, contents):
+        with filesystem.open(os.path.join(self.ROOT, relative_path), 'wb') as outfile:
+            outfile.write(contents)
+
+    def test_index(self):
+        self.write('assets/b.txt', b'b')
+        self.write('assets/a/deeper/c.txt', b'cc')
+        tree = filetree.scan(os.path.join(self.ROOT, 'assets'))
+        self.assertTrue(tree.isdir(''))
+        self.assertTrue(tree.isdir('a'))
+        self.assertTrue(tree.isdir('a/deeper'))
+        self.assertFalse(tree.isdir('b.txt'))
+        self.assertTrue(tree.exists('b.txt'))
+        self.assertFalse(tree.exists('c.txt'))
+        self.assertEqual(tree.stat('a/deeper/c.txt').size, 2)
+        with self.assertRaises(FileNotFoundError):
+            tree.stat('a')
+        self.assertEqual(tree.path('b.txt'), os.path.join(self.ROOT, 'assets', 'b.txt'))
+
+    def test_list_files_order(self):
+        # Files in a directory come before the contents of its subdirectories
+        for relative_path in ['z.txt', 'b/y.txt', 'b/c/x.txt', 'a/w.txt', 'b/v.txt']:
+            self.write(os.path.join('assets', relative_path), b'contents')
+        tree = filetree.scan(os.path.join(self.ROOT, 'assets'))
+        self.assertListEqual(
+            [zip_target for _, zip_target, _ in tree.list_files('bundle/assets')],
+            [
+                'bundle/assets/z.txt',
+                'bundle/assets/a/w.txt',
+                'bundle/assets/b/v.txt',
+                'bundle/assets/b/y.txt',
+                'bundle/assets/b/c/x.txt'
+            ]
+        )
+
+    def test_scan_if_directory(self):
+        self.write('model.tflite', b'tflite')
+        self.assertIsNone(filetree.scan_if_directory(os.path.join(self.ROOT, 'model.tflite')))
+        self.assertIsNone(filetree.scan_if_directory(os.path.join(self.ROOT, 'nonexistent')))
+
+    def test_tiobundle_build_lists_assets_once(self):
+        sources = {
+            'model.tflite': b'tflite',
+            'model.json': b'{"model": {"file": "model.tflite"}}'
+        }
+        for depth in range(5):
+            for i in range(3):
+                directory = '/'.join('level-{}'.format(level) for level in range(depth + 1))
+                sources['assets/{}/asset-{}.txt'.format(directory, i)] = b'asset'
+        for relative_path, contents in sources.items():
+            self.write(relative_path, contents)
+
+        outfile = os.path.join(self.ROOT, 'test.tiobundle.zip')
+        bundler.tiobundle_build(
+            os.path.join(self.ROOT, 'model.tflite'),
+            os.path.join(self.ROOT, 'model.json'),
+            os.path.join(self.ROOT, 'assets'),
+            'actual.tiobundle',
+            outfile
+        )
+        self.assertEqual(self.filesystem.calls.get('listdir', 0), 0)
+        self.assertEqual(self.filesystem.calls.get('stat', 0), 0)
+        self.assertEqual(self.filesystem.calls['scan'], 2)
+
+        with filesystem.open(outfile, 'rb') as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'r') as tiobundle_zip:
+                for relative_path, contents in sources.items():
+                    self.assertEqual(
+                        tiobundle_zip.read(os.path.join('actual.tiobundle', relative_path)),
+                        contents
+                    )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+from . import jobs
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.state in {jobs.QUEUED, jobs.RUNNING} and time.time() < deadline:
+        time.sleep(0.01)
+
+class TestJobManager(unittest.TestCase):
+    def test_successful_job(self):
+        def build(value, progress=None):
+            progress({'event': 'stage_started', 'stage': 'bundle'})
+            progress({
+                'event': 'bundle_progress',
+                'path': 'bundle/model.json',
+                'files_done': 1,
+                'files_total': 2,
+                'bytes_done': 10,
+                'bytes_total': 100
+            })
+            progress({'event': 'stage_finished', 'stage': 'bundle'})
+            return value
+
+        job_manager = jobs.JobManager(max_workers=1)
+        job = job_manager.submit(build, 'result')
+        wait_for(job)
+
+        self.assertIs(job_manager.get(job.id), job)
+        job_dict = job.to_dict()
+        self.assertEqual(job_dict['state'], jobs.SUCCEEDED)
+        self.assertEqual(job_dict['result'], 'result')
+        self.assertListEqual(job_dict['completed_stages'], ['bundle'])
+        self.assertDictEqual(
+            job_dict['progress'],
+            {'files_done': 1, 'files_total': 2, 'bytes_done': 10, 'bytes_total': 100}
+        )
+        self.assertIsNone(job_dict['error'])
+
+    def test_failed_job(self):
+        def build(progress=None):
+            raise KeyError('missing')
+
+        job_manager = jobs.JobManager(max_workers=1, error_status=lambda err: 404)
+        job = job_manager.submit(build)
+        wait_for(job)
+
+        self.assertEqual(job.state, jobs.FAILED)
+        self.assertEqual(job.error['type'], 'KeyError')
+        self.assertEqual(job.error['status'], 404)
+
+    def test_submit_when_queue_is_full(self):
+        release = threading.Event()
+
+        def build(progress=None):
+            release.wait()
+
+        job_manager = jobs.JobManager(max_workers=1, max_queued=1)
+        submitted = [job_manager.submit(build), job_manager.submit(build)]
+        with self.assertRaises(jobs.JobQueueFullError):
+            job_manager.submit(build)
+
+        release.set()
+        for job in submitted:
+            wait_for(job)
+        self.assertEqual(job_manager.stats()[jobs.SUCCEEDED], 2)
+
+    def test_finished_jobs_are_forgotten(self):
+        job_manager = jobs.JobManager(max_workers=1, max_finished=1)
+        first = job_manager.submit(lambda progress=None: None)
+        wait_for(first)
+        second = job_manager.submit(lambda progress=None: None)
+        wait_for(second)
+
+        self.assertIsNone(job_manager.get(first.id))
+        self.assertIs(job_manager.get(second.id), second)
@@ -0,0 +1,54 @@
+import unittest
+
+from . import metrics
+
+class TestMetrics(unittest.TestCase):
+    def test_render_counter_and_gauge(self):
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter('test_total', 'Test counter', ['kind']))
+        gauge = registry.register(metrics.Gauge('test_in_progress', 'Test gauge'))
+        counter.inc('a')
+        counter.inc('a', amount=2)
+        counter.inc('b "quoted"')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+
+        self.assertEqual(counter.value('a'), 3)
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_total counter', lines)
+        self.assertIn('test_total{kind="a"} 3.0', lines)
+        self.assertIn('test_total{kind="b \\"quoted\\""} 1.0', lines)
+        self.assertIn('test_in_progress 1.0', lines)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test histogram', ['stage'], buckets=[1, 10])
+        for value in [0.5, 5, 50]:
+            histogram.observe(value, 'bundle')
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="bundle",le="1.0"} 1.0', lines)
+        self.assertIn('test_seconds_bucket{stage="bundle",le="10.0"} 2.0', lines)
+        self.assertIn('test_seconds_bucket{stage="bundle",le="+Inf"} 3.0', lines)
+        self.assertIn('test_seconds_sum{stage="bundle"} 55.5', lines)
+        self.assertIn('test_seconds_count{stage="bundle"} 3.0', lines)
+        self.assertEqual(histogram.summary(), {('bundle',): (3, 55.5)})
+
+    def test_labels_must_match(self):
+        counter = metrics.Counter('test_total', 'Test counter', ['kind'])
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+    def test_timed_and_counting_errors(self):
+        with metrics.timed('test_stage'):
+            pass
+        self.assertIn('test_stage', [stage for stage, _, _ in metrics.stage_summary()])
+
+        errors = metrics.ERRORS.value('KeyError')
+        with self.assertRaises(KeyError):
+            with metrics.counting_errors():
+                raise KeyError('missing')
+        self.assertEqual(metrics.ERRORS.value('KeyError'), errors + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import hashlib
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import bundler, filesystem, quantization
+
+class TestConversionOptions(unittest.TestCase):
+    ROOT = 'mem://test-quantization'
+
+    def setUp(self):
+        self.dataset_path = os.path.join(self.ROOT, 'samples.npz')
+        with filesystem.open(self.dataset_path, 'wb') as dataset_file:
+            dataset_file.write(b'samples')
+
+    def tearDown(self):
+        filesystem.remove(self.dataset_path)
+
+    def test_default_options(self):
+        options = quantization.parse_options()
+        self.assertEqual(options.profile, quantization.NO_QUANTIZATION)
+        # Conversions without a profile share cache entries with conversions made before profiles
+        self.assertIsNone(options.cache_settings())
+
+    def test_invalid_profile(self):
+        with self.assertRaises(quantization.InvalidConversionProfileError):
+            quantization.parse_options('int4')
+
+    def test_full_integer_requires_representative_dataset(self):
+        with self.assertRaises(quantization.InvalidConversionProfileError):
+            quantization.parse_options(quantization.FULL_INTEGER)
+        with self.assertRaises(quantization.InvalidConversionProfileError):
+            quantization.parse_options(quantization.FLOAT16, self.dataset_path)
+        with self.assertRaises(quantization.InvalidConversionProfileError):
+            quantization.parse_options(quantization.FULL_INTEGER, self.dataset_path, 0)
+
+    def test_cache_settings(self):
+        float16 = quantization.parse_options(quantization.FLOAT16)
+        self.assertDictEqual(float16.cache_settings(), {'profile': quantization.FLOAT16})
+
+        full_integer = quantization.parse_options(quantization.FULL_INTEGER, self.dataset_path)
+        self.assertDictEqual(
+            full_integer.cache_settings(),
+            {
+                'profile': quantization.FULL_INTEGER,
+                'representative_dataset': hashlib.sha256(b'samples').hexdigest(),
+                'max_samples': quantization.DEFAULT_MAX_SAMPLES
+            }
+        )
+
+    def test_conversion_report(self):
+        tflite_path = os.path.join(self.ROOT, 'model.tflite')
+        with filesystem.open(tflite_path, 'wb') as tflite_file:
+            tflite_file.write(b'0' * 1000)
+        try:
+            report = quantization.conversion_report(
+                tflite_path,
+                quantization.parse_options(quantization.DYNAMIC_RANGE),
+                {'runs': 1, 'mean_ms': 1.0, 'median_ms': 1.0, 'min_ms': 1.0}
+            )
+        finally:
+            filesystem.remove(tflite_path)
+
+        self.assertEqual(report['conversion']['profile'], quantization.DYNAMIC_RANGE)
+        self.assertEqual(report['size_bytes'], 1000)
+        self.assertEqual(report['latency']['runs'], 1)
+
+@unittest.skipUnless(importlib.util.find_spec('tensorflow'), 'requires TensorFlow')
+class TestConfigureConverter(unittest.TestCase):
+    TEST_MODEL_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'fixtures',
+        'test-model'
+    )
+
+    def setUp(self):
+        self.output_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_directory)
+
+    def convert(self, options):
+        tflite_path = os.path.join(self.output_directory, '{}.tflite'.format(options.profile))
+        bundler.convert_saved_model(self.TEST_MODEL_DIR, tflite_path, options)
+        return tflite_path
+
+    def input_types(self, tflite_path):
+        import tensorflow as tf
+
+        interpreter = tf.lite.Interpreter(model_path=tflite_path)
+        interpreter.allocate_tensors()
+        return [detail['dtype'] for detail in interpreter.get_input_details()]
+
+    def test_dynamic_range(self):
+        unquantized = self.convert(quantization.parse_options())
+        quantized = self.convert(quantization.parse_options(quantization.DYNAMIC_RANGE))
+        self.assertLess(os.path.getsize(quantized), os.path.getsize(unquantized))
+        self.assertGreater(quantization.measure_latency(quantized, runs=1)['min_ms'], 0)
+
+    def test_float16(self):
+        import numpy as np
+        import tensorflow as tf
+
+        options = quantization.parse_options(quantization.FLOAT16)
+        converter = tf.lite.TFLiteConverter.from_saved_model(self.TEST_MODEL_DIR)
+        if hasattr(converter.target_spec, 'supported_types'):
+            self.assertEqual(self.input_types(self.convert(options)), [np.float32])
+        else:
+            with self.assertRaises(quantization.InvalidConversionProfileError):
+                self.convert(options)
+
+    def test_full_integer(self):
+        import numpy as np
+
+        dataset_path = os.path.join(self.output_directory, 'samples.npy')
+        np.save(dataset_path, np.random.uniform(-1, 1, (2, 224, 224, 3)).astype(np.float32))
+        tflite_path = self.convert(
+            quantization.parse_options(quantization.FULL_INTEGER, dataset_path)
+        )
+        # The inputs and outputs of the model stay float
+        self.assertEqual(self.input_types(tflite_path), [np.float32])
+        self.assertGreater(quantization.measure_latency(tflite_path, runs=1)['min_ms'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import base64
+import json
+import os
+import unittest
+import zipfile
+
+from . import filesystem, manifest, reader
+
+class TestBundleReader(unittest.TestCase):
+    ROOT = 'mem://test-bundle-reader'
+    WEIGHTS_SIZE = 8 * 1024 * 1024
+
+    def setUp(self):
+        self.bundle_path = os.path.join(self.ROOT, 'test.tiobundle.zip')
+        self.model_json = {'name': 'test', 'model': {'file': 'model.tflite'}}
+        with filesystem.open(self.bundle_path, 'wb') as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'w') as bundle_zip:
+                bundle_zip.writestr('test.tiobundle/model.json', json.dumps(self.model_json))
+                bundle_zip.writestr('test.tiobundle/model.tflite', os.urandom(self.WEIGHTS_SIZE))
+                bundle_zip.writestr('test.tiobundle/assets/labels.txt', b'cat\ndog\n')
+                bundle_zip.writestr(
+                    'test.tiobundle/{}'.format(manifest.MANIFEST_FILENAME),
+                    json.dumps({'digest': 'abc'})
+                )
+
+    def tearDown(self):
+        filesystem.remove(self.bundle_path)
+
+    def test_inspect_bundle(self):
+        result = reader.inspect_bundle(self.bundle_path, ['assets/labels.txt'])
+
+        self.assertEqual(result['bundle_name'], 'test.tiobundle')
+        self.assertDictEqual(result['model_json'], self.model_json)
+        self.assertEqual(result['manifest']['digest'], 'abc')
+        self.assertListEqual(
+            [(entry['path'], entry['size']) for entry in result['entries']],
+            [
+                ('assets/labels.txt', 8),
+                ('manifest.json', len(json.dumps({'digest': 'abc'}))),
+                ('model.json', len(json.dumps(self.model_json))),
+                ('model.tflite', self.WEIGHTS_SIZE)
+            ]
+        )
+        self.assertEqual(
+            base64.b64decode(result['contents']['assets/labels.txt']),
+            b'cat\ndog\n'
+        )
+        # The model weights are never read
+        self.assertLess(result['bytes_read'], self.WEIGHTS_SIZE / 8)
+
+    def test_read_entry(self):
+        with reader.BundleReader(self.bundle_path) as bundle_reader:
+            self.assertEqual(bundle_reader.read('assets/labels.txt'), b'cat\ndog\n')
+            with self.assertRaises(reader.BundleEntryNotFoundError):
+                bundle_reader.read('assets/nonexistent.txt')
+
+    def test_inspect_large_entry(self):
+        with self.assertRaises(reader.BundleEntryTooLargeError):
+            reader.inspect_bundle(self.bundle_path, ['model.tflite'])
+
+    def test_inspect_large_model_json(self):
+        large_bundle_path = os.path.join(self.ROOT, 'large.tiobundle.zip')
+        with filesystem.open(large_bundle_path, 'wb') as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'w', zipfile.ZIP_DEFLATED) as bundle_zip:
+                bundle_zip.writestr(
+                    'large.tiobundle/model.json',
+                    b' ' * (reader.MAX_INSPECTED_ENTRY_SIZE + 1)
+                )
+        try:
+            with self.assertRaises(reader.BundleEntryTooLargeError):
+                reader.inspect_bundle(large_bundle_path)
+        finally:
+            filesystem.remove(large_bundle_path)
+
+    def test_nonexistent_bundle(self):
+        with self.assertRaises(reader.BundleNotFoundError):
+            reader.BundleReader(os.path.join(self.ROOT, 'nonexistent.zip'))
+
+    def test_invalid_bundle(self):
+        invalid_path = os.path.join(self.ROOT, 'invalid.zip')
+        with filesystem.open(invalid_path, 'wb') as invalid_file:
+            invalid_file.write(b'not a zip file')
+        try:
+            with self.assertRaises(reader.BundleReadError):
+                reader.BundleReader(invalid_path)
+        finally:
+            filesystem.remove(invalid_path)
+
+if __name__ == '__main__':
+    unittest.main()
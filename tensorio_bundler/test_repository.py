@@ -0,0 +1,158 @@
+import http.server
+import json
+import socketserver
+import threading
+import time
+import unittest
+
+from . import bundler, repository
+
+class StandInRepositoryServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Local stand-in for a TensorIO Models repository, which records the registrations it receives
+    and responds with the status codes queued in responses (200 once they run out)
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInRepositoryHandler)
+        self.requests = []
+        self.responses = []
+        self.delay = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/v1/repository'.format(self.server_address[1])
+
+class StandInRepositoryHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        with self.server.lock:
+            self.server.requests.append({
+                'path': self.path,
+                'authorization': self.headers['Authorization'],
+                'body': body,
+                'client_port': self.client_address[1]
+            })
+            status = self.server.responses.pop(0) if self.server.responses else 200
+        time.sleep(self.server.delay)
+        response = json.dumps({'checkpointId': body['checkpointId']}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestRepositoryClient(unittest.TestCase):
+    RESOURCE_PATH = '/models/model/hyperparameters/hyperparameters/checkpoints/{}'
+
+    def setUp(self):
+        self.server = StandInRepositoryServer()
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+
+    def create_client(self, **kwargs):
+        client = repository.RepositoryClient(self.server.url, 'key', backoff_factor=0, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_bundle_link(self):
+        self.assertEqual(
+            repository.bundle_link('gs://bucket/bundle.tiobundle.zip'),
+            'https://storage.googleapis.com/bucket/bundle.tiobundle.zip'
+        )
+        self.assertEqual(
+            repository.bundle_link('https://example.com/bundle.tiobundle.zip'),
+            'https://example.com/bundle.tiobundle.zip'
+        )
+        with self.assertRaises(bundler.TIOModelsRegistrationError):
+            repository.bundle_link('/tmp/bundle.tiobundle.zip')
+
+    def test_register(self):
+        client = self.create_client()
+        for checkpoint in ['first', 'second']:
+            response = client.register(
+                'gs://bucket/{}.tiobundle.zip'.format(checkpoint),
+                self.RESOURCE_PATH.format(checkpoint)
+            )
+            self.assertEqual(json.loads(response), {'checkpointId': checkpoint})
+
+        self.assertEqual(len(self.server.requests), 2)
+        first, second = self.server.requests
+        self.assertEqual(first['path'], '/v1/repository/models/model/hyperparameters/'
+                                        'hyperparameters/checkpoints')
+        self.assertEqual(first['authorization'], 'Bearer key')
+        self.assertEqual(
+            first['body'],
+            {
+                'checkpointId': 'first',
+                'link': 'https://storage.googleapis.com/bucket/first.tiobundle.zip'
+            }
+        )
+        # Both registrations are sent over the same kept-alive connection
+        self.assertEqual(first['client_port'], second['client_port'])
+
+    def test_register_retries_unavailable_repository(self):
+        self.server.responses = [503, 429]
+        client = self.create_client(retries=2)
+        client.register('gs://bucket/bundle.tiobundle.zip', self.RESOURCE_PATH.format('c'))
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_register_raises_on_error_response(self):
+        self.server.responses = [409]
+        client = self.create_client()
+        with self.assertRaises(bundler.TIOModelsRegistrationError):
+            client.register('gs://bucket/bundle.tiobundle.zip', self.RESOURCE_PATH.format('c'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_register_does_not_retry_possibly_processed_requests(self):
+        self.server.responses = [502]
+        client = self.create_client(retries=2)
+        with self.assertRaises(bundler.TIOModelsRegistrationError):
+            client.register('gs://bucket/bundle.tiobundle.zip', self.RESOURCE_PATH.format('c'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_register_times_out(self):
+        self.server.delay = 1
+        client = self.create_client(read_timeout=0.1, retries=2)
+        with self.assertRaises(bundler.TIOModelsRegistrationError):
+            client.register('gs://bucket/bundle.tiobundle.zip', self.RESOURCE_PATH.format('c'))
+        # The registration may have been made, so it is not sent again
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_register_many(self):
+        self.server.responses = [400]
+        client = self.create_client()
+        registrations = [
+            ('gs://bucket/{}.tiobundle.zip'.format(i), self.RESOURCE_PATH.format(i))
+            for i in range(10)
+        ]
+        registrations.append(('gs://bucket/invalid.tiobundle.zip', 'invalid'))
+
+        results = client.register_many(registrations, max_workers=1)
+
+        self.assertEqual(
+            [(result['bundle'], result['resource_path']) for result in results],
+            registrations
+        )
+        self.assertIsNotNone(results[0]['error'])
+        self.assertIsNone(results[0]['registration'])
+        for result in results[1:-1]:
+            self.assertIsNone(result['error'])
+            self.assertIsNotNone(result['registration'])
+        self.assertIsNotNone(results[-1]['error'])
+        self.assertEqual(len(self.server.requests), 10)
+
+if __name__ == '__main__':
+    unittest.main()
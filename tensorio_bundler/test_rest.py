@@ -2,10 +2,11 @@ import json
 import os
 import shutil
 import tempfile
+import time
 
 from falcon import testing
 
-from . import bundler, rest
+from . import admission, bundler, metrics, rest
 
 class TestRestAPI(testing.TestCase):
     FIXTURES_DIR = os.path.join(
@@ -35,6 +36,25 @@ class TestRestAPI(testing.TestCase):
         self.assertEqual(result.status_code, 200)
         self.assertEqual(result.text, 'ok')
 
+    def test_stats(self):
+        result = self.api.simulate_get('/stats')
+        self.assertEqual(result.status_code, 200)
+        self.assertIn('conversion_cache', result.json)
+
+    def test_metrics(self):
+        self.api.simulate_get('/ping')
+        result = self.api.simulate_get('/metrics')
+        self.assertEqual(result.status_code, 200)
+        self.assertIn('tensorio_bundler_stage_duration_seconds', result.text)
+        self.assertIn(
+            'tensorio_bundler_requests_total{handler="PingHandler",status="200"}',
+            result.text
+        )
+        self.assertIn(
+            'tensorio_bundler_requests_in_progress{handler="MetricsHandler"} 1.0',
+            result.text
+        )
+
     def test_tflite_bundle_build(self):
         outdir = self.create_temp_dir()
         outfile = os.path.join(outdir, 'test.tiobundle.zip')
@@ -78,6 +98,203 @@ class TestRestAPI(testing.TestCase):
         self.assertEqual(result.status_code, 200)
         self.assertEqual(result.text, body['bundle_output_path'])
 
+    def test_repeated_bundle_request(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        body = {
+            'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+            'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+            'bundle_name': 'actual.tiobundle',
+            'bundle_output_path': outfile
+        }
+        headers = {'Idempotency-Key': 'test-repeated-bundle-request-{}'.format(outdir)}
+
+        first = self.api.simulate_post('/bundle', json=body, headers=headers)
+        retry = self.api.simulate_post('/bundle', json=body, headers=headers)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.text, outfile)
+
+        other_body = dict(body, bundle_name='other.tiobundle')
+        mismatch = self.api.simulate_post('/bundle', json=other_body, headers=headers)
+        self.assertEqual(mismatch.status_code, 422)
+
+    def test_bundle_refused_when_admission_queue_is_full(self):
+        body = {
+            'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+            'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+            'bundle_name': 'actual.tiobundle',
+            'bundle_output_path': os.path.join(self.create_temp_dir(), 'test.tiobundle.zip')
+        }
+        controller = admission.AdmissionController(cpu_budget=1, max_queued=0)
+        running = controller.acquire(admission.Cost(0, 1))
+        rest.admission_controller = controller
+        try:
+            result = self.api.simulate_post('/bundle', json=body)
+        finally:
+            rest.admission_controller = None
+            running.release()
+
+        self.assertEqual(result.status_code, 429)
+        self.assertEqual(result.headers['retry-after'], str(admission.DEFAULT_RETRY_AFTER))
+
+    def test_streamed_savedmodel_bundle_build(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        body = {
+            'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+            'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+            'bundle_name': 'actual.tiobundle',
+            'bundle_output_path': outfile
+        }
+
+        result = self.api.simulate_post(
+            '/bundle',
+            json=body,
+            headers={'Accept': 'text/event-stream'}
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.headers['content-type'], 'text/event-stream')
+        self.assertIn('event: stage_started\ndata: {"stage": "bundle"}', result.text)
+        self.assertIn('event: bundle_progress', result.text)
+        self.assertEqual(result.text.rstrip().split('\n')[-2], 'event: result')
+        self.assertTrue(os.path.isfile(outfile))
+
+    def test_streamed_bundle_build_with_existing_output(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+        with open(outfile, 'wb'):
+            pass
+
+        body = {
+            'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+            'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+            'bundle_name': 'actual.tiobundle',
+            'bundle_output_path': outfile
+        }
+        conflicts = metrics.REQUESTS.value('BundleHandler', 409)
+
+        result = self.api.simulate_post(
+            '/bundle',
+            json=body,
+            headers={'Accept': 'text/event-stream'}
+        )
+
+        # The stream has started by the time the build fails, so the error is its last event, and
+        # the request is counted with the status code of the error once the stream has ended
+        self.assertEqual(result.status_code, 200)
+        self.assertIn('event: error\ndata: {"status": 409', result.text)
+        self.assertEqual(metrics.REQUESTS.value('BundleHandler', 409), conflicts + 1)
+        self.assertEqual(metrics.REQUESTS_IN_PROGRESS.value('BundleHandler'), 0)
+
+    def test_async_savedmodel_bundle_build(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        body = {
+            'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+            'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+            'bundle_name': 'actual.tiobundle',
+            'bundle_output_path': outfile,
+            'async': True
+        }
+
+        result = self.api.simulate_post(
+            '/bundle',
+            json=body
+        )
+
+        self.assertEqual(result.status_code, 202)
+        job_path = '/jobs/{}'.format(result.json['job_id'])
+        self.assertEqual(result.headers['location'], job_path)
+
+        deadline = time.time() + 30
+        job = result.json
+        while job['state'] in {'queued', 'running'} and time.time() < deadline:
+            time.sleep(0.1)
+            job = self.api.simulate_get(job_path).json
+
+        self.assertEqual(job['state'], 'succeeded')
+        self.assertEqual(job['result']['bundle'], outfile)
+
+    def test_batch_bundle_build(self):
+        outdir = self.create_temp_dir()
+
+        specs = [
+            {
+                'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+                'build': bundler.SAVED_MODEL,
+                'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+                'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+                'bundle_name': 'actual{}.tiobundle'.format(i),
+                'bundle_output_path': os.path.join(outdir, 'test{}.tiobundle.zip'.format(i))
+            }
+            for i in range(2)
+        ]
+
+        result = self.api.simulate_post(
+            '/bundles',
+            json={'bundles': specs}
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json['summary'], {'succeeded': 2, 'failed': 0})
+        self.assertEqual(
+            [bundle['result']['bundle'] for bundle in result.json['results']],
+            [spec['bundle_output_path'] for spec in specs]
+        )
+
+        del specs[1]['bundle_name']
+        result = self.api.simulate_post(
+            '/bundles',
+            json={'bundles': specs}
+        )
+        self.assertEqual(result.status_code, 400)
+        self.assertIn('bundle 1', result.json['description'])
+
+    def test_inspect_bundle(self):
+        outdir = self.create_temp_dir()
+        outfile = os.path.join(outdir, 'test.tiobundle.zip')
+
+        body = {
+            'saved_model_dir': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'model.json'),
+            'assets_path': os.path.join(self.SAVED_MODEL_TIOBUNDLE, 'assets'),
+            'bundle_name': 'actual.tiobundle',
+            'bundle_output_path': outfile
+        }
+        self.api.simulate_post('/bundle', json=body)
+
+        result = self.api.simulate_get('/bundle/inspect', params={'path': outfile})
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json['bundle_name'], 'actual.tiobundle')
+        with open(body['model_json_path']) as model_json_file:
+            self.assertDictEqual(result.json['model_json'], json.load(model_json_file))
+
+        result = self.api.simulate_get(
+            '/bundle/inspect',
+            params={'path': os.path.join(outdir, 'nonexistent.zip')}
+        )
+        self.assertEqual(result.status_code, 404)
+
+    def test_nonexistent_job(self):
+        result = self.api.simulate_get('/jobs/nonexistent')
+        self.assertEqual(result.status_code, 404)
+
     def test_bundle_with_malformed_request_body(self):
         result = self.api.simulate_post(
             '/bundle',
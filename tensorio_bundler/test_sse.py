@@ -0,0 +1,99 @@
+import asyncio
+import json
+import unittest
+
+from . import bundler, sse
+
+def parse_frames(frames):
+    """
+    Returns: List of (event, data) pairs of the server-sent events among frames, with None for
+    heartbeats
+    """
+    parsed = []
+    for frame in frames:
+        if frame == sse.HEARTBEAT:
+            parsed.append(None)
+            continue
+        event_line, data_line = frame.decode('utf-8').strip().split('\n')
+        parsed.append((event_line[len('event: '):], json.loads(data_line[len('data: '):])))
+    return parsed
+
+class TestEventStream(unittest.TestCase):
+    def test_accepts_event_stream(self):
+        self.assertTrue(sse.accepts_event_stream('text/event-stream'))
+        self.assertTrue(sse.accepts_event_stream('application/json, text/event-stream;q=0.9'))
+        self.assertFalse(sse.accepts_event_stream('*/*'))
+        self.assertFalse(sse.accepts_event_stream(None))
+
+    def test_coalesce(self):
+        events = [
+            {'event': 'bundle_progress', 'files_done': 1},
+            {'event': 'bundle_progress', 'files_done': 2},
+            {'event': 'stage_finished', 'stage': 'bundle'},
+            {'event': 'bundle_progress', 'files_done': 3}
+        ]
+        self.assertListEqual(sse.coalesce(events), events[1:])
+
+    def test_frames(self):
+        stream = sse.EventStream(heartbeat_interval=0.01)
+
+        def build(progress=None):
+            progress({'event': 'stage_started', 'stage': 'bundle'})
+            return {'bundle': 'test.tiobundle.zip'}
+
+        stream.follow(build)
+        self.assertEqual(stream.status, sse.CLIENT_CLOSED_REQUEST)
+        self.assertListEqual(
+            [frame for frame in parse_frames(stream.frames()) if frame is not None],
+            [
+                ('stage_started', {'stage': 'bundle'}),
+                ('result', {'bundle': 'test.tiobundle.zip'})
+            ]
+        )
+        self.assertEqual(stream.status, 200)
+
+    def test_heartbeats_and_errors(self):
+        stream = sse.EventStream(heartbeat_interval=0.01)
+        frames = stream.frames()
+        self.assertEqual(next(frames), sse.HEARTBEAT)
+        stream.publish(sse.final_event(error=bundler.ZippedTIOBundleExistsError('exists')))
+        self.assertListEqual(
+            parse_frames(frames),
+            [('error', {'status': 409, 'title': 'Bundle request failed', 'description': 'exists'})]
+        )
+        self.assertEqual(stream.status, 409)
+
+        # Internal errors are not described
+        self.assertDictEqual(
+            sse.final_event(error=ValueError('secret')),
+            {'event': 'error', 'status': 500, 'title': 'Internal Server Error'}
+        )
+
+    def test_async_frames(self):
+        async def build(progress=None):
+            await asyncio.sleep(0.05)
+            progress({'event': 'stage_started', 'stage': 'bundle'})
+            return {'bundle': 'test.tiobundle.zip'}
+
+        async def run():
+            stream = sse.AsyncEventStream(heartbeat_interval=0.01)
+            stream.follow(build)
+            return [frame async for frame in stream.frames()]
+
+        # asyncio.run only exists from Python 3.7 on
+        loop = asyncio.new_event_loop()
+        try:
+            parsed = parse_frames(loop.run_until_complete(run()))
+        finally:
+            loop.close()
+        self.assertIn(None, parsed)
+        self.assertListEqual(
+            [frame for frame in parsed if frame is not None],
+            [
+                ('stage_started', {'stage': 'bundle'}),
+                ('result', {'bundle': 'test.tiobundle.zip'})
+            ]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
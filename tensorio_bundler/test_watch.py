@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+from . import bundler, pipeline, watch
+
+class TestWatch(unittest.TestCase):
+    FIXTURES_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'fixtures'
+    )
+    SAVED_MODEL_TIOBUNDLE = os.path.join(FIXTURES_DIR, 'savedmodel.tiobundle')
+
+    def setUp(self):
+        self.output_directories = []
+
+    def tearDown(self):
+        for output_directory in self.output_directories:
+            shutil.rmtree(output_directory)
+
+    def create_temp_dir(self):
+        temp_dir = tempfile.mkdtemp()
+        self.output_directories.append(temp_dir)
+        return temp_dir
+
+    def copy_sources(self):
+        # Sources of a SavedModel bundle in a temporary directory, where they can be changed
+        source_dir = os.path.join(self.create_temp_dir(), 'sources')
+        shutil.copytree(self.SAVED_MODEL_TIOBUNDLE, source_dir)
+        return {
+            'saved_model_dir': os.path.join(source_dir, 'train'),
+            'build': bundler.SAVED_MODEL,
+            'model_json_path': os.path.join(source_dir, 'model.json'),
+            'assets_path': os.path.join(source_dir, 'assets'),
+            'bundle_name': 'actual.tiobundle',
+            'bundle_output_path': os.path.join(self.create_temp_dir(), 'test.tiobundle.zip')
+        }
+
+    def change_later(self, path, contents, delay=0.1):
+        def change():
+            time.sleep(delay)
+            with open(path, 'w') as outfile:
+                outfile.write(contents)
+
+        thread = threading.Thread(target=change)
+        thread.start()
+        return thread
+
+    def test_snapshot(self):
+        spec = self.copy_sources()
+        before = watch.snapshot(spec['assets_path'])
+        self.assertListEqual(list(before), ['labels.txt'])
+        self.assertListEqual(list(watch.snapshot(spec['model_json_path'])), [''])
+        self.assertDictEqual(watch.snapshot(os.path.join(spec['assets_path'], 'nonexistent')), {})
+
+        os.makedirs(os.path.join(spec['assets_path'], 'extra'))
+        with open(os.path.join(spec['assets_path'], 'extra', 'vocab.txt'), 'w') as outfile:
+            outfile.write('vocab')
+        self.assertListEqual(
+            watch.changed_files(before, watch.snapshot(spec['assets_path'])),
+            ['extra/vocab.txt']
+        )
+
+    def test_source_watcher(self):
+        spec = self.copy_sources()
+        labels_path = os.path.join(spec['assets_path'], 'labels.txt')
+        for use_inotify in [True, False]:
+            watcher = watch.SourceWatcher(
+                {'assets_path': spec['assets_path'], 'model_json_path': spec['model_json_path']},
+                poll_interval=0.05,
+                debounce=0.05,
+                use_inotify=use_inotify
+            )
+            thread = self.change_later(labels_path, 'changed labels {}'.format(use_inotify))
+            try:
+                self.assertDictEqual(watcher.wait(), {'assets_path': ['labels.txt']})
+            finally:
+                thread.join()
+                watcher.close()
+
+    def test_rebuilder_stages(self):
+        spec = dict(
+            self.copy_sources(),
+            build=bundler.TFLITE,
+            tflite_model=os.path.join(self.create_temp_dir(), 'model.tflite'),
+            benchmark=True,
+            repository_path='/models/test/hyperparameters/test/checkpoints/test'
+        )
+        rebuilder = watch.Rebuilder(spec)
+        all_stages = [
+            pipeline.CONVERSION_STAGE,
+            pipeline.BENCHMARK_STAGE,
+            pipeline.BUNDLE_STAGE,
+            pipeline.REGISTRATION_STAGE
+        ]
+        self.assertListEqual(rebuilder.stages(), all_stages)
+
+        rebuilder.builds = 1
+        self.assertListEqual(rebuilder.stages({'saved_model_dir': ['saved_model.pb']}), all_stages)
+        self.assertListEqual(
+            rebuilder.stages({'model_json_path': ['']}),
+            [pipeline.BENCHMARK_STAGE, pipeline.BUNDLE_STAGE, pipeline.REGISTRATION_STAGE]
+        )
+        self.assertListEqual(
+            rebuilder.stages({'assets_path': ['labels.txt']}),
+            [pipeline.BUNDLE_STAGE, pipeline.REGISTRATION_STAGE]
+        )
+
+    def test_watch_rebuilds_bundle(self):
+        spec = self.copy_sources()
+        labels_path = os.path.join(spec['assets_path'], 'labels.txt')
+        lines = []
+        watching = threading.Event()
+
+        def log(line):
+            lines.append(line)
+            if line.startswith('Watching'):
+                watching.set()
+
+        thread = threading.Thread(
+            target=watch.watch,
+            args=(spec,),
+            kwargs={'poll_interval': 0.05, 'debounce': 0.05, 'log': log, 'max_builds': 2}
+        )
+        thread.start()
+        self.assertTrue(watching.wait(5))
+        with open(labels_path, 'w') as outfile:
+            outfile.write('changed labels')
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+        with zipfile.ZipFile(spec['bundle_output_path']) as bundle_zip:
+            self.assertEqual(
+                bundle_zip.read('actual.tiobundle/assets/labels.txt'),
+                b'changed labels'
+            )
+        self.assertFalse(
+            os.path.exists(spec['bundle_output_path'] + watch.PREVIOUS_BUNDLE_SUFFIX)
+        )
+        self.assertIn('Changed: assets_path (1 file)', lines)
+        self.assertTrue(lines[-1].startswith('Built {} in'.format(spec['bundle_output_path'])))
+
+    def test_failed_rebuild_keeps_last_bundle(self):
+        spec = self.copy_sources()
+        rebuilder = watch.Rebuilder(spec)
+        rebuilder.build()
+        with open(spec['bundle_output_path'], 'rb') as bundle_file:
+            built = bundle_file.read()
+
+        os.remove(spec['model_json_path'])
+        with self.assertRaises(bundler.ZippedTIOBundleMisspecificationError):
+            rebuilder.build({'model_json_path': ['']})
+        with open(spec['bundle_output_path'], 'rb') as bundle_file:
+            self.assertEqual(bundle_file.read(), built)
+
+if __name__ == '__main__':
+    unittest.main()
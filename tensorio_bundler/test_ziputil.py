@@ -0,0 +1,146 @@
+import io
+import unittest
+import zipfile
+import zlib
+
+from . import ziputil
+
+class UnseekableBuffer(io.RawIOBase):
+    """
+    Write-only stream which cannot seek, so that zipfile writes entries with data descriptors
+    """
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def tell(self):
+        return self.buffer.tell()
+
+class TestZipUtil(unittest.TestCase):
+    def create_source_zip(self):
+        contents = {
+            'old.tiobundle/model.json': b'{"model": {"file": "model.tflite"}}',
+            'old.tiobundle/assets/labels.txt': b'label\n' * 1000,
+            'old.tiobundle/assets/zip64.txt': b'zip64 ' * 100
+        }
+        stream = UnseekableBuffer()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as source_zip:
+            source_zip.writestr('old.tiobundle/model.json', contents['old.tiobundle/model.json'])
+            with source_zip.open('old.tiobundle/assets/labels.txt', 'w') as entry:
+                entry.write(contents['old.tiobundle/assets/labels.txt'])
+            with source_zip.open('old.tiobundle/assets/zip64.txt', 'w', force_zip64=True) as entry:
+                entry.write(contents['old.tiobundle/assets/zip64.txt'])
+        return zipfile.ZipFile(io.BytesIO(stream.buffer.getvalue())), contents
+
+    def test_copy_raw_entry(self):
+        source_zip, contents = self.create_source_zip()
+        target = io.BytesIO()
+        with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+            target_zip.writestr('new.tiobundle/first.txt', b'first')
+            for info in source_zip.infolist():
+                arcname = info.filename.replace('old.tiobundle', 'new.tiobundle')
+                copied = ziputil.copy_raw_entry(source_zip, info, target_zip, arcname, 16)
+                self.assertEqual(copied, info.compress_size)
+            target_zip.writestr('new.tiobundle/last.txt', b'last')
+
+        with zipfile.ZipFile(target) as target_zip:
+            self.assertIsNone(target_zip.testzip())
+            for name, data in contents.items():
+                new_name = name.replace('old.tiobundle', 'new.tiobundle')
+                self.assertEqual(target_zip.read(new_name), data)
+                info = target_zip.getinfo(new_name)
+                self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+                self.assertFalse(info.flag_bits & ziputil.DATA_DESCRIPTOR_FLAG)
+            self.assertEqual(target_zip.read('new.tiobundle/first.txt'), b'first')
+            self.assertEqual(target_zip.read('new.tiobundle/last.txt'), b'last')
+
+    def test_reusable_entries(self):
+        source_zip, contents = self.create_source_zip()
+        reusable = ziputil.ReusableEntries(source_zip)
+        labels = contents['old.tiobundle/assets/labels.txt']
+
+        target = io.BytesIO()
+        with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+            self.assertIsNotNone(reusable.find('new.tiobundle/assets/labels.txt', len(labels)))
+            self.assertIsNone(reusable.find('new.tiobundle/assets/labels.txt', len(labels) + 1))
+            self.assertFalse(
+                reusable.reuse(
+                    target_zip,
+                    'new.tiobundle/assets/labels.txt',
+                    len(labels),
+                    zlib.crc32(labels),
+                    zipfile.ZIP_STORED,
+                    1024
+                )
+            )
+            self.assertFalse(
+                reusable.reuse(
+                    target_zip,
+                    'new.tiobundle/assets/labels.txt',
+                    len(labels),
+                    zlib.crc32(labels) ^ 1,
+                    zipfile.ZIP_DEFLATED,
+                    1024
+                )
+            )
+            self.assertTrue(
+                reusable.reuse(
+                    target_zip,
+                    'new.tiobundle/assets/labels.txt',
+                    len(labels),
+                    zlib.crc32(labels),
+                    zipfile.ZIP_DEFLATED,
+                    1024
+                )
+            )
+
+        self.assertEqual(reusable.reused_entries, 1)
+        self.assertEqual(reusable.reused_bytes, len(labels))
+        with zipfile.ZipFile(target) as target_zip:
+            self.assertEqual(target_zip.read('new.tiobundle/assets/labels.txt'), labels)
+
+    def test_write_entries_with_each_compression_type(self):
+        contents = b'compressible contents ' * 1000
+        target = UnseekableBuffer()
+        compress_types = [
+            zipfile.ZIP_STORED,
+            zipfile.ZIP_DEFLATED,
+            zipfile.ZIP_BZIP2,
+            zipfile.ZIP_LZMA
+        ]
+        with zipfile.ZipFile(target, 'w') as target_zip:
+            for compress_type in compress_types:
+                zinfo = ziputil.new_zipinfo('raw-{}'.format(compress_type), compress_type)
+                zinfo.CRC = zlib.crc32(contents)
+                zinfo.file_size = len(contents)
+                data = ziputil.compress(contents, compress_type, 1)
+                zinfo.compress_size = len(data)
+                ziputil.write_raw_entry(target_zip, zinfo, data)
+
+                chunks = (contents[i:i + 1000] for i in range(0, len(contents), 1000))
+                written = ziputil.write_streamed_entry(
+                    target_zip,
+                    ziputil.new_zipinfo('streamed-{}'.format(compress_type), compress_type),
+                    chunks,
+                    level=9,
+                    force_zip64=compress_type == zipfile.ZIP_DEFLATED
+                )
+                self.assertEqual(written, len(contents))
+
+        with zipfile.ZipFile(io.BytesIO(target.buffer.getvalue())) as target_zip:
+            self.assertIsNone(target_zip.testzip())
+            for compress_type in compress_types:
+                for prefix in ['raw', 'streamed']:
+                    name = '{}-{}'.format(prefix, compress_type)
+                    self.assertEqual(target_zip.getinfo(name).compress_type, compress_type)
+                    self.assertEqual(target_zip.read(name), contents)
+                    if compress_type != zipfile.ZIP_STORED:
+                        self.assertLess(target_zip.getinfo(name).compress_size, len(contents))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,421 @@
+"""
+Watch mode of the bundler CLI: keeps a bundle up to date with its sources (SavedModel, model.json,
+assets and representative dataset), rebuilding only the stages affected by each change. The
+process stays up between rebuilds, so TensorFlow is only imported once and the conversion cache,
+conversion workers and asset store stay warm.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+
+from . import bundler, filesystem, filetree, pipeline
+
+# Seconds between checks for changes to sources which are not on the local disk (or to local
+# sources, where inotify is not available)
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Seconds for which sources must stay unchanged before a bundle is rebuilt, so that a change made
+# in several steps (e.g. copying a SavedModel) only causes one rebuild
+DEFAULT_DEBOUNCE = 0.5
+
+# Seconds between checks for changes to local sources watched with inotify, in case it misses any
+INOTIFY_RESCAN_INTERVAL = 30.0
+
+# Keys of the bundle specification which hold the paths of the sources of a bundle
+SOURCE_KEYS = ['saved_model_dir', 'model_json_path', 'assets_path', 'representative_dataset']
+
+# Sources whose changes require the SavedModel to be converted again
+CONVERSION_SOURCE_KEYS = {'saved_model_dir', 'representative_dataset'}
+
+# Suffix of the path to which a bundle is moved while it is rebuilt, so that its unchanged entries
+# can be copied into the new bundle
+PREVIOUS_BUNDLE_SUFFIX = '.previous'
+
+def _local_snapshot(path):
+    # Versions (sizes and modification times) of the local files at path, and the directories
+    # holding them
+    if os.path.isdir(path):
+        versions = {}
+        directories = []
+        for directory, _, filenames in os.walk(path):
+            directories.append(directory)
+            for filename in filenames:
+                file_path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                versions[os.path.relpath(file_path, path)] = (stat.st_size, stat.st_mtime_ns)
+        return versions, directories
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return {}, []
+    return {'': (stat.st_size, stat.st_mtime_ns)}, []
+
+def is_local(path):
+    """
+    Returns: True if path is on the local disk, False otherwise
+    """
+    return isinstance(filesystem.get_filesystem(path), filesystem.LocalFileSystem)
+
+def snapshot(path):
+    """
+    Records the version of every file at path: a directory tree (listed in a single pass; see
+    filetree.scan) or a single file. Local files are versioned by their sizes and modification
+    times, and others by their filesystem.FileStats.
+
+    Returns: Dictionary mapping the path of each file relative to path ('' for a single file) to
+    its version; empty if there is nothing at path
+    """
+    if is_local(path):
+        return _local_snapshot(path)[0]
+    tree = filetree.scan_if_directory(path)
+    if tree is not None:
+        return dict(tree.files)
+    if filesystem.exists(path):
+        return {'': filesystem.stat(path)}
+    return {}
+
+def changed_files(before, after):
+    """
+    Returns: Sorted list of the relative paths of the files which were added, removed or changed
+    between two snapshots
+    """
+    return sorted(
+        relative_path for relative_path in set(before) | set(after)
+        if before.get(relative_path) != after.get(relative_path)
+    )
+
+class _Inotify:
+    """
+    Linux inotify instance (used through ctypes, to avoid a dependency) on which the watcher waits
+    for changes to local directories, instead of sleeping for the whole poll interval. Events only
+    wake the watcher up; it finds out what changed by comparing snapshots.
+    """
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+    # IN_DELETE_SELF | IN_MOVE_SELF
+    MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def watch(self, directory):
+        # Watching a directory again is a no-op. Directories which have just been removed fail to
+        # be watched, which is harmless since they are not in the next snapshot.
+        self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds for an event, and discards the events which have arrived
+
+        Returns: True if there were events, False otherwise
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        while True:
+            try:
+                if not os.read(self.fd, 64 * 1024):
+                    break
+            except BlockingIOError:
+                break
+        return bool(readable)
+
+    def close(self):
+        os.close(self.fd)
+
+def _inotify():
+    # _Inotify instance, or None where inotify is not available (e.g. on macOS)
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return _Inotify()
+    except (OSError, AttributeError):
+        return None
+
+class SourceWatcher:
+    """
+    Watches named sources (files or directory trees on any filesystem) for changes. Local sources
+    are watched with inotify where it is available; other sources are polled every poll_interval
+    seconds. A change is reported once the sources have stayed unchanged for debounce seconds.
+    """
+    def __init__(
+            self,
+            sources,
+            poll_interval=DEFAULT_POLL_INTERVAL,
+            debounce=DEFAULT_DEBOUNCE,
+            use_inotify=True
+        ):
+        self.sources = dict(sources)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.inotify = None
+        if use_inotify and any(is_local(path) for path in self.sources.values()):
+            self.inotify = _inotify()
+        self.snapshots = self._snapshot()
+
+    def _snapshot(self):
+        snapshots = {}
+        for name, path in self.sources.items():
+            if self.inotify is not None and is_local(path):
+                snapshots[name], directories = _local_snapshot(path)
+                # Files are watched through the directories holding them, since editors often
+                # replace files rather than write them in place
+                parent = os.path.dirname(os.path.abspath(path))
+                for directory in directories + [parent]:
+                    self.inotify.watch(directory)
+            else:
+                snapshots[name] = snapshot(path)
+        return snapshots
+
+    def _changes(self, before, after):
+        changes = {}
+        for name in self.sources:
+            changed = changed_files(before[name], after[name])
+            if changed:
+                changes[name] = changed
+        return changes
+
+    def _sleep(self, seconds):
+        if self.inotify is None:
+            time.sleep(seconds)
+        else:
+            self.inotify.wait(seconds)
+
+    def wait(self):
+        """
+        Waits until the sources change and then stay unchanged for debounce seconds
+
+        Returns: Dictionary mapping the name of each source which changed to the sorted list of the
+        relative paths of its files which changed ('' for a single file)
+        """
+        interval = self.poll_interval
+        if self.inotify is not None and all(is_local(path) for path in self.sources.values()):
+            interval = max(interval, INOTIFY_RESCAN_INTERVAL)
+        while True:
+            self._sleep(interval)
+            current = self._snapshot()
+            changes = self._changes(self.snapshots, current)
+            if changes:
+                break
+        while True:
+            time.sleep(self.debounce)
+            latest = self._snapshot()
+            if not self._changes(current, latest):
+                break
+            current = latest
+        changes = self._changes(self.snapshots, current)
+        self.snapshots = current
+        return changes
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+class Rebuilder:
+    """
+    Builds the bundle described by a bundle specification (see rest.BundleHandler.on_post for its
+    keys) again and again, replacing its outputs in place and running only the stages affected by
+    the sources which changed since the last build:
+    + the SavedModel is converted again (for bundler.TFLITE builds) if it or the representative
+      dataset changed;
+    + the TFLite model is benchmarked again (if the specification requests it) if it was converted
+      again or model.json changed;
+    + the bundle is always rebuilt, but the entries of the last build whose files have not changed
+      are copied from it rather than compressed again (see bundler.tiobundle_build);
+    + the bundle is registered (if the specification has a repository_path) after each rebuild.
+
+    bundle_options are further keyword arguments of bundler.tiobundle_build (e.g. chunk_size).
+    """
+    def __init__(
+            self,
+            spec,
+            conversion_cache=None,
+            conversion_executor=None,
+            asset_store=None,
+            bundle_options=None
+        ):
+        pipeline.validate_spec(spec)
+        self.spec = spec
+        self.conversion_cache = conversion_cache
+        self.conversion_executor = conversion_executor
+        self.asset_store = asset_store
+        self.bundle_options = bundle_options or {}
+        self.model_path = spec.get('saved_model_dir')
+        self.conversion_report = None
+        self.builds = 0
+
+    def stages(self, changes=None):
+        """
+        Returns: List of the stages (see pipeline) to run after the given changes (see
+        SourceWatcher.wait); every stage is run if changes is None or nothing has been built yet
+        """
+        rebuild_all = changes is None or self.builds == 0
+        stages = []
+        convert = self.spec.get('build') == bundler.TFLITE and (
+            rebuild_all or any(name in CONVERSION_SOURCE_KEYS for name in changes)
+        )
+        if convert:
+            stages.append(pipeline.CONVERSION_STAGE)
+        if pipeline.needs_benchmark(self.spec) and (
+                convert or rebuild_all or 'model_json_path' in changes
+            ):
+            stages.append(pipeline.BENCHMARK_STAGE)
+        stages.append(pipeline.BUNDLE_STAGE)
+        if pipeline.needs_registration(self.spec):
+            stages.append(pipeline.REGISTRATION_STAGE)
+        return stages
+
+    def build(self, changes=None):
+        """
+        Runs the stages affected by the given changes (see stages)
+
+        Returns: Dictionary with the path of the "bundle", the "registration" response (None if the
+        bundle was not registered) and the "timings" (in seconds) of each stage run and of the
+        whole rebuild ("total")
+        """
+        timings = {}
+        registration = None
+        start = time.perf_counter()
+        for stage in self.stages(changes):
+            stage_start = time.perf_counter()
+            if stage == pipeline.CONVERSION_STAGE:
+                self._convert()
+            elif stage == pipeline.BENCHMARK_STAGE:
+                pipeline.run_benchmark(
+                    self.spec,
+                    self.model_path,
+                    conversion_executor=self.conversion_executor
+                )
+            elif stage == pipeline.BUNDLE_STAGE:
+                self._bundle()
+            elif stage == pipeline.REGISTRATION_STAGE:
+                registration = pipeline.register(self.spec, self.spec.get('bundle_output_path'))
+            timings[stage] = time.perf_counter() - stage_start
+        timings['total'] = time.perf_counter() - start
+        self.builds += 1
+        return {
+            'bundle': self.spec.get('bundle_output_path'),
+            'registration': registration,
+            'timings': timings
+        }
+
+    def _convert(self):
+        tflite_model = self.spec.get('tflite_model')
+        if filesystem.exists(tflite_model):
+            filesystem.remove(tflite_model)
+        self.model_path, self.conversion_report = pipeline.convert_model(
+            self.spec,
+            conversion_cache=self.conversion_cache,
+            conversion_executor=self.conversion_executor
+        )
+
+    def _bundle(self):
+        # The last build is moved aside while the bundle is rebuilt from it, and restored if the
+        # rebuild fails
+        outfile = self.spec.get('bundle_output_path')
+        spec = dict(self.spec)
+        previous_bundle = None
+        if filesystem.exists(outfile):
+            previous_bundle = outfile + PREVIOUS_BUNDLE_SUFFIX
+            filesystem.rename(outfile, previous_bundle)
+            spec['previous_bundle_path'] = previous_bundle
+        try:
+            pipeline.build_bundle(
+                spec,
+                self.model_path,
+                self.conversion_report,
+                self.asset_store,
+                **self.bundle_options
+            )
+        except BaseException:
+            if previous_bundle is not None:
+                filesystem.rename(previous_bundle, outfile)
+            raise
+        if previous_bundle is not None:
+            filesystem.remove(previous_bundle)
+
+def _describe_changes(changes):
+    return ', '.join(
+        '{} ({} file{})'.format(name, len(changed), '' if len(changed) == 1 else 's')
+        for name, changed in sorted(changes.items())
+    )
+
+def _build_and_report(rebuilder, changes, log):
+    if changes is not None:
+        log('Changed: {}'.format(_describe_changes(changes)))
+    try:
+        result = rebuilder.build(changes)
+    except Exception as e:
+        log('Build failed: {}: {}'.format(type(e).__name__, e))
+        return None
+    timings = result['timings']
+    log('Built {} in {:.2f}s ({})'.format(
+        result['bundle'],
+        timings['total'],
+        ', '.join(
+            '{}: {:.2f}s'.format(stage, seconds)
+            for stage, seconds in timings.items() if stage != 'total'
+        )
+    ))
+    if result['registration'] is not None:
+        log('Bundle registered against repository: {}'.format(result['registration']))
+    return result
+
+def watch(
+        spec,
+        conversion_cache=None,
+        conversion_executor=None,
+        asset_store=None,
+        bundle_options=None,
+        poll_interval=DEFAULT_POLL_INTERVAL,
+        debounce=DEFAULT_DEBOUNCE,
+        log=print,
+        max_builds=None
+    ):
+    """
+    Builds the bundle described by spec, then rebuilds it (see Rebuilder) whenever its sources
+    change, until interrupted. A failed build is reported and the sources are watched for the
+    next change. The time taken by each build, and by each of its stages, is reported through log.
+
+    Args:
+    1. spec - Dictionary specifying the bundle (see rest.BundleHandler.on_post for its keys)
+    2. conversion_cache - (Optional) cache.ConversionCache used for TFLite builds
+    3. conversion_executor - (Optional) conversion.ConversionExecutor on which to run TFLite
+       conversions
+    4. asset_store - (Optional) blobstore.BlobStore through which to read assets
+    5. bundle_options - (Optional) Further keyword arguments of bundler.tiobundle_build
+    6. poll_interval - Seconds between checks for changes to sources not watched with inotify
+    7. debounce - Seconds for which sources must stay unchanged before a rebuild
+    8. log - Function called with each line of the report
+    9. max_builds - (Optional) Number of builds (including the first) after which to return
+
+    Returns: None
+    """
+    rebuilder = Rebuilder(
+        spec,
+        conversion_cache=conversion_cache,
+        conversion_executor=conversion_executor,
+        asset_store=asset_store,
+        bundle_options=bundle_options
+    )
+    # The sources are recorded before the first build, so that changes made during a build cause
+    # another one
+    watcher = SourceWatcher(
+        {name: spec[name] for name in SOURCE_KEYS if spec.get(name)},
+        poll_interval=poll_interval,
+        debounce=debounce
+    )
+    try:
+        _build_and_report(rebuilder, None, log)
+        log('Watching {} for changes'.format(', '.join(sorted(watcher.sources.values()))))
+        while max_builds is None or rebuilder.builds < max_builds:
+            _build_and_report(rebuilder, watcher.wait(), log)
+    finally:
+        watcher.close()
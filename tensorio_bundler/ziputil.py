@@ -0,0 +1,388 @@
+"""
+Low-level writing of zipfile entries: entries compressed outside of zipfile (e.g. in other
+threads) and entries reused from previously built zipfiles without being decompressed and
+recompressed
+"""
+
+import bz2
+import struct
+import time
+import zipfile
+import zlib
+
+# Flag bit set on entries whose CRC and sizes follow their data in a data descriptor
+DATA_DESCRIPTOR_FLAG = 0x08
+# Flag bit set on encrypted entries
+ENCRYPTED_FLAG = 0x01
+# Flag bit set on entries whose names are encoded as UTF-8
+UTF8_FLAG = 0x800
+# Flag bit set on LZMA entries whose data ends with an end-of-stream marker
+LZMA_EOS_FLAG = 0x02
+# Signature which precedes data descriptors
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+# Header ID of the ZIP64 extended information extra field
+ZIP64_EXTRA_ID = 1
+# Value of ZipInfo.create_system for entries created on Unix
+UNIX_SYSTEM = 3
+
+# Modification time and permissions given to every entry of a reproducible zipfile (zipfiles
+# cannot represent dates before 1980)
+REPRODUCIBLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+REPRODUCIBLE_PERMISSIONS = 0o644
+
+def _strip_zip64_extra(extra):
+    # The ZIP64 field is regenerated when the copied entry is written, so it has to be removed
+    # from the extra fields carried over from the original entry
+    stripped = b''
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, data_size = struct.unpack('<HH', extra[offset:offset + 4])
+        end = offset + 4 + data_size
+        if header_id != ZIP64_EXTRA_ID:
+            stripped += extra[offset:end]
+        offset = end
+    return stripped
+
+def _data_offset(zfile, info):
+    zfile.fp.seek(info.header_offset)
+    header = zfile.fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader:
+        raise zipfile.BadZipFile('Truncated local header for {}'.format(info.filename))
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    if fields[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile('Bad local header signature for {}'.format(info.filename))
+    return (
+        info.header_offset +
+        zipfile.sizeFileHeader +
+        fields[zipfile._FH_FILENAME_LENGTH] +
+        fields[zipfile._FH_EXTRA_FIELD_LENGTH]
+    )
+
+def make_reproducible(zinfo):
+    """
+    Replaces the metadata of zinfo which depends on when and where it was created (timestamp,
+    permissions, creating system, comment and extra fields) with fixed values
+
+    Returns: zinfo
+    """
+    zinfo.date_time = REPRODUCIBLE_DATE_TIME
+    zinfo.create_system = UNIX_SYSTEM
+    zinfo.external_attr = REPRODUCIBLE_PERMISSIONS << 16
+    zinfo.comment = b''
+    zinfo.extra = b''
+    return zinfo
+
+def new_zipinfo(arcname, compress_type=zipfile.ZIP_STORED, reproducible=False):
+    """
+    Returns: zipfile.ZipInfo for a new file entry with the given name and compression type, with
+    the same timestamp and permissions as ZipFile.writestr would give it (or, if reproducible is
+    True, with fixed ones; see make_reproducible)
+    """
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(time.time())[:6])
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = 0o600 << 16
+    if compress_type == zipfile.ZIP_LZMA:
+        zinfo.flag_bits |= LZMA_EOS_FLAG
+    if reproducible:
+        make_reproducible(zinfo)
+    return zinfo
+
+def make_compressor(compress_type, level=None):
+    """
+    Creates a compressor which produces entry data for the given zip compression type. Unlike
+    zipfile's own compressors, the level is honoured on every supported Python version (LZMA, for
+    which zipfile does not support levels, always uses its default preset).
+
+    Returns: Object with compress and flush methods, or None for zipfile.ZIP_STORED
+    """
+    if compress_type == zipfile.ZIP_STORED:
+        return None
+    if compress_type == zipfile.ZIP_DEFLATED:
+        if level is None:
+            level = zlib.Z_DEFAULT_COMPRESSION
+        return zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    if compress_type == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Compressor(level if level is not None else 9)
+    if compress_type == zipfile.ZIP_LZMA:
+        return zipfile.LZMACompressor()
+    raise NotImplementedError('Unsupported compression type: {}'.format(compress_type))
+
+def compress(data, compress_type, level=None):
+    """
+    Returns: data compressed as the contents of a zip entry of the given compression type
+    """
+    compressor = make_compressor(compress_type, level)
+    if compressor is None:
+        return data
+    return compressor.compress(data) + compressor.flush()
+
+def _begin_raw_write(zfile, zinfo):
+    if zfile._writing:
+        raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+    zfile._writecheck(zinfo)
+    zfile._didModify = True
+    zinfo.header_offset = zfile.fp.tell()
+
+def _end_raw_write(zfile, zinfo):
+    zfile.filelist.append(zinfo)
+    zfile.NameToInfo[zinfo.filename] = zinfo
+    zfile.start_dir = zfile.fp.tell()
+
+def write_raw_entry(zfile, zinfo, data):
+    """
+    Writes an entry whose (already compressed) data, CRC and sizes are known into a zipfile
+
+    Args:
+    1. zfile - zipfile.ZipFile instance (opened for writing)
+    2. zinfo - zipfile.ZipInfo of the entry, with its compress_type, CRC, compress_size and
+       file_size set
+    3. data - Compressed data of the entry, or an iterable of chunks of it
+
+    Returns: None
+    """
+    if isinstance(data, bytes):
+        data = [data]
+    with zfile._lock:
+        _begin_raw_write(zfile, zinfo)
+        zfile.fp.write(zinfo.FileHeader())
+        for chunk in data:
+            zfile.fp.write(chunk)
+        _end_raw_write(zfile, zinfo)
+
+# Compression types whose entries can be compressed in independent blocks (see compress_block)
+BLOCK_COMPRESS_TYPES = {zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED}
+
+def compress_block(data, compress_type, level=None, final=True):
+    """
+    Compresses one block of the contents of an entry independently of the others, so that the
+    blocks of an entry can be compressed concurrently and their outputs concatenated in order.
+    Deflate blocks which are not final end on a byte boundary (Z_SYNC_FLUSH) and do not terminate
+    the stream, so the concatenation is a single valid deflate stream.
+
+    Args:
+    1. data - Uncompressed block
+    2. compress_type - One of the BLOCK_COMPRESS_TYPES
+    3. level - (Optional) Compression level
+    4. final - True for the last block of the entry
+
+    Returns: Compressed block
+    """
+    if compress_type == zipfile.ZIP_STORED:
+        return data
+    if compress_type != zipfile.ZIP_DEFLATED:
+        raise NotImplementedError(
+            'Compression type {} cannot be compressed in blocks'.format(compress_type)
+        )
+    compressor = make_compressor(compress_type, level)
+    flush_mode = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+    return compressor.compress(data) + compressor.flush(flush_mode)
+
+def write_compressed_blocks(zfile, zinfo, blocks, force_zip64=False):
+    """
+    Writes an entry whose CRC and sizes are not known in advance into a zipfile from blocks which
+    have already been compressed. The CRC and sizes are written in a data descriptor after the
+    data, so zfile need not be seekable.
+
+    Args:
+    1. zfile - zipfile.ZipFile instance (opened for writing)
+    2. zinfo - zipfile.ZipInfo of the entry, with its compress_type set
+    3. blocks - Iterable of (uncompressed data, compressed data) pairs, in order; the compressed
+       data of all the blocks together forms the data of the entry
+    4. force_zip64 - Must be True if the entry may be larger than zipfile.ZIP64_LIMIT
+
+    Returns: Number of (uncompressed) bytes written
+    """
+    zinfo.flag_bits |= DATA_DESCRIPTOR_FLAG
+    zinfo.CRC = 0
+    zinfo.compress_size = 0
+    zinfo.file_size = 0
+    with zfile._lock:
+        _begin_raw_write(zfile, zinfo)
+        zfile.fp.write(zinfo.FileHeader(force_zip64))
+        for data, compressed in blocks:
+            zinfo.CRC = zlib.crc32(data, zinfo.CRC)
+            zinfo.file_size += len(data)
+            zfile.fp.write(compressed)
+            zinfo.compress_size += len(compressed)
+
+        if not force_zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(
+                'Entry {} requires ZIP64 but was not written with force_zip64'.format(
+                    zinfo.filename
+                )
+            )
+        descriptor_format = '<LLQQ' if force_zip64 else '<LLLL'
+        zfile.fp.write(struct.pack(
+            descriptor_format,
+            DATA_DESCRIPTOR_SIGNATURE,
+            zinfo.CRC,
+            zinfo.compress_size,
+            zinfo.file_size
+        ))
+        _end_raw_write(zfile, zinfo)
+    return zinfo.file_size
+
+def write_streamed_entry(zfile, zinfo, chunks, level=None, force_zip64=False):
+    """
+    Compresses an entry whose CRC and sizes are not known in advance into a zipfile as it is
+    read. The CRC and sizes are written in a data descriptor after the data, so zfile need not be
+    seekable.
+
+    Args:
+    1. zfile - zipfile.ZipFile instance (opened for writing)
+    2. zinfo - zipfile.ZipInfo of the entry, with its compress_type set
+    3. chunks - Iterable of chunks of the uncompressed contents of the entry
+    4. level - (Optional) Compression level
+    5. force_zip64 - Must be True if the entry may be larger than zipfile.ZIP64_LIMIT
+
+    Returns: Number of (uncompressed) bytes written
+    """
+    return write_compressed_blocks(
+        zfile,
+        zinfo,
+        compressed_chunks(chunks, make_compressor(zinfo.compress_type, level)),
+        force_zip64=force_zip64
+    )
+
+def compressed_chunks(chunks, compressor):
+    """
+    Compresses chunks in order with compressor (as returned by make_compressor; None stores them)
+
+    Returns: Iterator over (chunk, compressed data) pairs, as accepted by write_compressed_blocks,
+    ending with the flushed output of the compressor
+    """
+    for chunk in chunks:
+        yield chunk, compressor.compress(chunk) if compressor is not None else chunk
+    if compressor is not None:
+        yield b'', compressor.flush()
+
+def _copy_chunks(zfile, offset, size, chunk_size, name):
+    zfile.fp.seek(offset)
+    remaining = size
+    while remaining > 0:
+        chunk = zfile.fp.read(min(chunk_size, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile('Truncated data for {}'.format(name))
+        remaining -= len(chunk)
+        yield chunk
+
+def copy_raw_entry(source_zip, info, target_zip, arcname, chunk_size, reproducible=False):
+    """
+    Copies an entry from one zipfile into another under the given name. The compressed data is
+    copied as is, without being decompressed and recompressed.
+
+    Args:
+    1. source_zip - zipfile.ZipFile instance (opened for reading) containing the entry
+    2. info - zipfile.ZipInfo of the entry in source_zip
+    3. target_zip - zipfile.ZipFile instance (opened for writing) into which the entry should be
+       copied
+    4. arcname - Name of the copied entry in target_zip
+    5. chunk_size - Size (in bytes) of the buffer used to copy the entry
+    6. reproducible - If True, the copy is given fixed metadata (see make_reproducible) rather than
+       that of the original entry
+
+    Returns: Number of (compressed) bytes copied
+    """
+    zinfo = zipfile.ZipInfo(arcname, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.comment = info.comment
+    zinfo.extra = _strip_zip64_extra(info.extra)
+    zinfo.create_system = info.create_system
+    zinfo.create_version = info.create_version
+    zinfo.extract_version = info.extract_version
+    zinfo.internal_attr = info.internal_attr
+    zinfo.external_attr = info.external_attr
+    # The sizes and CRC are known up front, so the copy is written without a data descriptor
+    zinfo.flag_bits = info.flag_bits & ~(DATA_DESCRIPTOR_FLAG | UTF8_FLAG)
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    if reproducible:
+        make_reproducible(zinfo)
+
+    data_offset = _data_offset(source_zip, info)
+    write_raw_entry(
+        target_zip,
+        zinfo,
+        _copy_chunks(source_zip, data_offset, info.compress_size, chunk_size, info.filename)
+    )
+    return info.compress_size
+
+class ReusableEntries:
+    """
+    Entries of a previously built tiobundle zipfile which can be copied raw into a new bundle if
+    the files they were built from have not changed. Entries are matched by their paths relative to
+    the bundle directory, so the bundle may be renamed between builds.
+    """
+    def __init__(self, zfile):
+        self.zfile = zfile
+        self.entries = {}
+        for info in zfile.infolist():
+            if info.filename.endswith('/') or info.flag_bits & ENCRYPTED_FLAG:
+                continue
+            self.entries[_bundle_relative_path(info.filename)] = info
+        self.reused_entries = 0
+        self.reused_bytes = 0
+
+    def find(self, zip_target, file_size):
+        """
+        Returns: zipfile.ZipInfo of the entry corresponding to zip_target if it has the given
+        (uncompressed) size, otherwise None. Such an entry can be reused if its CRC and
+        compression type match those of the new entry.
+        """
+        info = self.entries.get(_bundle_relative_path(zip_target))
+        if info is None or info.file_size != file_size:
+            return None
+        return info
+
+    def copy(self, info, target_zip, zip_target, chunk_size, reproducible=False):
+        """
+        Copies the given entry raw into target_zip at zip_target (see copy_raw_entry)
+        """
+        copied = copy_raw_entry(
+            self.zfile,
+            info,
+            target_zip,
+            zip_target,
+            chunk_size,
+            reproducible=reproducible
+        )
+        self.reused_entries += 1
+        self.reused_bytes += info.file_size
+        return copied
+
+    def match(self, zip_target, file_size, crc, compress_type):
+        """
+        Returns: zipfile.ZipInfo of the entry corresponding to zip_target if it matches a file with
+        the given size and CRC and is compressed with the given compression type, otherwise None.
+        (The compression level is not recorded in zipfiles, so entries compressed at other levels
+        match too.)
+        """
+        info = self.find(zip_target, file_size)
+        if info is None or info.CRC != crc or info.compress_type != compress_type:
+            return None
+        return info
+
+    def reuse(
+            self,
+            target_zip,
+            zip_target,
+            file_size,
+            crc,
+            compress_type,
+            chunk_size,
+            reproducible=False
+        ):
+        """
+        Copies the entry corresponding to zip_target into target_zip if it matches (see match)
+
+        Returns: True if the entry was copied, False if the file has to be written afresh
+        """
+        info = self.match(zip_target, file_size, crc, compress_type)
+        if info is None:
+            return False
+        self.copy(info, target_zip, zip_target, chunk_size, reproducible=reproducible)
+        return True
+
+def _bundle_relative_path(name):
+    return name.replace('\\', '/').split('/', 1)[-1]